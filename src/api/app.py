@@ -1,22 +1,47 @@
 """
 Punto de entrada principal para la API MatrixToImagen.
 """
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
 from src.api.routes import router as api_router
 from src.api.middlewares.logging_middleware import LoggingMiddleware
+from src.api.middlewares.metrics_middleware import MetricsMiddleware
+from src.utils.logging_config import configure_logging
 from src.utils.web_ui import setup_web_ui
 from src.config.settings import get_settings
+from src.services.execution_engine import get_execution_engine, shutdown_execution_engine
+from src.services.job_queue import get_job_queue, shutdown_job_queue
+from src.services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS_REGISTRY
+from src.services.upstream_client import close_upstream_client, get_upstream_client
+from src.services.warmup import warm_up
 
 settings = get_settings()
+configure_logging(settings)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Crea los recursos compartidos al arrancar y los libera al apagar."""
+    get_execution_engine()
+    # Crear el cliente es barato: httpx se importa y el pool se abre en la primera llamada
+    get_upstream_client()
+    if settings.WARMUP_ON_STARTUP:
+        warm_up()
+    get_job_queue().start()
+    yield
+    await shutdown_job_queue()
+    await close_upstream_client()
+    shutdown_execution_engine()
 
 # Inicialización de la aplicación FastAPI
 app = FastAPI(
     title="MatrixToImagen API",
     description="API para convertir matrices numéricas a imágenes y verificar transformaciones",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Configuración de CORS
@@ -28,9 +53,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Agregar middleware de logging
+# Registro estructurado de solicitudes (con identificador X-Request-ID)
 app.add_middleware(LoggingMiddleware)
 
+# Métricas de solicitudes (el más externo, para medir también el logging)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Inclusión de rutas
 app.include_router(api_router, prefix="/api/v1")
 
@@ -39,6 +68,12 @@ async def health_check():
     """Endpoint para comprobar el estado de la API."""
     return JSONResponse(status_code=200, content={"status": "healthy"})
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", tags=["Health"], include_in_schema=False)
+    async def metrics():
+        """Métricas del servicio en el formato de texto de Prometheus."""
+        return Response(content=METRICS_REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
 @app.get("/", tags=["Root"])
 async def root():
     """
@@ -55,9 +90,18 @@ async def root():
 setup_web_ui(app)
 
 def main():
-    """Punto de entrada para la ejecución de la API."""
+    """
+    Punto de entrada para desarrollo: un único proceso de uvicorn, con recarga
+    si DEBUG. En producción se usa ``python -m src.api.server``.
+    """
     import uvicorn
-    uvicorn.run("src.api.app:app", host=settings.API_HOST, port=settings.API_PORT, reload=settings.DEBUG)
+    uvicorn.run(
+        "src.api.app:app",
+        host=settings.API_HOST,
+        port=settings.API_PORT,
+        reload=settings.DEBUG,
+        ws_max_size=settings.FRAMES_MAX_BYTES,
+    )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,118 @@
+"""
+Controlador de las secuencias de fotogramas por WebSocket (/api/v1/convert/frames).
+
+La conexión se autentica y se configura una sola vez, en el handshake. Una
+tarea lee los mensajes según llegan y los deja en el buzón de la conexión;
+el bucle principal convierte el fotograma más reciente y envía la imagen.
+Mientras una conversión o un envío están en curso, los fotogramas que llegan
+sustituyen a los pendientes, de modo que un cliente lento recibe las imágenes
+más recientes en lugar de un retraso creciente.
+"""
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import WebSocket
+from starlette.websockets import WebSocketDisconnect
+
+from src.api.controllers.matrix_controller import _check_output_format
+from src.config.settings import get_settings
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.services.execution_engine import PoolSaturatedError, get_execution_engine
+from src.services.frame_stream import FrameEncoder, FrameMailbox, parse_frame, pack_frame
+from src.services.metrics import FRAMES
+
+
+async def _receive_frames(websocket: WebSocket, mailbox: FrameMailbox) -> None:
+    """Lee los mensajes del cliente hasta que se desconecta."""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            mailbox.put(data if data is not None else message.get("text", ""))
+    finally:
+        mailbox.close()
+
+
+async def _send_error(websocket: WebSocket, seq: int, status_code: int, error: str, **extra) -> None:
+    """Informa del fallo de un fotograma sin cerrar la conexión."""
+    FRAMES.inc(result="failed")
+    await websocket.send_text(
+        json.dumps({"seq": seq, "status_code": status_code, "error": error, **extra}, ensure_ascii=False)
+    )
+
+
+class FrameController:
+    @staticmethod
+    def check_options(output_format: str, options: ConversionOptions) -> None:
+        """
+        Valida las opciones de la conexión antes de aceptarla.
+
+        Raises:
+            HTTPException: 400 si el formato o el codificador no son válidos
+        """
+        _check_output_format(output_format, options)
+
+    @staticmethod
+    async def stream_frames(
+        websocket: WebSocket,
+        output_format: str = "png",
+        options: ConversionOptions = DEFAULT_OPTIONS,
+        max_pending: Optional[int] = None
+    ) -> None:
+        """
+        Acepta la conexión y convierte sus fotogramas hasta que el cliente la cierra.
+
+        Cada imagen se envía como mensaje binario con su cabecera (``seq``,
+        ``content_type``, ``dropped`` y ``timing`` en milisegundos). Un
+        fotograma no válido (400), el motor saturado (503, con
+        ``retry_after``) o un fallo de conversión (500) se notifican con un
+        mensaje de texto JSON y la conexión sigue abierta.
+
+        Args:
+            websocket: Conexión ya autenticada
+            output_format: Formato de salida de las imágenes
+            options: Opciones de conversión comunes a todos los fotogramas
+            max_pending: Fotogramas en espera antes de descartar los más antiguos
+                (por defecto ``FRAMES_MAX_PENDING``)
+        """
+        settings = get_settings()
+        encoder = FrameEncoder(output_format, options)
+        mailbox = FrameMailbox(max_pending or settings.FRAMES_MAX_PENDING)
+        engine = get_execution_engine()
+
+        await websocket.accept()
+        receiver = asyncio.create_task(_receive_frames(websocket, mailbox))
+        try:
+            while (frame := await mailbox.get()) is not None:
+                seq, message = frame
+                try:
+                    header_seq, raw = parse_frame(message)
+                    if header_seq is not None:
+                        seq = header_seq
+                    image, stages = await engine.run(encoder.encode, raw)
+                except (ValueError, TypeError) as e:
+                    await _send_error(websocket, seq, 400, str(e))
+                    continue
+                except PoolSaturatedError as e:
+                    await _send_error(websocket, seq, 503, str(e), retry_after=e.retry_after)
+                    continue
+                except Exception as e:
+                    await _send_error(websocket, seq, 500, f"Error al convertir el fotograma: {str(e)}")
+                    continue
+
+                FRAMES.inc(result="encoded")
+                header = {
+                    "seq": seq,
+                    "content_type": encoder.content_type,
+                    "dropped": mailbox.dropped,
+                    "timing": {name: round(duration, 2) for name, duration in stages.items()},
+                }
+                # El envío espera a que el cliente lea: contrapresión sobre el bucle
+                await websocket.send_bytes(pack_frame(header, image))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receiver.cancel()
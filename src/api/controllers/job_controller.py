@@ -0,0 +1,184 @@
+"""
+Controlador de los trabajos asíncronos (/api/v1/jobs).
+
+Cada trabajo ejecuta el mismo flujo que su endpoint síncrono (``/convert``,
+``/compare`` o ``/verify``) a través de MatrixController, de modo que las
+validaciones, la caché y los errores son los mismos; solo cambia que la
+respuesta se guarda en el almacén de resultados en lugar de devolverse.
+"""
+import asyncio
+import io
+from typing import Any, Awaitable, Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import FileResponse, Response
+from starlette.datastructures import Headers
+
+from src.api.controllers.matrix_controller import MatrixController, _check_comparison_mode, _check_output_format
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.services.job_queue import (
+    MAX_PRIORITY,
+    MIN_PRIORITY,
+    JobError,
+    JobQueueFullError,
+    JobRecord,
+    JobResult,
+    JobRunner,
+    get_job_queue,
+)
+
+
+def _check_priority(priority: int) -> None:
+    if not MIN_PRIORITY <= priority <= MAX_PRIORITY:
+        raise HTTPException(
+            status_code=400,
+            detail=f"La prioridad debe estar entre {MIN_PRIORITY} y {MAX_PRIORITY}"
+        )
+
+
+async def _job_result(response: Awaitable[Response]) -> JobResult:
+    """Traduce la respuesta del endpoint síncrono al resultado del trabajo (o a JobError)."""
+    try:
+        result = await response
+    except HTTPException as e:
+        retry_after = (e.headers or {}).get("Retry-After")
+        raise JobError(e.status_code, str(e.detail), int(retry_after) if retry_after else None)
+    return bytes(result.body), result.media_type
+
+
+def _upload(content: bytes, filename: Optional[str], content_type: Optional[str]) -> UploadFile:
+    """El archivo subido ya se cerró al terminar la solicitud: se reconstruye en memoria."""
+    headers = Headers({"content-type": content_type}) if content_type else None
+    return UploadFile(io.BytesIO(content), size=len(content), filename=filename, headers=headers)
+
+
+async def _find(job_id: str) -> JobRecord:
+    record = await asyncio.to_thread(get_job_queue().store.get, job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado o caducado")
+    return record
+
+
+async def _delete(job_id: str) -> None:
+    await asyncio.to_thread(get_job_queue().store.delete, job_id)
+
+
+async def _submit(kind: str, runner: JobRunner, priority: int) -> JobRecord:
+    try:
+        return await get_job_queue().submit(kind, runner, priority)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+class JobController:
+    @staticmethod
+    async def submit_convert(
+        data: Any,
+        format: str,
+        output_format: str = "png",
+        options: ConversionOptions = DEFAULT_OPTIONS,
+        priority: int = 5
+    ) -> JobRecord:
+        """
+        Encola una conversión como la de ``/convert`` (la imagen se guarda completa, sin fragmentos).
+
+        Returns:
+            Registro del trabajo creado
+        """
+        _check_priority(priority)
+        _check_output_format(output_format, options)
+
+        async def run() -> JobResult:
+            return await _job_result(
+                MatrixController.convert_matrix(data, format, output_format, None, False, options)
+            )
+
+        return await _submit("convert", run, priority)
+
+    @staticmethod
+    async def submit_compare(
+        matrix_data: bytes,
+        original_image: bytes,
+        original_filename: Optional[str],
+        original_content_type: Optional[str],
+        format: str,
+        preprocess: Optional[str] = None,
+        mode: str = "fast",
+        priority: int = 5
+    ) -> JobRecord:
+        """Encola una comparación como la de ``/compare``."""
+        _check_priority(priority)
+        _check_comparison_mode(mode)
+
+        async def run() -> JobResult:
+            upload = _upload(original_image, original_filename, original_content_type)
+            return await _job_result(
+                MatrixController.generate_comparison(matrix_data, upload, format, preprocess, mode)
+            )
+
+        return await _submit("compare", run, priority)
+
+    @staticmethod
+    async def submit_verify(
+        image: bytes,
+        filename: Optional[str],
+        content_type: Optional[str],
+        preprocess: Optional[str] = None,
+        api_key: Optional[str] = None,
+        mode: str = "fast",
+        priority: int = 5
+    ) -> JobRecord:
+        """Encola una verificación como la de ``/verify`` (ida y vuelta con ImageToMatrix)."""
+        _check_priority(priority)
+        _check_comparison_mode(mode)
+
+        async def run() -> JobResult:
+            upload = _upload(image, filename, content_type)
+            return await _job_result(MatrixController.verify_transformation(upload, preprocess, api_key, mode))
+
+        return await _submit("verify", run, priority)
+
+    @staticmethod
+    async def get_job(job_id: str) -> Dict[str, Any]:
+        """
+        Estado del trabajo: estado, progreso, tiempos, error y, mientras está
+        en cola, su posición (si lo aceptó este worker).
+        """
+        queue = get_job_queue()
+        record = await _find(job_id)
+        status = record.to_dict()
+        if record.status == "queued":
+            status["queue_position"] = queue.queue_position(job_id)
+        return status
+
+    @staticmethod
+    async def get_result(job_id: str) -> FileResponse:
+        """
+        Devuelve el resultado de un trabajo terminado con el tipo de contenido
+        que habría tenido la respuesta síncrona.
+
+        Raises:
+            HTTPException: 404 si no existe o caducó, 409 si no ha terminado con éxito
+        """
+        record = await _find(job_id)
+        if record.status != "succeeded":
+            detail: Dict[str, Any] = {"status": record.status}
+            if record.error:
+                detail.update(status_code=record.status_code, error=record.error)
+            raise HTTPException(status_code=409, detail=detail)
+        return FileResponse(get_job_queue().store.result_path(job_id), media_type=record.media_type)
+
+    @staticmethod
+    async def cancel_job(job_id: str) -> Dict[str, Any]:
+        """
+        Cancela un trabajo en cola. Los trabajos en ejecución no se
+        interrumpen (409); los terminados se eliminan con su resultado.
+        """
+        record = await _find(job_id)
+        if record.status == "queued" and await get_job_queue().cancel(job_id):
+            return (await _find(job_id)).to_dict()
+        if record.status in ("queued", "running"):
+            raise HTTPException(status_code=409, detail="El trabajo ya se está ejecutando")
+        await _delete(job_id)
+        return {"id": job_id, "deleted": True}
+
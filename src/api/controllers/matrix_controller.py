@@ -1,58 +1,628 @@
 """
 Controlador para la conversión de matrices a imágenes.
 """
-import io
-import json
-from fastapi import HTTPException, UploadFile, File, Form, Body
-from fastapi.responses import Response
-from typing import Optional, Dict, Any, Union
+import os
+import tempfile
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from typing import AsyncIterator, Optional, Dict, Any, List, Union
+import numpy as np
+
+from src.services.animation import ANIMATION_MEDIA_TYPES, STREAMED_FORMATS, AnimationService
+from src.services.matrix_service import COMPARISON_MODES, SIXTEEN_BIT_FORMATS, MatrixService
+from src.services.batch_service import BATCH_RESPONSE_FORMATS, BatchItem, BatchService
+from src.services.binary_matrix import RawMatrixBuffer
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.services.encoders import SEEKABLE_FORMATS, canonical_format, resolve_encoder, streaming_options
+from src.services.large_matrix import LARGE_OUTPUT_FORMATS, LargeMatrixService
+from src.services.region import output_shape
+from src.services.execution_engine import PoolSaturatedError, get_execution_engine
+from src.services.metrics import MATRIX_BYTES
+from src.services.result_cache import ResultCache, etag_matches, get_result_cache
+from src.services.streaming import stream_from_pool
+from src.services.tile_pyramid import TILE_FORMAT, TilePyramid, get_tile_store
+from src.services.upstream_client import UpstreamUnavailableError, get_upstream_client, response_matrix_data
+from src.utils.validation import validate_matrix_data, validate_output_channels
+from src.utils.timing import StageTimer
+from src.config.settings import get_settings
+
+
+def _service_unavailable(error: Union[PoolSaturatedError, UpstreamUnavailableError]) -> HTTPException:
+    """Traduce la saturación del motor o la caída de ImageToMatrix a un 503 con Retry-After."""
+    return HTTPException(
+        status_code=503,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+def _check_comparison_mode(mode: str) -> None:
+    """Rechaza con 400 los modos de comparación desconocidos."""
+    if mode not in COMPARISON_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Modo de comparación no válido. Modos permitidos: {', '.join(COMPARISON_MODES)}"
+        )
+
+
+async def _comparison_response(
+    original_bytes: bytes,
+    reconstructed_bytes: bytes,
+    mode: str,
+    timer: StageTimer
+) -> Response:
+    """Genera la imagen de comparación o, en modo 'metrics', solo las métricas en JSON."""
+    if mode == "metrics":
+        metrics = await MatrixService.compute_comparison_metrics(
+            original_bytes, reconstructed_bytes, timer
+        )
+        return JSONResponse(content=metrics, headers={"Server-Timing": timer.server_timing_header()})
+    
+    comparison_img_bytes = await MatrixService.generate_comparison_image(
+        original_bytes, reconstructed_bytes, timer, mode
+    )
+    return Response(
+        content=comparison_img_bytes,
+        media_type="image/png",
+        headers={"Server-Timing": timer.server_timing_header()}
+    )
+
+
+def _check_output_format(output_format: str, options: ConversionOptions) -> None:
+    """Rechaza con 400 la salida de 16 bits en formatos que no la admiten y los codificadores no disponibles."""
+    if options.normalize == "passthrough" and output_format.lower() not in SIXTEEN_BIT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El modo 'passthrough' (16 bits) solo admite los formatos: {', '.join(SIXTEEN_BIT_FORMATS)}"
+        )
+    try:
+        resolve_encoder(output_format, options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _remove_files(*paths: str) -> None:
+    """Elimina archivos temporales que puedan no existir ya."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _write_pyramid_zip(pyramid: TilePyramid, output_path: str) -> None:
+    with open(output_path, "wb") as fp:
+        pyramid.write_zip(fp)
+
+
+async def _started(results: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """
+    Espera al primer elemento de un flujo antes de empezar a responder, de
+    modo que la saturación del motor o un error inicial todavía puedan
+    devolverse con su código de estado.
+    """
+    first = await results.__anext__()
+    
+    async def chained() -> AsyncIterator[Any]:
+        yield first
+        async for result in results:
+            yield result
+    
+    return chained()
 
-from src.services.matrix_service import MatrixService
-from src.utils.validation import validate_matrix_data
-import httpx
-import base64
 
 class MatrixController:
     @staticmethod
     async def convert_matrix(
-        data: Union[Dict[str, Any], bytes, str], 
+        data: Union[Dict[str, Any], bytes, str, RawMatrixBuffer, np.ndarray], 
         format: str, 
-        output_format: str = "png"
+        output_format: str = "png",
+        if_none_match: Optional[str] = None,
+        stream: Optional[bool] = None,
+        options: ConversionOptions = DEFAULT_OPTIONS
     ):
         """
         Controla el flujo de conversión de matriz a imagen.
         
+        Las conversiones se identifican por el hash de su contenido: la
+        respuesta lleva una ETag, una petición con If-None-Match coincidente
+        recibe 304 y los resultados repetidos se sirven desde la caché.
+        
+        Las matrices grandes (a partir de STREAM_THRESHOLD_BYTES, o siempre con
+        ``stream=True``) se codifican directamente sobre la respuesta por
+        fragmentos, con Pillow si ``encoder`` es 'auto' (OpenCV escribe la
+        imagen de una vez); esas imágenes no se guardan en la caché. Los
+        formatos cuyo codificador necesita un destino posicionable (TIFF) se
+        devuelven siempre completos.
+        
         Args:
             data: Datos de la matriz
-            format: Formato de entrada ('json' o 'numpy')
+            format: Formato de entrada ('json', 'numpy' o 'raw')
             output_format: Formato de salida de la imagen ('png', 'jpeg', etc.)
+            if_none_match: Valor de la cabecera If-None-Match (opcional)
+            stream: Fuerza (True) o desactiva (False) la respuesta por fragmentos;
+                None la decide según el tamaño de la matriz
+            options: Opciones de conversión (normalización y región)
             
         Returns:
-            Response con la imagen generada
+            Response con la imagen generada, o StreamingResponse si se transmite por fragmentos
         """
-        # Validar datos
-        await validate_matrix_data(data, format)
+        _check_output_format(output_format, options)
+        streamable = canonical_format(output_format) not in SEEKABLE_FORMATS
+        if stream and not streamable:
+            raise HTTPException(
+                status_code=400,
+                detail=f"El formato {output_format} no puede transmitirse por fragmentos: use stream=false"
+            )
+        settings = get_settings()
+        timer = StageTimer()
+        cache = get_result_cache()
         
         try:
+            # Validar y parsear los datos una sola vez
+            with timer.stage("validate"):
+                envelope = await validate_matrix_data(data, format)
+            MATRIX_BYTES.observe(envelope.nbytes, endpoint="convert")
+            validate_output_channels(envelope.shape, output_format)
+            if options.colormap is not None and len(envelope.shape) == 3 and envelope.shape[2] != 1:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Los mapas de color requieren una matriz de un solo canal"
+                )
+            region_shape = output_shape(envelope.shape, options)
+            if 0 in region_shape[:2]:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"La región de recorte queda fuera de la matriz ({envelope.shape[1]}x{envelope.shape[0]})"
+                )
+            
+            # Imágenes grandes: codificar directamente sobre la respuesta.
+            # Cuenta el tamaño de la región que se convierte, no el de la matriz.
+            # El canal de fragmentos solo existe entre hilos del mismo proceso.
+            if stream is None:
+                stream = streamable and (
+                    int(np.prod(region_shape)) * envelope.dtype.itemsize >= settings.STREAM_THRESHOLD_BYTES
+                )
+            stream = stream and get_execution_engine().backend == "thread"
+            if stream:
+                # El codificador elegido forma parte de la clave: la ETag corresponde a los bytes enviados
+                options = streaming_options(options)
+            
+            headers = {}
+            if cache is not None:
+                with timer.stage("hash"):
+                    cache_key = await get_execution_engine().run(
+                        ResultCache.compute_key, envelope.matrix, output_format, options.cache_options()
+                    )
+                headers["ETag"] = f'"{cache_key}"'
+                
+                # El cliente ya tiene esta imagen
+                if etag_matches(if_none_match, headers["ETag"]):
+                    return Response(status_code=304, headers=headers)
+                
+                with timer.stage("cache"):
+                    cached = await cache.get(cache_key)
+                if cached is not None:
+                    headers["X-Cache"] = "HIT"
+                    headers["Server-Timing"] = timer.server_timing_header()
+                    return Response(content=cached.content, media_type=cached.content_type, headers=headers)
+                headers["X-Cache"] = "MISS"
+            
+            if stream:
+                chunks = await _started(MatrixService.stream_matrix_image(envelope.matrix, output_format, options))
+                headers["Server-Timing"] = timer.server_timing_header()
+                return StreamingResponse(chunks, media_type=f"image/{output_format}", headers=headers)
+            
             # Convertir matriz a imagen
             img_bytes, content_type = await MatrixService.matrix_to_image(
-                data, format, output_format
+                envelope, format, output_format, timer, options
             )
             
+            if cache is not None:
+                await cache.put(cache_key, img_bytes, content_type)
+            
             # Devolver la imagen
-            return Response(content=img_bytes, media_type=content_type)
+            headers["Server-Timing"] = timer.server_timing_header()
+            return Response(content=img_bytes, media_type=content_type, headers=headers)
+        except HTTPException:
+            raise
+        except PoolSaturatedError as e:
+            raise _service_unavailable(e)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error al convertir la matriz a imagen: {str(e)}"
+            )
+    
+    @staticmethod
+    async def convert_large_matrix(
+        path: str,
+        output_format: str = "png",
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ):
+        """
+        Controla la conversión de una matriz ``.npy`` más grande que la memoria.
+        
+        La matriz ya está guardada en ``path`` y se lee proyectada desde disco.
+        El PNG se transmite por fragmentos según se codifica; el TIFF por
+        teselas necesita escribir su directorio al final, así que se genera en
+        un archivo temporal y se sirve desde él. Los archivos temporales se
+        eliminan al terminar la respuesta (o ante cualquier error).
+        
+        Args:
+            path: Ruta del ``.npy`` recibido
+            output_format: 'png' o 'tiff'
+            options: Opciones de conversión (normalización y mapa de color)
+            
+        Returns:
+            StreamingResponse o FileResponse con la imagen
+        """
+        output_format = output_format.lower()
+        timer = StageTimer()
+        response = None
+        try:
+            if output_format not in LARGE_OUTPUT_FORMATS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Formato de salida no válido para matrices grandes. Formatos permitidos: {', '.join(LARGE_OUTPUT_FORMATS)}"
+                )
+            _check_output_format(output_format, options)
+            with timer.stage("validate"):
+                try:
+                    source = LargeMatrixService.open_matrix(path)
+                    MATRIX_BYTES.observe(source.nbytes, endpoint="convert_large")
+                    LargeMatrixService.output_layout(LargeMatrixService.select_view(source, options), options)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+            
+            # El canal de fragmentos solo existe entre hilos del mismo proceso
+            if output_format == "png" and get_execution_engine().backend == "thread":
+                chunks = await _started(LargeMatrixService.stream_png(path, options))
+                response = StreamingResponse(
+                    chunks,
+                    media_type="image/png",
+                    headers={"Server-Timing": timer.server_timing_header()},
+                    background=BackgroundTask(_remove_files, path)
+                )
+                return response
+            
+            with timer.stage("encode"):
+                output_path = await LargeMatrixService.render_to_file(path, output_format, options)
+            response = FileResponse(
+                output_path,
+                media_type=f"image/{output_format}",
+                headers={"Server-Timing": timer.server_timing_header()},
+                background=BackgroundTask(_remove_files, path, output_path)
+            )
+            return response
+        except HTTPException:
+            raise
+        except PoolSaturatedError as e:
+            raise _service_unavailable(e)
         except Exception as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"Error al convertir la matriz a imagen: {str(e)}"
             )
+        finally:
+            # Sin respuesta no habrá tarea de limpieza que borre la matriz
+            if response is None:
+                _remove_files(path)
+    
+    @staticmethod
+    async def convert_animation(
+        path: str,
+        output_format: str = "gif",
+        fps: float = 10.0,
+        loop: int = 0,
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ):
+        """
+        Controla la conversión de una pila de fotogramas ``.npy`` en una animación.
+        
+        La pila ya está guardada en ``path`` y se lee proyectada desde disco,
+        fotograma a fotograma. GIF y APNG se transmiten por fragmentos según se
+        escribe cada fotograma; WebP y MP4 se generan en un archivo temporal y
+        se sirven desde él. Los archivos temporales se eliminan al terminar la
+        respuesta (o ante cualquier error).
+        
+        Args:
+            path: Ruta del ``.npy`` recibido, de forma (fotogramas, alto, ancho[, canales])
+            output_format: 'gif', 'apng', 'webp' o 'mp4'
+            fps: Fotogramas por segundo
+            loop: Repeticiones (0: indefinidamente; no se aplica a MP4)
+            options: Opciones de conversión (normalización, mapa de color, región y codificador)
+            
+        Returns:
+            StreamingResponse o FileResponse con la animación
+        """
+        output_format = output_format.lower()
+        timer = StageTimer()
+        response = None
+        try:
+            with timer.stage("validate"):
+                try:
+                    stack = AnimationService.open_stack(path)
+                    MATRIX_BYTES.observe(stack.nbytes, endpoint="convert_animation")
+                    AnimationService.check_options(stack, output_format, fps, options)
+                    AnimationService.select_view(stack, options)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+            
+            media_type = ANIMATION_MEDIA_TYPES[output_format]
+            # El canal de fragmentos solo existe entre hilos del mismo proceso
+            if output_format in STREAMED_FORMATS and get_execution_engine().backend == "thread":
+                chunks = await _started(AnimationService.stream_animation(path, output_format, fps, loop, options))
+                response = StreamingResponse(
+                    chunks,
+                    media_type=media_type,
+                    headers={"Server-Timing": timer.server_timing_header()},
+                    background=BackgroundTask(_remove_files, path)
+                )
+                return response
+            
+            with timer.stage("encode"):
+                output_path = await AnimationService.render_to_file(path, output_format, fps, loop, options)
+            response = FileResponse(
+                output_path,
+                media_type=media_type,
+                headers={"Server-Timing": timer.server_timing_header()},
+                background=BackgroundTask(_remove_files, path, output_path)
+            )
+            return response
+        except HTTPException:
+            raise
+        except PoolSaturatedError as e:
+            raise _service_unavailable(e)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error al generar la animación: {str(e)}"
+            )
+        finally:
+            # Sin respuesta no habrá tarea de limpieza que borre la pila
+            if response is None:
+                _remove_files(path)
+    
+    @staticmethod
+    async def convert_batch(
+        items: List[BatchItem],
+        output_format: str = "png",
+        response_format: str = "zip",
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ):
+        """
+        Controla la conversión de un lote de matrices a imágenes.
+        
+        Los elementos se convierten en paralelo y la respuesta se transmite a
+        medida que terminan; un elemento inválido se informa en la respuesta
+        sin hacer fallar al resto del lote.
+        
+        Args:
+            items: Elementos del lote
+            output_format: Formato de salida de las imágenes
+            response_format: 'zip', 'multipart' o 'ndjson'
+            options: Opciones de conversión comunes a todo el lote
+            
+        Returns:
+            StreamingResponse con las imágenes del lote
+        """
+        _check_output_format(output_format, options)
+        response_format = response_format.lower()
+        if response_format not in BATCH_RESPONSE_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Formato de respuesta no válido. Formatos permitidos: {', '.join(BATCH_RESPONSE_FORMATS)}"
+            )
+        
+        try:
+            results = await _started(BatchService.convert_batch(items, output_format, options))
+        except PoolSaturatedError as e:
+            raise _service_unavailable(e)
+        
+        headers = {"X-Batch-Size": str(len(items))}
+        if response_format == "zip":
+            headers["Content-Disposition"] = 'attachment; filename="batch.zip"'
+            return StreamingResponse(
+                BatchService.zip_stream(results, output_format),
+                media_type="application/zip",
+                headers=headers
+            )
+        if response_format == "multipart":
+            boundary = BatchService.new_boundary()
+            return StreamingResponse(
+                BatchService.multipart_stream(results, output_format, boundary),
+                media_type=f"multipart/mixed; boundary={boundary}",
+                headers=headers
+            )
+        return StreamingResponse(
+            BatchService.ndjson_stream(results),
+            media_type="application/x-ndjson",
+            headers=headers
+        )
+    
+    @staticmethod
+    async def create_tile_pyramid(
+        data: Union[Dict[str, Any], bytes, str, RawMatrixBuffer, np.ndarray, None],
+        format: Optional[str],
+        tile_size: Optional[int] = None,
+        options: ConversionOptions = DEFAULT_OPTIONS,
+        path: Optional[str] = None
+    ):
+        """
+        Crea la pirámide de teselas de una matriz.
+        
+        Solo se genera el nivel de máxima resolución; el resto de niveles y
+        las teselas se generan al pedirlos. Una matriz ya registrada con las
+        mismas opciones devuelve la pirámide existente.
+        
+        Args:
+            data: Datos de la matriz (si no se indica ``path``)
+            format: Formato de entrada ('json', 'numpy' o 'raw')
+            tile_size: Lado de las teselas (por defecto TILE_SIZE)
+            options: Opciones de conversión (normalización y mapa de color)
+            path: Ruta de un ``.npy`` ya guardado en disco, que se lee proyectado
+                y se elimina al terminar
+            
+        Returns:
+            JSONResponse con los metadatos y las URL de la pirámide (201 si se ha creado)
+        """
+        settings = get_settings()
+        tile_size = tile_size or settings.TILE_SIZE
+        timer = StageTimer()
+        try:
+            if not 16 <= tile_size <= 4096:
+                raise HTTPException(status_code=400, detail="El tamaño de tesela debe estar entre 16 y 4096")
+            
+            with timer.stage("validate"):
+                try:
+                    if path is not None:
+                        source = LargeMatrixService.open_matrix(path)
+                    else:
+                        source = (await validate_matrix_data(data, format)).matrix
+                    MATRIX_BYTES.observe(source.nbytes, endpoint="tiles")
+                    LargeMatrixService.output_layout(LargeMatrixService.select_view(source, options), options)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+            
+            with timer.stage("pyramid"):
+                pyramid, created = await get_tile_store().create(
+                    path if path is not None else source, tile_size, options
+                )
+            
+            base_url = f"/api/v1/tiles/{pyramid.id}"
+            content = {
+                **pyramid.metadata(),
+                "dzi": f"{base_url}.dzi",
+                "tiles": f"{base_url}/{{z}}/{{x}}/{{y}}.{TILE_FORMAT}",
+                "zip": f"{base_url}.zip",
+            }
+            return JSONResponse(
+                status_code=201 if created else 200,
+                content=content,
+                headers={"Location": base_url, "Server-Timing": timer.server_timing_header()}
+            )
+        except HTTPException:
+            raise
+        except PoolSaturatedError as e:
+            raise _service_unavailable(e)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error al crear la pirámide de teselas: {str(e)}"
+            )
+        finally:
+            if path is not None:
+                _remove_files(path)
+    
+    @staticmethod
+    def get_tile_pyramid(pyramid_id: str) -> TilePyramid:
+        """Devuelve la pirámide registrada o responde 404."""
+        pyramid = get_tile_store().get(pyramid_id)
+        if pyramid is None:
+            raise HTTPException(status_code=404, detail="Pirámide de teselas no encontrada")
+        return pyramid
+    
+    @staticmethod
+    async def get_tile(
+        pyramid_id: str,
+        level: int,
+        column: int,
+        row: int,
+        if_none_match: Optional[str] = None
+    ):
+        """
+        Sirve una tesela de la pirámide, generándola si es la primera vez que se pide.
+        
+        Las teselas no cambian nunca (la pirámide se identifica por su
+        contenido), así que se sirven con ETag y caché inmutable, y se guardan
+        en la caché de resultados.
+        
+        Args:
+            pyramid_id: Identificador de la pirámide
+            level: Nivel de Deep Zoom (el máximo es la imagen completa)
+            column: Columna de la tesela
+            row: Fila de la tesela
+            if_none_match: Valor de la cabecera If-None-Match (opcional)
+            
+        Returns:
+            Response con la tesela PNG
+        """
+        pyramid = MatrixController.get_tile_pyramid(pyramid_id)
+        if not pyramid.has_tile(level, column, row):
+            raise HTTPException(status_code=404, detail="La tesela está fuera de la pirámide")
+        
+        key = f"{pyramid.id}-{level}-{column}-{row}"
+        headers = {"ETag": f'"{key}"', "Cache-Control": "public, max-age=31536000, immutable"}
+        if etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        
+        cache = get_result_cache()
+        cached = await cache.get(key) if cache is not None else None
+        if cached is not None:
+            headers["X-Cache"] = "HIT"
+            return Response(content=cached.content, media_type=cached.content_type, headers=headers)
+        
+        try:
+            content = await get_tile_store().tile(pyramid, level, column, row)
+        except PoolSaturatedError as e:
+            raise _service_unavailable(e)
+        except FileNotFoundError:
+            # La pirámide se ha eliminado mientras se atendía la petición
+            raise HTTPException(status_code=404, detail="Pirámide de teselas no encontrada")
+        
+        if cache is not None:
+            await cache.put(key, content, f"image/{TILE_FORMAT}")
+            headers["X-Cache"] = "MISS"
+        return Response(content=content, media_type=f"image/{TILE_FORMAT}", headers=headers)
+    
+    @staticmethod
+    async def export_tile_pyramid(pyramid_id: str):
+        """
+        Exporta la pirámide completa como ZIP con la estructura de Deep Zoom.
+        
+        Con el backend de hilos el ZIP se transmite según se generan las
+        teselas; con el de procesos se genera en un archivo temporal.
+        
+        Returns:
+            StreamingResponse o FileResponse con el ZIP
+        """
+        pyramid = MatrixController.get_tile_pyramid(pyramid_id)
+        settings = get_settings()
+        headers = {"Content-Disposition": f'attachment; filename="{pyramid.id}.zip"'}
+        try:
+            if get_execution_engine().backend == "thread":
+                chunks = await _started(stream_from_pool(
+                    pyramid.write_zip,
+                    chunk_size=settings.STREAM_CHUNK_SIZE,
+                    max_pending=settings.STREAM_MAX_PENDING_CHUNKS,
+                ))
+                return StreamingResponse(chunks, media_type="application/zip", headers=headers)
+            
+            fd, output_path = tempfile.mkstemp(suffix=".zip", dir=settings.LARGE_MATRIX_SPOOL_DIR)
+            os.close(fd)
+            try:
+                await get_execution_engine().run(_write_pyramid_zip, pyramid, output_path)
+            except BaseException:
+                _remove_files(output_path)
+                raise
+            return FileResponse(
+                output_path,
+                media_type="application/zip",
+                headers=headers,
+                background=BackgroundTask(_remove_files, output_path)
+            )
+        except PoolSaturatedError as e:
+            raise _service_unavailable(e)
     
     @staticmethod
     async def generate_comparison(
-        matrix_data: Dict[str, Any], 
+        matrix_data: Union[Dict[str, Any], bytes, str], 
         original_image: UploadFile,
         format: str, 
-        preprocess: Optional[str] = None
+        preprocess: Optional[str] = None,
+        mode: str = "fast"
     ):
         """
         Genera una comparación entre la imagen original y la reconstruida.
@@ -62,29 +632,36 @@ class MatrixController:
             original_image: Archivo de imagen original
             format: Formato de los datos de matriz ('json' o 'numpy')
             preprocess: Opciones de preprocesamiento aplicadas
+            mode: 'fast' o 'figure' (imagen) o 'metrics' (JSON con métricas)
             
         Returns:
-            Response con la imagen de comparación
+            Response con la imagen de comparación o JSONResponse con las métricas
         """
-        # Validar datos
-        await validate_matrix_data(matrix_data, format)
+        _check_comparison_mode(mode)
+        timer = StageTimer()
         
         try:
+            # Validar y parsear los datos una sola vez
+            with timer.stage("validate"):
+                envelope = await validate_matrix_data(matrix_data, format)
+            MATRIX_BYTES.observe(envelope.nbytes, endpoint="compare")
+            
             # Leer la imagen original
             original_img_bytes = await original_image.read()
             
             # Convertir la matriz a imagen
             reconstructed_img_bytes, _ = await MatrixService.matrix_to_image(
-                matrix_data, format, "png"
+                envelope, format, "png", timer
             )
             
-            # Generar la comparación
-            comparison_img_bytes = await MatrixService.generate_comparison_image(
-                original_img_bytes, reconstructed_img_bytes
+            # Generar y devolver la comparación
+            return await _comparison_response(
+                original_img_bytes, reconstructed_img_bytes, mode, timer
             )
-            
-            # Devolver la imagen de comparación
-            return Response(content=comparison_img_bytes, media_type="image/png")
+        except HTTPException:
+            raise
+        except PoolSaturatedError as e:
+            raise _service_unavailable(e)
         except Exception as e:
             raise HTTPException(
                 status_code=500,
@@ -95,7 +672,8 @@ class MatrixController:
     async def verify_transformation(
         original_image: UploadFile,
         preprocess: Optional[str] = None,
-        api_key: str = None
+        api_key: str = None,
+        mode: str = "fast"
     ):
         """
         Verifica la transformación completa: imagen → matriz → imagen
@@ -104,12 +682,15 @@ class MatrixController:
             original_image: Archivo de imagen original
             preprocess: Opciones de preprocesamiento (opcional)
             api_key: Clave API para el servicio ImageToMatrix
+            mode: 'fast' o 'figure' (imagen) o 'metrics' (JSON con métricas)
             
         Returns:
-            Response con la imagen de comparación
+            Response con la imagen de comparación o JSONResponse con las métricas
         """
         from src.config.settings import get_settings
         settings = get_settings()
+        _check_comparison_mode(mode)
+        timer = StageTimer()
         
         try:
             # 1. Guardar la imagen original para usarla después
@@ -119,41 +700,41 @@ class MatrixController:
             # 2. Enviar la imagen al servicio ImageToMatrix para obtener la matriz
             headers = {"X-API-Key": api_key or settings.DEFAULT_API_KEY}
             
-            # Crear el formulario para la petición
-            form_data = {"image": original_image, "format": "json"}
-            if preprocess:
-                form_data["preprocess"] = preprocess
-            
-            # Realizar petición HTTP al servicio ImageToMatrix
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
+            # Realizar petición HTTP al servicio ImageToMatrix (cliente persistente con keep-alive),
+            # pidiendo la matriz en .npy y aceptando JSON si el servicio no lo admite
+            with timer.stage("upstream"):
+                response, matrix_format = await get_upstream_client().post_matrix_request(
                     settings.IMAGE_TO_MATRIX_URL,
                     files={"image": (original_image.filename, original_bytes, original_image.content_type)},
-                    data={"format": "json", "preprocess": preprocess},
+                    data={"preprocess": preprocess},
                     headers=headers,
-                    timeout=30.0
+                    matrix_format=settings.UPSTREAM_MATRIX_FORMAT
                 )
-                
-                if response.status_code != 200:
-                    raise HTTPException(
-                        status_code=response.status_code,
-                        detail=f"Error en ImageToMatrix: {response.text}"
-                    )
-                
-                # Obtener la matriz desde la respuesta
-                matrix_data = response.json()
             
-            # 3. Convertir la matriz de vuelta a imagen
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=response.status_code,
+                    detail=f"Error en ImageToMatrix: {response.text}"
+                )
+            
+            # 3. Cargar la matriz de la respuesta (sin copias si es binaria) y convertirla de vuelta a imagen
+            with timer.stage("validate"):
+                envelope = await validate_matrix_data(
+                    response_matrix_data(response, matrix_format), matrix_format
+                )
+            MATRIX_BYTES.observe(envelope.nbytes, endpoint="verify")
             reconstructed_img_bytes, _ = await MatrixService.matrix_to_image(
-                matrix_data, "json", "png"
+                envelope, matrix_format, "png", timer
             )
             
-            # 4. Generar y devolver la imagen de comparación
-            comparison_img_bytes = await MatrixService.generate_comparison_image(
-                original_bytes, reconstructed_img_bytes
+            # 4. Generar y devolver la comparación
+            return await _comparison_response(
+                original_bytes, reconstructed_img_bytes, mode, timer
             )
-            
-            return Response(content=comparison_img_bytes, media_type="image/png")
+        except HTTPException:
+            raise
+        except (PoolSaturatedError, UpstreamUnavailableError) as e:
+            raise _service_unavailable(e)
         except Exception as e:
             raise HTTPException(
                 status_code=500,
@@ -1,48 +1,91 @@
 """
 Middleware para el registro de solicitudes y respuestas.
+
+Es un middleware ASGI puro: solo observa el mensaje de inicio de la respuesta
+y no envuelve el cuerpo, así que no retiene las respuestas por fragmentos.
+Registra una línea estructurada por solicitud al terminar de enviarla. Las
+solicitudes correctas se muestrean (``LOG_SAMPLE_RATE``); los errores y las
+solicitudes lentas (``LOG_SLOW_REQUEST_MS``) se registran siempre.
 """
-import time
 import logging
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+import random
+import time
+import uuid
 
-from src.config.settings import get_settings
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-settings = get_settings()
+from src.config.settings import get_settings
 
-# Configurar logging
-logging.basicConfig(
-    level=getattr(logging, settings.LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+REQUEST_ID_HEADER = "X-Request-ID"
 
 logger = logging.getLogger("matrix_to_image")
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        
-        # Registrar la solicitud entrante
-        logger.info(f"Request: {request.method} {request.url}")
-        
-        # Procesar la solicitud
+
+class LoggingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        settings = get_settings()
+        self.sample_rate = settings.LOG_SAMPLE_RATE
+        self.slow_seconds = settings.LOG_SLOW_REQUEST_MS / 1000.0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        # Se respeta el identificador del cliente o del proxy para correlacionar registros
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:128]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        scope.setdefault("state", {})["request_id"] = request_id
+        response = {"status": 500, "bytes": 0}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers[REQUEST_ID_HEADER] = request_id
+                # Tiempo hasta las cabeceras: con respuestas por fragmentos el cuerpo aún no se ha enviado
+                headers["X-Process-Time"] = f"{time.perf_counter() - start:.4f}"
+            elif message["type"] == "http.response.body":
+                response["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        error = None
         try:
-            response = await call_next(request)
-            process_time = time.time() - start_time
-            
-            # Registrar la respuesta
-            logger.info(
-                f"Response: {request.method} {request.url} - Status: {response.status_code} - Time: {process_time:.4f}s"
-            )
-            
-            # Añadir el tiempo de procesamiento como header
-            response.headers["X-Process-Time"] = f"{process_time:.4f}"
-            return response
-            
-        except Exception as e:
-            process_time = time.time() - start_time
-            logger.error(
-                f"Error: {request.method} {request.url} - Error: {str(e)} - Time: {process_time:.4f}s"
-            )
+            await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            error = exc
             raise
+        finally:
+            duration = time.perf_counter() - start
+            status = response["status"]
+            if error is not None or status >= 500:
+                level = logging.ERROR
+            elif status >= 400 or duration >= self.slow_seconds:
+                level = logging.WARNING
+            elif random.random() < self.sample_rate:
+                level = logging.INFO
+            else:
+                level = None
+
+            if level is not None and logger.isEnabledFor(level):
+                fields = {
+                    "request_id": request_id,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "duration_ms": round(duration * 1000, 2),
+                    "response_bytes": response["bytes"],
+                    "client": scope["client"][0] if scope.get("client") else None,
+                }
+                if error is not None:
+                    fields["error"] = repr(error)
+                if duration >= self.slow_seconds:
+                    fields["slow"] = True
+                logger.log(level, "request", extra={"fields": fields})
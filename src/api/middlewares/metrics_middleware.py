@@ -0,0 +1,73 @@
+"""
+Middleware que alimenta las métricas de solicitudes HTTP.
+
+Es un middleware ASGI puro: solo observa el mensaje de inicio de la
+respuesta (estado, tipo de contenido y ``Server-Timing``) sin envolver el
+cuerpo, así que no retiene las respuestas por fragmentos. La duración se
+mide hasta que se envía el último byte.
+"""
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.services.metrics import REQUEST_DURATION, REQUESTS_IN_FLIGHT, observe_server_timing
+
+# Etiqueta de las solicitudes que no corresponden a ninguna ruta (acota la cardinalidad)
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(scope: Scope) -> str:
+    """
+    Plantilla de la ruta que atendió la solicitud (``/api/v1/tiles/{pyramid_id}``).
+
+    Según la versión de FastAPI, la ruta del scope puede no llevar el prefijo
+    del router incluido; se recupera de los primeros segmentos de la URL (los
+    parámetros de ruta no contienen '/').
+    """
+    route = getattr(scope.get("route"), "path", None)
+    if route is None:
+        return UNMATCHED_ROUTE
+    segments = scope["path"].strip("/").split("/")
+    prefix = segments[:max(0, len(segments) - len(route.strip("/").split("/")))]
+    return "".join(f"/{segment}" for segment in prefix) + route
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        response = {"status": 500, "content_type": "", "server_timing": ""}
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name == b"content-type":
+                        response["content_type"] = value.decode("latin-1")
+                    elif name == b"server-timing":
+                        response["server_timing"] = value.decode("latin-1")
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            route = route_template(scope)
+            media_type = response["content_type"].split(";")[0].strip()
+            output_format = media_type[len("image/"):] if media_type.startswith("image/") else ""
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=route,
+                status=str(response["status"]),
+                output_format=output_format,
+            )
+            if response["server_timing"]:
+                observe_server_timing(route, response["server_timing"])
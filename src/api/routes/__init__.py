@@ -1,38 +1,323 @@
 """
 Rutas de la API para la conversión de matrices a imágenes.
 """
-from fastapi import APIRouter, UploadFile, File, Form, Body, Depends, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, UploadFile, File, Form, Body, Depends, HTTPException, Query, Request, WebSocket
+from fastapi.responses import JSONResponse, Response
 from typing import Optional, Dict, Any, List
 
+from src.api.controllers.frame_controller import FrameController
+from src.api.controllers.job_controller import JobController
 from src.api.controllers.matrix_controller import MatrixController
 from src.services.auth_service import verify_api_key
+from src.services.result_cache import get_result_cache
+from src.services.conversion_options import ConversionOptions
+from src.services.job_queue import JobRecord
+from src.config.settings import get_settings
+from src.utils.matrix_request import (
+    conversion_options,
+    is_npy_request,
+    read_batch_request,
+    read_matrix_request,
+    spool_request_body,
+)
+
+settings = get_settings()
 
 router = APIRouter(tags=["Matrix Conversion"])
 
-@router.post("/convert", summary="Convertir matriz a imagen")
+_MATRIX_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "object", "properties": {"matrix": {"type": "array"}}}},
+            "application/x-npy": {"schema": {"type": "string", "format": "binary"}},
+            "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
+@router.post("/convert", summary="Convertir matriz a imagen", openapi_extra=_MATRIX_REQUEST_BODY)
 async def convert_matrix_to_image(
-    matrix: Dict[str, Any] = Body(...),
-    format: str = Form("json"),
-    output_format: str = Form("png"),
+    request: Request,
+    format: Optional[str] = Query(None),
+    output_format: str = Query("png"),
+    stream: Optional[bool] = Query(None),
+    options: ConversionOptions = Depends(conversion_options),
     api_key: str = Depends(verify_api_key)
 ):
     """
     Convierte una matriz numérica a una imagen.
     
-    - **matrix**: Datos de la matriz en formato JSON
-    - **format**: Formato de entrada de la matriz (json, numpy)
+    - **body**: Matriz en JSON (`{"matrix": [...]}`), archivo `.npy`
+      (`application/x-npy`) o búfer crudo (`application/octet-stream` con las
+      cabeceras `X-Matrix-Dtype` y `X-Matrix-Shape`)
+    - **format**: Formato de entrada de la matriz (json, numpy, raw); por defecto se deduce del Content-Type
     - **output_format**: Formato de salida de la imagen (png, jpeg, etc.)
+    - **stream**: Transmitir la imagen por fragmentos mientras se codifica; por
+      defecto se activa a partir de `STREAM_THRESHOLD_BYTES`
+    - **normalize**: Modo de normalización (`auto`, `clip`, `minmax`,
+      `percentile`, `window` o `passthrough` para PNG/TIFF de 16 bits), con
+      `percentiles`, `window` y `level` como parámetros
+    - **crop**, **stride**: Región `x,y,ancho,alto` y paso de submuestreo,
+      aplicados antes de normalizar
+    - **max_width**, **max_height**: Tamaño máximo de la imagen (reducción con
+      `INTER_AREA`, sin ampliar), para miniaturas y vistas previas
+    - **profile**, **encoder**: Perfil de codificación (`fastest`, `balanced`,
+      `smallest`) y codificador (`auto`, `pillow`, `opencv`), con
+      `compress_level`, `quality`, `optimize` y `lossless` como parámetros explícitos
+    """
+    try:
+        matrix, format = await read_matrix_request(request, format)
+        return await MatrixController.convert_matrix(
+            matrix, format, output_format, request.headers.get("if-none-match"), stream, options
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+_LARGE_MATRIX_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/x-npy": {"schema": {"type": "string", "format": "binary"}},
+            "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
+@router.post(
+    "/convert/large",
+    summary="Convertir una matriz más grande que la memoria",
+    openapi_extra=_LARGE_MATRIX_REQUEST_BODY
+)
+async def convert_large_matrix(
+    request: Request,
+    output_format: str = Query("png"),
+    options: ConversionOptions = Depends(conversion_options),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Convierte una matriz `.npy` de cualquier tamaño (hasta `LARGE_MATRIX_MAX_SIZE`).
+    
+    El archivo se guarda en disco y se lee proyectado en memoria; la
+    normalización y la codificación se hacen por franjas o teselas sin
+    superar `LARGE_MATRIX_MEMORY_LIMIT`.
+    
+    - **body**: Archivo `.npy` (`application/x-npy`)
+    - **output_format**: `png` (transmitido por fragmentos) o `tiff` (por teselas)
+    - **normalize**, **percentiles**, **window**, **level**, **colormap**: Como en `/convert`
+    - **crop**, **stride**: Como en `/convert` (`max_width` y `max_height` no se admiten)
+    """
+    path = await spool_request_body(request, settings.LARGE_MATRIX_MAX_SIZE, settings.LARGE_MATRIX_SPOOL_DIR)
+    return await MatrixController.convert_large_matrix(path, output_format, options)
+
+@router.post(
+    "/convert/animation",
+    summary="Convertir una pila de fotogramas en una animación",
+    openapi_extra=_LARGE_MATRIX_REQUEST_BODY
+)
+async def convert_animation(
+    request: Request,
+    output_format: str = Query("gif"),
+    fps: float = Query(10.0),
+    loop: int = Query(0, ge=0, le=65535),
+    options: ConversionOptions = Depends(conversion_options),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Convierte una serie temporal `.npy` de forma `(T, alto, ancho)` o
+    `(T, alto, ancho, canales)` en una animación.
+    
+    La pila se guarda en disco y se lee proyectada en memoria, fotograma a
+    fotograma, con el mismo intervalo de normalización para todos.
+    
+    - **body**: Archivo `.npy` (`application/x-npy`)
+    - **output_format**: `gif`, `apng` (transmitidos por fragmentos), `webp` o `mp4`
+    - **fps**: Fotogramas por segundo (de 0.1 a 100)
+    - **loop**: Repeticiones; 0 repite indefinidamente (no se aplica a MP4)
+    - **normalize**, **colormap**, **crop**, **stride**, **max_width**, **max_height**,
+      **quality**, **lossless**...: Como en `/convert`, aplicados a cada fotograma
+    """
+    path = await spool_request_body(request, settings.LARGE_MATRIX_MAX_SIZE, settings.LARGE_MATRIX_SPOOL_DIR)
+    return await MatrixController.convert_animation(path, output_format, fps, loop, options)
+
+@router.websocket("/convert/frames")
+async def convert_frames(
+    websocket: WebSocket,
+    output_format: str = Query("png"),
+    max_pending: Optional[int] = Query(None, ge=1),
+    options: ConversionOptions = Depends(conversion_options),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Convierte una secuencia de fotogramas (simulaciones, vídeo) por una sola conexión.
+
+    La clave API y las opciones se comprueban una vez, en el handshake. Cada
+    mensaje binario es un fotograma: longitud de la cabecera (4 bytes,
+    little-endian), cabecera JSON con `dtype`, `shape` y `seq` opcional, y los
+    píxeles crudos. Cada imagen vuelve con el mismo formato; si el cliente
+    envía más deprisa de lo que se convierte, se descartan los fotogramas más
+    antiguos (`dropped` en la cabecera de la respuesta).
+
+    - **output_format**: Formato de salida de las imágenes
+    - **max_pending**: Fotogramas en espera antes de descartar (por defecto `FRAMES_MAX_PENDING`)
+    - **normalize**, **colormap**, **crop**, **profile**...: Como en `/convert`
+    """
+    FrameController.check_options(output_format, options)
+    await FrameController.stream_frames(websocket, output_format, options, max_pending)
+
+_BATCH_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "object", "properties": {"matrices": {"type": "array"}}}},
+            "application/x-npy": {"schema": {"type": "string", "format": "binary"}},
+            "application/x-npz": {"schema": {"type": "string", "format": "binary"}},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                }
+            },
+        },
+    }
+}
+
+@router.post("/convert/batch", summary="Convertir un lote de matrices a imágenes", openapi_extra=_BATCH_REQUEST_BODY)
+async def convert_batch(
+    request: Request,
+    output_format: str = Query("png"),
+    response_format: str = Query("zip"),
+    options: ConversionOptions = Depends(conversion_options),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Convierte varias matrices en una sola solicitud, en paralelo.
+    
+    - **body**: Lista JSON (o `{"matrices": [...]}`, cada elemento una matriz o
+      `{"id": ..., "matrix": [...]}`), `.npy` apilado con el lote en el primer
+      eje (`application/x-npy`), `.npz` con un array por elemento
+      (`application/x-npz`) o formulario multipart con un archivo por elemento
+    - **output_format**: Formato de salida de las imágenes (png, jpeg, etc.)
+    - **response_format**: `zip` (imágenes y `manifest.json`), `multipart`
+      (multipart/mixed) o `ndjson` (una línea JSON por imagen, en base64)
+    - **normalize**, **percentiles**, **window**, **level**: Normalización común
+      a todo el lote (como en `/convert`)
+    
+    Los errores de un elemento se informan en la respuesta sin hacer fallar el lote.
     """
     try:
-        return await MatrixController.convert_matrix(matrix, format, output_format)
+        items = await read_batch_request(request)
+        return await MatrixController.convert_batch(items, output_format, response_format, options)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/tiles", summary="Crear una pirámide de teselas", openapi_extra=_MATRIX_REQUEST_BODY)
+async def create_tile_pyramid(
+    request: Request,
+    format: Optional[str] = Query(None),
+    tile_size: Optional[int] = Query(None),
+    options: ConversionOptions = Depends(conversion_options),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Crea una pirámide de teselas multirresolución (Deep Zoom / XYZ) a partir de una matriz.
+    
+    Devuelve el identificador de la pirámide y sus URL; los niveles y las
+    teselas se generan al pedirlos.
+    
+    - **body**: Matriz como en `/convert`; un `.npy` (`application/x-npy`) se
+      guarda en disco y se lee proyectado, hasta `LARGE_MATRIX_MAX_SIZE`
+    - **tile_size**: Lado de las teselas (por defecto `TILE_SIZE`)
+    - **normalize**, **percentiles**, **window**, **level**, **colormap**: Como en `/convert`
+    - **crop**, **stride**: Como en `/convert` (`max_width` y `max_height` no se admiten)
+    """
+    if is_npy_request(request):
+        path = await spool_request_body(request, settings.LARGE_MATRIX_MAX_SIZE, settings.LARGE_MATRIX_SPOOL_DIR)
+        return await MatrixController.create_tile_pyramid(None, None, tile_size, options, path=path)
+    try:
+        matrix, format = await read_matrix_request(request, format)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await MatrixController.create_tile_pyramid(matrix, format, tile_size, options)
+
+@router.get("/tiles/{pyramid_id}.dzi", summary="Descriptor Deep Zoom de una pirámide")
+async def get_tile_pyramid_dzi(pyramid_id: str, api_key: str = Depends(verify_api_key)):
+    """
+    Devuelve el descriptor `.dzi`; sus teselas están en `/tiles/{id}_files/{z}/{x}_{y}.png`,
+    la ruta que esperan los visores Deep Zoom como OpenSeadragon.
+    """
+    pyramid = MatrixController.get_tile_pyramid(pyramid_id)
+    return Response(content=pyramid.dzi(), media_type="application/xml")
+
+@router.get("/tiles/{pyramid_id}.zip", summary="Exportar una pirámide completa")
+async def export_tile_pyramid(pyramid_id: str, api_key: str = Depends(verify_api_key)):
+    """
+    Genera todas las teselas y las devuelve en un ZIP con la estructura de Deep Zoom
+    (`{id}.dzi` y `{id}_files/{z}/{x}_{y}.png`).
+    """
+    return await MatrixController.export_tile_pyramid(pyramid_id)
+
+@router.get("/tiles/{pyramid_id}", summary="Metadatos de una pirámide de teselas")
+async def get_tile_pyramid(pyramid_id: str, api_key: str = Depends(verify_api_key)):
+    """
+    Devuelve el tamaño, el tamaño de tesela y los niveles de la pirámide.
+    """
+    return MatrixController.get_tile_pyramid(pyramid_id).metadata()
+
+@router.get("/tiles/{pyramid_id}/{z}/{x}/{y}.png", summary="Tesela de una pirámide")
+async def get_tile(
+    request: Request,
+    pyramid_id: str,
+    z: int,
+    x: int,
+    y: int,
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Devuelve una tesela PNG, generándola (y su nivel) la primera vez que se pide.
+    
+    - **z**: Nivel de Deep Zoom (`max_level` es la imagen completa; desde
+      `min_level` la imagen cabe en una tesela)
+    - **x**, **y**: Columna y fila de la tesela
+    """
+    return await MatrixController.get_tile(pyramid_id, z, x, y, request.headers.get("if-none-match"))
+
+@router.get("/tiles/{pyramid_id}_files/{z}/{x}_{y}.png", summary="Tesela de una pirámide (ruta Deep Zoom)")
+async def get_dzi_tile(
+    request: Request,
+    pyramid_id: str,
+    z: int,
+    x: int,
+    y: int,
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Igual que `/tiles/{id}/{z}/{x}/{y}.png`, con la ruta que deriva un visor Deep Zoom del `.dzi`.
+    """
+    return await MatrixController.get_tile(pyramid_id, z, x, y, request.headers.get("if-none-match"))
+
+@router.get("/cache/stats", summary="Estadísticas de la caché de resultados")
+async def cache_stats(api_key: str = Depends(verify_api_key)):
+    """
+    Devuelve los contadores de la caché de conversiones (aciertos, fallos,
+    expulsiones y ocupación en memoria y en disco).
+    """
+    cache = get_result_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
 @router.post("/verify", summary="Verificar transformación imagen-matriz-imagen")
 async def verify_transformation(
     image: UploadFile = File(...),
     preprocess: Optional[str] = Form(None),
+    mode: str = Form("fast"),
     api_key: str = Depends(verify_api_key)
 ):
     """
@@ -41,29 +326,140 @@ async def verify_transformation(
     
     - **image**: Archivo de imagen a procesar
     - **preprocess**: Opciones de preprocesamiento separadas por comas
+    - **mode**: `fast` o `figure` (imagen de comparación, esta última con matplotlib)
+      o `metrics` (JSON con MSE, PSNR, SSIM y estadísticas, sin renderizar)
     """
     try:
-        return await MatrixController.verify_transformation(image, preprocess, api_key)
+        return await MatrixController.verify_transformation(image, preprocess, api_key, mode)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/compare", summary="Comparar imagen original con reconstruida")
 async def compare_images(
-    matrix: Dict[str, Any] = Body(...),
+    matrix: UploadFile = File(...),
     original_image: UploadFile = File(...),
     format: str = Form("json"),
     preprocess: Optional[str] = Form(None),
+    mode: str = Form("fast"),
     api_key: str = Depends(verify_api_key)
 ):
     """
     Genera una comparación entre la imagen original y la reconstruida desde la matriz.
     
-    - **matrix**: Datos de la matriz en formato JSON
+    - **matrix**: Archivo con la matriz (JSON con la clave `matrix` o `.npy`)
     - **original_image**: Archivo de imagen original
     - **format**: Formato de entrada de la matriz (json, numpy)
     - **preprocess**: Opciones de preprocesamiento aplicadas (opcional)
+    - **mode**: `fast` o `figure` (imagen de comparación, esta última con matplotlib)
+      o `metrics` (JSON con MSE, PSNR, SSIM y estadísticas, sin renderizar)
     """
     try:
-        return await MatrixController.generate_comparison(matrix, original_image, format, preprocess)
+        matrix_data = await matrix.read()
+        return await MatrixController.generate_comparison(
+            matrix_data, original_image, format, preprocess, mode
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _job_accepted(request: Request, record: JobRecord) -> JSONResponse:
+    """202 con el estado inicial del trabajo y su URL de sondeo en Location."""
+    return JSONResponse(
+        status_code=202,
+        content=record.to_dict(),
+        headers={"Location": str(request.url_for("get_job", job_id=record.id))}
+    )
+
+@router.post("/jobs/convert", summary="Encolar una conversión", status_code=202, openapi_extra=_MATRIX_REQUEST_BODY)
+async def create_convert_job(
+    request: Request,
+    format: Optional[str] = Query(None),
+    output_format: str = Query("png"),
+    priority: int = Query(5),
+    options: ConversionOptions = Depends(conversion_options),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Acepta la misma entrada que `/convert` y devuelve de inmediato el trabajo
+    (`202`, con su URL en `Location`). La imagen se obtiene de
+    `/jobs/{id}/result` cuando el estado es `succeeded`.
+
+    - **priority**: De 0 a 9; los trabajos de mayor prioridad se ejecutan antes
+    """
+    try:
+        matrix, format = await read_matrix_request(request, format)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    record = await JobController.submit_convert(matrix, format, output_format, options, priority)
+    return _job_accepted(request, record)
+
+@router.post("/jobs/compare", summary="Encolar una comparación", status_code=202)
+async def create_compare_job(
+    request: Request,
+    matrix: UploadFile = File(...),
+    original_image: UploadFile = File(...),
+    format: str = Form("json"),
+    preprocess: Optional[str] = Form(None),
+    mode: str = Form("fast"),
+    priority: int = Form(5),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Acepta la misma entrada que `/compare` y devuelve de inmediato el trabajo.
+
+    - **priority**: De 0 a 9; los trabajos de mayor prioridad se ejecutan antes
+    """
+    record = await JobController.submit_compare(
+        await matrix.read(), await original_image.read(), original_image.filename,
+        original_image.content_type, format, preprocess, mode, priority
+    )
+    return _job_accepted(request, record)
+
+@router.post("/jobs/verify", summary="Encolar una verificación imagen-matriz-imagen", status_code=202)
+async def create_verify_job(
+    request: Request,
+    image: UploadFile = File(...),
+    preprocess: Optional[str] = Form(None),
+    mode: str = Form("fast"),
+    priority: int = Form(5),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Acepta la misma entrada que `/verify` y devuelve de inmediato el trabajo,
+    sin esperar a la ida y vuelta con ImageToMatrix.
+
+    - **priority**: De 0 a 9; los trabajos de mayor prioridad se ejecutan antes
+    """
+    record = await JobController.submit_verify(
+        await image.read(), image.filename, image.content_type, preprocess, api_key, mode, priority
+    )
+    return _job_accepted(request, record)
+
+@router.get("/jobs/{job_id}", summary="Estado de un trabajo")
+async def get_job(job_id: str, api_key: str = Depends(verify_api_key)):
+    """
+    Devuelve el estado (`queued`, `running`, `succeeded`, `failed` o
+    `cancelled`), el progreso, los tiempos y, si falló, el código y el error
+    que habría devuelto el endpoint síncrono.
+    """
+    return await JobController.get_job(job_id)
+
+@router.get("/jobs/{job_id}/result", summary="Resultado de un trabajo")
+async def get_job_result(job_id: str, api_key: str = Depends(verify_api_key)):
+    """
+    Devuelve el resultado con el tipo de contenido del endpoint síncrono
+    (`409` si el trabajo no ha terminado con éxito).
+    """
+    return await JobController.get_result(job_id)
+
+@router.delete("/jobs/{job_id}", summary="Cancelar o eliminar un trabajo")
+async def delete_job(job_id: str, api_key: str = Depends(verify_api_key)):
+    """
+    Cancela un trabajo en cola o elimina uno terminado junto con su resultado.
+    """
+    return await JobController.cancel_job(job_id)
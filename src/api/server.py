@@ -0,0 +1,200 @@
+"""
+Servidor de producción: varios procesos de uvicorn creados con fork.
+
+El proceso principal limita los hilos de las bibliotecas nativas, importa la
+aplicación, la calienta (``warm_up``) y abre el socket; después crea los
+workers con fork, que heredan todo eso ya hecho y comparten el socket. Cada
+worker arranca su propio ciclo de vida (motor de ejecución y cliente de
+ImageToMatrix) y se recicla tras ``SERVER_MAX_REQUESTS`` solicitudes para
+acotar la memoria que dejan las matrices grandes.
+
+Con SIGTERM o SIGINT el proceso principal lo reenvía a los workers, que dejan
+de aceptar conexiones y terminan las solicitudes en curso durante
+``SERVER_GRACEFUL_TIMEOUT`` segundos; los que sigan vivos después se matan.
+
+Uso::
+
+    python -m src.api.server
+"""
+import logging
+import os
+import signal
+import time
+from typing import Dict, Optional
+
+from src.config.settings import Settings, get_settings
+from src.utils.logging_config import stop_logging
+
+logger = logging.getLogger("matrix_to_image.server")
+
+# Variables que leen OpenBLAS, MKL, OpenMP y numexpr al cargarse
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+# Margen sobre SERVER_GRACEFUL_TIMEOUT antes de matar a los workers que no terminan
+_KILL_MARGIN = 5.0
+# Espera antes de recrear un worker que ha fallado (evita un bucle de forks)
+_RESPAWN_DELAY = 1.0
+
+
+def available_cpus() -> int:
+    """Núcleos que puede usar el proceso (respeta la afinidad de CPU del contenedor)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def worker_count(settings: Settings, cpus: Optional[int] = None) -> int:
+    """
+    Procesos de uvicorn: ``SERVER_WORKERS`` o, si es 0, los necesarios para que
+    los hilos de sus motores de ejecución cubran los núcleos sin sobrepasarlos.
+    """
+    if settings.SERVER_WORKERS > 0:
+        return settings.SERVER_WORKERS
+    cpus = cpus or available_cpus()
+    return max(1, cpus // max(1, settings.EXECUTION_WORKERS))
+
+
+def native_threads(settings: Settings, workers: int, cpus: Optional[int] = None) -> int:
+    """
+    Hilos de BLAS/OpenMP/OpenCV por tarea: ``NATIVE_THREADS`` o, si es 0, los
+    núcleos que sobran tras repartirlos entre todas las tareas simultáneas.
+    """
+    if settings.NATIVE_THREADS > 0:
+        return settings.NATIVE_THREADS
+    cpus = cpus or available_cpus()
+    return max(1, cpus // (workers * max(1, settings.EXECUTION_WORKERS)))
+
+
+def limit_native_threads(threads: int) -> None:
+    """
+    Fija los hilos de las bibliotecas nativas. Debe invocarse antes de importar
+    NumPy (OpenBLAS lee las variables al cargarse); las que ya estén definidas
+    en el entorno se respetan.
+    """
+    for name in _THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(threads))
+
+
+class PreforkServer:
+    """Proceso principal: crea los workers, recrea los que terminan y los detiene con SIGTERM."""
+
+    def __init__(self, config, workers: int, graceful_timeout: float):
+        """
+        Args:
+            config: ``uvicorn.Config`` de los workers (con la aplicación ya importada)
+            workers: Número de procesos
+            graceful_timeout: Segundos para terminar las solicitudes en curso al parar
+        """
+        self.config = config
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.children: Dict[int, int] = {}  # pid -> índice del worker
+        self.stopping = False
+        self.stop_deadline: Optional[float] = None
+
+    def run(self) -> None:
+        sock = self.config.bind_socket()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        logger.info(
+            "Servidor de producción en %s:%d con %d workers", self.config.host, self.config.port, self.workers
+        )
+        for index in range(self.workers):
+            self._spawn(index, sock)
+
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                if self.stop_deadline is not None and time.monotonic() > self.stop_deadline:
+                    for child in self.children:
+                        logger.warning("El worker %d no terminó a tiempo: se mata", child)
+                        try:
+                            os.kill(child, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+                    self.stop_deadline = None
+                time.sleep(0.1)
+                continue
+
+            index = self.children.pop(pid, None)
+            if index is None or self.stopping:
+                continue
+            # Un worker reciclado tras SERVER_MAX_REQUESTS sale con código 0
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0:
+                logger.error("El worker %d terminó con código %d; se recrea", pid, code)
+                time.sleep(_RESPAWN_DELAY)
+            self._spawn(index, sock)
+
+        sock.close()
+        logger.info("Servidor detenido")
+
+    def _spawn(self, index: int, sock) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._run_worker(sock)
+            except BaseException:
+                logger.exception("Error en el worker")
+                code = 1
+            finally:
+                stop_logging()
+                os._exit(code)
+        self.children[pid] = index
+
+    def _run_worker(self, sock) -> None:
+        import uvicorn
+
+        # uvicorn instala sus propios manejadores de SIGTERM/SIGINT con cierre
+        # ordenado y al terminar vuelve a lanzar la señal con los anteriores:
+        # ignorarla deja que el worker salga por _spawn y vacíe su registro
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        uvicorn.Server(self.config).run(sockets=[sock])
+
+    def _handle_stop(self, signum, frame) -> None:
+        if self.stopping:
+            return
+        self.stopping = True
+        self.stop_deadline = time.monotonic() + self.graceful_timeout + _KILL_MARGIN
+        logger.info("Señal %d: deteniendo %d workers", signum, len(self.children))
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+def serve(settings: Optional[Settings] = None) -> None:
+    """Arranca el servidor de producción con la configuración de ``Settings``."""
+    settings = settings or get_settings()
+    workers = worker_count(settings)
+    threads = native_threads(settings, workers)
+    limit_native_threads(threads)
+
+    import uvicorn
+
+    from src.api.app import app
+    from src.services.warmup import warm_up
+    from src.utils.lazy_import import cv2
+
+    warm_up()
+    cv2.setNumThreads(threads)
+
+    config = uvicorn.Config(
+        app,
+        host=settings.API_HOST,
+        port=settings.API_PORT,
+        # El registro lo llevan logging_config y LoggingMiddleware
+        log_config=None,
+        access_log=False,
+        limit_max_requests=settings.SERVER_MAX_REQUESTS or None,
+        limit_max_requests_jitter=settings.SERVER_MAX_REQUESTS_JITTER,
+        timeout_graceful_shutdown=int(settings.SERVER_GRACEFUL_TIMEOUT),
+        ws_max_size=settings.FRAMES_MAX_BYTES,
+    )
+    PreforkServer(config, workers, settings.SERVER_GRACEFUL_TIMEOUT).run()
+
+
+if __name__ == "__main__":
+    serve()
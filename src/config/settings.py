@@ -2,7 +2,7 @@
 Configuraciones de la aplicación.
 """
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 from functools import lru_cache
 import os
 
@@ -12,10 +12,21 @@ class Settings(BaseSettings):
     API_PORT: int = 8001  # Usando puerto 8001 para evitar conflicto con ImageToMatrix
     DEBUG: bool = False
     LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" (una línea JSON por registro) o "text"
+    LOG_SAMPLE_RATE: float = 1.0  # Fracción de solicitudes correctas que se registran (errores y lentas siempre)
+    LOG_SLOW_REQUEST_MS: float = 1000.0  # Solicitudes más lentas se registran siempre, como WARNING
+    WARMUP_ON_STARTUP: bool = False  # Importa OpenCV, matplotlib y httpx y genera las LUT al arrancar
     
+    # Servidor de producción (python -m src.api.server)
+    SERVER_WORKERS: int = 0  # Procesos de uvicorn (0: núcleos disponibles / EXECUTION_WORKERS)
+    SERVER_MAX_REQUESTS: int = 10000  # Solicitudes tras las que se recicla un worker (0: sin límite)
+    SERVER_MAX_REQUESTS_JITTER: int = 1000  # Variación aleatoria para no reciclar todos a la vez
+    SERVER_GRACEFUL_TIMEOUT: float = 30.0  # Segundos para terminar las solicitudes en curso tras SIGTERM
+    NATIVE_THREADS: int = 0  # Hilos de BLAS/OpenMP/OpenCV por tarea (0: núcleos / tareas simultáneas)
+
     # Límites y parámetros
     MAX_MATRIX_SIZE: int = 100 * 1024 * 1024  # 100MB
-    ALLOWED_FORMATS: List[str] = ["json", "numpy"]
+    ALLOWED_FORMATS: List[str] = ["json", "numpy", "raw"]
     
     # Seguridad
     API_KEY_HEADER: str = "X-API-Key"
@@ -23,6 +34,76 @@ class Settings(BaseSettings):
 
     # URL del servicio de ImageToMatrix
     IMAGE_TO_MATRIX_URL: str = "http://localhost:8000/api/v1/convert"
+
+    # Cliente HTTP hacia ImageToMatrix (persistente durante la vida de la aplicación)
+    UPSTREAM_MAX_CONNECTIONS: int = 20
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    UPSTREAM_KEEPALIVE_EXPIRY: float = 30.0  # Segundos que una conexión inactiva sigue abierta
+    UPSTREAM_CONNECT_TIMEOUT: float = 5.0
+    UPSTREAM_READ_TIMEOUT: float = 30.0
+    UPSTREAM_RETRIES: int = 2  # Reintentos ante errores de red o 502/503/504
+    UPSTREAM_BACKOFF: float = 0.2  # Espera base en segundos entre reintentos (exponencial)
+    UPSTREAM_BREAKER_THRESHOLD: int = 5  # Fallos consecutivos que abren el circuito
+    UPSTREAM_BREAKER_RESET_TIMEOUT: float = 30.0  # Segundos con el circuito abierto antes de reintentar
+    UPSTREAM_MATRIX_FORMAT: str = "auto"  # "auto" (.npy con alternativa JSON), "numpy" o "json"
+
+    # Motor de ejecución (trabajo de CPU fuera del event loop)
+    EXECUTION_BACKEND: str = "thread"  # "thread" o "process"
+    EXECUTION_WORKERS: int = 4
+    EXECUTION_QUEUE_SIZE: int = 8  # Tareas en espera admitidas además de las que están en ejecución
+    EXECUTION_RETRY_AFTER: int = 1  # Segundos sugeridos en Retry-After cuando el pool está saturado
+
+    # Respuestas por fragmentos
+    STREAM_THRESHOLD_BYTES: int = 16 * 1024 * 1024  # Matrices a partir de este tamaño se transmiten por fragmentos
+    STREAM_CHUNK_SIZE: int = 256 * 1024  # Tamaño mínimo de cada fragmento enviado
+    STREAM_MAX_PENDING_CHUNKS: int = 8  # Fragmentos en cola antes de pausar al codificador
+
+    # Secuencias de fotogramas por WebSocket (/convert/frames)
+    FRAMES_MAX_PENDING: int = 1  # Fotogramas en espera por conexión; al superarlos se descartan los más antiguos
+    FRAMES_MAX_BYTES: int = 64 * 1024 * 1024  # Tamaño máximo de cada mensaje (ws_max_size de uvicorn)
+
+    # Codificación de imágenes (valores por defecto de 'profile' y 'encoder')
+    ENCODER_PROFILE: str = "balanced"  # "fastest", "balanced" o "smallest"
+    ENCODER_BACKEND: str = "auto"  # "auto" (el más rápido por formato), "pillow" u "opencv"
+    
+    # Matrices más grandes que la memoria (/convert/large)
+    LARGE_MATRIX_MAX_SIZE: int = 64 * 1024 * 1024 * 1024  # 64GB: el .npy se guarda en disco, no en memoria
+    LARGE_MATRIX_MEMORY_LIMIT: int = 64 * 1024 * 1024  # Memoria de trabajo por conversión, sea cual sea el tamaño de la matriz
+    LARGE_MATRIX_SPOOL_DIR: Optional[str] = None  # Directorio de los archivos temporales (por defecto el del sistema)
+    LARGE_MATRIX_TILE_SIZE: int = 256  # Lado de las teselas del TIFF
+
+    # Animaciones a partir de pilas de fotogramas (/convert/animation)
+    ANIMATION_MAX_FRAMES: int = 10000  # Fotogramas admitidos por animación
+    ANIMATION_RENDER_THREADS: int = 2  # Fotogramas normalizados en paralelo por delante del codificador
+    ANIMATION_PALETTE_SAMPLES: int = 16  # Fotogramas muestreados para la paleta de los GIF en color
+    ANIMATION_MP4_FOURCC: str = "mp4v"  # Códec de cv2.VideoWriter ("avc1" si OpenCV tiene H.264)
+
+    # Pirámides de teselas (/tiles)
+    TILES_DIR: Optional[str] = None  # Directorio de las pirámides (por defecto, uno en el temporal del sistema)
+    TILE_SIZE: int = 256  # Lado de las teselas por defecto
+    TILES_MAX_PYRAMIDS: int = 32  # Pirámides conservadas en disco; se eliminan las menos usadas
+
+    # Trabajos asíncronos (/jobs)
+    JOBS_DIR: Optional[str] = None  # Estado (SQLite) y resultados; por defecto, uno en el temporal del sistema
+    JOBS_CONCURRENCY: int = 2  # Trabajos ejecutados a la vez por cada proceso
+    JOBS_MAX_QUEUED: int = 100  # Trabajos pendientes por proceso antes de responder 503
+    JOBS_RESULT_TTL: int = 3600  # Segundos que se conservan los resultados
+    JOBS_MAX_RETRIES: int = 3  # Reintentos de un trabajo cuando el motor está saturado o ImageToMatrix caído
+
+    # Conversión por lotes
+    BATCH_MAX_ITEMS: int = 1000  # Matrices admitidas por solicitud en /convert/batch
+
+    # Métricas de comparación
+    METRICS_TILE_ROWS: int = 512  # Filas por franja al calcular métricas de imágenes grandes
+
+    # Métricas de Prometheus (/metrics)
+    METRICS_ENABLED: bool = True
+    
+    # Caché de resultados (direccionada por contenido)
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_MAX_BYTES: int = 256 * 1024 * 1024  # 256MB en memoria
+    RESULT_CACHE_DIR: Optional[str] = None  # Directorio del nivel en disco (desactivado si es None)
+    RESULT_CACHE_DISK_MAX_BYTES: int = 2 * 1024 * 1024 * 1024  # 2GB en disco
     
     model_config = {
         "env_file": ".env",
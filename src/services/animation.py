@@ -0,0 +1,411 @@
+"""
+Animaciones (GIF, APNG, WebP y MP4) a partir de pilas de fotogramas.
+
+La matriz recibida es una serie temporal ``(T, alto, ancho)`` o
+``(T, alto, ancho, canales)`` guardada en disco como ``.npy`` y proyectada con
+``np.load(mmap_mode='r')``. El intervalo de normalización se calcula una vez
+para toda la pila, de modo que el brillo no salta entre fotogramas; después
+los fotogramas se normalizan en paralelo, unos pocos por delante del
+codificador, y se escriben de uno en uno. En memoria solo hay esos fotogramas
+adelantados, sea cual sea la duración de la animación.
+
+GIF y APNG con mapa de color o en escala de grises son imágenes indexadas: la
+paleta es la del mapa (o la escala de grises), se escribe una sola vez y cada
+fotograma se guarda con los índices que da la normalización. Para GIF de
+entradas RGB la paleta se calcula una vez con una muestra de fotogramas y se
+reutiliza en todos. WebP y MP4 reciben los fotogramas en color.
+"""
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, BinaryIO, Callable, Deque, Iterator, Optional
+
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+from src.config.settings import get_settings
+from src.services.binary_matrix import NPY_MAGIC, is_npy_buffer
+from src.services.colormaps import colorize, get_colormap_lut
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.services.encoders import encoder_params, zlib_level
+from src.services.execution_engine import get_execution_engine
+from src.services.normalization import Range, apply_range, release_rows, resolve_range
+from src.services.region import crop_and_stride, output_shape, select_region
+from src.services.streaming import stream_from_pool
+from src.services.strip_encoders import ApngWriter
+from src.utils.lazy_import import cv2
+
+ANIMATION_FORMATS = ("gif", "apng", "webp", "mp4")
+ANIMATION_MEDIA_TYPES = {"gif": "image/gif", "apng": "image/apng", "webp": "image/webp", "mp4": "video/mp4"}
+# Formatos que se escriben fotograma a fotograma y pueden transmitirse según se generan
+STREAMED_FORMATS = ("gif", "apng")
+MIN_FPS, MAX_FPS = 0.1, 100.0
+
+_GRAY_PALETTE = np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1)
+# Lado máximo de cada fotograma muestreado para calcular la paleta GIF
+_PALETTE_SAMPLE_SIZE = 128
+
+
+class _LazyFrames:
+    """
+    Fotogramas para el codificador WebP de Pillow, generados al pedirlos.
+
+    Pillow recorre ``n_frames`` con ``seek`` y usa el fotograma actual como
+    imagen: así no hace falta tener toda la secuencia en memoria.
+    """
+
+    def __init__(self, frames: Iterator[np.ndarray], count: int):
+        self._frames = frames
+        self._frame: Optional[Image.Image] = None
+        self.n_frames = count
+
+    def seek(self, index: int) -> None:
+        # Pillow los pide en orden, uno tras otro
+        self._frame = Image.fromarray(next(self._frames))
+
+    def __getattr__(self, name: str):
+        return getattr(self._frame, name)
+
+
+class GifWriter:
+    def __init__(self, fp: BinaryIO, width: int, height: int, palette: np.ndarray, fps: float = 10.0, loop: int = 0):
+        """
+        Escribe la cabecera del GIF con la paleta global; los fotogramas se añaden con ``write_frame``.
+
+        Args:
+            fp: Objeto tipo archivo de destino (basta con ``write``)
+            width: Ancho de los fotogramas
+            height: Alto de los fotogramas
+            palette: Paleta RGB (256 x 3, uint8) común a todos los fotogramas
+            fps: Fotogramas por segundo (GIF los guarda en centésimas de segundo)
+            loop: Repeticiones (0: indefinidamente)
+        """
+        self._fp = fp
+        self._size = (width, height)
+        self._palette = np.ascontiguousarray(palette, dtype=np.uint8).tobytes()
+        self._duration = round(1000.0 / fps)
+
+        # Cabecera, descriptor de pantalla con paleta global de 256 colores y
+        # extensión NETSCAPE2.0 con el número de repeticiones
+        fp.write(b"GIF89a" + width.to_bytes(2, "little") + height.to_bytes(2, "little") + b"\xf7\x00\x00")
+        fp.write(self._palette)
+        fp.write(b"!\xff\x0bNETSCAPE2.0\x03\x01" + loop.to_bytes(2, "little") + b"\x00")
+
+    def write_frame(self, indices: np.ndarray) -> None:
+        """
+        Añade un fotograma.
+
+        Args:
+            indices: Array uint8 (alto, ancho) con los índices de la paleta global
+        """
+        if indices.dtype != np.uint8 or indices.shape[::-1] != self._size:
+            raise ValueError(f"Fotograma no válido para un GIF de {self._size[0]}x{self._size[1]}: {indices.shape}")
+        frame = Image.fromarray(indices, mode="L").convert("P")
+        frame.putpalette(self._palette)
+        # Descriptor del fotograma y datos LZW, con la duración en su extensión de control
+        for block in GifImagePlugin.getdata(frame, duration=self._duration):
+            self._fp.write(block)
+
+    def close(self) -> None:
+        self._fp.write(b";")
+
+
+def _prefetch(render: Callable[[int], np.ndarray], count: int, threads: int) -> Iterator[np.ndarray]:
+    """
+    Genera los fotogramas en orden, normalizando hasta ``2 * threads`` por
+    delante del codificador en un pool de hilos propio.
+    """
+    if threads <= 1:
+        for index in range(count):
+            yield render(index)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="animation-frame")
+    pending: Deque[Future] = deque()
+    submitted = 0
+    try:
+        for _ in range(count):
+            while submitted < count and len(pending) < 2 * threads:
+                pending.append(executor.submit(render, submitted))
+                submitted += 1
+            yield pending.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class AnimationService:
+    @staticmethod
+    def open_stack(path: str) -> np.ndarray:
+        """
+        Proyecta en memoria una pila de fotogramas ``.npy`` (solo lectura) y valida su forma.
+
+        Raises:
+            ValueError: Si el archivo no es un ``.npy`` con forma ``(T, alto, ancho[, canales])``
+        """
+        with open(path, "rb") as fp:
+            if not is_npy_buffer(fp.read(len(NPY_MAGIC))):
+                raise ValueError("El cuerpo debe ser un archivo .npy")
+        try:
+            stack = np.load(path, mmap_mode="r", allow_pickle=False)
+        except Exception as e:
+            raise ValueError(f"Error al cargar matriz NumPy: {str(e)}")
+
+        if not isinstance(stack, np.ndarray):
+            raise ValueError("El archivo debe contener un único array .npy")
+        if stack.dtype.kind not in "biuf":
+            raise ValueError(f"Tipo de datos no admitido: {stack.dtype}")
+        if stack.ndim not in (3, 4) or (stack.ndim == 4 and stack.shape[3] not in (1, 3, 4)):
+            raise ValueError(
+                f"Dimensiones no compatibles: {stack.shape} (se espera (fotogramas, alto, ancho[, canales]))"
+            )
+        if stack.size == 0:
+            raise ValueError("La pila de fotogramas está vacía")
+        max_frames = get_settings().ANIMATION_MAX_FRAMES
+        if stack.shape[0] > max_frames:
+            raise ValueError(f"La animación supera el máximo de {max_frames} fotogramas")
+        return stack
+
+    @staticmethod
+    def select_view(stack: np.ndarray, options: ConversionOptions = DEFAULT_OPTIONS) -> np.ndarray:
+        """
+        Aplica ``crop`` y ``stride`` a todos los fotogramas como una vista de la pila.
+
+        Raises:
+            ValueError: Si el recorte queda fuera de los fotogramas
+        """
+        # El eje temporal pasa al final para recortar alto y ancho de una vez
+        return np.moveaxis(crop_and_stride(np.moveaxis(stack, 0, -1), options), -1, 0)
+
+    @staticmethod
+    def check_options(stack: np.ndarray, output_format: str, fps: float, options: ConversionOptions) -> None:
+        """
+        Rechaza las combinaciones que no admite la animación.
+
+        Raises:
+            ValueError: Si el formato, los fps o las opciones no son válidos
+        """
+        if output_format not in ANIMATION_FORMATS:
+            raise ValueError(f"Formato de animación no válido. Formatos permitidos: {', '.join(ANIMATION_FORMATS)}")
+        if not MIN_FPS <= fps <= MAX_FPS:
+            raise ValueError(f"'fps' debe estar entre {MIN_FPS} y {MAX_FPS}")
+        if options.normalize == "passthrough":
+            raise ValueError("Las animaciones son de 8 bits: el modo 'passthrough' no está admitido")
+        if options.colormap is not None and stack.ndim == 4 and stack.shape[3] != 1:
+            raise ValueError("Los mapas de color requieren una matriz de un solo canal")
+
+    @staticmethod
+    def _render_frame(
+        stack: np.ndarray,
+        index: int,
+        value_range: Optional[Range],
+        options: ConversionOptions,
+        indexed: bool
+    ) -> np.ndarray:
+        """
+        Recorta y normaliza un fotograma: índices de la paleta si ``indexed``,
+        píxeles uint8 (en color con mapa de color) en otro caso.
+        """
+        frame = select_region(np.asarray(stack[index]), options)
+        if frame.ndim == 3 and frame.shape[2] == 1:
+            frame = frame[:, :, 0]
+        if options.colormap is not None and not indexed:
+            pixels = colorize(frame, value_range or (0.0, 255.0), options.colormap)
+        elif value_range is None:
+            # Ya son píxeles uint8 (o índices): se copian antes de liberar sus páginas
+            pixels = np.array(frame)
+        else:
+            pixels = apply_range(frame, value_range, np.empty(frame.shape, dtype=np.uint8))
+        release_rows(stack, index, index + 1)
+        return pixels
+
+    @staticmethod
+    def _gif_palette(frames: Callable[[int], np.ndarray], count: int) -> Image.Image:
+        """
+        Paleta de 256 colores de una animación RGB, calculada una vez con una
+        muestra de fotogramas reducidos.
+        """
+        samples = get_settings().ANIMATION_PALETTE_SAMPLES
+        tiles = []
+        for index in np.unique(np.linspace(0, count - 1, max(1, samples)).astype(int)):
+            pixels = frames(int(index))[:, :, :3]
+            step = max(1, max(pixels.shape[:2]) // _PALETTE_SAMPLE_SIZE)
+            tiles.append(np.ascontiguousarray(pixels[::step, ::step]).reshape(-1, 3))
+        mosaic = Image.fromarray(np.concatenate(tiles)[None, :, :], mode="RGB")
+        return mosaic.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+
+    @staticmethod
+    def encode_animation(
+        path: str,
+        output_format: str,
+        fp: BinaryIO,
+        fps: float = 10.0,
+        loop: int = 0,
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> None:
+        """
+        Convierte la pila ``.npy`` de ``path`` en una animación escrita en ``fp``.
+
+        Args:
+            path: Ruta del ``.npy``
+            output_format: 'gif', 'apng' o 'webp' (MP4 necesita una ruta: ``encode_to_path``)
+            fp: Objeto tipo archivo de destino
+            fps: Fotogramas por segundo
+            loop: Repeticiones (0: indefinidamente)
+            options: Opciones de conversión (normalización, mapa de color, región y codificador)
+        """
+        stack = AnimationService.open_stack(path)
+        AnimationService.check_options(stack, output_format, fps, options)
+        if output_format == "mp4":
+            raise ValueError("El vídeo MP4 se escribe en un archivo: use encode_to_path")
+
+        value_range = resolve_range(AnimationService.select_view(stack, options), options)
+        channels = stack.shape[3] if stack.ndim == 4 else 1
+        # Mapa de color o escala de grises: GIF y APNG guardan directamente los índices
+        indexed = channels == 1 and output_format in ("gif", "apng")
+        palette = None
+        if indexed:
+            palette = get_colormap_lut(options.colormap) if options.colormap is not None else _GRAY_PALETTE
+
+        def render(index: int) -> np.ndarray:
+            return AnimationService._render_frame(stack, index, value_range, options, indexed)
+
+        count = stack.shape[0]
+        threads = get_settings().ANIMATION_RENDER_THREADS
+        height, width = output_shape(stack.shape[1:], options)[:2]
+
+        if output_format == "gif":
+            if not indexed:
+                quantized = AnimationService._gif_palette(render, count)
+                palette = np.array(quantized.getpalette()[:768], dtype=np.uint8).reshape(-1, 3)
+                palette = np.pad(palette, ((0, 256 - len(palette)), (0, 0)))
+            writer = GifWriter(fp, width, height, palette, fps, loop)
+            for pixels in _prefetch(render, count, threads):
+                if not indexed:
+                    # Sin tramado: los colores de un fotograma no parpadean en el siguiente
+                    image = Image.fromarray(np.ascontiguousarray(pixels[:, :, :3]), mode="RGB")
+                    pixels = np.asarray(image.quantize(palette=quantized, dither=Image.Dither.NONE))
+                writer.write_frame(pixels)
+            writer.close()
+        elif output_format == "apng":
+            writer = ApngWriter(
+                fp, width, height, count, 1 if indexed else channels, palette, fps, loop,
+                compress_level=zlib_level(options)
+            )
+            for pixels in _prefetch(render, count, threads):
+                writer.write_frame(pixels)
+            writer.close()
+        else:
+            frames = _prefetch(render, count, threads)
+            first = Image.fromarray(next(frames))
+            first.save(
+                fp,
+                format="WEBP",
+                save_all=True,
+                append_images=[_LazyFrames(frames, count - 1)] if count > 1 else [],
+                duration=round(1000.0 / fps),
+                loop=loop,
+                **encoder_params("webp", options),
+            )
+
+    @staticmethod
+    def _encode_mp4(path: str, output_path: str, fps: float, options: ConversionOptions) -> None:
+        """Escribe el vídeo con ``cv2.VideoWriter`` (necesita un archivo, no un flujo)."""
+        stack = AnimationService.open_stack(path)
+        AnimationService.check_options(stack, "mp4", fps, options)
+        value_range = resolve_range(AnimationService.select_view(stack, options), options)
+
+        def render(index: int) -> np.ndarray:
+            return AnimationService._render_frame(stack, index, value_range, options, False)
+
+        settings = get_settings()
+        writer = None
+        try:
+            for pixels in _prefetch(render, stack.shape[0], settings.ANIMATION_RENDER_THREADS):
+                if pixels.ndim == 2:
+                    pixels = cv2.cvtColor(pixels, cv2.COLOR_GRAY2BGR)
+                else:
+                    pixels = cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR if pixels.shape[2] == 3 else cv2.COLOR_RGBA2BGR)
+                if writer is None:
+                    height, width = pixels.shape[:2]
+                    writer = cv2.VideoWriter(
+                        output_path, cv2.VideoWriter_fourcc(*settings.ANIMATION_MP4_FOURCC), fps, (width, height)
+                    )
+                    if not writer.isOpened():
+                        raise ValueError(
+                            f"OpenCV no puede escribir MP4 con el códec '{settings.ANIMATION_MP4_FOURCC}'"
+                        )
+                writer.write(pixels)
+        finally:
+            if writer is not None:
+                writer.release()
+
+    @staticmethod
+    def encode_to_path(
+        path: str,
+        output_format: str,
+        output_path: str,
+        fps: float = 10.0,
+        loop: int = 0,
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> None:
+        if output_format == "mp4":
+            AnimationService._encode_mp4(path, output_path, fps, options)
+            return
+        with open(output_path, "wb") as fp:
+            AnimationService.encode_animation(path, output_format, fp, fps, loop, options)
+
+    @staticmethod
+    async def render_to_file(
+        path: str,
+        output_format: str,
+        fps: float = 10.0,
+        loop: int = 0,
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> str:
+        """
+        Genera la animación en el motor de ejecución y la deja en un archivo temporal.
+
+        Returns:
+            Ruta de la animación generada (la elimina quien la sirve)
+
+        Raises:
+            PoolSaturatedError: Si el motor de ejecución está saturado
+        """
+        settings = get_settings()
+        fd, output_path = tempfile.mkstemp(suffix=f".{output_format}", dir=settings.LARGE_MATRIX_SPOOL_DIR)
+        os.close(fd)
+        try:
+            await get_execution_engine().run(
+                AnimationService.encode_to_path, path, output_format, output_path, fps, loop, options
+            )
+        except BaseException:
+            os.remove(output_path)
+            raise
+        return output_path
+
+    @staticmethod
+    def stream_animation(
+        path: str,
+        output_format: str,
+        fps: float = 10.0,
+        loop: int = 0,
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> AsyncIterator[bytes]:
+        """
+        Genera un GIF o APNG y lo entrega por fragmentos según se escriben los fotogramas.
+
+        Returns:
+            Iterador asíncrono de fragmentos de la animación
+        """
+        settings = get_settings()
+        return stream_from_pool(
+            AnimationService.encode_animation,
+            path,
+            output_format,
+            fps=fps,
+            loop=loop,
+            options=options,
+            chunk_size=settings.STREAM_CHUNK_SIZE,
+            max_pending=settings.STREAM_MAX_PENDING_CHUNKS,
+        )
@@ -0,0 +1,203 @@
+"""
+Servicio para la conversión de lotes de matrices.
+
+Cada elemento del lote se parsea, valida y codifica en el motor de ejecución
+con concurrencia limitada; los resultados se entregan según terminan y los
+errores se informan por elemento sin abortar el lote. El cuerpo de la
+respuesta se genera de forma incremental como ZIP, multipart/mixed o NDJSON.
+"""
+import base64
+import json
+import re
+import uuid
+import zipfile
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException
+
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.services.execution_engine import get_execution_engine
+from src.services.matrix_service import MatrixService
+from src.utils.validation import validate_matrix_layout, validate_output_channels
+
+BATCH_RESPONSE_FORMATS = ("zip", "multipart", "ndjson")
+
+_UNSAFE_ID_CHARS = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class BatchItem(NamedTuple):
+    id: str
+    data: Any  # ndarray, {"matrix": [...]} o bytes JSON/.npy
+    format: str
+
+
+class BatchResult(NamedTuple):
+    index: int
+    id: str
+    content: Optional[bytes]
+    content_type: Optional[str]
+    error: Optional[str]
+
+
+def _render_batch_item(item: BatchItem, output_format: str, options: ConversionOptions) -> bytes:
+    """Parsea, valida y codifica un elemento del lote (se ejecuta en el pool)."""
+    matrix = MatrixService._parse_matrix_input(item.data, item.format)
+    validate_matrix_layout(matrix.shape, matrix.dtype)
+    validate_output_channels(matrix.shape, output_format)
+    return MatrixService._convert_matrix_to_image_bytes(matrix, output_format, options=options)
+
+
+def _error_message(error: BaseException) -> str:
+    if isinstance(error, HTTPException):
+        return str(error.detail)
+    return str(error)
+
+
+def _safe_id(item_id: str) -> str:
+    """Identificador apto para nombres de archivo y cabeceras."""
+    return _UNSAFE_ID_CHARS.sub("_", item_id)[:64]
+
+
+def _item_filename(result: BatchResult, output_format: str) -> str:
+    """Nombre seguro del archivo de un elemento dentro del ZIP o del multipart."""
+    return f"{result.index:05d}_{_safe_id(result.id)}.{output_format.lower()}"
+
+
+class _ChunkSink:
+    """Destino de escritura no posicionable que acumula los bytes pendientes de enviar."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class BatchService:
+    @staticmethod
+    async def convert_batch(
+        items: List[BatchItem],
+        output_format: str = "png",
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> AsyncIterator[BatchResult]:
+        """
+        Convierte un lote de matrices a imágenes en paralelo.
+
+        Args:
+            items: Elementos del lote
+            output_format: Formato de salida de las imágenes
+            options: Opciones de conversión comunes a todo el lote
+
+        Yields:
+            BatchResult de cada elemento, en orden de finalización
+
+        Raises:
+            PoolSaturatedError: Si el motor de ejecución no admite el lote
+        """
+        content_type = f"image/{output_format}"
+        results = get_execution_engine().map_unordered(
+            _render_batch_item, ((item, output_format, options) for item in items)
+        )
+        async for index, content, error in results:
+            item_id = items[index].id
+            if error is not None:
+                yield BatchResult(index, item_id, None, None, _error_message(error))
+            else:
+                yield BatchResult(index, item_id, content, content_type, None)
+
+    @staticmethod
+    async def zip_stream(
+        results: AsyncIterator[BatchResult],
+        output_format: str
+    ) -> AsyncIterator[bytes]:
+        """
+        Genera un ZIP con una imagen por elemento y un ``manifest.json`` con
+        el estado de cada uno. Las entradas se emiten según terminan, usando
+        descriptores de datos para no necesitar un destino posicionable.
+        """
+        sink = _ChunkSink()
+        manifest: List[Dict[str, Any]] = []
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+            async for result in results:
+                entry = {"index": result.index, "id": result.id}
+                if result.error is None:
+                    entry["status"] = "ok"
+                    entry["filename"] = _item_filename(result, output_format)
+                    archive.writestr(entry["filename"], result.content)
+                else:
+                    entry["status"] = "error"
+                    entry["error"] = result.error
+                manifest.append(entry)
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+
+            manifest.sort(key=lambda entry: entry["index"])
+            failed = sum(1 for entry in manifest if entry["status"] == "error")
+            archive.writestr(
+                "manifest.json",
+                json.dumps({
+                    "output_format": output_format,
+                    "succeeded": len(manifest) - failed,
+                    "failed": failed,
+                    "items": manifest,
+                }, indent=2),
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+        yield sink.drain()
+
+    @staticmethod
+    async def multipart_stream(
+        results: AsyncIterator[BatchResult],
+        output_format: str,
+        boundary: str
+    ) -> AsyncIterator[bytes]:
+        """
+        Genera un cuerpo multipart/mixed con una parte por elemento. Las
+        partes con error son JSON y llevan ``X-Item-Status: error``.
+        """
+        delimiter = f"--{boundary}\r\n".encode()
+        async for result in results:
+            headers = [f"X-Item-Index: {result.index}", f"X-Item-Id: {_safe_id(result.id)}"]
+            if result.error is None:
+                headers += [
+                    "X-Item-Status: ok",
+                    f"Content-Type: {result.content_type}",
+                    f'Content-Disposition: attachment; filename="{_item_filename(result, output_format)}"',
+                ]
+                body = result.content
+            else:
+                headers += ["X-Item-Status: error", "Content-Type: application/json"]
+                body = json.dumps({"index": result.index, "id": result.id, "error": result.error}).encode()
+            yield delimiter + "\r\n".join(headers).encode() + b"\r\n\r\n" + body + b"\r\n"
+        yield f"--{boundary}--\r\n".encode()
+
+    @staticmethod
+    async def ndjson_stream(results: AsyncIterator[BatchResult]) -> AsyncIterator[bytes]:
+        """Genera una línea JSON por elemento con la imagen en base64 o el error."""
+        async for result in results:
+            line = {"index": result.index, "id": result.id}
+            if result.error is None:
+                line.update({
+                    "status": "ok",
+                    "content_type": result.content_type,
+                    "size": len(result.content),
+                    "data": base64.b64encode(result.content).decode("ascii"),
+                })
+            else:
+                line.update({"status": "error", "error": result.error})
+            yield json.dumps(line).encode() + b"\n"
+
+    @staticmethod
+    def new_boundary() -> str:
+        """Genera un delimitador multipart aleatorio."""
+        return f"batch-{uuid.uuid4().hex}"
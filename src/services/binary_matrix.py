@@ -0,0 +1,119 @@
+"""
+Carga de matrices binarias (.npy o búfer crudo) sin copias intermedias.
+
+Las matrices se construyen con ``np.frombuffer`` directamente sobre los bytes
+recibidos, por lo que el array resultante comparte memoria con el búfer de
+entrada. Si el búfer es inmutable (``bytes``) el array será de solo lectura.
+"""
+import io
+from typing import NamedTuple, Tuple, Union
+
+import numpy as np
+
+NPY_MAGIC = b"\x93NUMPY"
+
+BufferLike = Union[bytes, bytearray, memoryview]
+
+
+class RawMatrixBuffer(NamedTuple):
+    """Búfer crudo de píxeles acompañado de su tipo y forma."""
+    buffer: BufferLike
+    dtype: str
+    shape: Tuple[int, ...]
+
+
+def is_npy_buffer(data: BufferLike) -> bool:
+    """Indica si el búfer comienza con la firma de un archivo .npy."""
+    return bytes(data[:len(NPY_MAGIC)]) == NPY_MAGIC
+
+
+def parse_shape(value: str) -> Tuple[int, ...]:
+    """
+    Convierte una forma textual ('480,640,3' o '480x640x3') en una tupla.
+
+    Raises:
+        ValueError: Si la forma no es válida
+    """
+    parts = [part for part in value.replace("x", ",").split(",") if part.strip()]
+    try:
+        shape = tuple(int(part) for part in parts)
+    except ValueError:
+        raise ValueError(f"Forma de matriz no válida: {value}")
+    if not shape or any(dim <= 0 for dim in shape):
+        raise ValueError(f"Forma de matriz no válida: {value}")
+    return shape
+
+
+def _check_dtype(dtype: np.dtype) -> np.dtype:
+    """Rechaza tipos que no sean numéricos simples (p. ej. objetos serializados)."""
+    if dtype.hasobject or dtype.kind not in "biuf":
+        raise ValueError(f"Tipo de datos no admitido: {dtype}")
+    return dtype
+
+
+def read_npy_header(data: BufferLike) -> Tuple[Tuple[int, ...], np.dtype, bool, int]:
+    """
+    Lee la cabecera de un .npy sin tocar los datos de la matriz.
+
+    Args:
+        data: Búfer con el contenido del archivo .npy
+
+    Returns:
+        Tupla (forma, dtype, orden Fortran, desplazamiento de los datos)
+
+    Raises:
+        ValueError: Si la cabecera no es válida o el tipo no está admitido
+    """
+    if not is_npy_buffer(data):
+        raise ValueError("El búfer no es un archivo .npy válido")
+
+    # Solo se copia la cabecera, nunca los datos
+    stream = io.BytesIO(bytes(data[:65536]))
+    version = np.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+    else:
+        raise ValueError(f"Versión de .npy no admitida: {version}")
+
+    return tuple(shape), _check_dtype(dtype), fortran_order, stream.tell()
+
+
+def load_npy_buffer(data: BufferLike) -> np.ndarray:
+    """
+    Construye la matriz de un .npy directamente sobre el búfer recibido.
+
+    Args:
+        data: Búfer con el contenido del archivo .npy
+
+    Returns:
+        Matriz NumPy que comparte memoria con ``data``
+    """
+    shape, dtype, fortran_order, offset = read_npy_header(data)
+    count = int(np.prod(shape, dtype=np.int64))
+    if len(data) - offset < count * dtype.itemsize:
+        raise ValueError("El archivo .npy está truncado")
+
+    matrix = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+    return matrix.reshape(shape, order="F" if fortran_order else "C")
+
+
+def load_raw_buffer(raw: RawMatrixBuffer) -> np.ndarray:
+    """
+    Construye la matriz de un búfer crudo con tipo y forma explícitos.
+
+    Args:
+        raw: Búfer, dtype y forma de la matriz
+
+    Returns:
+        Matriz NumPy que comparte memoria con ``raw.buffer``
+    """
+    dtype = _check_dtype(np.dtype(raw.dtype))
+    expected = int(np.prod(raw.shape, dtype=np.int64)) * dtype.itemsize
+    if len(raw.buffer) != expected:
+        raise ValueError(
+            f"El tamaño del búfer ({len(raw.buffer)} bytes) no coincide con "
+            f"la forma {raw.shape} y el tipo {dtype} ({expected} bytes)"
+        )
+    return np.frombuffer(raw.buffer, dtype=dtype).reshape(raw.shape)
@@ -0,0 +1,172 @@
+"""
+Mapas de color para matrices de un solo canal.
+
+Cada mapa es una tabla de consulta (LUT) RGB de 256 o 65536 entradas. Las
+tablas de los mapas con nombre se generan una sola vez con OpenCV (en el
+primer uso o al arrancar con ``WARMUP_ON_STARTUP``) y quedan en caché; colorear una matriz es una
+indexación ``lut[indices]`` por franjas de filas, sin llamadas a matplotlib
+por petición.
+
+Además de los mapas con nombre se admiten mapas personalizados con la forma
+``custom:#000000,#ff0000,#ffff00`` (colores equiespaciados) o
+``custom:0:#000000,0.8:#ff0000,1:#ffffff`` (posiciones explícitas en [0, 1]).
+"""
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.services.normalization import apply_range, build_lut, lut_index_dtype
+from src.utils.lazy_import import cv2
+
+_OPENCV_COLORMAPS = (
+    "autumn", "bone", "jet", "winter", "rainbow", "ocean", "summer", "spring",
+    "cool", "hsv", "pink", "hot", "parula", "magma", "inferno", "plasma",
+    "viridis", "cividis", "twilight", "twilight_shifted", "turbo", "deepgreen",
+)
+# Nombre de la constante de OpenCV de cada mapa (se resuelve al generar la LUT)
+COLORMAPS = {name: f"COLORMAP_{name.upper()}" for name in _OPENCV_COLORMAPS}
+CUSTOM_PREFIX = "custom:"
+LUT_SIZES = (256, 65536)
+
+# Valores procesados por franja al colorear
+_STRIP_VALUES = 1 << 20
+
+
+def _parse_color(color: str) -> Tuple[int, int, int]:
+    color = color.strip().lstrip("#")
+    if len(color) != 6:
+        raise ValueError(f"Color no válido: '{color}' (se espera #rrggbb)")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _parse_custom_stops(spec: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Convierte ``custom:...`` en posiciones (N,) y colores (N, 3)."""
+    parts = [part for part in spec[len(CUSTOM_PREFIX):].split(",") if part.strip()]
+    if len(parts) < 2:
+        raise ValueError("Un mapa de color personalizado necesita al menos dos colores")
+
+    positions: List[float] = []
+    colors: List[Tuple[int, int, int]] = []
+    for index, part in enumerate(parts):
+        if ":" in part:
+            position, color = part.split(":", 1)
+            positions.append(float(position))
+        else:
+            color = part
+            positions.append(index / (len(parts) - 1))
+        colors.append(_parse_color(color))
+
+    positions = np.asarray(positions, dtype=np.float64)
+    if positions[0] != 0.0 or positions[-1] != 1.0 or np.any(np.diff(positions) < 0):
+        raise ValueError("Las posiciones del mapa personalizado deben ir de 0 a 1 en orden creciente")
+    return positions, np.asarray(colors, dtype=np.float64)
+
+
+@lru_cache(maxsize=128)
+def _base_lut(name: str) -> np.ndarray:
+    """LUT RGB de 256 entradas de un mapa con nombre o personalizado."""
+    if name.startswith(CUSTOM_PREFIX):
+        return _interpolate_custom(name, 256)
+    if name not in COLORMAPS:
+        raise ValueError(
+            f"Mapa de color no válido: '{name}'. Mapas disponibles: {', '.join(COLORMAPS)} o custom:..."
+        )
+    ramp = np.arange(256, dtype=np.uint8).reshape(256, 1)
+    bgr = cv2.applyColorMap(ramp, getattr(cv2, COLORMAPS[name])).reshape(256, 3)
+    return np.ascontiguousarray(bgr[:, ::-1])
+
+
+def _interpolate_custom(spec: str, size: int) -> np.ndarray:
+    positions, colors = _parse_custom_stops(spec)
+    samples = np.linspace(0.0, 1.0, size)
+    lut = np.empty((size, 3), dtype=np.uint8)
+    for channel in range(3):
+        lut[:, channel] = np.rint(np.interp(samples, positions, colors[:, channel]))
+    return lut
+
+
+@lru_cache(maxsize=128)
+def get_colormap_lut(name: str, size: int = 256) -> np.ndarray:
+    """
+    Devuelve la LUT RGB (``size`` x 3, uint8, de solo lectura) del mapa de color.
+
+    Las tablas de 65536 entradas se obtienen interpolando la de 256 (o los
+    colores del mapa personalizado), para colorear datos de 16 bits sin
+    perder resolución.
+
+    Args:
+        name: Nombre del mapa o especificación ``custom:...``
+        size: 256 o 65536
+
+    Raises:
+        ValueError: Si el mapa o el tamaño no son válidos
+    """
+    if size not in LUT_SIZES:
+        raise ValueError(f"Tamaño de LUT no válido: {size}")
+    if size == 256:
+        lut = _base_lut(name)
+    elif name.startswith(CUSTOM_PREFIX):
+        lut = _interpolate_custom(name, size)
+    else:
+        base = _base_lut(name).astype(np.float64)
+        samples = np.linspace(0.0, 255.0, size)
+        lut = np.empty((size, 3), dtype=np.uint8)
+        for channel in range(3):
+            lut[:, channel] = np.rint(np.interp(samples, np.arange(256), base[:, channel]))
+    lut.flags.writeable = False
+    return lut
+
+
+def warm_colormaps() -> None:
+    """Genera por adelantado las LUT de todos los mapas con nombre (calentamiento al arrancar)."""
+    for name in COLORMAPS:
+        for size in LUT_SIZES:
+            get_colormap_lut(name, size)
+
+
+def colorize(
+    matrix: np.ndarray,
+    value_range: Tuple[float, float],
+    name: str,
+    out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Colorea una matriz de un solo canal.
+
+    Para enteros de hasta 16 bits la normalización y el mapa se combinan en
+    una sola tabla indexada con los valores de entrada; para el resto, cada
+    franja se normaliza a 16 bits y se indexa en la LUT de 65536 entradas.
+
+    Args:
+        matrix: Matriz 2D
+        value_range: Intervalo de entrada que recorre el mapa completo
+        name: Nombre del mapa o especificación ``custom:...``
+        out: Array de salida reutilizable; se ignora si su forma o su tipo no coinciden
+
+    Returns:
+        Matriz RGB (H, W, 3) uint8
+    """
+    if out is None or out.shape != matrix.shape + (3,) or out.dtype != np.uint8:
+        out = np.empty(matrix.shape + (3,), dtype=np.uint8)
+    rows = matrix.shape[0]
+    step = max(1, _STRIP_VALUES // max(1, matrix[:1].size))
+
+    index_dtype = lut_index_dtype(matrix.dtype)
+    if index_dtype is not None:
+        # Tabla combinada: valor de entrada -> índice del mapa -> color
+        size = 256 if index_dtype.itemsize == 1 else 65536
+        positions = build_lut(matrix.dtype, value_range, np.uint8 if size == 256 else np.uint16)
+        table = get_colormap_lut(name, size)[positions]
+        indices = matrix.view(index_dtype)
+        for start in range(0, rows, step):
+            np.take(table, indices[start:start + step], axis=0, out=out[start:start + step])
+        return out
+
+    lut = get_colormap_lut(name, 65536)
+    positions = np.empty((min(step, rows),) + matrix.shape[1:], dtype=np.uint16)
+    for start in range(0, rows, step):
+        end = min(start + step, rows)
+        strip = apply_range(matrix[start:end], value_range, positions[:end - start])
+        np.take(lut, strip, axis=0, out=out[start:end])
+    return out
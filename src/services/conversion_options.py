@@ -0,0 +1,79 @@
+"""
+Opciones de conversión de matriz a imagen.
+"""
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Optional, Tuple
+
+NORMALIZATION_MODES = ("auto", "clip", "minmax", "percentile", "window", "passthrough")
+ENCODER_PROFILES = ("fastest", "balanced", "smallest")
+ENCODER_BACKENDS = ("auto", "pillow", "opencv")
+
+
+@dataclass(frozen=True)
+class ConversionOptions:
+    """
+    Parámetros que afectan a la imagen generada.
+
+    Viaja junto a la matriz hasta el motor de ejecución y forma parte de la
+    clave de la caché de resultados, por lo que debe ser inmutable y
+    serializable.
+    """
+    normalize: str = "auto"
+    percentiles: Tuple[float, float] = (1.0, 99.0)
+    window: Optional[float] = None
+    level: Optional[float] = None
+    colormap: Optional[str] = None
+    crop: Optional[Tuple[int, int, int, int]] = None
+    stride: int = 1
+    max_width: Optional[int] = None
+    max_height: Optional[int] = None
+    profile: str = "balanced"
+    encoder: str = "auto"
+    compress_level: Optional[int] = None
+    quality: Optional[int] = None
+    optimize: Optional[bool] = None
+    lossless: Optional[bool] = None
+
+    def __post_init__(self):
+        if self.normalize not in NORMALIZATION_MODES:
+            raise ValueError(
+                f"Modo de normalización no válido. Modos permitidos: {', '.join(NORMALIZATION_MODES)}"
+            )
+        low, high = self.percentiles
+        if not 0.0 <= low < high <= 100.0:
+            raise ValueError("Los percentiles deben cumplir 0 <= inferior < superior <= 100")
+        if self.normalize == "window":
+            if self.window is None or self.level is None:
+                raise ValueError("El modo 'window' requiere los parámetros 'window' y 'level'")
+            if self.window <= 0:
+                raise ValueError("El ancho de ventana debe ser positivo")
+        if self.colormap is not None and self.normalize == "passthrough":
+            raise ValueError("El modo 'passthrough' (16 bits) no admite mapas de color")
+        if self.crop is not None:
+            x, y, width, height = self.crop
+            if x < 0 or y < 0 or width <= 0 or height <= 0:
+                raise ValueError("'crop' debe tener x, y >= 0 y ancho y alto positivos")
+        if self.stride < 1:
+            raise ValueError("'stride' debe ser un entero positivo")
+        for name in ("max_width", "max_height"):
+            if getattr(self, name) is not None and getattr(self, name) <= 0:
+                raise ValueError(f"'{name}' debe ser positivo")
+        if self.profile not in ENCODER_PROFILES:
+            raise ValueError(f"Perfil de codificación no válido. Perfiles permitidos: {', '.join(ENCODER_PROFILES)}")
+        if self.encoder not in ENCODER_BACKENDS:
+            raise ValueError(f"Codificador no válido. Codificadores permitidos: {', '.join(ENCODER_BACKENDS)}")
+        if self.compress_level is not None and not 0 <= self.compress_level <= 9:
+            raise ValueError("'compress_level' debe estar entre 0 y 9")
+        if self.quality is not None and not 1 <= self.quality <= 100:
+            raise ValueError("'quality' debe estar entre 1 y 100")
+
+    def cache_options(self) -> Dict[str, Any]:
+        """Devuelve solo las opciones distintas de las predeterminadas, para la clave de caché."""
+        return {
+            field.name: getattr(self, field.name)
+            for field in fields(self)
+            if getattr(self, field.name) != field.default
+        }
+
+
+DEFAULT_OPTIONS = ConversionOptions()
@@ -0,0 +1,220 @@
+"""
+Codificación de los píxeles normalizados en el formato de salida.
+
+Cada formato se codifica con Pillow o con ``cv2.imencode``: con
+``encoder='auto'`` se usa el más rápido de los dos para ese formato (OpenCV
+para PNG, JPEG, BMP y AVIF; Pillow para WebP, TIFF y el resto), salvo en las
+respuestas por fragmentos, que usan siempre Pillow. Los parámetros salen del
+perfil elegido (``fastest``, ``balanced`` o ``smallest``) y los explícitos de
+``ConversionOptions`` los sustituyen.
+
+``balanced`` reproduce los valores predeterminados de Pillow salvo en AVIF,
+cuya velocidad predeterminada tarda segundos por megapíxel.
+"""
+import io
+from dataclasses import replace
+from typing import Any, BinaryIO, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.utils.lazy_import import cv2
+
+_FORMAT_ALIASES = {"jpg": "jpeg", "tif": "tiff"}
+
+# Parámetros de Pillow de cada perfil por formato
+PROFILE_PARAMS: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "png": {
+        "fastest": {"compress_level": 1},
+        "balanced": {"compress_level": 6},
+        "smallest": {"compress_level": 9, "optimize": True},
+    },
+    "jpeg": {
+        "fastest": {"quality": 75},
+        "balanced": {"quality": 75},
+        "smallest": {"quality": 75, "optimize": True, "progressive": True},
+    },
+    "webp": {
+        "fastest": {"quality": 80, "method": 0},
+        "balanced": {"quality": 80, "method": 4},
+        "smallest": {"quality": 80, "method": 6},
+    },
+    "avif": {
+        "fastest": {"quality": 75, "speed": 10},
+        "balanced": {"quality": 75, "speed": 8},
+        "smallest": {"quality": 75, "speed": 6},
+    },
+    "tiff": {
+        "fastest": {},
+        "balanced": {},
+        "smallest": {"compression": "tiff_adobe_deflate"},
+    },
+}
+
+# Parámetros explícitos que admite cada formato (los demás se ignoran)
+_EXPLICIT_PARAMS = {
+    "png": ("compress_level", "optimize"),
+    "jpeg": ("quality", "optimize"),
+    "webp": ("quality", "lossless"),
+    "avif": ("quality",),
+}
+
+# Extensión de cv2.imencode de cada formato que OpenCV codifica
+_OPENCV_EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp", "avif": ".avif", "tiff": ".tiff", "bmp": ".bmp"}
+# Backend más rápido de cada formato (según el caso 'encoders/' de tests/benchmarks)
+PREFERRED_BACKENDS = {"png": "opencv", "jpeg": "opencv", "bmp": "opencv", "avif": "opencv"}
+
+# Formatos cuyo codificador necesita posicionarse en el destino (tell/seek):
+# no pueden escribirse en un flujo de solo escritura como la respuesta por fragmentos
+SEEKABLE_FORMATS = ("tiff",)
+# Formatos sin canal alfa: las matrices RGBA se rechazan en lugar de perder la transparencia
+OPAQUE_FORMATS = ("jpeg",)
+
+
+def canonical_format(output_format: str) -> str:
+    """Nombre del formato en minúsculas, con ``jpg`` y ``tif`` como ``jpeg`` y ``tiff``."""
+    output_format = output_format.lower()
+    return _FORMAT_ALIASES.get(output_format, output_format)
+
+
+def encoder_params(output_format: str, options: ConversionOptions = DEFAULT_OPTIONS) -> Dict[str, Any]:
+    """
+    Parámetros del codificador: los del perfil con los explícitos encima.
+
+    Returns:
+        Parámetros con los nombres de Pillow (``compress_level``, ``quality``,
+        ``optimize``, ``lossless``, ``method``, ``speed``...)
+    """
+    output_format = canonical_format(output_format)
+    params = dict(PROFILE_PARAMS.get(output_format, {}).get(options.profile, {}))
+    for name in _EXPLICIT_PARAMS.get(output_format, ()):
+        if getattr(options, name) is not None:
+            params[name] = getattr(options, name)
+    return params
+
+
+def _opencv_supports(output_format: str, params: Dict[str, Any]) -> bool:
+    # libpng de OpenCV no tiene la búsqueda de filtros de 'optimize'
+    return output_format in _OPENCV_EXTENSIONS and not (output_format == "png" and params.get("optimize"))
+
+
+def resolve_encoder(
+    output_format: str,
+    options: ConversionOptions = DEFAULT_OPTIONS
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Elige el backend y los parámetros con los que se codifica el formato.
+
+    Returns:
+        ('pillow' u 'opencv', parámetros del codificador)
+
+    Raises:
+        ValueError: Si se pide OpenCV para un formato o parámetro que no admite
+    """
+    output_format = canonical_format(output_format)
+    params = encoder_params(output_format, options)
+    backend = options.encoder
+    if backend == "auto":
+        backend = PREFERRED_BACKENDS.get(output_format, "pillow")
+        if backend == "opencv" and not _opencv_supports(output_format, params):
+            backend = "pillow"
+    elif backend == "opencv" and not _opencv_supports(output_format, params):
+        raise ValueError(f"El codificador 'opencv' no admite {output_format} con estos parámetros")
+    return backend, params
+
+
+def streaming_options(options: ConversionOptions = DEFAULT_OPTIONS) -> ConversionOptions:
+    """
+    Opciones con las que se codifica una respuesta por fragmentos.
+
+    OpenCV codifica la imagen completa antes de escribirla, lo que anularía
+    la transmisión; con ``encoder='auto'`` se usa Pillow, que escribe según
+    comprime. Un backend pedido explícitamente se respeta.
+    """
+    if options.encoder != "auto":
+        return options
+    return replace(options, encoder="pillow")
+
+
+def _opencv_flags(output_format: str, params: Dict[str, Any]) -> List[int]:
+    """Traduce los parámetros de Pillow a los de ``cv2.imencode``."""
+    if output_format == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, params.get("compress_level", 6)]
+    if output_format == "jpeg":
+        return [
+            cv2.IMWRITE_JPEG_QUALITY, params.get("quality", 75),
+            cv2.IMWRITE_JPEG_OPTIMIZE, int(bool(params.get("optimize"))),
+            cv2.IMWRITE_JPEG_PROGRESSIVE, int(bool(params.get("progressive"))),
+        ]
+    if output_format == "webp":
+        # Calidad por encima de 100: WebP sin pérdida
+        return [cv2.IMWRITE_WEBP_QUALITY, 101 if params.get("lossless") else params.get("quality", 80)]
+    if output_format == "avif":
+        return [cv2.IMWRITE_AVIF_QUALITY, params.get("quality", 75), cv2.IMWRITE_AVIF_SPEED, params.get("speed", 8)]
+    if output_format == "tiff":
+        compression = (
+            cv2.IMWRITE_TIFF_COMPRESSION_ADOBE_DEFLATE if params.get("compression") else cv2.IMWRITE_TIFF_COMPRESSION_NONE
+        )
+        return [cv2.IMWRITE_TIFF_COMPRESSION, compression]
+    return []
+
+
+def encode_pixels(
+    pixels: np.ndarray,
+    output_format: str,
+    fp: BinaryIO,
+    options: ConversionOptions = DEFAULT_OPTIONS
+) -> None:
+    """
+    Codifica píxeles uint8 (o uint16) y escribe la imagen en ``fp``.
+
+    Pillow escribe a medida que comprime; OpenCV codifica la imagen completa
+    y la escribe de una vez. Pillow no tiene modos de color de 16 bits, así
+    que esas imágenes van siempre con OpenCV.
+
+    Args:
+        pixels: Array (alto, ancho) o (alto, ancho, 3|4) en RGB(A)
+        output_format: Formato de salida de la imagen
+        fp: Objeto tipo archivo de destino
+        options: Opciones de conversión (perfil, backend y parámetros del codificador)
+    """
+    output_format = canonical_format(output_format)
+    backend, params = resolve_encoder(output_format, options)
+    channels = pixels.shape[2] if pixels.ndim == 3 else 1
+    if pixels.dtype == np.uint16 and channels > 1:
+        backend = "opencv"
+
+    if output_format in OPAQUE_FORMATS and channels == 4:
+        # Pillow lo rechaza; OpenCV descartaría el canal alfa sin avisar
+        raise ValueError(f"El formato {output_format} no admite canal alfa")
+
+    if backend == "pillow":
+        # Pillow deduce el modo (L, I;16, RGB o RGBA) del tipo y la forma del array
+        img = Image.fromarray(pixels[:, :, 0] if pixels.ndim == 3 and channels == 1 else pixels)
+        img.save(fp, format=output_format.upper(), **params)
+        return
+
+    if channels > 1:
+        pixels = cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR if channels == 3 else cv2.COLOR_RGBA2BGRA)
+    ok, encoded = cv2.imencode(
+        _OPENCV_EXTENSIONS.get(output_format, f".{output_format}"), pixels, _opencv_flags(output_format, params)
+    )
+    if not ok:
+        raise ValueError(f"No se pudo codificar la imagen en {output_format}")
+    fp.write(encoded.data)
+
+
+def zlib_level(options: ConversionOptions = DEFAULT_OPTIONS) -> int:
+    """Nivel de Deflate de los codificadores por franjas y teselas (``compress_level`` o el del perfil)."""
+    if options.compress_level is not None:
+        return options.compress_level
+    return PROFILE_PARAMS["png"][options.profile]["compress_level"]
+
+
+def warm_encoders(formats: Tuple[str, ...] = ("png", "jpeg", "webp", "tiff")) -> None:
+    """Codifica una imagen mínima en cada formato para cargar los códecs y plugins de Pillow."""
+    pixels = np.zeros((8, 8, 3), dtype=np.uint8)
+    for output_format in formats:
+        encode_pixels(pixels, output_format, io.BytesIO())
+
@@ -0,0 +1,267 @@
+"""
+Motor de ejecución para el trabajo de CPU (parseo, normalización, codificación).
+
+Las operaciones pesadas se ejecutan en un pool de hilos o de procesos para no
+bloquear el event loop de uvicorn. El motor aplica control de admisión: si ya
+hay tantas tareas en curso como trabajadores más la cola permitida, la nueva
+tarea se rechaza de inmediato con ``PoolSaturatedError``. Cada tarea de un
+lote cuenta como una más.
+"""
+import asyncio
+import functools
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterable, List, Optional, Tuple
+
+from src.config.settings import get_settings
+from src.services.metrics import EXECUTION_REJECTED
+from src.utils.timing import StageTimer
+
+
+class PoolSaturatedError(RuntimeError):
+    """El pool de trabajo está saturado y no admite más tareas."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("El servicio está saturado, inténtelo de nuevo más tarde")
+        self.retry_after = retry_after
+
+
+def _timed_call(fn: Callable, submitted_at: float, args: tuple, kwargs: dict) -> Tuple[Any, float]:
+    """
+    Ejecuta ``fn`` dentro del trabajador y mide el tiempo que esperó en cola.
+
+    Se define a nivel de módulo para que sea serializable en el backend de procesos.
+    """
+    queue_ms = max(0.0, (time.time() - submitted_at) * 1000.0)
+    return fn(*args, **kwargs), queue_ms
+
+
+class ExecutionEngine:
+    def __init__(
+        self,
+        backend: str = "thread",
+        workers: int = 4,
+        queue_size: int = 8,
+        retry_after: int = 1
+    ):
+        """
+        Crea el pool de trabajo.
+
+        Args:
+            backend: 'thread' o 'process'
+            workers: Número de trabajadores del pool
+            queue_size: Tareas en espera admitidas además de las que se ejecutan
+            retry_after: Segundos sugeridos al cliente cuando el pool está saturado
+        """
+        backend = backend.lower()
+        if backend not in ("thread", "process"):
+            raise ValueError(f"Backend de ejecución no admitido: {backend}")
+
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, queue_size)
+        self.retry_after = retry_after
+        self._in_flight = 0
+        self._slot_waiters: List[asyncio.Future] = []
+        self._executor: Executor = (
+            ProcessPoolExecutor(max_workers=self.workers)
+            if backend == "process"
+            else ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="matrix-worker")
+        )
+
+    @property
+    def in_flight(self) -> int:
+        """Número de tareas admitidas que aún no han terminado."""
+        return self._in_flight
+
+    def _admit(self) -> None:
+        """Ocupa un hueco de admisión o rechaza la tarea si no queda ninguno."""
+        if self._in_flight >= self.capacity:
+            EXECUTION_REJECTED.inc()
+            raise PoolSaturatedError(self.retry_after)
+        self._in_flight += 1
+
+    def _release(self, *_: Any) -> None:
+        """Libera un hueco y despierta a los lotes que esperan uno."""
+        self._in_flight -= 1
+        waiters, self._slot_waiters = self._slot_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _release_from_pool(self, loop: asyncio.AbstractEventLoop, *_: Any) -> None:
+        """Libera un hueco desde el hilo que completa la tarea del pool."""
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._release)
+
+    async def _wait_for_slot(self) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        self._slot_waiters.append(waiter)
+        await waiter
+
+    async def run(
+        self,
+        fn: Callable,
+        *args,
+        timer: Optional[StageTimer] = None,
+        **kwargs
+    ) -> Any:
+        """
+        Ejecuta ``fn(*args, **kwargs)`` en el pool.
+
+        Args:
+            fn: Función a ejecutar (debe ser serializable en el backend de procesos)
+            timer: Temporizador opcional donde se registra la espera en cola ('queue')
+
+        Returns:
+            El valor devuelto por ``fn``
+
+        Raises:
+            PoolSaturatedError: Si el pool no admite más tareas
+        """
+        return await self._submit(self._executor, fn, args, kwargs, timer)
+
+    async def run_local(
+        self,
+        fn: Callable,
+        *args,
+        timer: Optional[StageTimer] = None,
+        **kwargs
+    ) -> Any:
+        """
+        Ejecuta ``fn(*args, **kwargs)`` en un hilo de este proceso, con el
+        mismo control de admisión que ``run``.
+
+        Es para funciones que modifican objetos del llamador (p. ej. el parser
+        incremental de JSON) y no pueden enviarse a otro proceso: con el
+        backend de hilos usan el pool del motor; con el de procesos, el
+        ejecutor por defecto del event loop.
+
+        Raises:
+            PoolSaturatedError: Si el pool no admite más tareas
+        """
+        executor = self._executor if self.backend == "thread" else None
+        return await self._submit(executor, fn, args, kwargs, timer)
+
+    async def _submit(
+        self,
+        executor: Optional[Executor],
+        fn: Callable,
+        args: tuple,
+        kwargs: dict,
+        timer: Optional[StageTimer]
+    ) -> Any:
+        self._admit()
+        try:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(_timed_call, fn, time.time(), args, kwargs)
+            result, queue_ms = await loop.run_in_executor(executor, call)
+        finally:
+            self._release()
+
+        if timer is not None:
+            timer.add("queue", queue_ms)
+        return result
+
+    async def map_unordered(
+        self,
+        fn: Callable,
+        calls: Iterable[tuple]
+    ) -> AsyncIterator[Tuple[int, Any, Optional[BaseException]]]:
+        """
+        Ejecuta ``fn(*args)`` para cada tupla de ``calls`` y entrega los
+        resultados según terminan.
+
+        Cada tarea ocupa un hueco de admisión mientras está en el pool y el
+        lote mantiene como máximo ``workers`` tareas a la vez. La primera se
+        admite como cualquier otra solicitud; las siguientes esperan a que
+        haya hueco. Así los lotes nunca superan la capacidad del motor y el
+        resto de solicitudes sigue recibiendo 503 mientras esté lleno.
+
+        Args:
+            fn: Función a ejecutar (debe ser serializable en el backend de procesos)
+            calls: Argumentos posicionales de cada llamada
+
+        Yields:
+            Tuplas (índice, resultado, excepción); la excepción es None si la llamada tuvo éxito
+
+        Raises:
+            PoolSaturatedError: Si el pool no admite la primera tarea del lote
+        """
+        loop = asyncio.get_running_loop()
+        pending = {}
+        calls = enumerate(calls)
+        call = next(calls, None)
+        if call is None:
+            return
+
+        self._admit()
+        reserved = True  # Hueco ocupado por una tarea que aún no está en el pool
+        try:
+            while call is not None or pending:
+                while call is not None and len(pending) < self.workers:
+                    if not reserved:
+                        if self._in_flight >= self.capacity:
+                            break
+                        self._in_flight += 1
+                        reserved = True
+                    index, args = call
+                    submitted = self._executor.submit(fn, *args)
+                    # El hueco pasa a la tarea y se libera cuando termina en el pool (o
+                    # si se cancela antes de empezar), no al cancelar su futuro asyncio
+                    submitted.add_done_callback(functools.partial(self._release_from_pool, loop))
+                    future = asyncio.wrap_future(submitted)
+                    reserved = False
+                    pending[future] = index
+                    call = next(calls, None)
+
+                if not pending:
+                    # El motor está lleno con otras solicitudes
+                    await self._wait_for_slot()
+                    continue
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    error = future.exception()
+                    yield index, None if error else future.result(), error
+        finally:
+            for future in pending:
+                future.cancel()
+            if reserved:
+                self._release()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Detiene el pool esperando (opcionalmente) a las tareas en curso."""
+        self._executor.shutdown(wait=wait)
+
+
+_engine: Optional[ExecutionEngine] = None
+
+
+def get_execution_engine() -> ExecutionEngine:
+    """
+    Devuelve el motor de ejecución compartido, creándolo con la configuración
+    actual la primera vez que se solicita.
+
+    Returns:
+        Instancia de ExecutionEngine
+    """
+    global _engine
+    if _engine is None:
+        settings = get_settings()
+        _engine = ExecutionEngine(
+            backend=settings.EXECUTION_BACKEND,
+            workers=settings.EXECUTION_WORKERS,
+            queue_size=settings.EXECUTION_QUEUE_SIZE,
+            retry_after=settings.EXECUTION_RETRY_AFTER,
+        )
+    return _engine
+
+
+def shutdown_execution_engine() -> None:
+    """Detiene el motor compartido (se invoca al apagar la aplicación)."""
+    global _engine
+    if _engine is not None:
+        _engine.shutdown()
+        _engine = None
@@ -0,0 +1,161 @@
+"""
+Conversión de secuencias de fotogramas recibidas por WebSocket.
+
+Cada mensaje binario es un fotograma: 4 bytes (entero sin signo little-endian)
+con la longitud de una cabecera JSON (``dtype``, ``shape`` y, opcionalmente,
+``seq``) y a continuación los píxeles crudos en orden C. Las imágenes se
+devuelven con el mismo formato: la cabecera lleva ``seq``, ``content_type``,
+``dropped`` y la duración de cada etapa, y le siguen los bytes de la imagen.
+
+Cada conexión tiene su ``FrameEncoder``, que conserva entre fotogramas el
+array de píxeles y el búfer de salida, y su ``FrameMailbox``: si llegan
+fotogramas más deprisa de lo que se convierten y envían, se descartan los más
+antiguos en lugar de acumular retraso.
+"""
+import asyncio
+import io
+import json
+import struct
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from src.services.binary_matrix import RawMatrixBuffer, load_raw_buffer
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.services.encoders import canonical_format, encode_pixels
+from src.services.matrix_service import MatrixService
+from src.services.metrics import FRAMES
+from src.utils.timing import StageTimer
+
+# Longitud de la cabecera JSON que precede a cada fotograma y a cada imagen
+HEADER_LENGTH = struct.Struct("<I")
+
+Message = Union[bytes, str]
+
+
+def parse_frame(message: Message) -> Tuple[Optional[int], RawMatrixBuffer]:
+    """
+    Separa la cabecera de un fotograma de sus píxeles, sin copiarlos.
+
+    Args:
+        message: Mensaje recibido por el WebSocket
+
+    Returns:
+        Tupla (``seq`` de la cabecera o None, búfer crudo con su dtype y forma)
+
+    Raises:
+        ValueError: Si el mensaje no es un fotograma válido
+    """
+    if not isinstance(message, (bytes, bytearray)):
+        raise ValueError("Los fotogramas deben enviarse como mensajes binarios")
+    if len(message) < HEADER_LENGTH.size:
+        raise ValueError("Fotograma sin cabecera")
+    (length,) = HEADER_LENGTH.unpack_from(message)
+    start = HEADER_LENGTH.size
+    if length > len(message) - start:
+        raise ValueError("La cabecera del fotograma está truncada")
+    try:
+        header = json.loads(bytes(message[start:start + length]))
+        dtype, shape = header["dtype"], tuple(int(dim) for dim in header["shape"])
+        seq = header.get("seq")
+        np.dtype(dtype)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("Cabecera de fotograma no válida: se esperaba JSON con 'dtype' y 'shape'")
+    if not shape or any(dim <= 0 for dim in shape):
+        raise ValueError(f"Forma de matriz no válida: {shape}")
+    if seq is not None and not isinstance(seq, int):
+        raise ValueError("El campo 'seq' debe ser un entero")
+    return seq, RawMatrixBuffer(memoryview(message)[start + length:], dtype, shape)
+
+
+def pack_frame(header: Dict[str, Any], payload: bytes) -> bytes:
+    """Antepone a ``payload`` su cabecera JSON precedida de la longitud."""
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    return HEADER_LENGTH.pack(len(encoded)) + encoded + payload
+
+
+class FrameEncoder:
+    """
+    Convierte los fotogramas de una conexión con las mismas opciones.
+
+    Los fotogramas de una conexión se convierten de uno en uno, así que el
+    array de píxeles normalizados y el búfer de la imagen se reutilizan
+    mientras no cambie el tamaño. Con el backend de procesos el codificador
+    viaja serializado en cada llamada y esos búferes no se conservan.
+    """
+
+    def __init__(self, output_format: str = "png", options: ConversionOptions = DEFAULT_OPTIONS):
+        self.output_format = canonical_format(output_format)
+        self.content_type = f"image/{self.output_format}"
+        self.options = options
+        self._pixels: Optional[np.ndarray] = None
+        self._output = io.BytesIO()
+
+    def encode(self, raw: RawMatrixBuffer) -> Tuple[bytes, Dict[str, float]]:
+        """
+        Convierte un fotograma (se ejecuta en el pool).
+
+        Returns:
+            Tupla con los bytes de la imagen y la duración de cada etapa
+        """
+        timer = StageTimer()
+        with timer.stage("parse"):
+            matrix = load_raw_buffer(raw)
+        pixels = MatrixService._matrix_pixels(matrix, self.output_format, timer, self.options, self._pixels)
+        # Solo se conserva un array propio, nunca una vista del fotograma recibido
+        if pixels.flags.owndata:
+            self._pixels = pixels
+
+        with timer.stage("encode"):
+            self._output.seek(0)
+            self._output.truncate()
+            encode_pixels(pixels, self.output_format, self._output, self.options)
+            image = self._output.getvalue()
+        return image, timer.stages
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Backend de procesos: los búferes no se envían al trabajador
+        state = dict(self.__dict__)
+        state["_pixels"] = None
+        state["_output"] = io.BytesIO()
+        return state
+
+
+class FrameMailbox:
+    """Fotogramas recibidos pendientes de convertir; al llenarse se descartan los más antiguos."""
+
+    def __init__(self, max_pending: int = 1):
+        """
+        Args:
+            max_pending: Fotogramas en espera como máximo
+        """
+        self._frames: Deque[Tuple[int, Message]] = deque(maxlen=max(1, max_pending))
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, message: Message) -> None:
+        """Añade un fotograma, descartando el más antiguo si no hay sitio."""
+        if len(self._frames) == self._frames.maxlen:
+            self.dropped += 1
+            FRAMES.inc(result="dropped")
+        self._frames.append((self.received, message))
+        self.received += 1
+        self._ready.set()
+
+    def close(self) -> None:
+        """El cliente se ha desconectado: los pendientes se descartan y ``get`` devuelve None."""
+        self._closed = True
+        self._frames.clear()
+        self._ready.set()
+
+    async def get(self) -> Optional[Tuple[int, Message]]:
+        """Espera al siguiente fotograma: (número de orden de llegada, mensaje)."""
+        while not self._frames:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self._frames.popleft()
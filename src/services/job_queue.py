@@ -0,0 +1,413 @@
+"""
+Cola de trabajos asíncronos para las conversiones largas (/api/v1/jobs).
+
+Cada proceso tiene su propia cola en memoria con prioridades y un número
+máximo de trabajos en ejecución; el estado, el progreso y los resultados se
+guardan en un almacén SQLite con los resultados en archivos, en un directorio
+local compartido por todos los workers. Así cualquier worker puede responder
+al sondeo de un trabajo aunque lo ejecute otro. Los resultados caducan tras
+``JOBS_RESULT_TTL`` segundos.
+
+No necesita ningún broker externo: los trabajos pendientes viven en el
+proceso que los aceptó y se marcan como fallidos si ese proceso termina.
+"""
+import asyncio
+import itertools
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.config.settings import get_settings
+
+JOB_KINDS = ("convert", "compare", "verify")
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+MIN_PRIORITY, MAX_PRIORITY = 0, 9
+
+# Lo que devuelve un trabajo: bytes del resultado y su tipo de contenido
+JobResult = Tuple[bytes, str]
+JobRunner = Callable[[], Awaitable[JobResult]]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    owner INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    expires_at REAL,
+    status_code INTEGER,
+    error TEXT,
+    media_type TEXT,
+    result_size INTEGER
+)
+"""
+
+
+class JobError(Exception):
+    """Fallo de un trabajo, con el código de estado HTTP que habría tenido la solicitud."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: Optional[int] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class JobQueueFullError(RuntimeError):
+    """La cola de este proceso ya tiene ``JOBS_MAX_QUEUED`` trabajos pendientes."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("La cola de trabajos está llena, inténtelo de nuevo más tarde")
+        self.retry_after = retry_after
+
+
+@dataclass
+class JobRecord:
+    id: str
+    kind: str
+    status: str
+    priority: int
+    progress: float
+    owner: int
+    attempts: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    expires_at: Optional[float] = None
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    media_type: Optional[str] = None
+    result_size: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Estado público del trabajo (sin el proceso propietario)."""
+        data = asdict(self)
+        del data["owner"]
+        return data
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """Estado de los trabajos en SQLite y sus resultados en archivos. Métodos síncronos: llamar con ``to_thread``."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.results_dir = os.path.join(directory, "results")
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.db_path = os.path.join(directory, "jobs.db")
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Una conexión por operación (se usan desde varios hilos y procesos), en una transacción
+        db = sqlite3.connect(self.db_path, timeout=10.0)
+        db.row_factory = sqlite3.Row
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def result_path(self, job_id: str) -> str:
+        return os.path.join(self.results_dir, job_id)
+
+    def create(self, kind: str, priority: int) -> JobRecord:
+        record = JobRecord(
+            id=uuid.uuid4().hex, kind=kind, status="queued", priority=priority,
+            progress=0.0, owner=os.getpid(), attempts=0, created_at=time.time(),
+        )
+        data = asdict(record)
+        with self._connect() as db:
+            db.execute(
+                f"INSERT INTO jobs ({', '.join(data)}) VALUES ({', '.join('?' * len(data))})",
+                tuple(data.values()),
+            )
+        return record
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        """Devuelve el trabajo, o None si no existe o su resultado ha caducado."""
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        record = JobRecord(**dict(row))
+        if record.expires_at is not None and record.expires_at <= time.time():
+            return None
+        return record
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self._connect() as db:
+            db.execute(
+                f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def claim(self, job_id: str, attempt: int) -> bool:
+        """
+        Pasa el trabajo a 'running' solo si sigue en cola, en una única
+        sentencia: un DELETE atendido por otro worker no puede colarse entre la
+        comprobación y el cambio. Devuelve si se ha reclamado.
+        """
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, attempts = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (time.time(), attempt, job_id),
+            )
+            return cursor.rowcount == 1
+
+    def cancel(self, job_id: str, ttl: float) -> bool:
+        """Cancela el trabajo si aún está en cola; devuelve si se ha cancelado."""
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, expires_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (now, now + ttl, job_id),
+            )
+            return cursor.rowcount == 1
+
+    def finish(
+        self,
+        job_id: str,
+        ttl: float,
+        result: Optional[JobResult] = None,
+        error: Optional[JobError] = None
+    ) -> None:
+        """Guarda el resultado (o el error) y programa su caducidad."""
+        now = time.time()
+        if result is not None:
+            content, media_type = result
+            path = self.result_path(job_id)
+            with open(path + ".tmp", "wb") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+            self.update(
+                job_id, status="succeeded", progress=1.0, finished_at=now, expires_at=now + ttl,
+                status_code=200, media_type=media_type, result_size=len(content),
+            )
+        else:
+            self.update(
+                job_id, status="failed", finished_at=now, expires_at=now + ttl,
+                status_code=error.status_code, error=error.detail,
+            )
+
+    def delete(self, job_id: str) -> None:
+        with self._connect() as db:
+            db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        try:
+            os.remove(self.result_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def purge_expired(self) -> int:
+        """Elimina los trabajos caducados y sus resultados; devuelve cuántos."""
+        with self._connect() as db:
+            expired = [row["id"] for row in db.execute(
+                "SELECT id FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            )]
+        for job_id in expired:
+            self.delete(job_id)
+        return len(expired)
+
+    def fail_unfinished(self, ttl: float, owner: Optional[int] = None) -> int:
+        """
+        Marca como fallidos los trabajos pendientes del proceso ``owner`` o, sin
+        él, los de procesos que ya no existen (reinicio o reciclado del worker
+        que los aceptó). Devuelve cuántos.
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchall()
+        if owner is not None:
+            orphans = [row["id"] for row in rows if row["owner"] == owner]
+        else:
+            orphans = [row["id"] for row in rows if not _process_alive(row["owner"])]
+        error = JobError(503, "El proceso que ejecutaba el trabajo terminó antes de completarlo")
+        for job_id in orphans:
+            self.finish(job_id, ttl, error=error)
+        return len(orphans)
+
+
+class JobQueue:
+    """Cola en memoria de este proceso: prioridades, límite de concurrencia y reintentos ante saturación."""
+
+    def __init__(
+        self,
+        store: JobStore,
+        concurrency: int = 2,
+        max_queued: int = 100,
+        result_ttl: float = 3600.0,
+        max_retries: int = 3,
+        retry_after: int = 1
+    ):
+        """
+        Args:
+            store: Almacén de estado y resultados
+            concurrency: Trabajos ejecutados a la vez por este proceso
+            max_queued: Trabajos pendientes admitidos antes de rechazar nuevos
+            result_ttl: Segundos que se conservan los resultados
+            max_retries: Reintentos de un trabajo rechazado por saturación (503)
+            retry_after: Segundos sugeridos al cliente cuando la cola está llena
+        """
+        self.store = store
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.max_retries = max_retries
+        self.retry_after = retry_after
+        self._queue: "asyncio.PriorityQueue[Tuple[int, int, str]]" = asyncio.PriorityQueue()
+        self._runners: Dict[str, JobRunner] = {}
+        # Clave de orden (-prioridad, secuencia) de los trabajos que aún esperan en la cola
+        self._pending: Dict[str, Tuple[int, int]] = {}
+        # Desempate FIFO entre trabajos de la misma prioridad
+        self._sequence = itertools.count()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        """Arranca los trabajadores y la limpieza periódica (dentro del event loop)."""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._purge_periodically()))
+
+    async def stop(self) -> None:
+        """Detiene los trabajadores; los trabajos sin terminar de este proceso se marcan como fallidos."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._runners.clear()
+        self._pending.clear()
+        await asyncio.to_thread(self.store.fail_unfinished, self.result_ttl, os.getpid())
+
+    async def submit(self, kind: str, runner: JobRunner, priority: int = 5) -> JobRecord:
+        """
+        Encola un trabajo y devuelve su registro de inmediato.
+
+        Args:
+            kind: Tipo de trabajo (uno de JOB_KINDS)
+            runner: Corrutina sin argumentos que produce el resultado o lanza JobError
+            priority: De MIN_PRIORITY a MAX_PRIORITY; los de mayor prioridad se ejecutan antes
+
+        Raises:
+            JobQueueFullError: Si la cola de este proceso está llena
+        """
+        if len(self._runners) >= self.max_queued:
+            raise JobQueueFullError(self.retry_after)
+        record = await asyncio.to_thread(self.store.create, kind, priority)
+        key = (-priority, next(self._sequence))
+        self._runners[record.id] = runner
+        self._pending[record.id] = key
+        self._queue.put_nowait((*key, record.id))
+        return record
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancela un trabajo en cola (aunque lo aceptara otro worker); devuelve si se ha cancelado."""
+        cancelled = await asyncio.to_thread(self.store.cancel, job_id, self.result_ttl)
+        if cancelled:
+            self._runners.pop(job_id, None)
+            self._pending.pop(job_id, None)
+        return cancelled
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """Trabajos por delante en la cola de este proceso (None si no está en ella)."""
+        key = self._pending.get(job_id)
+        if key is None:
+            return None
+        return sum(1 for other in self._pending.values() if other < key)
+
+    async def _work(self) -> None:
+        while True:
+            _, _, job_id = await self._queue.get()
+            self._pending.pop(job_id, None)
+            runner = self._runners.get(job_id)
+            if runner is None:
+                continue
+            try:
+                await self._run(job_id, runner)
+            finally:
+                self._runners.pop(job_id, None)
+
+    async def _run(self, job_id: str, runner: JobRunner) -> None:
+        for attempt in range(self.max_retries + 1):
+            # Se pudo cancelar (desde cualquier worker) mientras esperaba
+            if not await asyncio.to_thread(self.store.claim, job_id, attempt + 1):
+                return
+            try:
+                result = await runner()
+            except JobError as e:
+                if e.status_code == 503 and attempt < self.max_retries:
+                    # Motor saturado o ImageToMatrix caído: esperar y reintentar
+                    await asyncio.to_thread(self.store.update, job_id, status="queued")
+                    await asyncio.sleep(e.retry_after or 1)
+                    continue
+                await asyncio.to_thread(self.store.finish, job_id, self.result_ttl, None, e)
+                return
+            except Exception as e:
+                error = JobError(500, f"Error al ejecutar el trabajo: {str(e)}")
+                await asyncio.to_thread(self.store.finish, job_id, self.result_ttl, None, error)
+                return
+            await asyncio.to_thread(self.store.finish, job_id, self.result_ttl, result)
+            return
+
+    async def _purge_periodically(self) -> None:
+        interval = max(1.0, min(60.0, self.result_ttl / 2))
+        while True:
+            await asyncio.to_thread(self.store.purge_expired)
+            await asyncio.sleep(interval)
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """
+    Devuelve la cola de trabajos de este proceso, creándola con la
+    configuración actual la primera vez que se solicita.
+    """
+    global _queue
+    if _queue is None:
+        settings = get_settings()
+        store = JobStore(settings.JOBS_DIR or os.path.join(tempfile.gettempdir(), "matrixtoimagen-jobs"))
+        store.fail_unfinished(settings.JOBS_RESULT_TTL)
+        _queue = JobQueue(
+            store,
+            concurrency=settings.JOBS_CONCURRENCY,
+            max_queued=settings.JOBS_MAX_QUEUED,
+            result_ttl=settings.JOBS_RESULT_TTL,
+            max_retries=settings.JOBS_MAX_RETRIES,
+            retry_after=settings.EXECUTION_RETRY_AFTER,
+        )
+    return _queue
+
+
+async def shutdown_job_queue() -> None:
+    """Detiene la cola de trabajos (se invoca al apagar la aplicación)."""
+    global _queue
+    if _queue is not None:
+        await _queue.stop()
+        _queue = None
@@ -0,0 +1,309 @@
+"""
+Parser incremental de matrices JSON.
+
+Convierte ``{"matrix": [[...], ...]}`` en un ``np.ndarray`` sin materializar
+listas anidadas de Python: el texto se procesa por fragmentos y cada bloque de
+filas completas se convierte de una sola vez con ``np.fromstring`` dentro de
+un array reservado de antemano. La forma de cada fila se deduce de la primera.
+
+Fuera de la matriz el documento se recorre por tokens para encontrar la clave
+en el primer nivel del objeto (no en objetos anidados). Ese texto se conserva,
+con la matriz sustituida por ``[]``, y al terminar se valida con ``json.loads``:
+un documento truncado o con contenido sobrante se rechaza igual que antes.
+"""
+import json
+import re
+from typing import AsyncIterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.services.execution_engine import get_execution_engine
+
+_OPEN, _CLOSE, _COMMA = ord("["), ord("]"), ord(",")
+_BRACKETS_TO_SPACES = bytes.maketrans(b"[]", b"  ")
+_FLOAT_CHARS = re.compile(rb"[.eE]")
+_INITIAL_ROWS = 64
+_FEED_SIZE = 1024 * 1024  # Bytes acumulados antes de cada llamada a feed en el motor de ejecución
+
+# Un token JSON fuera de la matriz: cadena completa, signo estructural o literal
+_TOKEN = re.compile(rb'\s*(?:("(?:[^"\\]|\\.)*")|([{}\[\]:,])|[^"{}\[\]:,\s]+)')
+
+
+class StreamingMatrixParser:
+    def __init__(self, key: str = "matrix", size_hint: Optional[int] = None):
+        """
+        Crea un parser para el array de la clave indicada.
+
+        Args:
+            key: Clave del objeto JSON que contiene la matriz
+            size_hint: Tamaño total esperado del documento (p. ej. Content-Length),
+                usado para reservar el array de una sola vez
+        """
+        self._key = key
+        self._size_hint = size_hint
+        self._pending = bytearray()
+        self._consumed = 0  # Bytes descartados de _pending hasta ahora
+        self._in_matrix = False
+        self._done = False
+        # Recorrido del documento fuera de la matriz
+        self._skeleton = bytearray()  # Texto sin la matriz, validado en close()
+        self._containers: List[bytes] = []  # Objetos y arrays abiertos
+        self._previous = b""  # Último signo estructural, b'"' tras una cadena o b'0' tras un literal
+        self._key_seen = False  # La última cadena es la clave en el primer nivel
+        self._expect_matrix = False  # Tras la clave y los dos puntos
+        self._buffer: Optional[np.ndarray] = None
+        self._row_shape: Optional[Tuple[int, ...]] = None
+        self._rows = 0
+
+    def feed(self, chunk: Union[bytes, bytearray, memoryview, str]) -> None:
+        """
+        Procesa un nuevo fragmento del documento.
+
+        Raises:
+            ValueError: Si el documento no es válido o la matriz es irregular
+        """
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        if self._done:
+            # Lo que sigue a la matriz se valida al cerrar
+            self._skeleton += chunk
+            return
+        self._pending += chunk
+
+        if not self._in_matrix and not self._find_matrix_start():
+            return
+        self._consume_rows()
+
+    def close(self) -> np.ndarray:
+        """
+        Finaliza el parseo y devuelve la matriz.
+
+        Returns:
+            Matriz NumPy con forma (filas, *forma_de_fila)
+
+        Raises:
+            ValueError: Si el documento terminó antes de cerrar la matriz, no
+                está completo o tiene contenido después del objeto
+        """
+        if not self._in_matrix:
+            raise ValueError(f"El formato JSON no contiene la clave '{self._key}'")
+        if not self._done:
+            raise ValueError("Error al decodificar JSON: la matriz está incompleta")
+        if self._buffer is None:
+            raise ValueError(f"El formato JSON no contiene la clave '{self._key}'")
+        try:
+            json.loads(self._skeleton)
+        except json.JSONDecodeError as e:
+            # La posición del error sería la del esqueleto, no la del documento
+            raise ValueError(f"Error al decodificar JSON: {e.msg}")
+        except UnicodeDecodeError:
+            raise ValueError("Error al decodificar JSON: el documento no está en UTF-8")
+
+        if self._rows != self._buffer.shape[0]:
+            self._buffer.resize((self._rows,) + self._row_shape, refcheck=False)
+        return self._buffer
+
+    def _find_matrix_start(self) -> bool:
+        """
+        Recorre los tokens hasta el array de la clave en el primer nivel del
+        objeto; lo recorrido pasa al esqueleto del documento.
+        """
+        position = 0
+        found = False
+        while not found:
+            match = _TOKEN.match(self._pending, position)
+            # Una cadena partida entre fragmentos espera al siguiente
+            if match is None:
+                break
+            string, sign = match.group(1), match.group(2)
+            if self._expect_matrix:
+                if sign != b"[":
+                    raise ValueError(f"El formato JSON no contiene la clave '{self._key}'")
+                # La matriz empieza después del corchete; en el esqueleto queda '[]'
+                self._skeleton += self._pending[:match.start(2)] + b"[]"
+                position = match.end()
+                found = True
+                break
+            if string is not None:
+                self._key_seen = (
+                    self._containers == [b"{"]
+                    and self._previous in (b"{", b",")
+                    and json.loads(string) == self._key
+                )
+                self._previous = b'"'
+            elif sign is not None:
+                self._expect_matrix = sign == b":" and self._key_seen
+                self._key_seen = False
+                if sign in b"{[":
+                    self._containers.append(sign)
+                elif sign in b"}]":
+                    if not self._containers:
+                        raise ValueError("Error al decodificar JSON: estructura no válida")
+                    self._containers.pop()
+                self._previous = sign
+            else:
+                self._key_seen = False
+                self._previous = b"0"
+            position = match.end()
+
+        if not found:
+            self._skeleton += self._pending[:position]
+        self._discard(position)
+        self._in_matrix = found
+        return found
+
+    def _discard(self, count: int) -> None:
+        del self._pending[:count]
+        self._consumed += count
+
+    def _consume_rows(self) -> None:
+        """Convierte todas las filas completas disponibles en ``_pending``."""
+        data = np.frombuffer(self._pending, dtype=np.uint8)
+        opens = data == _OPEN
+        closes = data == _CLOSE
+        # Profundidad tras cada byte (1 = dentro del array exterior, entre filas)
+        depth = 1 + np.cumsum(opens, dtype=np.int64) - np.cumsum(closes, dtype=np.int64)
+
+        matrix_end = np.flatnonzero(depth == 0)
+        limit = int(matrix_end[0]) if matrix_end.size else len(data)
+        row_ends = np.flatnonzero(closes[:limit] & (depth[:limit] == 1))
+
+        if row_ends.size:
+            end = int(row_ends[-1]) + 1
+            self._parse_rows(data[:end], depth[:end], opens[:end], closes[:end], row_ends.size)
+        else:
+            end = 0
+
+        if matrix_end.size:
+            if bytes(data[end:limit]).strip():
+                raise ValueError("La matriz debe tener al menos dos dimensiones y filas regulares")
+            self._done = True
+            self._skeleton += self._pending[limit + 1:]
+            self._pending = bytearray()
+            return
+
+        del data
+        self._discard(end)
+
+    def _parse_rows(
+        self,
+        data: np.ndarray,
+        depth: np.ndarray,
+        opens: np.ndarray,
+        closes: np.ndarray,
+        row_count: int
+    ) -> None:
+        """Valida la estructura de un bloque de filas y copia sus valores al búfer."""
+        commas = data == _COMMA
+        levels = int(depth.max())
+
+        # Número de elementos de cada array en cada nivel de anidamiento
+        dims = []
+        for level in range(2, levels + 1):
+            level_opens = np.flatnonzero(opens & (depth == level))
+            level_closes = np.flatnonzero(closes & (depth == level - 1))
+            if level_opens.size != level_closes.size or level_opens.size == 0:
+                raise ValueError("Error al decodificar JSON: estructura de matriz no válida")
+            level_commas = np.cumsum(commas & (depth == level), dtype=np.int64)
+            sizes = level_commas[level_closes] - level_commas[level_opens] + 1
+            if np.any(sizes != sizes[0]):
+                raise ValueError("La matriz es irregular: las filas tienen longitudes distintas")
+            dims.append(int(sizes[0]))
+
+        row_shape = tuple(dims)
+        text = bytes(data).translate(_BRACKETS_TO_SPACES).strip()
+        if self._rows:
+            # El bloque empieza con la coma que lo separa de la fila anterior
+            if not text.startswith(b","):
+                raise ValueError("Error al decodificar JSON: falta una coma entre filas")
+            text = text[1:]
+        is_float = _FLOAT_CHARS.search(text) is not None
+
+        if self._buffer is None:
+            self._allocate(row_shape, len(data) / row_count, np.float64 if is_float else np.int64)
+        elif row_shape != self._row_shape:
+            raise ValueError("La matriz es irregular: las filas tienen formas distintas")
+        elif is_float and self._buffer.dtype != np.float64:
+            self._buffer = self._buffer.astype(np.float64)
+
+        try:
+            values = np.fromstring(text, dtype=self._buffer.dtype, sep=",")
+        except ValueError:
+            raise ValueError("Error al decodificar JSON: la matriz contiene valores no numéricos")
+        if values.size != row_count * int(np.prod(row_shape)):
+            raise ValueError("Error al decodificar JSON: la matriz contiene valores no numéricos")
+
+        self._ensure_capacity(self._rows + row_count)
+        self._buffer[self._rows:self._rows + row_count] = values.reshape((row_count,) + row_shape)
+        self._rows += row_count
+
+    def _allocate(self, row_shape: Tuple[int, ...], row_bytes: float, dtype: type) -> None:
+        """Reserva el array a partir de la forma de la primera fila y del tamaño esperado."""
+        self._row_shape = row_shape
+        capacity = _INITIAL_ROWS
+        if self._size_hint:
+            remaining = max(0, self._size_hint - self._consumed)
+            capacity = max(1, int(remaining / max(row_bytes, 1.0) * 1.05) + 1)
+        self._buffer = np.empty((capacity,) + row_shape, dtype=dtype)
+
+    def _ensure_capacity(self, rows: int) -> None:
+        capacity = self._buffer.shape[0]
+        if rows <= capacity:
+            return
+        self._buffer.resize((max(rows, capacity * 2),) + self._row_shape, refcheck=False)
+
+
+def parse_matrix_json(data: Union[bytes, bytearray, memoryview, str], key: str = "matrix") -> np.ndarray:
+    """
+    Parsea un documento JSON completo y devuelve su matriz.
+
+    Args:
+        data: Documento JSON
+        key: Clave que contiene la matriz
+
+    Returns:
+        Matriz NumPy
+    """
+    parser = StreamingMatrixParser(key, size_hint=len(data))
+    parser.feed(data)
+    return parser.close()
+
+
+async def parse_matrix_stream(
+    chunks: AsyncIterable[bytes],
+    size_hint: Optional[int] = None,
+    max_size: Optional[int] = None,
+    key: str = "matrix"
+) -> np.ndarray:
+    """
+    Parsea la matriz a medida que llegan los fragmentos del cuerpo.
+
+    Args:
+        chunks: Iterable asíncrono de fragmentos (p. ej. ``request.stream()``)
+        size_hint: Tamaño total esperado del documento
+        max_size: Tamaño máximo admitido en bytes
+        key: Clave que contiene la matriz
+
+    Returns:
+        Matriz NumPy
+
+    Raises:
+        ValueError: Si el documento no es válido
+        OverflowError: Si el documento supera ``max_size``
+        PoolSaturatedError: Si el motor de ejecución no admite la conversión de un bloque
+    """
+    parser = StreamingMatrixParser(key, size_hint=size_hint)
+    engine = get_execution_engine()
+    received = 0
+    # Cada bloque se convierte en el motor de ejecución, sujeto a su control de admisión
+    pending = bytearray()
+    async for chunk in chunks:
+        received += len(chunk)
+        if max_size is not None and received > max_size:
+            raise OverflowError(f"La matriz supera el tamaño máximo permitido ({max_size} bytes)")
+        pending += chunk
+        if len(pending) >= _FEED_SIZE:
+            await engine.run_local(parser.feed, pending)
+            pending = bytearray()
+    await engine.run_local(parser.feed, pending)
+    return await engine.run_local(parser.close)
@@ -0,0 +1,269 @@
+"""
+Conversión de matrices más grandes que la memoria.
+
+El ``.npy`` recibido se guarda en disco y se proyecta con
+``np.load(mmap_mode='r')``: solo se leen las filas que se están procesando.
+La normalización y la codificación se hacen por franjas de filas (PNG
+transmitido según se comprime) o por teselas (TIFF por teselas), con un
+tamaño de bloque calculado a partir de ``LARGE_MATRIX_MEMORY_LIMIT`` y no del
+tamaño de la matriz.
+"""
+import os
+import tempfile
+from typing import AsyncIterator, BinaryIO, Optional, Tuple
+
+import numpy as np
+
+from src.config.settings import get_settings
+from src.services.binary_matrix import NPY_MAGIC, is_npy_buffer
+from src.services.colormaps import colorize
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.services.encoders import zlib_level
+from src.services.execution_engine import get_execution_engine
+from src.services.normalization import Range, apply_range, release_rows, resolve_range
+from src.services.region import crop_and_stride
+from src.services.streaming import stream_from_pool
+from src.services.strip_encoders import StripPngWriter, TiledTiffWriter
+
+LARGE_OUTPUT_FORMATS = ("png", "tiff")
+
+# Memoria fija de cada conversión, aparte de los bloques: franjas internas de
+# la normalización y tablas de consulta de los mapas de color
+_FIXED_OVERHEAD = 16 * 1024 * 1024
+# Copias de los píxeles de salida que conviven al codificar un bloque
+# (píxeles, bytes filtrados o teselas y la salida comprimida)
+_OUTPUT_COPIES = 3
+
+
+class LargeMatrixService:
+    @staticmethod
+    def open_matrix(path: str) -> np.ndarray:
+        """
+        Proyecta en memoria un archivo ``.npy`` (solo lectura) y valida su forma.
+
+        Args:
+            path: Ruta del archivo
+
+        Returns:
+            Matriz proyectada desde disco
+
+        Raises:
+            ValueError: Si el archivo no es un ``.npy`` con una matriz de imagen válida
+        """
+        with open(path, "rb") as fp:
+            if not is_npy_buffer(fp.read(len(NPY_MAGIC))):
+                raise ValueError("El cuerpo debe ser un archivo .npy")
+        try:
+            matrix = np.load(path, mmap_mode="r", allow_pickle=False)
+        except Exception as e:
+            raise ValueError(f"Error al cargar matriz NumPy: {str(e)}")
+
+        if not isinstance(matrix, np.ndarray):
+            raise ValueError("El archivo debe contener un único array .npy")
+        if matrix.dtype.kind not in "biuf":
+            raise ValueError(f"Tipo de datos no admitido: {matrix.dtype}")
+        if matrix.ndim not in (2, 3) or (matrix.ndim == 3 and matrix.shape[2] not in (1, 3, 4)):
+            raise ValueError(f"Dimensiones de matriz no compatibles: {matrix.shape}")
+        if matrix.size == 0:
+            raise ValueError("La matriz está vacía")
+        return matrix
+
+    @staticmethod
+    def select_view(matrix: np.ndarray, options: ConversionOptions = DEFAULT_OPTIONS) -> np.ndarray:
+        """
+        Aplica ``crop`` y ``stride`` como vistas de la matriz proyectada.
+
+        Raises:
+            ValueError: Si se pide ``max_width``/``max_height`` (la reducción
+                con INTER_AREA necesita la región completa en memoria) o si el
+                recorte queda fuera de la matriz
+        """
+        if options.max_width is not None or options.max_height is not None:
+            raise ValueError("'max_width' y 'max_height' requieren la matriz completa en memoria; use 'stride'")
+        return crop_and_stride(matrix, options)
+
+    @staticmethod
+    def output_layout(matrix: np.ndarray, options: ConversionOptions = DEFAULT_OPTIONS) -> Tuple[int, np.dtype]:
+        """
+        Devuelve los canales y el tipo de los píxeles de la imagen resultante.
+
+        Raises:
+            ValueError: Si se pide un mapa de color para una matriz de varios canales
+        """
+        channels = matrix.shape[2] if matrix.ndim == 3 else 1
+        if options.colormap is not None:
+            if channels != 1:
+                raise ValueError("Los mapas de color requieren una matriz de un solo canal")
+            channels = 3
+        dtype = np.dtype(np.uint16 if options.normalize == "passthrough" else np.uint8)
+        return channels, dtype
+
+    @staticmethod
+    def block_values(matrix: np.ndarray, options: ConversionOptions, memory_limit: int) -> int:
+        """Número de valores de entrada que se procesan a la vez sin superar ``memory_limit``."""
+        channels, dtype = LargeMatrixService.output_layout(matrix, options)
+        in_bytes = matrix.itemsize * (matrix.shape[2] if matrix.ndim == 3 else 1)
+        per_pixel = in_bytes + _OUTPUT_COPIES * channels * dtype.itemsize
+        return max(1, (memory_limit - _FIXED_OVERHEAD) // per_pixel)
+
+    @staticmethod
+    def _render_block(
+        block: np.ndarray,
+        value_range: Optional[Range],
+        options: ConversionOptions,
+        dtype: np.dtype
+    ) -> np.ndarray:
+        """Normaliza (o colorea) un bloque de la matriz proyectada."""
+        block = np.asarray(block)
+        if block.ndim == 3 and block.shape[2] == 1:
+            block = block[:, :, 0]
+        if options.colormap is not None:
+            return colorize(block, value_range or (0.0, 255.0), options.colormap)
+        if value_range is None:
+            # Ya está en el tipo de salida: se codifica directamente desde disco
+            return block
+        return apply_range(block, value_range, np.empty(block.shape, dtype=dtype))
+
+    @staticmethod
+    def encode_large_matrix(
+        path: str,
+        output_format: str,
+        fp: BinaryIO,
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> None:
+        """
+        Convierte el ``.npy`` de ``path`` en una imagen escrita en ``fp``.
+
+        El intervalo de normalización se calcula con una pasada por franjas;
+        después la matriz se normaliza y codifica por bloques de filas (PNG) o
+        de teselas (TIFF, que requiere un ``fp`` con ``seek``).
+
+        Args:
+            path: Ruta del ``.npy``
+            output_format: 'png' o 'tiff'
+            fp: Objeto tipo archivo de destino
+            options: Opciones de conversión (normalización, mapa de color, ``crop``,
+                ``stride`` y nivel de compresión del perfil o ``compress_level``)
+        """
+        settings = get_settings()
+        output_format = output_format.lower()
+        if output_format not in LARGE_OUTPUT_FORMATS:
+            raise ValueError(
+                f"Formato de salida no válido para matrices grandes. Formatos permitidos: {', '.join(LARGE_OUTPUT_FORMATS)}"
+            )
+
+        matrix = LargeMatrixService.select_view(LargeMatrixService.open_matrix(path), options)
+        channels, dtype = LargeMatrixService.output_layout(matrix, options)
+        value_range = resolve_range(matrix, options)
+        block_values = LargeMatrixService.block_values(matrix, options, settings.LARGE_MATRIX_MEMORY_LIMIT)
+        height, width = matrix.shape[:2]
+
+        if output_format == "png":
+            writer = StripPngWriter(fp, width, height, channels, dtype, compress_level=zlib_level(options))
+            rows = max(1, block_values // width)
+            for start in range(0, height, rows):
+                writer.write_rows(
+                    LargeMatrixService._render_block(matrix[start:start + rows], value_range, options, dtype)
+                )
+                release_rows(matrix, start, start + rows)
+            writer.close()
+            return
+
+        tile = settings.LARGE_MATRIX_TILE_SIZE
+        writer = TiledTiffWriter(
+            fp, width, height, channels, dtype, tile_size=tile, compress_level=zlib_level(options)
+        )
+        # Bloques de una fila de teselas y tantas columnas de teselas como quepan
+        columns = max(1, block_values // (tile * tile)) * tile
+        for tile_row in range(writer.tiles_down):
+            band = matrix[tile_row * tile:(tile_row + 1) * tile]
+            for left in range(0, width, columns):
+                pixels = LargeMatrixService._render_block(band[:, left:left + columns], value_range, options, dtype)
+                for offset in range(0, pixels.shape[1], tile):
+                    writer.write_tile(tile_row, (left + offset) // tile, pixels[:, offset:offset + tile])
+            release_rows(matrix, tile_row * tile, (tile_row + 1) * tile)
+        writer.close()
+
+    @staticmethod
+    def render_pixels(matrix: np.ndarray, output_path: str, options: ConversionOptions = DEFAULT_OPTIONS) -> np.ndarray:
+        """
+        Normaliza (o colorea) la matriz por franjas en un ``.npy`` de píxeles.
+
+        Ni la matriz (en memoria o proyectada) ni la salida quedan residentes
+        enteras: ambas se recorren por bloques de ``LARGE_MATRIX_MEMORY_LIMIT``.
+
+        Args:
+            matrix: Matriz 2D o 3D, ya recortada con ``select_view``
+            output_path: Ruta del ``.npy`` de píxeles (uint8, o uint16 en 'passthrough')
+            options: Opciones de conversión (normalización y mapa de color)
+
+        Returns:
+            Píxeles proyectados desde ``output_path``
+        """
+        settings = get_settings()
+        channels, dtype = LargeMatrixService.output_layout(matrix, options)
+        value_range = resolve_range(matrix, options)
+        block_values = LargeMatrixService.block_values(matrix, options, settings.LARGE_MATRIX_MEMORY_LIMIT)
+        height, width = matrix.shape[:2]
+
+        shape = (height, width) + ((channels,) if channels > 1 else ())
+        pixels = np.lib.format.open_memmap(output_path, mode="w+", dtype=dtype, shape=shape)
+        rows = max(1, block_values // width)
+        for start in range(0, height, rows):
+            pixels[start:start + rows] = LargeMatrixService._render_block(
+                matrix[start:start + rows], value_range, options, dtype
+            )
+            release_rows(matrix, start, start + rows)
+            release_rows(pixels, start, start + rows)
+        pixels.flush()
+        return pixels
+
+    @staticmethod
+    def _encode_to_path(path: str, output_format: str, output_path: str, options: ConversionOptions) -> None:
+        with open(output_path, "wb") as fp:
+            LargeMatrixService.encode_large_matrix(path, output_format, fp, options)
+
+    @staticmethod
+    async def render_to_file(
+        path: str,
+        output_format: str,
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> str:
+        """
+        Convierte el ``.npy`` en el motor de ejecución y deja la imagen en un archivo temporal.
+
+        Returns:
+            Ruta de la imagen generada (la elimina quien la sirve)
+
+        Raises:
+            PoolSaturatedError: Si el motor de ejecución está saturado
+        """
+        settings = get_settings()
+        fd, output_path = tempfile.mkstemp(suffix=f".{output_format}", dir=settings.LARGE_MATRIX_SPOOL_DIR)
+        os.close(fd)
+        try:
+            await get_execution_engine().run(
+                LargeMatrixService._encode_to_path, path, output_format, output_path, options
+            )
+        except BaseException:
+            os.remove(output_path)
+            raise
+        return output_path
+
+    @staticmethod
+    def stream_png(path: str, options: ConversionOptions = DEFAULT_OPTIONS) -> AsyncIterator[bytes]:
+        """
+        Convierte el ``.npy`` a PNG y entrega la imagen por fragmentos según se comprime.
+
+        Returns:
+            Iterador asíncrono de fragmentos del PNG
+        """
+        settings = get_settings()
+        return stream_from_pool(
+            LargeMatrixService.encode_large_matrix,
+            path,
+            "png",
+            options=options,
+            chunk_size=settings.STREAM_CHUNK_SIZE,
+            max_pending=settings.STREAM_MAX_PENDING_CHUNKS,
+        )
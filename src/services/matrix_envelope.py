@@ -0,0 +1,31 @@
+"""
+Envoltorio tipado de una matriz ya parseada y validada.
+"""
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class MatrixEnvelope:
+    """
+    Matriz validada que viaja del controlador al servicio.
+
+    Se construye una única vez en ``validate_matrix_data``; las capas
+    siguientes usan ``matrix`` directamente sin volver a parsear la entrada.
+    """
+    matrix: np.ndarray
+    source_format: str
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.matrix.shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.matrix.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
@@ -2,58 +2,125 @@
 Servicio para la conversión de matrices a imágenes.
 """
 import numpy as np
-from PIL import Image
-import cv2
+from PIL import Image, ImageDraw, ImageFont
 import io
-import json
-import base64
-from typing import Dict, List, Union, BinaryIO, Tuple
-import matplotlib.pyplot as plt
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Optional, Union, BinaryIO, Tuple
+
+from src.config.settings import get_settings
+from src.services.binary_matrix import RawMatrixBuffer, load_npy_buffer, load_raw_buffer
+from src.services.execution_engine import get_execution_engine
+from src.services.json_stream_parser import parse_matrix_json
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.services.matrix_envelope import MatrixEnvelope
+from src.services.colormaps import colorize
+from src.services.encoders import encode_pixels
+from src.services.normalization import normalize_matrix, resolve_range
+from src.services.region import select_region
+from src.services.streaming import stream_from_pool
+from src.utils.lazy_import import cv2, matplotlib
+from src.utils.timing import StageTimer
+
+# Modos de comparación: dos renderizados de imagen y uno solo de métricas
+RENDER_MODES = ("fast", "figure")
+COMPARISON_MODES = RENDER_MODES + ("metrics",)
+COMPARISON_TITLES = ("Imagen Original", "Imagen Reconstruida", "Diferencia")
+
+# Formatos que admiten píxeles de 16 bits (modo de normalización 'passthrough')
+SIXTEEN_BIT_FORMATS = ("png", "tiff")
+
+# Parámetros de SSIM (Wang et al., 2004): ventana gaussiana 11x11 con sigma 1.5
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+_SSIM_WINDOW = (11, 11)
+_SSIM_SIGMA = 1.5
+_SSIM_HALO = 5  # Filas extra por cada lado de una franja para que el filtro sea exacto
 
 class MatrixService:
     @staticmethod
     async def matrix_to_image(
-        matrix_data: Union[Dict, BinaryIO, str],
+        matrix_data: Union[MatrixEnvelope, Dict, BinaryIO, str, bytes, RawMatrixBuffer],
         format: str,
-        output_format: str = "png"
+        output_format: str = "png",
+        timer: Optional[StageTimer] = None,
+        options: ConversionOptions = DEFAULT_OPTIONS
     ) -> Tuple[bytes, str]:
         """
         Convierte una matriz numérica a una imagen.
         
+        El parseo y la codificación se ejecutan en el motor de ejecución para
+        no bloquear el event loop.
+        
         Args:
-            matrix_data: Datos de la matriz en formato JSON o NumPy serializado
-            format: Formato de entrada ('json' o 'numpy')
+            matrix_data: Matriz validada (MatrixEnvelope) o datos en formato JSON,
+                NumPy serializado o búfer crudo
+            format: Formato de entrada ('json', 'numpy' o 'raw')
             output_format: Formato de salida de la imagen
+            timer: Temporizador opcional donde se registran las etapas
+            options: Opciones de conversión (normalización)
             
         Returns:
             Tupla con los bytes de la imagen y el tipo de contenido
+            
+        Raises:
+            PoolSaturatedError: Si el motor de ejecución está saturado
         """
-        # Convertir los datos de entrada a una matriz NumPy
-        matrix = MatrixService._parse_matrix_input(matrix_data, format)
-        
-        # Realizar la conversión a imagen
-        img_bytes = MatrixService._convert_matrix_to_image_bytes(matrix, output_format)
+        img_bytes, stages = await get_execution_engine().run(
+            MatrixService._render_matrix, matrix_data, format, output_format, options, timer=timer
+        )
+        if timer is not None:
+            timer.merge(stages)
         
         # Definir el tipo MIME según el formato de salida
         content_type = f"image/{output_format}"
         
         return img_bytes, content_type
     
+    @staticmethod
+    def _render_matrix(
+        matrix_data: Union[MatrixEnvelope, Dict, BinaryIO, str, bytes, RawMatrixBuffer],
+        format: str,
+        output_format: str,
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> Tuple[bytes, Dict[str, float]]:
+        """
+        Parsea y codifica la matriz de forma síncrona (se ejecuta en el pool).
+        
+        Returns:
+            Tupla con los bytes de la imagen y la duración de cada etapa
+        """
+        timer = StageTimer()
+        
+        # Convertir los datos de entrada a una matriz NumPy
+        with timer.stage("parse"):
+            matrix = MatrixService._parse_matrix_input(matrix_data, format)
+        
+        # Realizar la conversión a imagen
+        img_bytes = MatrixService._convert_matrix_to_image_bytes(matrix, output_format, timer, options)
+        
+        return img_bytes, timer.stages
+    
     @staticmethod
     def _parse_matrix_input(
-        data: Union[Dict, BinaryIO, str],
+        data: Union[MatrixEnvelope, Dict, BinaryIO, str, bytes, RawMatrixBuffer, np.ndarray],
         format: str
     ) -> np.ndarray:
         """
         Parsea los datos de entrada en una matriz NumPy.
         
         Args:
-            data: Datos de entrada en formato JSON o NumPy serializado
-            format: Formato de los datos ('json' o 'numpy')
+            data: Datos de entrada en formato JSON, NumPy serializado o búfer crudo
+            format: Formato de los datos ('json', 'numpy' o 'raw')
             
         Returns:
             Matriz NumPy
         """
+        # Si ya viene validada en su envoltorio o como matriz NumPy
+        if isinstance(data, MatrixEnvelope):
+            return data.matrix
+        if isinstance(data, np.ndarray):
+            return data
+        
         if format.lower() == "json":
             # Si es un diccionario, extraer directamente
             if isinstance(data, dict):
@@ -62,91 +129,172 @@ class MatrixService:
                     raise ValueError("El formato JSON no contiene la clave 'matrix'")
                 return np.array(matrix_data)
             
-            # Si es una cadena JSON
-            if isinstance(data, str):
-                try:
-                    json_data = json.loads(data)
-                    matrix_data = json_data.get("matrix")
-                    if not matrix_data:
-                        raise ValueError("El formato JSON no contiene la clave 'matrix'")
-                    return np.array(matrix_data)
-                except json.JSONDecodeError:
-                    raise ValueError("Error al decodificar JSON")
-            
-            # Si son bytes JSON
-            try:
-                json_data = json.loads(data)
-                matrix_data = json_data.get("matrix")
-                if not matrix_data:
-                    raise ValueError("El formato JSON no contiene la clave 'matrix'")
-                return np.array(matrix_data)
-            except (json.JSONDecodeError, TypeError, AttributeError):
-                raise ValueError("Formato de datos JSON no válido")
+            # Si es una cadena o bytes JSON: parseo incremental sin listas intermedias
+            if isinstance(data, (str, bytes, bytearray, memoryview)):
+                return parse_matrix_json(data)
+            
+            raise ValueError("Formato de datos JSON no válido")
         
         elif format.lower() == "numpy":
             try:
                 # Si es un archivo binario o bytes directos
                 if hasattr(data, 'read'):
-                    return np.load(data)
-                elif isinstance(data, bytes):
-                    buffer = io.BytesIO(data)
-                    return np.load(buffer)
+                    return np.load(data, allow_pickle=False)
+                elif isinstance(data, (bytes, bytearray, memoryview)):
+                    # Sin copias: la matriz se construye sobre el propio búfer
+                    return load_npy_buffer(data)
                 else:
                     raise ValueError("Formato de datos NumPy no válido")
             except Exception as e:
                 raise ValueError(f"Error al cargar matriz NumPy: {str(e)}")
         
+        elif format.lower() == "raw":
+            if not isinstance(data, RawMatrixBuffer):
+                raise ValueError("El formato 'raw' requiere un búfer con dtype y forma")
+            try:
+                return load_raw_buffer(data)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Error al cargar matriz cruda: {str(e)}")
+        
         else:
             raise ValueError(f"Formato no admitido: {format}")
     
     @staticmethod
-    def _convert_matrix_to_image_bytes(matrix: np.ndarray, output_format: str) -> bytes:
+    def _convert_matrix_to_image_bytes(
+        matrix: np.ndarray,
+        output_format: str,
+        timer: Optional[StageTimer] = None,
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> bytes:
         """
         Convierte una matriz NumPy en bytes de imagen.
         
         Args:
             matrix: Matriz NumPy con los datos de la imagen
             output_format: Formato de salida de la imagen
+            timer: Temporizador opcional para las etapas 'normalize' y 'encode'
+            options: Opciones de conversión (normalización)
             
         Returns:
             Bytes de la imagen
         """
+        img_buffer = io.BytesIO()
+        MatrixService._encode_matrix(matrix, output_format, img_buffer, timer, options)
+        return img_buffer.getvalue()
+    
+    @staticmethod
+    def _encode_matrix(
+        matrix: np.ndarray,
+        output_format: str,
+        fp: BinaryIO,
+        timer: Optional[StageTimer] = None,
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> None:
+        """
+        Recorta, normaliza y codifica la matriz escribiendo en ``fp``.
+        
+        El codificador escribe a medida que comprime, de modo que ``fp`` puede
+        ser un canal de transmisión en lugar de un búfer en memoria.
+        
+        Args:
+            matrix: Matriz NumPy con los datos de la imagen
+            output_format: Formato de salida de la imagen
+            fp: Objeto tipo archivo de destino
+            timer: Temporizador opcional para las etapas 'region', 'normalize' y 'encode'
+            options: Opciones de conversión (normalización, región y codificador)
+        """
+        timer = timer if timer is not None else StageTimer()
+        pixels = MatrixService._matrix_pixels(matrix, output_format, timer, options)
+        
+        # Codificar en el formato solicitado
+        with timer.stage("encode"):
+            encode_pixels(pixels, output_format, fp, options)
+    
+    @staticmethod
+    def _matrix_pixels(
+        matrix: np.ndarray,
+        output_format: str,
+        timer: StageTimer,
+        options: ConversionOptions = DEFAULT_OPTIONS,
+        out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Recorta y normaliza la matriz hasta los píxeles que recibe el codificador.
+        
+        El recorte, el paso y la reducción de tamaño se aplican antes de
+        normalizar, de modo que el resto del proceso trabaja con el tamaño de
+        salida.
+        
+        Args:
+            matrix: Matriz NumPy con los datos de la imagen
+            output_format: Formato de salida de la imagen
+            timer: Temporizador para las etapas 'region' y 'normalize'
+            options: Opciones de conversión (normalización y región)
+            out: Array de píxeles reutilizable (se ignora si no coincide con la salida)
+            
+        Returns:
+            Píxeles uint8 (o uint16 en 'passthrough'), RGB(A) o escala de grises
+        """
         # Verificar dimensiones
         if len(matrix.shape) not in [2, 3]:
             raise ValueError("La matriz debe ser 2D (escala grises) o 3D (color)")
         
-        # Normalización si los valores están entre 0 y 1
-        if matrix.dtype == np.float32 or matrix.dtype == np.float64:
-            if np.max(matrix) <= 1.0:
-                matrix = (matrix * 255).astype(np.uint8)
-        
-        # Convertir a uint8 si es necesario
-        if matrix.dtype != np.uint8:
-            matrix = matrix.astype(np.uint8)
-        
-        # Crear imagen desde matriz
-        if len(matrix.shape) == 2:  # Escala de grises
-            img = Image.fromarray(matrix, mode='L')
-        elif matrix.shape[2] == 1:  # Escala de grises con dimensión adicional
-            img = Image.fromarray(matrix.squeeze(), mode='L')
-        elif matrix.shape[2] == 3:  # RGB
-            img = Image.fromarray(matrix, mode='RGB')
-        elif matrix.shape[2] == 4:  # RGBA
-            img = Image.fromarray(matrix, mode='RGBA')
-        else:
+        if len(matrix.shape) == 3 and matrix.shape[2] not in (1, 3, 4):
             raise ValueError(f"Dimensiones de matriz no compatibles: {matrix.shape}")
+        if options.normalize == "passthrough" and output_format.lower() not in SIXTEEN_BIT_FORMATS:
+            raise ValueError(
+                f"El modo 'passthrough' (16 bits) solo admite los formatos: {', '.join(SIXTEEN_BIT_FORMATS)}"
+            )
         
-        # Convertir a bytes en el formato solicitado
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format=output_format.upper())
-        img_buffer.seek(0)
+        with timer.stage("region"):
+            matrix = select_region(matrix, options)
         
-        return img_buffer.getvalue()
+        with timer.stage("normalize"):
+            # Llevar los valores a uint8 (o uint16 en 'passthrough') sin desbordamientos
+            if len(matrix.shape) == 3 and matrix.shape[2] == 1:
+                matrix = matrix[:, :, 0]
+            if options.colormap is not None:
+                # Mapa de color: la normalización decide qué intervalo recorre el mapa
+                if len(matrix.shape) != 2:
+                    raise ValueError("Los mapas de color requieren una matriz de un solo canal")
+                value_range = resolve_range(matrix, options) or (0.0, 255.0)
+                return colorize(matrix, value_range, options.colormap, out)
+            return normalize_matrix(matrix, options, out)
+    
+    @staticmethod
+    def stream_matrix_image(
+        matrix: np.ndarray,
+        output_format: str = "png",
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> AsyncIterator[bytes]:
+        """
+        Codifica la matriz en el motor de ejecución y entrega la imagen por
+        fragmentos según se comprime, sin reunirla completa en memoria.
+        
+        Args:
+            matrix: Matriz validada
+            output_format: Formato de salida de la imagen
+            options: Opciones de conversión (normalización)
+            
+        Returns:
+            Iterador asíncrono de fragmentos de la imagen
+        """
+        settings = get_settings()
+        return stream_from_pool(
+            MatrixService._encode_matrix,
+            matrix,
+            output_format,
+            options=options,
+            chunk_size=settings.STREAM_CHUNK_SIZE,
+            max_pending=settings.STREAM_MAX_PENDING_CHUNKS,
+        )
     
     @staticmethod
     async def generate_comparison_image(
         original_image_bytes: bytes,
-        reconstructed_image_bytes: bytes
+        reconstructed_image_bytes: bytes,
+        timer: Optional[StageTimer] = None,
+        mode: str = "fast"
     ) -> bytes:
         """
         Genera una imagen de comparación entre la original y la reconstruida.
@@ -154,9 +302,225 @@ class MatrixService:
         Args:
             original_image_bytes: Bytes de la imagen original
             reconstructed_image_bytes: Bytes de la imagen reconstruida
+            timer: Temporizador opcional donde se registran las etapas
+            mode: 'fast' (compositor NumPy/Pillow) o 'figure' (figura de matplotlib)
             
         Returns:
             Bytes de la imagen de comparación
+            
+        Raises:
+            ValueError: Si el modo no es válido
+            PoolSaturatedError: Si el motor de ejecución está saturado
+        """
+        if mode not in RENDER_MODES:
+            raise ValueError(
+                f"Modo de comparación no válido: {mode}. Modos permitidos: {', '.join(RENDER_MODES)}"
+            )
+        
+        comparison_bytes, stages = await get_execution_engine().run(
+            MatrixService._render_comparison,
+            original_image_bytes,
+            reconstructed_image_bytes,
+            mode,
+            timer=timer
+        )
+        if timer is not None:
+            timer.merge(stages)
+        return comparison_bytes
+    
+    @staticmethod
+    def _render_comparison(
+        original_image_bytes: bytes,
+        reconstructed_image_bytes: bytes,
+        mode: str = "fast"
+    ) -> Tuple[bytes, Dict[str, float]]:
+        """
+        Renderiza la comparación de forma síncrona (se ejecuta en el pool).
+        
+        Args:
+            original_image_bytes: Bytes de la imagen original
+            reconstructed_image_bytes: Bytes de la imagen reconstruida
+            mode: 'fast' o 'figure'
+            
+        Returns:
+            Tupla con los bytes de la imagen de comparación y la duración de las etapas
+        """
+        timer = StageTimer()
+        with timer.stage("decode"):
+            original, reconstructed = MatrixService._load_comparison_pair(
+                original_image_bytes, reconstructed_image_bytes
+            )
+        with timer.stage("compare"):
+            if mode == "figure":
+                comparison_bytes = MatrixService._compose_comparison_figure(original, reconstructed)
+            else:
+                comparison_bytes = MatrixService._compose_comparison_tiles(original, reconstructed)
+        return comparison_bytes, timer.stages
+    
+    @staticmethod
+    async def compute_comparison_metrics(
+        original_image_bytes: bytes,
+        reconstructed_image_bytes: bytes,
+        timer: Optional[StageTimer] = None
+    ) -> Dict[str, Any]:
+        """
+        Calcula métricas cuantitativas entre la imagen original y la reconstruida
+        sin renderizar ninguna imagen.
+        
+        Args:
+            original_image_bytes: Bytes de la imagen original
+            reconstructed_image_bytes: Bytes de la imagen reconstruida
+            timer: Temporizador opcional donde se registran las etapas
+            
+        Returns:
+            Diccionario con MSE, PSNR, SSIM, MAE, error máximo, estadísticas
+            por canal e histograma de la diferencia absoluta
+            
+        Raises:
+            PoolSaturatedError: Si el motor de ejecución está saturado
+        """
+        metrics, stages = await get_execution_engine().run(
+            MatrixService._render_metrics,
+            original_image_bytes,
+            reconstructed_image_bytes,
+            get_settings().METRICS_TILE_ROWS,
+            timer=timer
+        )
+        if timer is not None:
+            timer.merge(stages)
+        return metrics
+    
+    @staticmethod
+    def _render_metrics(
+        original_image_bytes: bytes,
+        reconstructed_image_bytes: bytes,
+        tile_rows: int
+    ) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        """Decodifica el par de imágenes y calcula las métricas (se ejecuta en el pool)."""
+        timer = StageTimer()
+        with timer.stage("decode"):
+            original, reconstructed = MatrixService._load_comparison_pair(
+                original_image_bytes, reconstructed_image_bytes
+            )
+        with timer.stage("metrics"):
+            metrics = MatrixService._compute_metrics(original, reconstructed, tile_rows)
+        return metrics, timer.stages
+    
+    @staticmethod
+    def _compute_metrics(
+        original: np.ndarray,
+        reconstructed: np.ndarray,
+        tile_rows: int = 512
+    ) -> Dict[str, Any]:
+        """
+        Calcula las métricas por franjas de filas para acotar la memoria.
+        
+        Cada franja solo reserva temporales de su propio tamaño; para SSIM se
+        añaden ``_SSIM_HALO`` filas de contexto a cada lado, de modo que el
+        resultado es idéntico al de procesar la imagen completa.
+        
+        Args:
+            original: Imagen original (alto, ancho, canales) uint8
+            reconstructed: Imagen reconstruida del mismo tamaño
+            tile_rows: Filas por franja
+            
+        Returns:
+            Diccionario con las métricas
+        """
+        height, width, channels = original.shape
+        tile_rows = max(1, tile_rows)
+        
+        sq_err = np.zeros(channels, dtype=np.float64)
+        abs_err = np.zeros(channels, dtype=np.float64)
+        max_err = np.zeros(channels, dtype=np.int64)
+        ssim_sum = np.zeros(channels, dtype=np.float64)
+        histogram = np.zeros(256, dtype=np.int64)
+        
+        for start in range(0, height, tile_rows):
+            stop = min(height, start + tile_rows)
+            
+            diff = cv2.absdiff(original[start:stop], reconstructed[start:stop])
+            diff_f = diff.astype(np.float32)
+            sq_err += np.einsum("ijk,ijk->k", diff_f, diff_f, dtype=np.float64)
+            abs_err += diff.sum(axis=(0, 1), dtype=np.float64)
+            max_err = np.maximum(max_err, diff.max(axis=(0, 1)))
+            histogram += np.bincount(diff.ravel(), minlength=256)
+            
+            # SSIM sobre la franja ampliada con el halo, recortando después
+            halo_start = max(0, start - _SSIM_HALO)
+            halo_stop = min(height, stop + _SSIM_HALO)
+            ssim_map = MatrixService._ssim_map(
+                original[halo_start:halo_stop], reconstructed[halo_start:halo_stop]
+            )
+            ssim_sum += ssim_map[start - halo_start:stop - halo_start].sum(axis=(0, 1), dtype=np.float64)
+        
+        pixels = height * width
+        mse = sq_err / pixels
+        ssim = ssim_sum / pixels
+        
+        per_channel = {}
+        names = ("R", "G", "B", "A")[:channels] if channels > 1 else ("L",)
+        for index, name in enumerate(names):
+            per_channel[name] = {
+                "mse": float(mse[index]),
+                "psnr": _psnr(mse[index]),
+                "ssim": float(ssim[index]),
+                "mae": float(abs_err[index] / pixels),
+                "max_abs_error": int(max_err[index]),
+            }
+        
+        total_mse = float(mse.mean())
+        return {
+            "width": width,
+            "height": height,
+            "channels": channels,
+            "identical": bool(max_err.max() == 0),
+            "mse": total_mse,
+            "psnr": _psnr(total_mse),
+            "ssim": float(ssim.mean()),
+            "mae": float(abs_err.sum() / (pixels * channels)),
+            "max_abs_error": int(max_err.max()),
+            "per_channel": per_channel,
+            "abs_diff_histogram": histogram.tolist(),
+        }
+    
+    @staticmethod
+    def _ssim_map(original: np.ndarray, reconstructed: np.ndarray) -> np.ndarray:
+        """Mapa SSIM por píxel y canal con ventana gaussiana (OpenCV)."""
+        x = original.astype(np.float32)
+        y = reconstructed.astype(np.float32)
+        
+        def blur(image: np.ndarray) -> np.ndarray:
+            return cv2.GaussianBlur(image, _SSIM_WINDOW, _SSIM_SIGMA).reshape(image.shape)
+        
+        mu_x = blur(x)
+        mu_y = blur(y)
+        mu_xy = mu_x * mu_y
+        mu_x_sq = np.square(mu_x, out=mu_x)
+        mu_y_sq = np.square(mu_y, out=mu_y)
+        
+        sigma_x_sq = blur(x * x) - mu_x_sq
+        sigma_y_sq = blur(y * y) - mu_y_sq
+        sigma_xy = blur(x * y) - mu_xy
+        
+        numerator = (2 * mu_xy + _SSIM_C1) * (2 * sigma_xy + _SSIM_C2)
+        denominator = (mu_x_sq + mu_y_sq + _SSIM_C1) * (sigma_x_sq + sigma_y_sq + _SSIM_C2)
+        return numerator / denominator
+    
+    @staticmethod
+    def _load_comparison_pair(
+        original_image_bytes: bytes,
+        reconstructed_image_bytes: bytes
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Decodifica ambas imágenes como RGB y las lleva al mismo tamaño.
+        
+        Args:
+            original_image_bytes: Bytes de la imagen original
+            reconstructed_image_bytes: Bytes de la imagen reconstruida
+            
+        Returns:
+            Tupla (original, reconstruida) de arrays uint8 con forma (alto, ancho, 3)
         """
         # Cargar imágenes
         original_img = Image.open(io.BytesIO(original_image_bytes))
@@ -177,37 +541,95 @@ class MatrixService:
         if reconstructed_img.size != (width, height):
             reconstructed_img = reconstructed_img.resize((width, height), Image.LANCZOS)
         
-        # Convertir a arrays NumPy
-        original_array = np.array(original_img)
-        reconstructed_array = np.array(reconstructed_img)
+        return np.asarray(original_img), np.asarray(reconstructed_img)
+    
+    @staticmethod
+    def _compose_comparison_tiles(original: np.ndarray, reconstructed: np.ndarray) -> bytes:
+        """
+        Compone original | reconstruida | diferencia en un único array reservado
+        de antemano, con las etiquetas dibujadas por Pillow.
         
-        # Calcular diferencia absoluta
-        diff_array = np.abs(original_array.astype(np.float32) - reconstructed_array.astype(np.float32)).astype(np.uint8)
+        Args:
+            original: Imagen original RGB
+            reconstructed: Imagen reconstruida RGB del mismo tamaño
+            
+        Returns:
+            Bytes PNG de la imagen de comparación
+        """
+        height, width = original.shape[:2]
+        gap = max(4, width // 50)
+        label_height = max(20, min(48, height // 12))
         
-        # Crear imagen de diferencia
-        diff_img = Image.fromarray(diff_array)
+        canvas = np.full((label_height + height, 3 * width + 2 * gap, 3), 255, dtype=np.uint8)
+        panels = [canvas[label_height:, i * (width + gap):i * (width + gap) + width] for i in range(3)]
+        panels[0][...] = original
+        panels[1][...] = reconstructed
+        # La diferencia se escribe directamente en su panel, sin imagen intermedia
+        cv2.absdiff(original, reconstructed, dst=panels[2])
         
-        # Crear figura de comparación
-        fig, axes = plt.subplots(1, 3, figsize=(15, 5))
+        # Etiquetas: se dibujan sobre la franja superior del lienzo
+        labels = Image.fromarray(canvas[:label_height])
+        draw = ImageDraw.Draw(labels)
+        font = _label_font(int(label_height * 0.6))
+        for i, title in enumerate(COMPARISON_TITLES):
+            left, top, right, bottom = draw.textbbox((0, 0), title, font=font)
+            x = i * (width + gap) + (width - (right - left)) // 2
+            y = (label_height - (bottom - top)) // 2 - top
+            draw.text((x, y), title, fill=(0, 0, 0), font=font)
+        canvas[:label_height] = np.asarray(labels)
         
-        # Mostrar imágenes
-        axes[0].imshow(np.array(original_img))
-        axes[0].set_title("Imagen Original")
-        axes[0].axis("off")
+        buf = io.BytesIO()
+        Image.fromarray(canvas).save(buf, format='PNG')
+        return buf.getvalue()
+    
+    @staticmethod
+    def _compose_comparison_figure(original: np.ndarray, reconstructed: np.ndarray) -> bytes:
+        """
+        Compone la figura de comparación con matplotlib (modo 'figure').
         
-        axes[1].imshow(np.array(reconstructed_img))
-        axes[1].set_title("Imagen Reconstruida")
-        axes[1].axis("off")
+        Usa la API orientada a objetos (sin el estado global de pyplot), por lo
+        que es segura en los hilos del pool. matplotlib se importa en la
+        primera comparación de este modo.
         
-        axes[2].imshow(np.array(diff_img))
-        axes[2].set_title("Diferencia")
-        axes[2].axis("off")
+        Args:
+            original: Imagen original RGB
+            reconstructed: Imagen reconstruida RGB del mismo tamaño
+            
+        Returns:
+            Bytes PNG de la imagen de comparación
+        """
+        diff = cv2.absdiff(original, reconstructed)
+        
+        # Crear figura de comparación
+        fig = matplotlib.figure.Figure(figsize=(15, 5))
+        matplotlib.backends.backend_agg.FigureCanvasAgg(fig)
+        axes = fig.subplots(1, 3)
+        
+        # Mostrar imágenes
+        for ax, image, title in zip(axes, (original, reconstructed, diff), COMPARISON_TITLES):
+            ax.imshow(image)
+            ax.set_title(title)
+            ax.axis("off")
         
         # Guardar a bytes
         buf = io.BytesIO()
-        plt.tight_layout()
+        fig.tight_layout()
         fig.savefig(buf, format='png')
-        plt.close(fig)
-        buf.seek(0)
-        
         return buf.getvalue()
+
+
+def _psnr(mse: float) -> Optional[float]:
+    """PSNR en dB para imágenes de 8 bits; None si las imágenes son idénticas."""
+    if mse <= 0:
+        return None
+    return float(10.0 * np.log10(255.0 ** 2 / mse))
+
+
+@lru_cache(maxsize=16)
+def _label_font(size: int) -> ImageFont.ImageFont:
+    """Fuente para las etiquetas de la comparación (se carga una vez por tamaño)."""
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 no admite tamaño en la fuente por defecto
+        return ImageFont.load_default()
@@ -0,0 +1,258 @@
+"""
+Métricas del servicio en el formato de texto de Prometheus.
+
+Registro en memoria sin dependencias externas: contadores, indicadores e
+histogramas con etiquetas, protegidos por un cerrojo porque se actualizan
+desde el event loop y desde los hilos del motor de ejecución. Los valores que
+ya lleva otro componente (tareas en curso del motor) se leen al exportar.
+
+Cada proceso de uvicorn expone sus propias métricas; Prometheus las agrega
+por instancia.
+"""
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Límites de los histogramas de duración (segundos) y de tamaño (bytes)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(float(4 ** exponent) for exponent in range(5, 19))  # 1KB .. 64GB
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Etiquetas no válidas para {self.name}: {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[Tuple[str, Sequence[str], Sequence[str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, names, values, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        if not self.labelnames:
+            values.setdefault((), 0.0)
+        return [("_total", self.labelnames, key, value) for key, value in sorted(values.items())]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        callback: Optional[Callable[[], float]] = None
+    ):
+        """
+        Args:
+            callback: Función que devuelve el valor al exportar (solo sin etiquetas)
+        """
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self._callback is not None:
+            return [("", (), (), float(self._callback()))]
+        with self._lock:
+            values = dict(self._values)
+        if not self.labelnames:
+            values.setdefault((), 0.0)
+        return [("", self.labelnames, key, value) for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Por combinación de etiquetas: observaciones por intervalo (no acumuladas) y suma
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * len(self.buckets)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    def _samples(self):
+        samples = []
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for key in sorted(self._counts):
+                cumulative = 0
+                for bound, count in zip(self.buckets, self._counts[key]):
+                    cumulative += count
+                    samples.append(("_bucket", names, key + (_format_value(bound),), cumulative))
+                samples.append(("_sum", self.labelnames, key, self._sums[key]))
+                samples.append(("_count", self.labelnames, key, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Todas las métricas en el formato de exposición de texto de Prometheus."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _engine_in_flight() -> float:
+    # Import diferido: el motor registra sus propias métricas en este módulo
+    from src.services import execution_engine
+
+    engine = execution_engine._engine
+    return engine.in_flight if engine is not None else 0
+
+
+REQUEST_DURATION = REGISTRY.register(Histogram(
+    "matrixtoimagen_request_duration_seconds",
+    "Duración de las solicitudes HTTP hasta el último byte de la respuesta",
+    ("method", "route", "status", "output_format"),
+))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "matrixtoimagen_requests_in_flight",
+    "Solicitudes HTTP en curso",
+))
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "matrixtoimagen_stage_duration_seconds",
+    "Duración de cada etapa del procesamiento (las de la cabecera Server-Timing)",
+    ("route", "stage"),
+))
+MATRIX_BYTES = REGISTRY.register(Histogram(
+    "matrixtoimagen_matrix_bytes",
+    "Tamaño en bytes de las matrices recibidas",
+    ("endpoint",),
+    buckets=SIZE_BUCKETS,
+))
+EXECUTION_IN_FLIGHT = REGISTRY.register(Gauge(
+    "matrixtoimagen_execution_in_flight",
+    "Tareas admitidas en el motor de ejecución (en ejecución o en cola)",
+    callback=_engine_in_flight,
+))
+EXECUTION_REJECTED = REGISTRY.register(Counter(
+    "matrixtoimagen_execution_rejected",
+    "Tareas rechazadas por saturación del motor de ejecución",
+))
+UPSTREAM_DURATION = REGISTRY.register(Histogram(
+    "matrixtoimagen_upstream_request_duration_seconds",
+    "Duración de cada intento de llamada a ImageToMatrix",
+    ("outcome",),
+))
+UPSTREAM_REJECTED = REGISTRY.register(Counter(
+    "matrixtoimagen_upstream_rejected",
+    "Llamadas a ImageToMatrix cortadas por el circuito abierto",
+))
+
+FRAMES = REGISTRY.register(Counter(
+    "matrixtoimagen_frames",
+    "Fotogramas recibidos por WebSocket según su resultado (encoded, dropped o failed)",
+    ("result",),
+))
+
+
+def observe_server_timing(route: str, header: str) -> None:
+    """
+    Registra las etapas de una cabecera ``Server-Timing`` (``parse;dur=1.20, encode;dur=35.10``).
+
+    Args:
+        route: Plantilla de la ruta que generó la respuesta
+        header: Valor de la cabecera
+    """
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    STAGE_DURATION.observe(float(value) / 1000.0, route=route, stage=name)
+                except ValueError:
+                    pass
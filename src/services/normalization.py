@@ -0,0 +1,255 @@
+"""
+Normalización vectorizada de matrices a píxeles de 8 o 16 bits.
+
+La conversión se hace en dos pasos: ``resolve_range`` decide qué intervalo de
+valores de entrada se lleva a [0, 255] (o [0, 65535]) según el modo, y
+``apply_range`` escribe el resultado en un único array de salida. Los tipos
+enteros de hasta 16 bits se convierten con una tabla de consulta (LUT)
+precalculada; el resto se procesa por franjas de filas con operaciones en el
+sitio, de modo que los temporales de coma flotante nunca ocupan más que una
+franja.
+"""
+import mmap
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.utils.lazy_import import cv2
+
+# Valores procesados por franja en la ruta de coma flotante
+_STRIP_VALUES = 1 << 20
+# Muestras como máximo para estimar percentiles en tipos sin LUT
+_PERCENTILE_SAMPLES = 1 << 22
+
+Range = Tuple[float, float]
+
+
+def release_rows(matrix: np.ndarray, start: int, end: int) -> None:
+    """
+    Descarta de la memoria residente las filas ya recorridas de una matriz proyectada desde disco.
+
+    El contenido sigue en el archivo (las escrituras pendientes se conservan
+    en la caché de páginas del sistema), pero sin esto la memoria residente
+    del proceso crecería con cada franja. No hace nada en matrices en memoria.
+    """
+    mapping = getattr(matrix, "_mmap", None)
+    if mapping is None or not hasattr(mmap, "MADV_DONTNEED") or matrix.strides[0] <= 0:
+        return
+    # Posición de la primera fila dentro de la proyección (la matriz puede ser una vista recortada)
+    first = matrix.ctypes.data - np.frombuffer(mapping, dtype=np.uint8, count=1).ctypes.data
+    begin = (first + start * matrix.strides[0]) // mmap.PAGESIZE * mmap.PAGESIZE
+    stop = min(len(mapping), first + min(end, matrix.shape[0]) * matrix.strides[0]) // mmap.PAGESIZE * mmap.PAGESIZE
+    if stop > begin:
+        mapping.madvise(mmap.MADV_DONTNEED, begin, stop - begin)
+
+
+def _row_strips(matrix: np.ndarray) -> Iterator[Tuple[int, np.ndarray]]:
+    """Recorre la matriz en franjas de filas de unos ``_STRIP_VALUES`` valores: (fila inicial, franja)."""
+    step = max(1, _STRIP_VALUES // max(1, matrix[:1].size))
+    for start in range(0, matrix.shape[0], step):
+        yield start, np.asarray(matrix[start:start + step])
+        release_rows(matrix, start, start + step)
+
+
+def _finite_min_max(matrix: np.ndarray) -> Range:
+    """Mínimo y máximo ignorando NaN (la matriz vacía o toda NaN da (0, 0))."""
+    # Por franjas: los temporales de NaN e infinitos no superan una franja y,
+    # si la matriz está proyectada desde disco, no queda residente entera
+    low, high = np.inf, -np.inf
+    for _, strip in _row_strips(matrix):
+        if strip.dtype.kind != "f":
+            low, high = min(low, float(strip.min())), max(high, float(strip.max()))
+            continue
+        with np.errstate(invalid="ignore"):
+            strip_low, strip_high = np.nanmin(strip), np.nanmax(strip)
+        if np.isnan(strip_low):
+            continue
+        if np.isinf(strip_low) or np.isinf(strip_high):
+            # Caso poco frecuente: los infinitos se saturan y no cuentan para el intervalo
+            finite = strip[np.isfinite(strip)]
+            if finite.size == 0:
+                continue
+            strip_low, strip_high = finite.min(), finite.max()
+        low, high = min(low, float(strip_low)), max(high, float(strip_high))
+    if low > high:
+        return 0.0, 0.0
+    return low, high
+
+
+def lut_index_dtype(dtype: np.dtype) -> Optional[np.dtype]:
+    """Tipo sin signo con el que se indexa la LUT, o None si el tipo no admite LUT."""
+    if dtype == np.bool_:
+        return np.dtype(np.uint8)
+    if dtype.kind in "iu" and dtype.itemsize <= 2:
+        return np.dtype(f"u{dtype.itemsize}")
+    return None
+
+
+def _percentiles(matrix: np.ndarray, low: float, high: float) -> Range:
+    """Percentiles exactos por histograma para enteros pequeños; por muestreo en el resto."""
+    if matrix.dtype == np.bool_:
+        matrix = matrix.view(np.uint8)
+    index_dtype = lut_index_dtype(matrix.dtype)
+    if index_dtype is not None:
+        # Histograma de todos los valores posibles: una pasada por franjas, sin ordenar la matriz
+        counts = np.zeros(1 << (8 * index_dtype.itemsize), dtype=np.int64)
+        for _, strip in _row_strips(matrix):
+            counts += np.bincount(strip.view(index_dtype).ravel(), minlength=counts.size)
+        values = np.sort(np.arange(counts.size, dtype=index_dtype).view(matrix.dtype))
+        cumulative = np.cumsum(counts[values.view(index_dtype)])
+        targets = np.maximum(cumulative[-1] * np.array([low, high]) / 100.0, 1)
+        positions = np.minimum(np.searchsorted(cumulative, targets, side="left"), counts.size - 1)
+        return float(values[positions[0]]), float(values[positions[1]])
+
+    # Muestreo por filas, franja a franja: no copia la matriz completa
+    row_step = max(1, min(matrix.shape[0], matrix.size // _PERCENTILE_SAMPLES))
+    flat = np.concatenate([
+        strip[-start % row_step::row_step].reshape(-1) for start, strip in _row_strips(matrix)
+    ])
+    if flat.size > _PERCENTILE_SAMPLES:
+        flat = flat[::flat.size // _PERCENTILE_SAMPLES]
+    result = np.nanpercentile(flat, [low, high])
+    if np.isnan(result).any():
+        return 0.0, 0.0
+    return float(result[0]), float(result[1])
+
+
+def resolve_range(matrix: np.ndarray, options: ConversionOptions = DEFAULT_OPTIONS) -> Optional[Range]:
+    """
+    Calcula el intervalo de entrada que se lleva al rango completo de salida.
+
+    Args:
+        matrix: Matriz de entrada
+        options: Opciones de conversión con el modo de normalización
+
+    Returns:
+        Tupla (inferior, superior), o None si la matriz ya está en el tipo de
+        salida y no hay que transformarla
+    """
+    mode = options.normalize
+    out_max = 65535.0 if mode == "passthrough" else 255.0
+    native = np.uint16 if mode == "passthrough" else np.uint8
+
+    if mode in ("auto", "passthrough"):
+        if matrix.dtype == native:
+            return None
+        if matrix.dtype == np.bool_:
+            return 0.0, 1.0
+        low, high = _finite_min_max(matrix)
+        if matrix.dtype.kind == "f" and low >= 0.0 and high <= 1.0:
+            return 0.0, 1.0
+        if low >= 0.0 and high <= out_max:
+            return 0.0, out_max
+        return low, high
+    if mode == "clip":
+        if matrix.dtype == np.uint8:
+            return None
+        return 0.0, out_max
+    if mode == "minmax":
+        return _finite_min_max(matrix)
+    if mode == "percentile":
+        return _percentiles(matrix, *options.percentiles)
+    if mode == "window":
+        return options.level - options.window / 2.0, options.level + options.window / 2.0
+    raise ValueError(f"Modo de normalización no válido: {mode}")
+
+
+def build_lut(dtype: np.dtype, value_range: Range, out_dtype: np.dtype) -> np.ndarray:
+    """
+    Tabla de consulta para un tipo entero de hasta 16 bits.
+
+    La tabla se indexa con la vista sin signo de la matriz: la posición ``i``
+    contiene el píxel de salida del valor cuyo patrón de bits es ``i``.
+    """
+    dtype = np.dtype(dtype)
+    index_dtype = lut_index_dtype(dtype)
+    values = np.arange(1 << (8 * index_dtype.itemsize), dtype=index_dtype)
+    if dtype != np.bool_:
+        values = values.view(dtype)
+    return _scale(values.astype(np.float64), value_range, np.dtype(out_dtype))
+
+
+def _scale(values: np.ndarray, value_range: Range, out_dtype: np.dtype, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Escala ``values`` (float, modificado en el sitio) al rango de ``out_dtype`` con redondeo y saturación."""
+    out_max = float(np.iinfo(out_dtype).max)
+    low, high = value_range
+    factor = out_max / (high - low) if high > low else 0.0
+
+    np.nan_to_num(values, copy=False, nan=low, posinf=high, neginf=low)
+    values -= low
+    values *= factor
+    values += 0.5
+    np.clip(values, 0.0, out_max, out=values)
+    if out is None:
+        return values.astype(out_dtype)
+    np.copyto(out, values, casting="unsafe")
+    return out
+
+
+def apply_range(matrix: np.ndarray, value_range: Range, out: np.ndarray) -> np.ndarray:
+    """
+    Escribe en ``out`` la matriz llevada del intervalo ``value_range`` al rango de ``out.dtype``.
+
+    Args:
+        matrix: Matriz de entrada (no se modifica; puede ser de solo lectura)
+        value_range: Intervalo de entrada (inferior, superior)
+        out: Array de salida uint8 o uint16 con la misma forma que ``matrix``
+
+    Returns:
+        ``out``
+    """
+    # Las franjas acotan los temporales (índices de la LUT o valores en coma flotante)
+    rows = matrix.shape[0]
+    step = max(1, _STRIP_VALUES // max(1, matrix[:1].size))
+
+    index_dtype = lut_index_dtype(matrix.dtype)
+    if index_dtype is not None:
+        if matrix.dtype == np.uint8 and out.dtype == np.uint8:
+            lut = build_lut(matrix.dtype, value_range, out.dtype)
+            return cv2.LUT(matrix, lut, dst=out)
+        lut = build_lut(matrix.dtype, value_range, out.dtype)
+        indices = matrix.view(index_dtype)
+        for start in range(0, rows, step):
+            np.take(lut, indices[start:start + step], out=out[start:start + step])
+        return out
+
+    work_dtype = np.float32 if matrix.dtype in (np.float16, np.float32) else np.float64
+    strip = np.empty((min(step, rows),) + matrix.shape[1:], dtype=work_dtype)
+    for start in range(0, rows, step):
+        end = min(start + step, rows)
+        buffer = strip[:end - start]
+        np.copyto(buffer, matrix[start:end], casting="unsafe")
+        _scale(buffer, value_range, out.dtype, out[start:end])
+    return out
+
+
+def normalize_matrix(
+    matrix: np.ndarray,
+    options: ConversionOptions = DEFAULT_OPTIONS,
+    out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Convierte la matriz a píxeles según el modo de normalización.
+
+    Los valores fuera de rango se saturan en lugar de desbordarse. Con el modo
+    'passthrough' la salida es de 16 bits y una matriz uint16 se devuelve sin
+    copiar; en el resto de modos la salida es uint8 y una matriz uint8 en modo
+    'auto' o 'clip' también se devuelve tal cual.
+
+    Args:
+        matrix: Matriz numérica 2D o 3D
+        options: Opciones de conversión
+        out: Array de salida reutilizable; se ignora si su forma o su tipo no coinciden
+
+    Returns:
+        Matriz uint8 (o uint16 en modo 'passthrough')
+    """
+    value_range = resolve_range(matrix, options)
+    if value_range is None:
+        return matrix
+
+    out_dtype = np.uint16 if options.normalize == "passthrough" else np.uint8
+    if out is None or out.shape != matrix.shape or out.dtype != out_dtype:
+        out = np.empty(matrix.shape, dtype=out_dtype)
+    return apply_range(matrix, value_range, out)
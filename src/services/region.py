@@ -0,0 +1,97 @@
+"""
+Recorte, submuestreo y reducción de la matriz antes de normalizarla.
+
+El recorte (``crop``) y el paso (``stride``) son vistas de la matriz, sin
+copias; la reducción a ``max_width`` x ``max_height`` usa ``cv2.resize`` con
+INTER_AREA (media de las áreas de origen) sobre la región ya seleccionada.
+Así la normalización y la codificación trabajan con el tamaño de salida y no
+con el de la matriz recibida.
+"""
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.utils.lazy_import import cv2
+
+# Tipos que cv2.resize no admite y el tipo al que se convierten (sin pérdida salvo en 64 bits)
+_RESIZE_CASTS = {
+    np.dtype(np.bool_): np.float32,
+    np.dtype(np.int8): np.int16,
+    np.dtype(np.float16): np.float32,
+    np.dtype(np.int32): np.float64,
+    np.dtype(np.uint32): np.float64,
+    np.dtype(np.int64): np.float64,
+    np.dtype(np.uint64): np.float64,
+}
+
+
+def crop_and_stride(matrix: np.ndarray, options: ConversionOptions = DEFAULT_OPTIONS) -> np.ndarray:
+    """
+    Aplica ``crop`` y ``stride`` como vistas de la matriz.
+
+    Raises:
+        ValueError: Si la región de recorte queda fuera de la matriz
+    """
+    if options.crop is not None:
+        x, y, width, height = options.crop
+        if x >= matrix.shape[1] or y >= matrix.shape[0]:
+            raise ValueError(
+                f"La región de recorte queda fuera de la matriz ({matrix.shape[1]}x{matrix.shape[0]})"
+            )
+        matrix = matrix[y:y + height, x:x + width]
+    if options.stride > 1:
+        matrix = matrix[::options.stride, ::options.stride]
+    return matrix
+
+
+def fit_size(width: int, height: int, options: ConversionOptions = DEFAULT_OPTIONS) -> Tuple[int, int]:
+    """Tamaño que cabe en ``max_width`` x ``max_height`` conservando la proporción (nunca amplía)."""
+    scale = 1.0
+    if options.max_width is not None:
+        scale = min(scale, options.max_width / width)
+    if options.max_height is not None:
+        scale = min(scale, options.max_height / height)
+    if scale >= 1.0:
+        return width, height
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def output_shape(shape: Tuple[int, ...], options: ConversionOptions = DEFAULT_OPTIONS) -> Tuple[int, ...]:
+    """Forma de la matriz después de ``select_region``, sin tocar los datos."""
+    height, width = shape[:2]
+    if options.crop is not None:
+        x, y, crop_width, crop_height = options.crop
+        width = max(0, min(width - x, crop_width))
+        height = max(0, min(height - y, crop_height))
+    if options.stride > 1:
+        width, height = math.ceil(width / options.stride), math.ceil(height / options.stride)
+    if width and height:
+        width, height = fit_size(width, height, options)
+    return (height, width) + tuple(shape[2:])
+
+
+def select_region(matrix: np.ndarray, options: ConversionOptions = DEFAULT_OPTIONS) -> np.ndarray:
+    """
+    Devuelve la región de la matriz que se va a convertir.
+
+    Args:
+        matrix: Matriz 2D o 3D
+        options: Opciones de conversión (``crop``, ``stride``, ``max_width`` y ``max_height``)
+
+    Returns:
+        Vista de la matriz o, si hay que reducirla, una matriz nueva del tamaño de salida
+    """
+    matrix = crop_and_stride(matrix, options)
+    height, width = matrix.shape[:2]
+    target = fit_size(width, height, options)
+    if target == (width, height):
+        return matrix
+
+    if matrix.ndim == 3 and matrix.shape[2] == 1:
+        matrix = matrix[:, :, 0]
+    cast: Optional[type] = _RESIZE_CASTS.get(matrix.dtype)
+    if cast is not None:
+        matrix = matrix.astype(cast)
+    return cv2.resize(matrix, target, interpolation=cv2.INTER_AREA)
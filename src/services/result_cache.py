@@ -0,0 +1,240 @@
+"""
+Caché de resultados direccionada por contenido para las conversiones.
+
+La clave es un hash de los bytes de la matriz, su forma, su dtype, el formato
+de salida y las opciones de codificación, de modo que matrices idénticas
+reutilizan la imagen ya codificada. Tiene un nivel en memoria (LRU limitado
+por bytes) y un nivel opcional en disco.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+import numpy as np
+
+from src.config.settings import get_settings
+
+
+class CachedResult(NamedTuple):
+    content: bytes
+    content_type: str
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Indica si la cabecera If-None-Match coincide con la ETag.
+
+    Args:
+        if_none_match: Valor de la cabecera (puede contener varias ETags o '*')
+        etag: ETag del recurso, entre comillas
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+class ResultCache:
+    def __init__(
+        self,
+        max_bytes: int,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 0
+    ):
+        """
+        Crea la caché.
+
+        Args:
+            max_bytes: Presupuesto en bytes del nivel en memoria
+            disk_dir: Directorio del nivel en disco (None para desactivarlo)
+            disk_max_bytes: Presupuesto en bytes del nivel en disco
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._bytes = 0
+        self._disk_entries: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def compute_key(matrix: np.ndarray, output_format: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Calcula la clave de contenido de una conversión.
+
+        Args:
+            matrix: Matriz a convertir
+            output_format: Formato de salida de la imagen
+            options: Opciones de codificación que afectan al resultado
+
+        Returns:
+            Hash hexadecimal de la conversión
+        """
+        header = json.dumps(
+            {
+                "shape": list(matrix.shape),
+                "dtype": matrix.dtype.str,
+                "output_format": output_format.lower(),
+                "options": options or {},
+            },
+            sort_keys=True,
+            default=str,
+        )
+        digest = hashlib.blake2b(header.encode(), digest_size=20)
+        digest.update(np.ascontiguousarray(matrix).data)
+        return digest.hexdigest()
+
+    async def get(self, key: str) -> Optional[CachedResult]:
+        """Busca un resultado en memoria y, si no está, en disco."""
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            on_disk = key in self._disk_entries
+
+        if on_disk:
+            result = await asyncio.to_thread(self._read_disk, key)
+            if result is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    if key in self._disk_entries:
+                        self._disk_entries.move_to_end(key)
+                self._store_memory(key, result)
+                return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def put(self, key: str, content: bytes, content_type: str) -> None:
+        """Guarda un resultado en memoria y, si está configurado, en disco."""
+        result = CachedResult(content, content_type)
+        self._store_memory(key, result)
+        if self.disk_dir and len(content) <= self.disk_max_bytes:
+            await asyncio.to_thread(self._write_disk, key, result)
+
+    def stats(self) -> Dict[str, int]:
+        """Devuelve los contadores de la caché."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk_entries),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def _store_memory(self, key: str, result: CachedResult) -> None:
+        size = len(result.content)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous.content)
+            self._entries[key] = result
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.content)
+                self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _load_disk_index(self) -> None:
+        """Reconstruye el índice del nivel en disco, del más antiguo al más reciente."""
+        found = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                found.append((stat.st_mtime, name, stat.st_size))
+        for _, key, size in sorted(found):
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+
+    def _read_disk(self, key: str) -> Optional[CachedResult]:
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                content_type, _, content = f.read().partition(b"\n")
+        except OSError:
+            with self._lock:
+                size = self._disk_entries.pop(key, 0)
+                self._disk_bytes -= size
+            return None
+        return CachedResult(content, content_type.decode())
+
+    def _write_disk(self, key: str, result: CachedResult) -> None:
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(result.content_type.encode() + b"\n")
+            f.write(result.content)
+        os.replace(tmp_path, path)
+
+        size = os.path.getsize(path)
+        evicted = []
+        with self._lock:
+            self._disk_bytes -= self._disk_entries.pop(key, 0)
+            self._disk_entries[key] = size
+            self._disk_bytes += size
+            while self._disk_bytes > self.disk_max_bytes and self._disk_entries:
+                old_key, old_size = self._disk_entries.popitem(last=False)
+                self._disk_bytes -= old_size
+                self.disk_evictions += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._disk_path(old_key))
+            except OSError:
+                pass
+
+
+_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """
+    Devuelve la caché de resultados compartida, o None si está desactivada.
+
+    Returns:
+        Instancia de ResultCache o None
+    """
+    global _cache
+    settings = get_settings()
+    if not settings.RESULT_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = ResultCache(
+            max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+            disk_dir=settings.RESULT_CACHE_DIR,
+            disk_max_bytes=settings.RESULT_CACHE_DISK_MAX_BYTES,
+        )
+    return _cache
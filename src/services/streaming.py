@@ -0,0 +1,138 @@
+"""
+Transmisión por fragmentos de la salida de los codificadores.
+
+Los codificadores de Pillow escriben en un objeto tipo archivo a medida que
+comprimen (bloques IDAT en PNG, líneas de barrido en JPEG). ``ChunkChannel``
+es ese objeto: recibe las escrituras en el hilo del pool, las agrupa en
+fragmentos y las entrega al event loop, donde la respuesta las envía al
+cliente sin reunir nunca la imagen completa en memoria.
+"""
+import asyncio
+import threading
+from typing import AsyncIterator, Callable, Optional
+
+from src.services.execution_engine import get_execution_engine
+
+_EOF = object()
+
+
+class ChunkChannel:
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        chunk_size: int = 256 * 1024,
+        max_pending: int = 8
+    ):
+        """
+        Crea el canal.
+
+        Args:
+            loop: Event loop que consume los fragmentos
+            chunk_size: Tamaño mínimo de cada fragmento entregado
+            max_pending: Fragmentos pendientes de enviar antes de bloquear al codificador
+        """
+        self._loop = loop
+        self._chunk_size = chunk_size
+        self._max_pending = max_pending
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._slots = threading.Semaphore(max_pending)
+        self._buffer = bytearray()
+        self._cancelled = False
+
+    # Lado del codificador (hilo del pool)
+
+    def write(self, data: bytes) -> int:
+        if self._cancelled:
+            raise BrokenPipeError("El cliente cerró la conexión")
+        self._buffer += data
+        if len(self._buffer) >= self._chunk_size:
+            self._push(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def finish(self) -> None:
+        """Entrega lo que quede en el búfer (se llama en el hilo al terminar la codificación)."""
+        if self._buffer:
+            self._push(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _push(self, chunk: bytes) -> None:
+        # Contrapresión: el codificador espera si el cliente no consume
+        self._slots.acquire()
+        if self._cancelled:
+            raise BrokenPipeError("El cliente cerró la conexión")
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, chunk)
+
+    # Lado de la respuesta (event loop)
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """Marca el final del flujo, con el error del codificador si lo hubo."""
+        self._queue.put_nowait(error if error is not None else _EOF)
+
+    def cancel(self) -> None:
+        """Libera al codificador si el consumidor abandona el flujo."""
+        self._cancelled = True
+        for _ in range(self._max_pending):
+            self._slots.release()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        while True:
+            item = await self._queue.get()
+            if item is _EOF:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            self._slots.release()
+            yield item
+
+
+def _encode_into_channel(encode: Callable, channel: ChunkChannel, args: tuple, kwargs: dict) -> None:
+    """Ejecuta ``encode(*args, fp=channel, **kwargs)`` en el pool y vacía el búfer final."""
+    encode(*args, fp=channel, **kwargs)
+    channel.finish()
+
+
+async def stream_from_pool(
+    encode: Callable,
+    *args,
+    chunk_size: int = 256 * 1024,
+    max_pending: int = 8,
+    **kwargs
+) -> AsyncIterator[bytes]:
+    """
+    Ejecuta un codificador en el motor de ejecución y entrega su salida por fragmentos.
+
+    ``encode`` recibe los argumentos indicados y, en el argumento ``fp``, el
+    objeto tipo archivo en el que debe escribir. El primer fragmento (o el
+    error de admisión del motor) se produce en la primera iteración.
+
+    Args:
+        encode: Función síncrona de codificación
+        chunk_size: Tamaño mínimo de cada fragmento
+        max_pending: Fragmentos en cola antes de aplicar contrapresión
+        **kwargs: Argumentos con nombre adicionales de ``encode``
+
+    Yields:
+        Fragmentos de la salida codificada
+
+    Raises:
+        PoolSaturatedError: Si el motor de ejecución está saturado
+    """
+    loop = asyncio.get_running_loop()
+    channel = ChunkChannel(loop, chunk_size, max_pending)
+    task = asyncio.ensure_future(
+        get_execution_engine().run(_encode_into_channel, encode, channel, args, kwargs)
+    )
+    task.add_done_callback(
+        lambda done: channel.close(None if done.cancelled() else done.exception())
+    )
+
+    try:
+        async for chunk in channel:
+            yield chunk
+    finally:
+        if not task.done():
+            channel.cancel()
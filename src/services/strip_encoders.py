@@ -0,0 +1,348 @@
+"""
+Codificadores de imagen que reciben los píxeles por partes.
+
+Pillow y OpenCV necesitan la imagen completa en memoria antes de codificarla.
+Para matrices más grandes que la RAM, ``StripPngWriter`` escribe un PNG a
+partir de franjas de filas consecutivas (se puede transmitir según se genera)
+y ``TiledTiffWriter`` escribe un TIFF por teselas, en cualquier orden, sobre
+un archivo en el que se pueda hacer ``seek``. ``ApngWriter`` escribe un PNG
+animado fotograma a fotograma (Pillow reúne todos los fotogramas antes de
+escribir el primero).
+"""
+import struct
+import zlib
+from fractions import Fraction
+from typing import BinaryIO, List, Optional, Tuple
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_COLOR_TYPES = {1: 0, 3: 2, 4: 6}  # Canales -> tipo de color (gris, RGB, RGBA)
+_PNG_COLOR_PALETTE = 3
+_PNG_FILTER_UP = 2
+_PNG_IDAT_SIZE = 256 * 1024  # Datos comprimidos acumulados antes de emitir un bloque IDAT
+
+# Tipos de campo TIFF: SHORT, LONG, LONG8 (BigTIFF)
+_TIFF_SHORT, _TIFF_LONG, _TIFF_LONG8 = 3, 4, 16
+_TIFF_FIELD_SIZES = {_TIFF_SHORT: 2, _TIFF_LONG: 4, _TIFF_LONG8: 8}
+_TIFF_FIELD_CODES = {_TIFF_SHORT: "H", _TIFF_LONG: "I", _TIFF_LONG8: "Q"}
+_TIFF_DEFLATE = 8
+_TIFF_PREDICTOR_HORIZONTAL = 2
+# Por encima de este tamaño (sin comprimir) se escribe BigTIFF con desplazamientos de 64 bits
+_TIFF_CLASSIC_LIMIT = 2 ** 32 - 2 ** 26
+
+
+def _png_chunk(fp: BinaryIO, kind: bytes, data: bytes) -> None:
+    fp.write(struct.pack(">I", len(data)) + kind)
+    fp.write(data)
+    fp.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+
+def _filter_up(data: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    """Filtro 'Up' vectorizado: cada byte menos el de la fila anterior (módulo 256)."""
+    filtered = np.empty((data.shape[0], data.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = _PNG_FILTER_UP
+    np.subtract(data[0], previous, out=filtered[0, 1:])
+    np.subtract(data[1:], data[:-1], out=filtered[1:, 1:])
+    return filtered
+
+
+def _check_pixels(pixels: np.ndarray, channels: int, dtype: np.dtype) -> None:
+    if pixels.dtype != dtype:
+        raise ValueError(f"Tipo de píxel no válido: {pixels.dtype} (se espera {dtype})")
+    if (pixels.shape[2] if pixels.ndim == 3 else 1) != channels:
+        raise ValueError(f"Número de canales no válido: {pixels.shape}")
+
+
+class StripPngWriter:
+    def __init__(
+        self,
+        fp: BinaryIO,
+        width: int,
+        height: int,
+        channels: int = 1,
+        dtype: np.dtype = np.uint8,
+        compress_level: int = 6
+    ):
+        """
+        Escribe la cabecera del PNG; las filas se añaden con ``write_rows``.
+
+        Args:
+            fp: Objeto tipo archivo de destino (basta con ``write``)
+            width: Ancho de la imagen
+            height: Alto de la imagen
+            channels: 1 (gris), 3 (RGB) o 4 (RGBA)
+            dtype: uint8 o uint16
+            compress_level: Nivel de compresión de zlib (0-9)
+        """
+        if channels not in _PNG_COLOR_TYPES:
+            raise ValueError(f"Número de canales no válido para PNG: {channels}")
+        self._fp = fp
+        self._width = width
+        self._height = height
+        self._channels = channels
+        self._dtype = np.dtype(dtype)
+        self._rows_written = 0
+        self._previous = np.zeros(width * channels * self._dtype.itemsize, dtype=np.uint8)
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = bytearray()
+
+        fp.write(PNG_SIGNATURE)
+        self._chunk(b"IHDR", struct.pack(
+            ">IIBBBBB", width, height, 8 * self._dtype.itemsize, _PNG_COLOR_TYPES[channels], 0, 0, 0
+        ))
+
+    def _chunk(self, kind: bytes, data: bytes) -> None:
+        _png_chunk(self._fp, kind, data)
+
+    def write_rows(self, pixels: np.ndarray) -> None:
+        """
+        Añade una franja de filas consecutivas.
+
+        Args:
+            pixels: Array (filas, ancho[, canales]) del tipo y canales de la imagen
+        """
+        _check_pixels(pixels, self._channels, self._dtype)
+        rows = pixels.shape[0]
+        if pixels.shape[1] != self._width or self._rows_written + rows > self._height:
+            raise ValueError(f"Franja no válida para una imagen de {self._width}x{self._height}: {pixels.shape}")
+
+        # PNG guarda las muestras de 16 bits en big-endian
+        samples = pixels.astype(">u2", copy=False) if self._dtype.itemsize == 2 else pixels
+        data = np.ascontiguousarray(samples).reshape(rows, -1).view(np.uint8)
+
+        filtered = _filter_up(data, self._previous)
+        self._previous = data[-1].copy()
+        self._rows_written += rows
+
+        self._pending += self._compressor.compress(filtered)
+        if len(self._pending) >= _PNG_IDAT_SIZE:
+            self._chunk(b"IDAT", bytes(self._pending))
+            self._pending.clear()
+
+    def close(self) -> None:
+        """Cierra el flujo comprimido y escribe el final del PNG."""
+        if self._rows_written != self._height:
+            raise ValueError(f"Se escribieron {self._rows_written} de {self._height} filas")
+        self._pending += self._compressor.flush()
+        self._chunk(b"IDAT", bytes(self._pending))
+        self._pending.clear()
+        self._chunk(b"IEND", b"")
+
+
+class ApngWriter:
+    def __init__(
+        self,
+        fp: BinaryIO,
+        width: int,
+        height: int,
+        frames: int,
+        channels: int = 1,
+        palette: Optional[np.ndarray] = None,
+        fps: float = 10.0,
+        loop: int = 0,
+        compress_level: int = 6
+    ):
+        """
+        Escribe la cabecera del PNG animado; los fotogramas se añaden con ``write_frame``.
+
+        Con ``palette`` la imagen es indexada (los fotogramas son índices de
+        un solo canal) y la paleta se escribe una vez para toda la animación.
+
+        Args:
+            fp: Objeto tipo archivo de destino (basta con ``write``)
+            width: Ancho de los fotogramas
+            height: Alto de los fotogramas
+            frames: Número de fotogramas (APNG lo declara en la cabecera)
+            channels: 1 (gris o índices), 3 (RGB) o 4 (RGBA)
+            palette: Paleta RGB (hasta 256 x 3, uint8) de una imagen indexada
+            fps: Fotogramas por segundo
+            loop: Repeticiones (0: indefinidamente)
+            compress_level: Nivel de compresión de zlib (0-9)
+        """
+        if channels not in _PNG_COLOR_TYPES or (palette is not None and channels != 1):
+            raise ValueError(f"Número de canales no válido para APNG: {channels}")
+        self._fp = fp
+        self._width = width
+        self._height = height
+        self._frames = frames
+        self._channels = channels
+        self._compress_level = compress_level
+        self._frames_written = 0
+        self._sequence = 0
+        # Duración de cada fotograma como fracción de segundo (numerador y denominador de 16 bits)
+        self._delay = Fraction(1 / fps).limit_denominator(1000)
+
+        fp.write(PNG_SIGNATURE)
+        color_type = _PNG_COLOR_PALETTE if palette is not None else _PNG_COLOR_TYPES[channels]
+        _png_chunk(fp, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+        _png_chunk(fp, b"acTL", struct.pack(">II", frames, loop))
+        if palette is not None:
+            _png_chunk(fp, b"PLTE", np.ascontiguousarray(palette, dtype=np.uint8).tobytes())
+
+    def write_frame(self, pixels: np.ndarray) -> None:
+        """
+        Añade un fotograma completo.
+
+        Args:
+            pixels: Array uint8 (alto, ancho[, canales]) del tamaño de la animación
+        """
+        _check_pixels(pixels, self._channels, np.dtype(np.uint8))
+        if pixels.shape[:2] != (self._height, self._width) or self._frames_written >= self._frames:
+            raise ValueError(f"Fotograma no válido para una animación de {self._width}x{self._height}: {pixels.shape}")
+
+        _png_chunk(self._fp, b"fcTL", struct.pack(
+            ">IIIIIHHBB", self._sequence, self._width, self._height, 0, 0,
+            self._delay.numerator, self._delay.denominator, 0, 0
+        ))
+        self._sequence += 1
+
+        data = np.ascontiguousarray(pixels).reshape(self._height, -1)
+        compressed = zlib.compress(_filter_up(data, np.zeros(data.shape[1], dtype=np.uint8)), self._compress_level)
+        for start in range(0, len(compressed), _PNG_IDAT_SIZE):
+            block = compressed[start:start + _PNG_IDAT_SIZE]
+            # El primer fotograma es la imagen PNG normal; el resto va en bloques fdAT numerados
+            if self._frames_written == 0:
+                _png_chunk(self._fp, b"IDAT", block)
+            else:
+                _png_chunk(self._fp, b"fdAT", struct.pack(">I", self._sequence) + block)
+                self._sequence += 1
+        self._frames_written += 1
+
+    def close(self) -> None:
+        """Escribe el final del PNG."""
+        if self._frames_written != self._frames:
+            raise ValueError(f"Se escribieron {self._frames_written} de {self._frames} fotogramas")
+        _png_chunk(self._fp, b"IEND", b"")
+
+
+class TiledTiffWriter:
+    def __init__(
+        self,
+        fp: BinaryIO,
+        width: int,
+        height: int,
+        channels: int = 1,
+        dtype: np.dtype = np.uint8,
+        tile_size: int = 256,
+        compress_level: int = 6
+    ):
+        """
+        Prepara un TIFF por teselas comprimidas con Deflate y predictor horizontal.
+
+        Las teselas se escriben a medida que llegan y el directorio (IFD) al
+        final, por lo que ``fp`` debe admitir ``seek``. Si la imagen sin
+        comprimir no cabe en desplazamientos de 32 bits se escribe BigTIFF.
+
+        Args:
+            fp: Archivo de destino con ``seek``
+            width: Ancho de la imagen
+            height: Alto de la imagen
+            channels: 1 (gris), 3 (RGB) o 4 (RGBA)
+            dtype: uint8 o uint16
+            tile_size: Lado de las teselas (múltiplo de 16)
+            compress_level: Nivel de compresión de zlib (0-9)
+        """
+        if channels not in (1, 3, 4):
+            raise ValueError(f"Número de canales no válido para TIFF: {channels}")
+        if tile_size <= 0 or tile_size % 16:
+            raise ValueError("El tamaño de tesela TIFF debe ser un múltiplo de 16")
+        self._fp = fp
+        self._width = width
+        self._height = height
+        self._channels = channels
+        self._dtype = np.dtype(dtype)
+        self._tile_size = tile_size
+        self._compress_level = compress_level
+        self.tiles_across = -(-width // tile_size)
+        self.tiles_down = -(-height // tile_size)
+        self._offsets: List[int] = [0] * (self.tiles_across * self.tiles_down)
+        self._byte_counts: List[int] = [0] * len(self._offsets)
+        self.bigtiff = width * height * channels * self._dtype.itemsize > _TIFF_CLASSIC_LIMIT
+
+        self._start = fp.tell()
+        # Cabecera con el desplazamiento del IFD pendiente de rellenar al cerrar
+        if self.bigtiff:
+            fp.write(b"II+\x00" + struct.pack("<HHQ", 8, 0, 0))
+        else:
+            fp.write(b"II*\x00" + struct.pack("<I", 0))
+
+    def write_tile(self, tile_row: int, tile_col: int, pixels: np.ndarray) -> None:
+        """
+        Escribe una tesela.
+
+        Args:
+            tile_row: Fila de la tesela
+            tile_col: Columna de la tesela
+            pixels: Array (alto, ancho[, canales]) de como mucho ``tile_size``
+                de lado; las teselas del borde se rellenan con ceros
+        """
+        _check_pixels(pixels, self._channels, self._dtype)
+        size = self._tile_size
+        tile = np.zeros((size, size, self._channels), dtype=self._dtype)
+        tile[:pixels.shape[0], :pixels.shape[1]] = pixels.reshape(pixels.shape[:2] + (self._channels,))
+
+        # Predictor horizontal: cada muestra menos la anterior de la misma fila
+        tile[:, 1:] -= tile[:, :-1].copy()
+
+        data = zlib.compress(tile.astype(self._dtype.newbyteorder("<"), copy=False).tobytes(), self._compress_level)
+        index = tile_row * self.tiles_across + tile_col
+        self._offsets[index] = self._fp.tell() - self._start
+        self._byte_counts[index] = len(data)
+        self._fp.write(data)
+
+    def _ifd_entries(self) -> List[Tuple[int, int, List[int]]]:
+        offset_type = _TIFF_LONG8 if self.bigtiff else _TIFF_LONG
+        entries = [
+            (256, _TIFF_LONG, [self._width]),
+            (257, _TIFF_LONG, [self._height]),
+            (258, _TIFF_SHORT, [8 * self._dtype.itemsize] * self._channels),
+            (259, _TIFF_SHORT, [_TIFF_DEFLATE]),
+            (262, _TIFF_SHORT, [1 if self._channels == 1 else 2]),
+            (277, _TIFF_SHORT, [self._channels]),
+            (284, _TIFF_SHORT, [1]),
+            (317, _TIFF_SHORT, [_TIFF_PREDICTOR_HORIZONTAL]),
+            (322, _TIFF_LONG, [self._tile_size]),
+            (323, _TIFF_LONG, [self._tile_size]),
+            (324, offset_type, self._offsets),
+            (325, offset_type, self._byte_counts),
+        ]
+        if self._channels == 4:
+            entries.append((338, _TIFF_SHORT, [2]))  # Canal alfa no premultiplicado
+        return entries
+
+    def close(self) -> None:
+        """Escribe el directorio de la imagen y completa la cabecera."""
+        if any(count == 0 for count in self._byte_counts):
+            raise ValueError("Faltan teselas por escribir")
+
+        fp = self._fp
+        if (fp.tell() - self._start) % 2:
+            fp.write(b"\x00")
+        ifd_offset = fp.tell() - self._start
+        entries = self._ifd_entries()
+        count_code, value_code, slot = ("Q", "Q", 8) if self.bigtiff else ("H", "I", 4)
+        entry_size = 20 if self.bigtiff else 12
+        # Los valores que no caben en la entrada van a continuación del IFD
+        external = ifd_offset + struct.calcsize("<" + count_code) + entry_size * len(entries) + slot
+
+        table = bytearray(struct.pack("<" + count_code, len(entries)))
+        values = bytearray()
+        for tag, field_type, field_values in entries:
+            packed = struct.pack(f"<{len(field_values)}{_TIFF_FIELD_CODES[field_type]}", *field_values)
+            table += struct.pack(f"<HH{value_code}", tag, field_type, len(field_values))
+            if len(packed) <= slot:
+                table += packed.ljust(slot, b"\x00")
+            else:
+                table += struct.pack("<" + value_code, external + len(values))
+                values += packed
+                if len(values) % 2:
+                    values += b"\x00"
+        table += struct.pack("<" + value_code, 0)  # Sin más directorios
+        fp.write(table)
+        fp.write(values)
+
+        end = fp.tell()
+        fp.seek(self._start + (8 if self.bigtiff else 4))
+        fp.write(struct.pack("<" + value_code, ifd_offset))
+        fp.seek(end)
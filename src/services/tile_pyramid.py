@@ -0,0 +1,427 @@
+"""
+Pirámides de teselas multirresolución (Deep Zoom / XYZ).
+
+Cada nivel de la pirámide se guarda en disco como un ``.npy`` de píxeles y
+se lee proyectado en memoria. Al crear la pirámide solo se genera el nivel de
+máxima resolución; los demás se calculan cuando se piden, reduciendo el nivel
+siguiente a la mitad por media de bloques 2x2, y cada tesela se codifica
+también bajo demanda. Los niveles siguen la numeración de Deep Zoom: el nivel
+0 es un único píxel y el último es la imagen completa.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+import weakref
+import zipfile
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from src.config.settings import get_settings
+from src.services.conversion_options import DEFAULT_OPTIONS, ConversionOptions
+from src.services.execution_engine import get_execution_engine
+from src.services.large_matrix import LargeMatrixService
+from src.services.matrix_service import MatrixService
+from src.services.normalization import release_rows
+from src.services.result_cache import ResultCache
+
+TILE_FORMAT = "png"
+DZI_NAMESPACE = "http://schemas.microsoft.com/deepzoom/2008"
+_METADATA_FILE = "pyramid.json"
+# Valores por franja al reducir un nivel
+_STRIP_VALUES = 1 << 22
+_HASH_CHUNK = 4 * 1024 * 1024
+
+
+def downsample_half(source: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """
+    Reduce la imagen a la mitad por media de bloques 2x2, con redondeo.
+
+    La suma se hace en enteros sobre las cuatro vistas intercaladas de cada
+    franja, sin pasar por coma flotante. Con alto o ancho impar la última
+    fila o columna se replica.
+
+    Args:
+        source: Píxeles (alto, ancho[, canales]) uint8 o uint16
+        out: Array de salida de (ceil(alto/2), ceil(ancho/2)[, canales])
+
+    Returns:
+        ``out``
+    """
+    height, width = source.shape[:2]
+    accumulator = np.uint16 if source.dtype == np.uint8 else np.uint32
+    rows = max(2, _STRIP_VALUES // max(1, source[:1].size) // 2 * 2)
+    pad = ((0, 0), (0, width % 2)) + ((0, 0),) * (source.ndim - 2)
+
+    for start in range(0, height, rows):
+        strip = np.asarray(source[start:start + rows])
+        if strip.shape[0] % 2 or width % 2:
+            strip = np.pad(strip, ((0, strip.shape[0] % 2),) + pad[1:], mode="edge")
+        total = strip[0::2, 0::2].astype(accumulator)
+        total += strip[1::2, 0::2]
+        total += strip[0::2, 1::2]
+        total += strip[1::2, 1::2]
+        total += 2
+        total >>= 2
+        out[start // 2:start // 2 + total.shape[0]] = total
+        release_rows(source, start, start + rows)
+        release_rows(out, start // 2, (start + rows) // 2)
+    return out
+
+
+class TilePyramid:
+    def __init__(
+        self,
+        pyramid_id: str,
+        directory: str,
+        width: int,
+        height: int,
+        tile_size: int
+    ):
+        """
+        Describe una pirámide guardada en ``directory``.
+
+        Args:
+            pyramid_id: Identificador (hash del contenido y las opciones)
+            directory: Directorio con los niveles y ``pyramid.json``
+            width: Ancho de la imagen completa
+            height: Alto de la imagen completa
+            tile_size: Lado de las teselas
+        """
+        self.id = pyramid_id
+        self.directory = directory
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+
+    @property
+    def max_level(self) -> int:
+        """Nivel de máxima resolución (la imagen completa)."""
+        return math.ceil(math.log2(max(self.width, self.height, 1)))
+
+    @property
+    def min_level(self) -> int:
+        """Primer nivel que ocupa una sola tesela (el nivel 0 de un visor XYZ)."""
+        levels_above = math.ceil(math.log2(max(self.width, self.height) / self.tile_size))
+        return self.max_level - max(0, levels_above)
+
+    def level_size(self, level: int) -> Tuple[int, int]:
+        """Ancho y alto del nivel."""
+        scale = 2 ** (self.max_level - level)
+        return -(-self.width // scale), -(-self.height // scale)
+
+    def grid(self, level: int) -> Tuple[int, int]:
+        """Columnas y filas de teselas del nivel."""
+        width, height = self.level_size(level)
+        return -(-width // self.tile_size), -(-height // self.tile_size)
+
+    def has_tile(self, level: int, column: int, row: int) -> bool:
+        if not 0 <= level <= self.max_level:
+            return False
+        columns, rows = self.grid(level)
+        return 0 <= column < columns and 0 <= row < rows
+
+    def level_path(self, level: int) -> str:
+        return os.path.join(self.directory, f"{level}.npy")
+
+    def has_level(self, level: int) -> bool:
+        return os.path.exists(self.level_path(level))
+
+    def level_pixels(self, level: int) -> np.ndarray:
+        """Píxeles del nivel, proyectados desde disco."""
+        return np.load(self.level_path(level), mmap_mode="r")
+
+    def build_level(self, level: int) -> None:
+        """Genera el nivel reduciendo el siguiente (que ya debe existir)."""
+        source = self.level_pixels(level + 1)
+        width, height = self.level_size(level)
+        tmp_path = f"{self.level_path(level)}.{os.getpid()}.{id(source)}.tmp"
+        out = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=source.dtype, shape=(height, width) + source.shape[2:]
+        )
+        downsample_half(source, out)
+        out.flush()
+        del out
+        # Escritura atómica: otro proceso puede estar generando el mismo nivel
+        os.replace(tmp_path, self.level_path(level))
+
+    def render_tile(self, level: int, column: int, row: int) -> bytes:
+        """Codifica una tesela (las del borde derecho e inferior pueden ser más pequeñas)."""
+        size = self.tile_size
+        pixels = self.level_pixels(level)
+        tile = np.array(pixels[row * size:(row + 1) * size, column * size:(column + 1) * size])
+        return MatrixService._convert_matrix_to_image_bytes(tile, TILE_FORMAT)
+
+    def dzi(self) -> str:
+        """Descriptor Deep Zoom (XML) de la pirámide."""
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<Image xmlns="{DZI_NAMESPACE}" Format="{TILE_FORMAT}" Overlap="0" TileSize="{self.tile_size}">'
+            f'<Size Width="{self.width}" Height="{self.height}"/></Image>'
+        )
+
+    def metadata(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "width": self.width,
+            "height": self.height,
+            "tile_size": self.tile_size,
+            "format": TILE_FORMAT,
+            "min_level": self.min_level,
+            "max_level": self.max_level,
+        }
+
+    def save_metadata(self) -> None:
+        with open(os.path.join(self.directory, _METADATA_FILE), "w") as f:
+            json.dump(self.metadata(), f)
+
+    @classmethod
+    def load(cls, directory: str) -> "TilePyramid":
+        with open(os.path.join(directory, _METADATA_FILE)) as f:
+            metadata = json.load(f)
+        return cls(metadata["id"], directory, metadata["width"], metadata["height"], metadata["tile_size"])
+
+    def iter_tiles(self) -> Iterator[Tuple[int, int, int, bytes]]:
+        """Genera todas las teselas, del nivel completo al de un píxel, creando los niveles que falten."""
+        for level in range(self.max_level, -1, -1):
+            if not self.has_level(level):
+                self.build_level(level)
+            columns, rows = self.grid(level)
+            for row in range(rows):
+                for column in range(columns):
+                    yield level, column, row, self.render_tile(level, column, row)
+
+    def write_zip(self, fp: BinaryIO, name: Optional[str] = None) -> None:
+        """
+        Escribe la pirámide completa en un ZIP con la estructura de Deep Zoom
+        (``<nombre>.dzi`` y ``<nombre>_files/<nivel>/<columna>_<fila>.png``).
+
+        ``fp`` no necesita ``seek``: el ZIP se puede transmitir según se escribe.
+        """
+        name = name or self.id
+        with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_STORED) as archive:
+            archive.writestr(f"{name}.dzi", self.dzi())
+            for level, column, row, content in self.iter_tiles():
+                archive.writestr(f"{name}_files/{level}/{column}_{row}.{TILE_FORMAT}", content)
+
+    def export_directory(self, directory: str, name: Optional[str] = None) -> str:
+        """
+        Escribe la pirámide completa en un directorio con la estructura de Deep Zoom.
+
+        Returns:
+            Ruta del descriptor ``.dzi``
+        """
+        name = name or self.id
+        os.makedirs(directory, exist_ok=True)
+        for level, column, row, content in self.iter_tiles():
+            level_dir = os.path.join(directory, f"{name}_files", str(level))
+            os.makedirs(level_dir, exist_ok=True)
+            with open(os.path.join(level_dir, f"{column}_{row}.{TILE_FORMAT}"), "wb") as f:
+                f.write(content)
+        dzi_path = os.path.join(directory, f"{name}.dzi")
+        with open(dzi_path, "w") as f:
+            f.write(self.dzi())
+        return dzi_path
+
+
+def pyramid_key(source: Union[str, np.ndarray], options: ConversionOptions, tile_size: int) -> str:
+    """
+    Identificador de la pirámide: hash del contenido de la matriz (o del
+    ``.npy`` en disco) junto con las opciones y el tamaño de tesela.
+    """
+    extra = {**options.cache_options(), "tile_size": tile_size}
+    if isinstance(source, np.ndarray):
+        return ResultCache.compute_key(source, "tiles", extra)
+
+    digest = hashlib.blake2b(json.dumps({"tiles": extra}, sort_keys=True).encode(), digest_size=20)
+    with open(source, "rb") as f:
+        while chunk := f.read(_HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_pyramid(
+    source: Union[str, np.ndarray],
+    directory: str,
+    pyramid_id: str,
+    tile_size: int,
+    options: ConversionOptions = DEFAULT_OPTIONS
+) -> TilePyramid:
+    """
+    Crea la pirámide: genera el nivel de máxima resolución y sus metadatos.
+
+    Args:
+        source: Matriz o ruta de un ``.npy`` (que se lee proyectado)
+        directory: Directorio de la pirámide (se crea de forma atómica)
+        pyramid_id: Identificador de la pirámide
+        tile_size: Lado de las teselas
+        options: Opciones de conversión (normalización, mapa de color, ``crop`` y ``stride``)
+    """
+    matrix = LargeMatrixService.open_matrix(source) if isinstance(source, str) else source
+    matrix = LargeMatrixService.select_view(matrix, options)
+    height, width = matrix.shape[:2]
+    tmp_directory = tempfile.mkdtemp(dir=os.path.dirname(directory), prefix=".building-")
+    try:
+        pyramid = TilePyramid(pyramid_id, tmp_directory, width, height, tile_size)
+        LargeMatrixService.render_pixels(matrix, pyramid.level_path(pyramid.max_level), options)
+        pyramid.save_metadata()
+        os.replace(tmp_directory, directory)
+    except BaseException:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+    pyramid.directory = directory
+    return pyramid
+
+
+class TileStore:
+    def __init__(self, root: str, max_pyramids: int):
+        """
+        Registro de pirámides en disco, con expulsión de las menos usadas.
+
+        Args:
+            root: Directorio donde se guardan las pirámides
+            max_pyramids: Número máximo de pirámides conservadas
+        """
+        self.root = root
+        self.max_pyramids = max_pyramids
+        self._pyramids: "OrderedDict[str, TilePyramid]" = OrderedDict()
+        self._locks: "weakref.WeakValueDictionary[Tuple, asyncio.Lock]" = weakref.WeakValueDictionary()
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Recupera las pirámides de ejecuciones anteriores, de la más antigua a la más reciente."""
+        found = []
+        for name in os.listdir(self.root):
+            directory = os.path.join(self.root, name)
+            if name.startswith(".building-"):
+                shutil.rmtree(directory, ignore_errors=True)
+            elif os.path.exists(os.path.join(directory, _METADATA_FILE)):
+                found.append((os.path.getmtime(directory), directory))
+        for _, directory in sorted(found):
+            pyramid = TilePyramid.load(directory)
+            self._pyramids[pyramid.id] = pyramid
+
+    def _lock(self, *key: Any) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+    def get(self, pyramid_id: str) -> Optional[TilePyramid]:
+        pyramid = self._pyramids.get(pyramid_id)
+        if pyramid is not None:
+            self._pyramids.move_to_end(pyramid_id)
+        return pyramid
+
+    async def create(
+        self,
+        source: Union[str, np.ndarray],
+        tile_size: int,
+        options: ConversionOptions = DEFAULT_OPTIONS
+    ) -> Tuple[TilePyramid, bool]:
+        """
+        Crea la pirámide de una matriz o devuelve la existente si ya se creó.
+
+        Args:
+            source: Matriz o ruta de un ``.npy``
+            tile_size: Lado de las teselas
+            options: Opciones de conversión
+
+        Returns:
+            Tupla con la pirámide e indicador de si se ha creado ahora
+
+        Raises:
+            PoolSaturatedError: Si el motor de ejecución está saturado
+        """
+        engine = get_execution_engine()
+        pyramid_id = await engine.run(pyramid_key, source, options, tile_size)
+
+        async with self._lock(pyramid_id):
+            pyramid = self.get(pyramid_id)
+            if pyramid is not None:
+                return pyramid, False
+            pyramid = await engine.run(
+                build_pyramid, source, os.path.join(self.root, pyramid_id), pyramid_id, tile_size, options
+            )
+            self._pyramids[pyramid_id] = pyramid
+
+        while len(self._pyramids) > self.max_pyramids:
+            _, evicted = self._pyramids.popitem(last=False)
+            await asyncio.to_thread(shutil.rmtree, evicted.directory, True)
+        return pyramid, True
+
+    async def ensure_level(self, pyramid: TilePyramid, level: int) -> None:
+        """Genera (una sola vez, aunque lleguen peticiones simultáneas) el nivel y los intermedios."""
+        if pyramid.has_level(level):
+            return
+        async with self._lock(pyramid.id, "levels"):
+            missing = [
+                missing_level
+                for missing_level in range(pyramid.max_level - 1, level - 1, -1)
+                if not pyramid.has_level(missing_level)
+            ]
+            for missing_level in missing:
+                await get_execution_engine().run(pyramid.build_level, missing_level)
+
+    async def tile(self, pyramid: TilePyramid, level: int, column: int, row: int) -> bytes:
+        """
+        Devuelve los bytes PNG de una tesela, generando su nivel si hace falta.
+
+        Raises:
+            PoolSaturatedError: Si el motor de ejecución está saturado
+        """
+        await self.ensure_level(pyramid, level)
+        return await get_execution_engine().run(pyramid.render_tile, level, column, row)
+
+
+_store: Optional[TileStore] = None
+
+
+def get_tile_store() -> TileStore:
+    """
+    Devuelve el registro de pirámides compartido.
+
+    Returns:
+        Instancia de TileStore
+    """
+    global _store
+    if _store is None:
+        settings = get_settings()
+        _store = TileStore(
+            settings.TILES_DIR or os.path.join(tempfile.gettempdir(), "matrixtoimagen-tiles"),
+            settings.TILES_MAX_PYRAMIDS,
+        )
+    return _store
+
+
+def main() -> None:
+    """Genera la pirámide de un ``.npy`` en un directorio o ZIP de Deep Zoom."""
+    parser = argparse.ArgumentParser(description="Genera una pirámide de teselas Deep Zoom a partir de un .npy")
+    parser.add_argument("matrix", help="Archivo .npy de entrada")
+    parser.add_argument("output", help="Directorio de salida, o archivo .zip")
+    parser.add_argument("--tile-size", type=int, default=get_settings().TILE_SIZE)
+    parser.add_argument("--normalize", default="auto")
+    parser.add_argument("--colormap", default=None)
+    args = parser.parse_args()
+
+    options = ConversionOptions(normalize=args.normalize, colormap=args.colormap)
+    name = os.path.splitext(os.path.basename(args.matrix))[0]
+    with tempfile.TemporaryDirectory() as work:
+        pyramid = build_pyramid(args.matrix, os.path.join(work, "pyramid"), name, args.tile_size, options)
+        if args.output.lower().endswith(".zip"):
+            with open(args.output, "wb") as f:
+                pyramid.write_zip(f, name)
+        else:
+            pyramid.export_directory(args.output, name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Cliente HTTP persistente para el servicio ImageToMatrix.
+
+Un único ``UpstreamClient`` vive mientras dura la aplicación; su
+``httpx.AsyncClient`` (y la importación de httpx) se crea en la primera
+llamada, con un pool de conexiones limitado y keep-alive. Las peticiones fallidas por errores de
+red o respuestas 502/503/504 se reintentan con espera exponencial, y un
+interruptor de circuito corta las llamadas mientras el servicio está caído.
+"""
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+from src.config.settings import get_settings
+from src.services.binary_matrix import RawMatrixBuffer, is_npy_buffer, parse_shape
+from src.services.metrics import UPSTREAM_DURATION, UPSTREAM_REJECTED
+from src.utils.lazy_import import httpx
+
+RETRYABLE_STATUS_CODES = (502, 503, 504)
+
+# Negociación del formato de la matriz: se pide .npy y se acepta JSON como alternativa
+BINARY_ACCEPT = "application/x-npy, application/octet-stream;q=0.9, application/json;q=0.5"
+BINARY_REJECTED_STATUS_CODES = (406, 415)
+# Pueden deberse al formato o a la propia imagen: se reintenta en JSON sin darlo por rechazado
+BINARY_AMBIGUOUS_STATUS_CODES = (400, 422)
+NPY_CONTENT_TYPES = ("application/x-npy", "application/npy")
+
+
+class UpstreamUnavailableError(RuntimeError):
+    """El servicio ImageToMatrix no está disponible."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Crea el interruptor.
+
+        Tras ``failure_threshold`` fallos consecutivos se abre y rechaza las
+        llamadas durante ``reset_timeout`` segundos; después deja pasar una
+        llamada de prueba (semiabierto) que lo cierra si tiene éxito.
+
+        Args:
+            failure_threshold: Fallos consecutivos que abren el circuito
+            reset_timeout: Segundos que el circuito permanece abierto
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def retry_after(self) -> int:
+        """Segundos que faltan para que el circuito admita una llamada de prueba."""
+        if self._opened_at is None:
+            return 0
+        remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def allow(self) -> bool:
+        """Indica si se puede realizar una llamada ahora."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def release(self) -> None:
+        """Libera la llamada de prueba sin contarla (p. ej. si se cancela antes de recibir respuesta)."""
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+
+class UpstreamClient:
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        retries: int = 2,
+        backoff: float = 0.2,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Crea el cliente.
+
+        Args:
+            max_connections: Conexiones simultáneas máximas
+            max_keepalive_connections: Conexiones inactivas que se mantienen abiertas
+            keepalive_expiry: Segundos que una conexión inactiva sigue abierta
+            connect_timeout: Tiempo máximo para establecer la conexión
+            read_timeout: Tiempo máximo de espera de la respuesta (y de escritura)
+            retries: Reintentos tras el primer intento fallido
+            backoff: Espera base en segundos; se duplica en cada reintento
+            breaker: Interruptor de circuito (se crea uno por defecto si es None)
+        """
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        # None mientras no se sepa si ImageToMatrix admite el formato binario
+        self.binary_supported: Optional[bool] = None
+        self.breaker = breaker or CircuitBreaker()
+        self._limits = (max_connections, max_keepalive_connections, keepalive_expiry)
+        self._timeouts = (connect_timeout, read_timeout)
+        self._client: Optional["httpx.AsyncClient"] = None
+
+    def _http_client(self) -> "httpx.AsyncClient":
+        """Cliente HTTP con el pool de conexiones, creado (e importado httpx) en la primera llamada."""
+        if self._client is None:
+            max_connections, max_keepalive_connections, keepalive_expiry = self._limits
+            connect_timeout, read_timeout = self._timeouts
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                    keepalive_expiry=keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(
+                    connect=connect_timeout,
+                    read=read_timeout,
+                    write=read_timeout,
+                    pool=connect_timeout,
+                ),
+            )
+        return self._client
+
+    async def post(self, url: str, **kwargs) -> "httpx.Response":
+        """
+        Envía una petición POST con reintentos y a través del interruptor.
+
+        Args:
+            url: URL de destino
+            **kwargs: Argumentos de ``httpx.AsyncClient.post``
+
+        Returns:
+            Respuesta del servicio (que puede ser un error 4xx/5xx no reintentable;
+            los 5xx cuentan como fallos para el interruptor)
+
+        Raises:
+            UpstreamUnavailableError: Si el circuito está abierto o se agotan los reintentos
+        """
+        if not self.breaker.allow():
+            UPSTREAM_REJECTED.inc()
+            raise UpstreamUnavailableError(
+                "El servicio ImageToMatrix no está disponible (circuito abierto)",
+                self.breaker.retry_after(),
+            )
+
+        last_error = "sin respuesta"
+        # Cualquier salida sin pasar por record_*, incluida la cancelación, debe
+        # liberar la llamada de prueba: si no, el circuito quedaría semiabierto para siempre
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    # Espera exponencial con variación aleatoria para no sincronizar reintentos
+                    delay = self.backoff * (2 ** (attempt - 1))
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                start = time.perf_counter()
+                try:
+                    response = await self._http_client().post(url, **kwargs)
+                except httpx.TransportError as e:
+                    UPSTREAM_DURATION.observe(time.perf_counter() - start, outcome="error")
+                    last_error = f"{type(e).__name__}: {str(e)}"
+                    continue
+                UPSTREAM_DURATION.observe(time.perf_counter() - start, outcome=str(response.status_code))
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    last_error = f"HTTP {response.status_code}"
+                    continue
+
+                # Un 5xx no reintentable se devuelve al llamador, pero cuenta como fallo del servicio
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                return response
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_failure()
+        raise UpstreamUnavailableError(
+            f"El servicio ImageToMatrix no respondió tras {self.retries + 1} intentos ({last_error})",
+            max(1, self.breaker.retry_after()),
+        )
+
+    async def post_matrix_request(
+        self,
+        url: str,
+        files: Dict[str, Any],
+        data: Dict[str, Any],
+        headers: Dict[str, str],
+        matrix_format: str = "auto"
+    ) -> Tuple["httpx.Response", str]:
+        """
+        Pide una matriz a ImageToMatrix negociando el formato binario.
+
+        En modo 'auto' se solicita ``.npy``; si el servicio lo rechaza
+        (406/415) o responde en JSON, se recuerda que no admite el formato
+        binario y las siguientes peticiones van directamente en JSON. Un 400 o
+        422 puede deberse a la imagen: se repite en JSON y solo se recuerda si
+        esa petición tiene éxito.
+
+        Args:
+            url: URL del servicio
+            files: Archivos del formulario
+            data: Campos del formulario (sin 'format')
+            headers: Cabeceras de la petición
+            matrix_format: 'auto', 'numpy' (solo binario) o 'json' (solo JSON)
+
+        Returns:
+            Tupla con la respuesta y el formato de la matriz recibida ('numpy', 'raw' o 'json')
+        """
+        if matrix_format == "numpy" or (matrix_format == "auto" and self.binary_supported is not False):
+            response = await self.post(
+                url,
+                files=files,
+                data={**data, "format": "numpy"},
+                headers={**headers, "Accept": BINARY_ACCEPT},
+            )
+            if response.status_code == 200:
+                received_format = detect_matrix_format(response)
+                self.binary_supported = received_format != "json"
+                return response, received_format
+            rejected = response.status_code in BINARY_REJECTED_STATUS_CODES
+            if matrix_format == "numpy" or not (rejected or response.status_code in BINARY_AMBIGUOUS_STATUS_CODES):
+                return response, "json"
+            if rejected:
+                self.binary_supported = False
+            response = await self.post(url, files=files, data={**data, "format": "json"}, headers=headers)
+            if response.status_code == 200:
+                self.binary_supported = False
+            return response, "json"
+
+        response = await self.post(url, files=files, data={**data, "format": "json"}, headers=headers)
+        return response, "json"
+
+    async def aclose(self) -> None:
+        """Cierra las conexiones del pool (si llegó a crearse)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def detect_matrix_format(response: "httpx.Response") -> str:
+    """
+    Deduce el formato de la matriz recibida por su Content-Type, su firma o
+    las cabeceras de dtype y forma del búfer crudo.
+    """
+    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NPY_CONTENT_TYPES or is_npy_buffer(response.content[:8]):
+        return "numpy"
+    if "x-matrix-dtype" in response.headers and "x-matrix-shape" in response.headers:
+        return "raw"
+    return "json"
+
+
+def response_matrix_data(response: "httpx.Response", matrix_format: str) -> Union[bytes, RawMatrixBuffer]:
+    """Devuelve el cuerpo de la respuesta listo para ``validate_matrix_data``."""
+    if matrix_format == "raw":
+        return RawMatrixBuffer(
+            response.content,
+            response.headers["x-matrix-dtype"],
+            parse_shape(response.headers["x-matrix-shape"]),
+        )
+    return response.content
+
+
+_client: Optional[UpstreamClient] = None
+
+
+def get_upstream_client() -> UpstreamClient:
+    """
+    Devuelve el cliente compartido, creándolo con la configuración actual la
+    primera vez que se solicita.
+
+    Returns:
+        Instancia de UpstreamClient
+    """
+    global _client
+    if _client is None:
+        settings = get_settings()
+        _client = UpstreamClient(
+            max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY,
+            connect_timeout=settings.UPSTREAM_CONNECT_TIMEOUT,
+            read_timeout=settings.UPSTREAM_READ_TIMEOUT,
+            retries=settings.UPSTREAM_RETRIES,
+            backoff=settings.UPSTREAM_BACKOFF,
+            breaker=CircuitBreaker(
+                failure_threshold=settings.UPSTREAM_BREAKER_THRESHOLD,
+                reset_timeout=settings.UPSTREAM_BREAKER_RESET_TIMEOUT,
+            ),
+        )
+    return _client
+
+
+async def close_upstream_client() -> None:
+    """Cierra el cliente compartido (se invoca al apagar la aplicación)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,19 @@
+"""
+Calentamiento del proceso: lo que si no pagaría la primera solicitud de cada tipo.
+
+Importa OpenCV, matplotlib y httpx, genera las LUT de los mapas de color y
+carga los codificadores de imagen. Lo invoca el ciclo de vida de la
+aplicación con ``WARMUP_ON_STARTUP`` y el servidor de producción una sola
+vez antes de crear los workers, que lo heredan ya hecho.
+
+No arranca hilos ni abre conexiones: debe poder ejecutarse antes de un fork.
+"""
+from src.services.colormaps import warm_colormaps
+from src.services.encoders import warm_encoders
+from src.utils.lazy_import import HEAVY_MODULES, preload
+
+
+def warm_up() -> None:
+    preload(*HEAVY_MODULES)
+    warm_colormaps()
+    warm_encoders()
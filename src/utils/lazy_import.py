@@ -0,0 +1,81 @@
+"""
+Importación diferida de los módulos pesados (OpenCV, matplotlib, httpx).
+
+``from src.utils.lazy_import import cv2`` deja en el módulo un sustituto que
+importa el real la primera vez que se accede a uno de sus atributos. Así
+arrancar un worker no paga el coste de importarlos (unos 0,7s entre los
+tres) hasta que una solicitud los necesita, o hasta que ``preload`` los
+carga en el arranque con ``WARMUP_ON_STARTUP``.
+"""
+import importlib
+import threading
+from types import ModuleType
+from typing import Any, Callable, Optional
+
+
+class LazyModule:
+    """Sustituto de un módulo que lo importa en el primer acceso a un atributo."""
+
+    def __init__(self, name: str, on_load: Optional[Callable[[ModuleType], None]] = None):
+        """
+        Args:
+            name: Nombre del módulo
+            on_load: Función que recibe el módulo recién importado (para configurarlo)
+        """
+        self.__dict__["_name"] = name
+        self.__dict__["_on_load"] = on_load
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def load(self) -> ModuleType:
+        """Importa el módulo si aún no se ha hecho y lo devuelve."""
+        module = self.__dict__["_module"]
+        if module is None:
+            # Los hilos del motor de ejecución pueden pedirlo a la vez
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_name"])
+                    if self.__dict__["_on_load"] is not None:
+                        self.__dict__["_on_load"](module)
+                    self.__dict__["_module"] = module
+        return module
+
+    @property
+    def loaded(self) -> bool:
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        setattr(self.load(), attr, value)
+
+    def __repr__(self) -> str:
+        state = "cargado" if self.loaded else "sin cargar"
+        return f"<LazyModule {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_module(name: str, on_load: Optional[Callable[[ModuleType], None]] = None) -> LazyModule:
+    """Devuelve un sustituto de ``name`` que se importa en el primer uso."""
+    return LazyModule(name, on_load)
+
+
+def preload(*modules: LazyModule) -> None:
+    """Importa por adelantado los módulos indicados."""
+    for module in modules:
+        module.load()
+
+
+def _configure_matplotlib(module: ModuleType) -> None:
+    # Sin pantalla: backend Agg antes de cargar nada más, y las piezas que usa la comparación
+    module.use("Agg")
+    importlib.import_module("matplotlib.figure")
+    importlib.import_module("matplotlib.backends.backend_agg")
+
+
+cv2 = lazy_module("cv2")
+matplotlib = lazy_module("matplotlib", on_load=_configure_matplotlib)
+httpx = lazy_module("httpx")
+
+HEAVY_MODULES = (cv2, matplotlib, httpx)
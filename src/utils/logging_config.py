@@ -0,0 +1,102 @@
+"""
+Configuración del logging de la aplicación.
+
+Los registros se encolan con un ``QueueHandler`` y un hilo aparte
+(``QueueListener``) los formatea y escribe, así el event loop no espera a
+la salida estándar ni al disco. Con ``LOG_FORMAT=json`` cada registro es una
+línea JSON con los campos que se pasan en ``extra={"fields": {...}}``.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from src.config.settings import Settings
+
+_TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[QueueListener] = None
+_settings: Optional[Settings] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea: fecha, nivel, logger, mensaje y los campos estructurados."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    """Formato legible para desarrollo, con los campos estructurados al final."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            message += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return message
+
+
+def configure_logging(settings: Settings) -> None:
+    """
+    Sustituye los handlers del logger raíz por uno que encola los registros.
+
+    Es idempotente: las siguientes llamadas no hacen nada.
+    """
+    global _listener, _settings
+    if _listener is not None:
+        return
+    _settings = settings
+
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else _TextFormatter(_TEXT_FORMAT))
+    # Cola sin límite: encolar nunca bloquea a quien registra
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    _listener = QueueListener(records, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(records))
+    root.setLevel(getattr(logging, settings.LOG_LEVEL))
+
+    _listener.start()
+    # Al salir se vacía la cola para no perder los últimos registros
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Escribe los registros pendientes y detiene el hilo del listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_after_fork() -> None:
+    """
+    En un proceso hijo el hilo del listener no existe: se instala una cola y
+    un listener nuevos (el servidor de producción arranca los workers con fork).
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener = None
+    configure_logging(_settings)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,411 @@
+"""
+Utilidades para leer el cuerpo de las solicitudes con matrices.
+"""
+import asyncio
+import io
+import json
+import os
+import tempfile
+import zipfile
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException, Query, Request
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from src.config.settings import get_settings
+from src.services.batch_service import BatchItem
+from src.services.binary_matrix import RawMatrixBuffer, is_npy_buffer, load_npy_buffer, parse_shape
+from src.services.colormaps import get_colormap_lut
+from src.services.conversion_options import ConversionOptions
+from src.services.execution_engine import PoolSaturatedError
+from src.services.json_stream_parser import parse_matrix_stream
+
+settings = get_settings()
+
+NPY_CONTENT_TYPES = ("application/x-npy", "application/npy")
+NPZ_CONTENT_TYPES = ("application/x-npz", "application/zip")
+ZIP_MAGIC = b"PK\x03\x04"
+_SPOOL_WRITE_SIZE = 4 * 1024 * 1024  # Bytes acumulados antes de cada escritura en disco
+
+
+async def read_request_body(request: Request, max_size: int) -> bytearray:
+    """
+    Lee el cuerpo de la solicitud en un único búfer.
+
+    Si se conoce ``Content-Length`` el búfer se reserva de antemano y cada
+    fragmento recibido se copia en su sitio, sin listas ni concatenaciones
+    intermedias.
+
+    Args:
+        request: Solicitud entrante
+        max_size: Tamaño máximo admitido en bytes
+
+    Returns:
+        Búfer mutable con el cuerpo completo
+
+    Raises:
+        HTTPException: Si el cuerpo supera el límite o está incompleto
+    """
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"La matriz supera el tamaño máximo permitido ({max_size} bytes)"
+    )
+
+    content_length = request.headers.get("content-length")
+    if content_length is None:
+        # Transferencia por fragmentos: acumular respetando el límite
+        buffer = bytearray()
+        async for chunk in request.stream():
+            buffer += chunk
+            if len(buffer) > max_size:
+                raise too_large
+        return buffer
+
+    try:
+        length = int(content_length)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cabecera Content-Length no válida")
+    if length > max_size:
+        raise too_large
+
+    buffer = bytearray(length)
+    received = 0
+    with memoryview(buffer) as view:
+        async for chunk in request.stream():
+            end = received + len(chunk)
+            if end > length:
+                raise HTTPException(status_code=400, detail="El cuerpo excede la longitud declarada")
+            view[received:end] = chunk
+            received = end
+
+    if received != length:
+        raise HTTPException(status_code=400, detail="El cuerpo de la solicitud está incompleto")
+    return buffer
+
+
+async def spool_request_body(request: Request, max_size: int, directory: Optional[str] = None) -> str:
+    """
+    Guarda el cuerpo de la solicitud en un archivo temporal.
+
+    Los fragmentos se acumulan hasta ``_SPOOL_WRITE_SIZE`` y se escriben en
+    disco fuera del event loop, de modo que la memoria usada no depende del
+    tamaño del cuerpo.
+
+    Args:
+        request: Solicitud entrante
+        max_size: Tamaño máximo admitido en bytes
+        directory: Directorio del archivo temporal (por defecto el del sistema)
+
+    Returns:
+        Ruta del archivo (la elimina quien lo consume)
+
+    Raises:
+        HTTPException: Si el cuerpo supera el límite
+    """
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"La matriz supera el tamaño máximo permitido ({max_size} bytes)"
+    )
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size:
+        raise too_large
+
+    fd, path = tempfile.mkstemp(suffix=".npy", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            pending = bytearray()
+            received = 0
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > max_size:
+                    raise too_large
+                pending += chunk
+                if len(pending) >= _SPOOL_WRITE_SIZE:
+                    await asyncio.to_thread(spool.write, pending)
+                    pending = bytearray()
+            await asyncio.to_thread(spool.write, pending)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def _content_type(request: Request) -> str:
+    """Devuelve el Content-Type de la solicitud sin parámetros y en minúsculas."""
+    content_type = request.headers.get("content-type", "application/json")
+    return content_type.split(";")[0].strip().lower()
+
+
+def is_npy_request(request: Request) -> bool:
+    """Indica si el Content-Type de la solicitud es el de un archivo ``.npy``."""
+    return _content_type(request) in NPY_CONTENT_TYPES
+
+
+def conversion_options(
+    normalize: str = Query("auto", description="auto, clip, minmax, percentile, window o passthrough (16 bits)"),
+    percentiles: str = Query("1,99", description="Percentiles inferior y superior del modo 'percentile'"),
+    window: Optional[float] = Query(None, description="Ancho de ventana del modo 'window'"),
+    level: Optional[float] = Query(None, description="Centro de ventana del modo 'window'"),
+    colormap: Optional[str] = Query(
+        None, description="Mapa de color para matrices de un canal (viridis, magma, jet...) o custom:#rrggbb,..."
+    ),
+    crop: Optional[str] = Query(None, description="Región a convertir: 'x,y,ancho,alto'"),
+    stride: int = Query(1, description="Tomar una de cada 'stride' filas y columnas"),
+    max_width: Optional[int] = Query(None, description="Ancho máximo de la imagen (se reduce con INTER_AREA)"),
+    max_height: Optional[int] = Query(None, description="Alto máximo de la imagen (se reduce con INTER_AREA)"),
+    profile: Optional[str] = Query(None, description="Perfil de codificación: fastest, balanced o smallest"),
+    encoder: Optional[str] = Query(None, description="Codificador: auto, pillow u opencv"),
+    compress_level: Optional[int] = Query(None, description="Nivel de compresión PNG (0-9)"),
+    quality: Optional[int] = Query(None, description="Calidad JPEG, WebP o AVIF (1-100)"),
+    optimize: Optional[bool] = Query(None, description="Optimizar PNG o JPEG (más lento, archivo menor)"),
+    lossless: Optional[bool] = Query(None, description="WebP sin pérdida")
+) -> ConversionOptions:
+    """
+    Dependencia que construye las opciones de conversión a partir de la query.
+
+    Raises:
+        HTTPException: Si alguna opción no es válida
+    """
+    try:
+        bounds = [float(value) for value in percentiles.split(",")]
+        if len(bounds) != 2:
+            raise ValueError("'percentiles' debe tener la forma 'inferior,superior'")
+        low, high = bounds
+        if colormap is not None:
+            colormap = colormap.strip().lower()
+            get_colormap_lut(colormap)
+        region = None
+        if crop is not None:
+            region = tuple(int(value) for value in crop.split(","))
+            if len(region) != 4:
+                raise ValueError("'crop' debe tener la forma 'x,y,ancho,alto'")
+        return ConversionOptions(
+            normalize=normalize.lower(),
+            percentiles=(low, high),
+            window=window,
+            level=level,
+            colormap=colormap,
+            crop=region,
+            stride=stride,
+            max_width=max_width,
+            max_height=max_height,
+            profile=(profile or settings.ENCODER_PROFILE).lower(),
+            encoder=(encoder or settings.ENCODER_BACKEND).lower(),
+            compress_level=compress_level,
+            quality=quality,
+            optimize=optimize,
+            lossless=lossless,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Opciones de conversión no válidas: {str(e)}")
+
+
+def _infer_format(request: Request, body_prefix: bytes) -> str:
+    """Deduce el formato de entrada a partir del Content-Type y de la firma del cuerpo."""
+    content_type = _content_type(request)
+
+    if content_type in NPY_CONTENT_TYPES:
+        return "numpy"
+    if content_type == "application/octet-stream":
+        if is_npy_buffer(body_prefix):
+            return "numpy"
+        return "raw"
+    return "json"
+
+
+async def _stream_json_matrix(request: Request) -> np.ndarray:
+    """Parsea la matriz JSON a medida que llegan los fragmentos del cuerpo."""
+    content_length = request.headers.get("content-length")
+    size_hint = int(content_length) if content_length and content_length.isdigit() else None
+    if size_hint is not None and size_hint > settings.MAX_MATRIX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"La matriz supera el tamaño máximo permitido ({settings.MAX_MATRIX_SIZE} bytes)"
+        )
+
+    try:
+        return await parse_matrix_stream(
+            request.stream(), size_hint=size_hint, max_size=settings.MAX_MATRIX_SIZE
+        )
+    except OverflowError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PoolSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+async def read_matrix_request(request: Request, format: Optional[str] = None) -> Tuple[Any, str]:
+    """
+    Lee la matriz enviada en el cuerpo de la solicitud.
+
+    Admite JSON (``{"matrix": [...]}``, parseado en streaming), un archivo
+    ``.npy`` o un búfer crudo acompañado de las cabeceras ``X-Matrix-Dtype`` y
+    ``X-Matrix-Shape`` (o de los parámetros ``dtype`` y ``shape``).
+
+    Args:
+        request: Solicitud entrante
+        format: Formato explícito ('json', 'numpy' o 'raw'); si es None se deduce
+
+    Returns:
+        Tupla con los datos de la matriz (ya convertida a ndarray en el caso
+        JSON) y el formato de entrada
+    """
+    if (format or _infer_format(request, b"")).lower() == "json":
+        return await _stream_json_matrix(request), "json"
+
+    body = await read_request_body(request, settings.MAX_MATRIX_SIZE)
+    format = (format or _infer_format(request, bytes(body[:8]))).lower()
+
+    if format == "raw":
+        dtype = request.headers.get("x-matrix-dtype") or request.query_params.get("dtype")
+        shape = request.headers.get("x-matrix-shape") or request.query_params.get("shape")
+        if not dtype or not shape:
+            raise HTTPException(
+                status_code=400,
+                detail="El formato 'raw' requiere las cabeceras X-Matrix-Dtype y X-Matrix-Shape"
+            )
+        try:
+            return RawMatrixBuffer(body, dtype, parse_shape(shape)), format
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return body, format
+
+
+def _load_json_batch(body: bytes) -> List[BatchItem]:
+    """Separa un lote JSON (lista o ``{"matrices": [...]}``) en elementos sin convertirlos."""
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Error al decodificar JSON: {str(e)}")
+
+    entries = data.get("matrices") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        raise ValueError("El lote JSON debe ser una lista o un objeto con la clave 'matrices'")
+
+    items = []
+    for index, entry in enumerate(entries):
+        if isinstance(entry, dict):
+            items.append(BatchItem(str(entry.get("id", index)), entry, "json"))
+        else:
+            items.append(BatchItem(str(index), {"matrix": entry}, "json"))
+    return items
+
+
+def _load_npy_batch(body: bytearray) -> List[BatchItem]:
+    """Divide un ``.npy`` apilado en vistas a lo largo del primer eje, sin copias."""
+    stack = load_npy_buffer(body)
+    if stack.ndim not in (3, 4):
+        raise ValueError(
+            f"El archivo .npy del lote debe tener un eje de lote inicial (N,H,W[,C]); forma recibida: {stack.shape}"
+        )
+    return [BatchItem(str(index), stack[index], "numpy") for index in range(stack.shape[0])]
+
+
+def _load_npz_batch(body: bytes) -> List[BatchItem]:
+    """Carga cada array de un ``.npz`` como un elemento del lote, con su nombre como identificador."""
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        # Evitar archivos que se expanden muy por encima del límite
+        if sum(info.file_size for info in archive.infolist()) > settings.MAX_MATRIX_SIZE:
+            raise OverflowError(
+                f"El lote supera el tamaño máximo permitido ({settings.MAX_MATRIX_SIZE} bytes)"
+            )
+
+    with np.load(io.BytesIO(body), allow_pickle=False) as arrays:
+        return [BatchItem(name, arrays[name], "numpy") for name in arrays.files]
+
+
+async def _limited_stream(request: Request, max_size: int) -> AsyncIterator[bytes]:
+    """Fragmentos del cuerpo; se corta en cuanto superan ``max_size``, haya o no Content-Length."""
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > max_size:
+            raise OverflowError(f"El lote supera el tamaño máximo permitido ({max_size} bytes)")
+        yield chunk
+
+
+async def _read_batch_form(request: Request) -> List[BatchItem]:
+    """Lee un lote multipart: cada archivo es un elemento (``.npy`` o JSON)."""
+    # El parser cierra sus archivos temporales si la lectura falla a medias
+    parser = MultiPartParser(
+        request.headers,
+        _limited_stream(request, settings.MAX_MATRIX_SIZE),
+        max_files=settings.BATCH_MAX_ITEMS + 1,
+    )
+    try:
+        form = await parser.parse()
+    except MultiPartException as e:
+        raise ValueError(e.message)
+
+    try:
+        items = []
+        for field, value in form.multi_items():
+            if not isinstance(value, UploadFile):
+                continue
+            data = await value.read()
+            filename = value.filename or field
+            content_type = (value.content_type or "").split(";")[0].strip().lower()
+            is_npy = (
+                content_type in NPY_CONTENT_TYPES
+                or filename.lower().endswith(".npy")
+                or is_npy_buffer(data[:8])
+            )
+            items.append(BatchItem(os.path.splitext(filename)[0], data, "numpy" if is_npy else "json"))
+        return items
+    finally:
+        await form.close()
+
+
+async def read_batch_request(request: Request) -> List[BatchItem]:
+    """
+    Lee un lote de matrices del cuerpo de la solicitud.
+
+    Admite una lista JSON (o ``{"matrices": [...]}``, cada elemento una matriz
+    o un objeto con ``id`` y ``matrix``), un ``.npy`` apilado con el lote en
+    el primer eje, un ``.npz`` con un array por elemento o un formulario
+    multipart con un archivo por elemento.
+
+    Args:
+        request: Solicitud entrante
+
+    Returns:
+        Lista de elementos del lote (todavía sin convertir)
+
+    Raises:
+        HTTPException: Si el cuerpo no es un lote válido o supera los límites
+    """
+    content_type = _content_type(request)
+
+    try:
+        if content_type == "multipart/form-data":
+            content_length = request.headers.get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > settings.MAX_MATRIX_SIZE:
+                raise OverflowError(
+                    f"El lote supera el tamaño máximo permitido ({settings.MAX_MATRIX_SIZE} bytes)"
+                )
+            items = await _read_batch_form(request)
+        else:
+            body = await read_request_body(request, settings.MAX_MATRIX_SIZE)
+            if content_type in NPZ_CONTENT_TYPES or body.startswith(ZIP_MAGIC):
+                items = await asyncio.to_thread(_load_npz_batch, bytes(body))
+            elif content_type in NPY_CONTENT_TYPES or is_npy_buffer(bytes(body[:8])):
+                items = _load_npy_batch(body)
+            else:
+                items = await asyncio.to_thread(_load_json_batch, body)
+    except OverflowError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=400, detail=f"Lote no válido: {str(e)}")
+
+    if not items:
+        raise HTTPException(status_code=400, detail="El lote está vacío")
+    if len(items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote supera el número máximo de elementos ({settings.BATCH_MAX_ITEMS})"
+        )
+    return items
@@ -0,0 +1,52 @@
+"""
+Utilidades para medir el tiempo de cada etapa del procesamiento.
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class StageTimer:
+    """
+    Acumula la duración (en milisegundos) de las etapas de una solicitud.
+
+    Es un objeto simple y serializable: las etapas ejecutadas en un proceso
+    de trabajo se devuelven como diccionario y se fusionan con ``merge``.
+    """
+
+    def __init__(self, stages: Optional[Dict[str, float]] = None):
+        self.stages: Dict[str, float] = dict(stages or {})
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Mide el bloque envuelto y lo suma a la etapa indicada.
+
+        Args:
+            name: Nombre de la etapa (por ejemplo 'parse' o 'encode')
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000.0)
+
+    def add(self, name: str, duration_ms: float) -> None:
+        """Suma una duración en milisegundos a una etapa."""
+        self.stages[name] = self.stages.get(name, 0.0) + duration_ms
+
+    def merge(self, stages: Dict[str, float]) -> None:
+        """Fusiona las etapas medidas en otro lugar (hilo o proceso)."""
+        for name, duration_ms in stages.items():
+            self.add(name, duration_ms)
+
+    def server_timing_header(self) -> str:
+        """
+        Devuelve las etapas con el formato de la cabecera ``Server-Timing``.
+
+        Returns:
+            Cadena del tipo ``parse;dur=1.20, encode;dur=35.10``
+        """
+        return ", ".join(
+            f"{name};dur={duration_ms:.2f}" for name, duration_ms in self.stages.items()
+        )
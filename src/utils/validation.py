@@ -2,24 +2,136 @@
 Utilidades para validación de datos.
 """
 from fastapi import HTTPException
-import json
-from typing import Dict, Any, Union
+import numpy as np
+from typing import Dict, Any, BinaryIO, List, Tuple, Union
 
 from src.config.settings import get_settings
+from src.services.binary_matrix import RawMatrixBuffer, load_npy_buffer, load_raw_buffer, read_npy_header
+from src.services.encoders import OPAQUE_FORMATS, canonical_format
+from src.services.execution_engine import get_execution_engine
+from src.services.json_stream_parser import parse_matrix_json
+from src.services.matrix_envelope import MatrixEnvelope
 
 settings = get_settings()
 
-async def validate_matrix_data(data: Union[Dict[str, Any], bytes], format: str):
+def validate_matrix_layout(shape: Tuple[int, ...], dtype: Any) -> None:
     """
-    Valida que los datos de la matriz sean válidos.
+    Comprueba forma, tipo y tamaño de una matriz sin tocar sus píxeles.
+    
+    Args:
+        shape: Forma (declarada o estimada) de la matriz
+        dtype: Tipo de datos de la matriz
+        
+    Raises:
+        HTTPException: Si la matriz no puede convertirse en imagen o
+            supera MAX_MATRIX_SIZE
+    """
+    dtype = np.dtype(dtype)
+    if dtype.hasobject or dtype.kind not in "biuf":
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tipo de datos no admitido: {dtype}"
+        )
+    
+    if len(shape) not in (2, 3):
+        raise HTTPException(
+            status_code=400,
+            detail="La matriz debe ser 2D (escala grises) o 3D (color)"
+        )
+    if len(shape) == 3 and shape[2] not in (1, 3, 4):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Dimensiones de matriz no compatibles: {tuple(shape)}"
+        )
+    if any(dim <= 0 for dim in shape):
+        raise HTTPException(
+            status_code=400,
+            detail="La matriz está vacía"
+        )
+    
+    nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    if nbytes > settings.MAX_MATRIX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"La matriz supera el tamaño máximo permitido ({settings.MAX_MATRIX_SIZE} bytes)"
+        )
+
+
+def validate_output_channels(shape: Tuple[int, ...], output_format: str) -> None:
+    """
+    Comprueba que el formato de salida admite los canales de la matriz.
+    
+    Args:
+        shape: Forma de la matriz (o de la región que se convierte)
+        output_format: Formato de salida de la imagen
+        
+    Raises:
+        HTTPException: Si la matriz tiene canal alfa y el formato no lo admite
+    """
+    if len(shape) == 3 and shape[2] == 4 and canonical_format(output_format) in OPAQUE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"El formato {output_format} no admite canal alfa: use png, webp o tiff"
+        )
+
+
+def _nested_list_layout(matrix_data: List[Any]) -> Tuple[Tuple[int, ...], np.dtype]:
+    """Estima forma y tipo de una lista anidada recorriendo solo sus primeros elementos."""
+    shape = []
+    node = matrix_data
+    while isinstance(node, list):
+        shape.append(len(node))
+        if not node:
+            break
+        node = node[0]
+    if isinstance(node, bool):
+        return tuple(shape), np.dtype(np.bool_)
+    return tuple(shape), np.dtype(np.float64 if isinstance(node, float) else np.int64)
+
+
+def _load_binary_matrix(data: Union[bytes, bytearray, RawMatrixBuffer], format: str) -> np.ndarray:
+    """Valida la cabecera binaria y construye la matriz sobre el búfer recibido."""
+    try:
+        if format == "raw":
+            validate_matrix_layout(data.shape, data.dtype)
+            return load_raw_buffer(data)
+        shape, dtype, _, _ = read_npy_header(data)
+        validate_matrix_layout(shape, dtype)
+        return load_npy_buffer(data)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Error al cargar la matriz: {str(e)}")
+
+
+async def validate_matrix_data(
+    data: Union[Dict[str, Any], bytes, str, np.ndarray, RawMatrixBuffer, BinaryIO],
+    format: str
+) -> MatrixEnvelope:
+    """
+    Valida los datos de la matriz y construye su envoltorio tipado.
+    
+    La entrada se parsea una única vez: forma, tipo y tamaño se comprueban
+    antes de convertir píxeles (con la cabecera .npy, las cabeceras del búfer
+    crudo o las longitudes de la lista anidada) y la matriz resultante viaja
+    en el envoltorio hasta el servicio.
     
     Args:
         data: Datos de la matriz a validar
-        format: Formato de los datos ('json' o 'numpy')
+        format: Formato de los datos ('json', 'numpy' o 'raw')
+        
+    Returns:
+        MatrixEnvelope con la matriz validada
         
     Raises:
         HTTPException: Si los datos no son válidos
+        PoolSaturatedError: Si el parseo no puede encolarse en el motor de ejecución
     """
+    format = format.lower()
+    
+    # Una matriz ya parseada (p. ej. desde el cuerpo en streaming)
+    if isinstance(data, np.ndarray):
+        validate_matrix_layout(data.shape, data.dtype)
+        return MatrixEnvelope(data, format)
+    
     # Verificar que hay datos
     if not data:
         raise HTTPException(
@@ -28,35 +140,43 @@ async def validate_matrix_data(data: Union[Dict[str, Any], bytes], format: str):
         )
     
     # Verificar formato
-    if format.lower() not in settings.ALLOWED_FORMATS:
+    if format not in settings.ALLOWED_FORMATS:
         raise HTTPException(
             status_code=400,
             detail=f"Formato no compatible. Formatos permitidos: {', '.join(settings.ALLOWED_FORMATS)}"
         )
     
     # Validación específica para formato JSON
-    if format.lower() == "json":
+    if format == "json":
+        engine = get_execution_engine()
         try:
             # Si es un diccionario ya parseado
             if isinstance(data, dict):
-                if "matrix" not in data:
+                matrix_data = data.get("matrix")
+                if not isinstance(matrix_data, list) or not matrix_data:
                     raise HTTPException(
                         status_code=400,
                         detail="El objeto JSON debe contener la clave 'matrix'"
                     )
-            # Si son bytes o string
+                validate_matrix_layout(*_nested_list_layout(matrix_data))
+                matrix = await engine.run(np.array, matrix_data)
+            # Si son bytes o string: parseo incremental fuera del event loop
+            elif isinstance(data, (str, bytes, bytearray)):
+                matrix = await engine.run(parse_matrix_json, data)
             else:
-                # Intentar parsear JSON
-                json_data = json.loads(data) if isinstance(data, str) or isinstance(data, bytes) else None
-                if not json_data or "matrix" not in json_data:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="El objeto JSON debe contener la clave 'matrix'"
-                    )
-        except json.JSONDecodeError:
-            raise HTTPException(
-                status_code=400,
-                detail="JSON inválido"
-            )
+                raise HTTPException(status_code=400, detail="JSON inválido")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        validate_matrix_layout(matrix.shape, matrix.dtype)
+        return MatrixEnvelope(matrix, format)
     
-    # Para numpy, la validación se hará durante el procesamiento debido a su naturaleza binaria
+    # Formatos binarios: solo se lee la cabecera antes de envolver el búfer
+    if hasattr(data, "read"):
+        data = data.read()
+    if format == "raw" and not isinstance(data, RawMatrixBuffer):
+        raise HTTPException(
+            status_code=400,
+            detail="El formato 'raw' requiere un búfer con dtype y forma"
+        )
+    return MatrixEnvelope(_load_binary_matrix(data, format), format)
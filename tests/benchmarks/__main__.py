@@ -0,0 +1,59 @@
+"""
+Ejecuta los casos de rendimiento y los compara con la línea base.
+
+    python -m tests.benchmarks                  # todos los casos
+    python -m tests.benchmarks convert/ parse/  # casos cuyo nombre empieza así
+    python -m tests.benchmarks --save           # guarda los resultados como línea base
+    python -m tests.benchmarks --encoders       # latencia y tamaño por formato, perfil y backend
+
+Sale con código 1 si algún caso empeora más de BENCHMARK_TOLERANCE respecto a
+la línea base (BENCHMARK_BASELINE).
+"""
+import argparse
+import sys
+
+from tests.benchmarks.cases import CASES, BenchmarkContext, benchmark_encoders, format_encoder_table, sample_pixels
+from tests.benchmarks.harness import BASELINE_PATH, format_table, load_baseline, measure, regressions, save_baseline
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Casos de rendimiento de la conversión de matrices")
+    parser.add_argument("prefixes", nargs="*", help="Prefijos de los casos a ejecutar (por defecto, todos)")
+    parser.add_argument("--save", action="store_true", help="Guardar los resultados como línea base")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Archivo JSON de la línea base")
+    parser.add_argument("--encoders", action="store_true", help="Comparar latencia y tamaño de los codificadores")
+    parser.add_argument("--size", type=int, default=2048, help="Lado de la imagen de prueba de --encoders")
+    args = parser.parse_args()
+
+    if args.encoders:
+        print(format_encoder_table(benchmark_encoders(sample_pixels(args.size, 3))))
+        return 0
+
+    selected = [case for name, case in CASES.items() if not args.prefixes or name.startswith(tuple(args.prefixes))]
+    baseline = load_baseline(args.baseline)
+    context = BenchmarkContext()
+    results = []
+    try:
+        for case in selected:
+            operation, nbytes = case.setup(context)
+            results.append(measure(case.name, operation, iterations=case.iterations, nbytes=nbytes))
+            print(f"  {case.name}: p50 {results[-1].p50_ms} ms", file=sys.stderr)
+    finally:
+        context.close()
+
+    print(format_table(results, baseline))
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f"\nLínea base guardada en {args.baseline}")
+        return 0
+
+    failed = False
+    for result in results:
+        for problem in regressions(result, baseline.get(result.name)):
+            failed = True
+            print(f"REGRESIÓN {result.name}: {problem}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
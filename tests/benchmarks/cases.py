@@ -0,0 +1,326 @@
+"""
+Casos de rendimiento de los caminos críticos de la conversión.
+
+Cada caso prepara sus datos (fuera de la medición) y devuelve la operación
+que se mide y los bytes de entrada que procesa. Los datos son deterministas
+(semilla fija) para que las líneas base sean reproducibles.
+"""
+import atexit
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from src.config.settings import get_settings
+from src.services.animation import AnimationService
+from src.services.binary_matrix import RawMatrixBuffer
+from src.services.conversion_options import ENCODER_PROFILES, ConversionOptions
+from src.services.encoders import canonical_format, encode_pixels, resolve_encoder
+from src.services.matrix_service import MatrixService
+
+Operation = Tuple[Callable[[], Any], Optional[int]]
+
+_HEADERS = {get_settings().API_KEY_HEADER: get_settings().DEFAULT_API_KEY}
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Arranque y parada de la aplicación en un intérprete nuevo (lo que paga cada worker)
+_STARTUP_SCRIPT = """
+import asyncio
+from src.api.app import app
+
+async def main():
+    async with app.router.lifespan_context(app):
+        pass
+
+asyncio.run(main())
+"""
+
+
+class BenchmarkContext:
+    """Recursos compartidos entre casos: la aplicación en proceso, con su ciclo de vida arrancado."""
+
+    def __init__(self):
+        self._client: Optional[TestClient] = None
+
+    @property
+    def client(self) -> TestClient:
+        if self._client is None:
+            from src.api.app import app
+
+            self._client = TestClient(app)
+            self._client.__enter__()
+        return self._client
+
+    def run_async(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Ejecuta una corrutina en el bucle de la aplicación (donde está arrancado el motor de ejecución)."""
+        return self.client.portal.call(func, *args)
+
+    @contextmanager
+    def without_cache(self) -> Iterator[None]:
+        """Desactiva la caché de resultados para medir conversiones completas."""
+        settings = get_settings()
+        enabled = settings.RESULT_CACHE_ENABLED
+        settings.RESULT_CACHE_ENABLED = False
+        try:
+            yield
+        finally:
+            settings.RESULT_CACHE_ENABLED = enabled
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.__exit__(None, None, None)
+            self._client = None
+
+
+@dataclass(frozen=True)
+class Case:
+    name: str
+    setup: Callable[[BenchmarkContext], Operation]
+    iterations: int = 20
+
+
+def sample_matrix(shape: Tuple[int, ...], dtype: str) -> np.ndarray:
+    """Matriz de prueba: gradiente con ruido en el intervalo típico de cada tipo."""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0.0, 1.0, shape[1])[None, :]
+    values = np.clip(gradient + rng.normal(0.0, 0.05, shape[:2]), 0.0, 1.0)
+    if len(shape) == 3:
+        values = np.repeat(values[:, :, None], shape[2], axis=2)
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return (values * 1000.0 - 500.0).astype(dtype)
+    return (values * np.iinfo(dtype).max).astype(dtype)
+
+
+def sample_pixels(size: int, channels: int) -> np.ndarray:
+    """Imagen de prueba con gradientes suaves y ruido, más realista que el ruido puro."""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+    base = (np.sin(x / 50) + np.cos(y / 37)) * 60 + 128 + rng.normal(0, 8, (size, size))
+    gray = np.clip(base, 0, 255).astype(np.uint8)
+    if channels == 1:
+        return gray
+    return np.dstack([gray, np.roll(gray, size // 20, axis=1), 255 - gray][:channels])
+
+
+def benchmark_encoders(
+    pixels: np.ndarray,
+    formats: Tuple[str, ...] = ("png", "jpeg", "webp", "avif", "tiff"),
+    repeat: int = 3
+) -> List[Dict[str, Any]]:
+    """
+    Mide la latencia (mejor de ``repeat``) y el tamaño de cada formato, perfil y backend.
+
+    Returns:
+        Una fila por combinación con 'format', 'profile', 'backend', 'ms' y 'bytes'
+    """
+    results = []
+    for output_format in formats:
+        output_format = canonical_format(output_format)
+        for profile in ENCODER_PROFILES:
+            for backend in ("pillow", "opencv"):
+                options = ConversionOptions(profile=profile, encoder=backend)
+                try:
+                    resolve_encoder(output_format, options)
+                except ValueError:
+                    continue
+                best: Optional[float] = None
+                for _ in range(repeat):
+                    buffer = io.BytesIO()
+                    start = time.perf_counter()
+                    encode_pixels(pixels, output_format, buffer, options)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                results.append({
+                    "format": output_format,
+                    "profile": profile,
+                    "backend": backend,
+                    "ms": round(best * 1000, 1),
+                    "bytes": buffer.tell(),
+                })
+    return results
+
+
+def format_encoder_table(rows: List[Dict[str, Any]]) -> str:
+    """Tabla de ``benchmark_encoders``."""
+    lines = [f"{'formato':<8}{'perfil':<10}{'backend':<9}{'ms':>10}{'bytes':>12}"]
+    for row in rows:
+        lines.append(f"{row['format']:<8}{row['profile']:<10}{row['backend']:<9}{row['ms']:>10}{row['bytes']:>12}")
+    return "\n".join(lines)
+
+
+def _npy_bytes(matrix: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, matrix)
+    return buffer.getvalue()
+
+
+def _png_bytes(matrix: np.ndarray) -> bytes:
+    return MatrixService._convert_matrix_to_image_bytes(matrix, "png")
+
+
+def _label(shape: Tuple[int, ...], dtype: str) -> str:
+    return f"{'x'.join(map(str, shape))}-{dtype}"
+
+
+def _parse_case(input_format: str, shape: Tuple[int, ...], dtype: str) -> Case:
+    def setup(context: BenchmarkContext) -> Operation:
+        matrix = sample_matrix(shape, dtype)
+        if input_format == "json":
+            data: Any = json.dumps({"matrix": matrix.tolist()}).encode()
+        elif input_format == "numpy":
+            data = _npy_bytes(matrix)
+        else:
+            data = RawMatrixBuffer(matrix.tobytes(), matrix.dtype.str, matrix.shape)
+        size = len(data) if isinstance(data, bytes) else matrix.nbytes
+        return (lambda: MatrixService._parse_matrix_input(data, input_format)), size
+
+    return Case(f"parse/{input_format}-{_label(shape, dtype)}", setup, iterations=10 if input_format == "json" else 50)
+
+
+def _convert_case(shape: Tuple[int, ...], dtype: str, output_format: str) -> Case:
+    def setup(context: BenchmarkContext) -> Operation:
+        matrix = sample_matrix(shape, dtype)
+        return (lambda: MatrixService._convert_matrix_to_image_bytes(matrix, output_format)), matrix.nbytes
+
+    iterations = 20 if np.prod(shape) <= 2048 * 2048 else 5
+    return Case(f"convert/{_label(shape, dtype)}-{output_format}", setup, iterations=iterations)
+
+
+def _encoder_case(output_format: str, backend: str, profile: str = "balanced") -> Case:
+    def setup(context: BenchmarkContext) -> Operation:
+        pixels = sample_pixels(2048, 3)
+        options = ConversionOptions(profile=profile, encoder=backend)
+        return (lambda: encode_pixels(pixels, output_format, io.BytesIO(), options)), pixels.nbytes
+
+    return Case(f"encoders/{output_format}-{profile}-{backend}", setup, iterations=10)
+
+
+def _comparison_case(mode: str, shape: Tuple[int, ...]) -> Case:
+    def setup(context: BenchmarkContext) -> Operation:
+        original = sample_matrix(shape, "uint8")
+        reconstructed = np.clip(original.astype(np.int16) + 3, 0, 255).astype(np.uint8)
+        original_png, reconstructed_png = _png_bytes(original), _png_bytes(reconstructed)
+        return (
+            lambda: context.run_async(
+                MatrixService.generate_comparison_image, original_png, reconstructed_png, None, mode
+            ),
+            len(original_png) + len(reconstructed_png),
+        )
+
+    return Case(f"compare/{mode}-{_label(shape, 'uint8')}", setup, iterations=5 if mode == "figure" else 20)
+
+
+def _endpoint_case(
+    input_format: str,
+    shape: Tuple[int, ...],
+    dtype: str,
+    cached: bool = False,
+    stream: Optional[bool] = None
+) -> Case:
+    def setup(context: BenchmarkContext) -> Operation:
+        matrix = sample_matrix(shape, dtype)
+        if input_format == "json":
+            body = json.dumps({"matrix": matrix.tolist()}).encode()
+            headers = {**_HEADERS, "Content-Type": "application/json"}
+        else:
+            body = _npy_bytes(matrix)
+            headers = {**_HEADERS, "Content-Type": "application/x-npy"}
+
+        url = "/api/v1/convert" if stream is None else f"/api/v1/convert?stream={str(stream).lower()}"
+
+        def convert() -> None:
+            response = context.client.post(url, content=body, headers=headers)
+            response.raise_for_status()
+
+        if cached:
+            return convert, len(body)
+
+        def convert_uncached() -> None:
+            with context.without_cache():
+                convert()
+
+        return convert_uncached, len(body)
+
+    suffix = "-cache" if cached else ""
+    if stream is not None:
+        suffix += "-stream" if stream else "-buffered"
+    return Case(f"endpoint/{input_format}-{_label(shape, dtype)}{suffix}", setup)
+
+
+def _animation_case(frames: int, shape: Tuple[int, ...], dtype: str, output_format: str) -> Case:
+    def setup(context: BenchmarkContext) -> Operation:
+        frame = sample_matrix(shape, dtype)
+        stack = np.stack([np.roll(frame, index, axis=1) for index in range(frames)])
+        directory = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree, directory, True)
+        path, output_path = os.path.join(directory, "stack.npy"), os.path.join(directory, f"animation.{output_format}")
+        np.save(path, stack)
+        return (lambda: AnimationService.encode_to_path(path, output_format, output_path)), stack.nbytes
+
+    return Case(f"animation/{frames}x{_label(shape, dtype)}-{output_format}", setup, iterations=5)
+
+
+def _startup_case(warmup: bool) -> Case:
+    def setup(context: BenchmarkContext) -> Operation:
+        env = {**os.environ, "WARMUP_ON_STARTUP": str(warmup)}
+
+        def start() -> None:
+            subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT], cwd=_ROOT, env=env, check=True)
+
+        # La memoria pico medida es la del proceso que lanza, no la del arrancado
+        return start, None
+
+    return Case(f"startup/app{'-warmup' if warmup else ''}", setup, iterations=5)
+
+
+CASES: Dict[str, Case] = {
+    case.name: case
+    for case in [
+        _parse_case("json", (256, 256), "uint8"),
+        _parse_case("json", (256, 256), "float32"),
+        _parse_case("numpy", (256, 256), "uint8"),
+        _parse_case("numpy", (2048, 2048), "float32"),
+        _parse_case("raw", (2048, 2048), "float32"),
+        _convert_case((512, 512), "uint8", "png"),
+        _convert_case((2048, 2048), "uint8", "png"),
+        _convert_case((2048, 2048), "uint16", "png"),
+        _convert_case((2048, 2048), "float32", "png"),
+        _convert_case((2048, 2048, 3), "uint8", "png"),
+        _convert_case((2048, 2048, 3), "uint8", "jpeg"),
+        _convert_case((2048, 2048, 3), "uint8", "webp"),
+        _convert_case((2048, 2048, 4), "uint8", "tiff"),
+        _encoder_case("png", "pillow"),
+        _encoder_case("png", "opencv"),
+        _encoder_case("jpeg", "pillow"),
+        _encoder_case("jpeg", "opencv"),
+        _encoder_case("webp", "pillow"),
+        _encoder_case("webp", "opencv"),
+        _encoder_case("tiff", "pillow"),
+        _encoder_case("tiff", "opencv"),
+        _comparison_case("fast", (1024, 1024)),
+        _comparison_case("figure", (1024, 1024)),
+        _endpoint_case("json", (256, 256), "uint8"),
+        _endpoint_case("numpy", (1024, 1024), "uint8"),
+        _endpoint_case("numpy", (1024, 1024), "float32"),
+        _endpoint_case("numpy", (1024, 1024), "float32", cached=True),
+        # Respuesta por fragmentos (Pillow) frente a completa (OpenCV con encoder=auto)
+        _endpoint_case("numpy", (2048, 2048, 3), "uint8", stream=True),
+        _endpoint_case("numpy", (2048, 2048, 3), "uint8", stream=False),
+        _animation_case(32, (512, 512), "float32", "gif"),
+        _animation_case(32, (512, 512), "float32", "apng"),
+        _animation_case(32, (512, 512, 3), "uint8", "gif"),
+        _startup_case(warmup=False),
+        _startup_case(warmup=True),
+    ]
+}
@@ -0,0 +1,153 @@
+"""
+Medición de los casos de rendimiento y comparación con la línea base.
+
+Cada caso se ejecuta unas veces de calentamiento y después ``iterations``
+veces midiendo la latencia; la memoria pico se mide en una ejecución aparte
+con ``tracemalloc`` (que ralentiza las reservas y falsearía las latencias).
+tracemalloc ve las reservas de Python y de NumPy, no las internas de Pillow
+u OpenCV.
+"""
+import json
+import os
+import platform
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+BASELINE_PATH = os.environ.get(
+    "BENCHMARK_BASELINE", os.path.join(os.path.dirname(__file__), "baselines", "baseline.json")
+)
+# Margen admitido sobre la línea base antes de considerar que hay una regresión
+TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", "0.25"))
+# Por debajo de estos valores las diferencias son ruido de medición
+_MIN_LATENCY_MS = 1.0
+_MIN_MEMORY_MB = 1.0
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    iterations: int
+    p50_ms: float
+    p99_ms: float
+    mean_ms: float
+    ops_per_s: float
+    mb_per_s: Optional[float]
+    peak_memory_mb: float
+
+
+def measure(
+    name: str,
+    func: Callable[[], Any],
+    iterations: int = 20,
+    warmup: int = 2,
+    nbytes: Optional[int] = None
+) -> BenchmarkResult:
+    """
+    Mide un caso.
+
+    Args:
+        name: Nombre del caso
+        func: Función sin argumentos que ejecuta una operación
+        iterations: Ejecuciones medidas
+        warmup: Ejecuciones previas sin medir
+        nbytes: Bytes de entrada de cada operación, para el caudal en MB/s
+
+    Returns:
+        Latencias p50/p99 y media, operaciones y MB por segundo y memoria pico
+    """
+    for _ in range(warmup):
+        func()
+
+    latencies = np.empty(iterations)
+    for index in range(iterations):
+        start = time.perf_counter()
+        func()
+        latencies[index] = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    mean = float(latencies.mean())
+    return BenchmarkResult(
+        name=name,
+        iterations=iterations,
+        p50_ms=round(float(np.percentile(latencies, 50)) * 1000, 3),
+        p99_ms=round(float(np.percentile(latencies, 99)) * 1000, 3),
+        mean_ms=round(mean * 1000, 3),
+        ops_per_s=round(1.0 / mean, 2),
+        mb_per_s=round(nbytes / mean / 1e6, 2) if nbytes else None,
+        peak_memory_mb=round(peak / 1e6, 3),
+    )
+
+
+def environment() -> Dict[str, Any]:
+    """Datos de la máquina: las líneas base solo son comparables en el mismo entorno."""
+    import cv2
+    import PIL
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Dict[str, Dict[str, Any]]:
+    """Resultados de la línea base por nombre de caso (vacío si no existe)."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def save_baseline(results: List[BenchmarkResult], path: str = BASELINE_PATH) -> None:
+    """Guarda los resultados como línea base, conservando los casos no medidos esta vez."""
+    merged = load_baseline(path)
+    merged.update({result.name: asdict(result) for result in results})
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": merged}, f, indent=2, sort_keys=True)
+
+
+def regressions(result: BenchmarkResult, baseline: Optional[Dict[str, Any]], tolerance: float = TOLERANCE) -> List[str]:
+    """
+    Compara un resultado con su línea base.
+
+    Returns:
+        Descripción de cada métrica que empeora más de ``tolerance`` (vacía si no hay línea base)
+    """
+    if baseline is None:
+        return []
+    problems = []
+    for metric, floor in (("p50_ms", _MIN_LATENCY_MS), ("peak_memory_mb", _MIN_MEMORY_MB)):
+        limit = max(baseline[metric], floor) * (1 + tolerance)
+        if getattr(result, metric) > limit:
+            problems.append(f"{metric}: {getattr(result, metric)} > {limit:.3f} (línea base {baseline[metric]})")
+    return problems
+
+
+def format_table(results: List[BenchmarkResult], baseline: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    """Tabla de resultados, con la variación del p50 respecto a la línea base si la hay."""
+    baseline = baseline or {}
+    lines = [
+        f"{'caso':<44}{'p50 ms':>10}{'p99 ms':>10}{'op/s':>12}{'MB/s':>12}{'pico MB':>10}{'vs base':>9}"
+    ]
+    for result in results:
+        reference = baseline.get(result.name)
+        change = f"{(result.p50_ms / reference['p50_ms'] - 1) * 100:+.0f}%" if reference and reference["p50_ms"] else "-"
+        lines.append(
+            f"{result.name:<44}{result.p50_ms:>10}{result.p99_ms:>10}{result.ops_per_s:>12}"
+            f"{result.mb_per_s if result.mb_per_s is not None else '-':>12}{result.peak_memory_mb:>10}{change:>9}"
+        )
+    return "\n".join(lines)
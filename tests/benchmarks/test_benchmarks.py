@@ -0,0 +1,38 @@
+"""
+Casos de rendimiento como pruebas de pytest.
+
+Solo se ejecutan con ``RUN_BENCHMARKS=1``; cada caso falla si empeora más de
+BENCHMARK_TOLERANCE respecto a la línea base guardada con
+``python -m tests.benchmarks --save`` (sin línea base solo se mide).
+"""
+import os
+
+import pytest
+
+from tests.benchmarks.cases import CASES, BenchmarkContext
+from tests.benchmarks.harness import load_baseline, measure, regressions
+
+pytestmark = pytest.mark.skipif(
+    os.environ.get("RUN_BENCHMARKS") != "1", reason="Casos de rendimiento: ejecutar con RUN_BENCHMARKS=1"
+)
+
+
+@pytest.fixture(scope="module")
+def context():
+    context = BenchmarkContext()
+    yield context
+    context.close()
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    return load_baseline()
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_benchmark(name, context, baseline):
+    case = CASES[name]
+    operation, nbytes = case.setup(context)
+    result = measure(name, operation, iterations=case.iterations, nbytes=nbytes)
+    print(f"\n{name}: p50 {result.p50_ms} ms, p99 {result.p99_ms} ms, pico {result.peak_memory_mb} MB")
+    assert not regressions(result, baseline.get(name)), regressions(result, baseline.get(name))
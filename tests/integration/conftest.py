@@ -0,0 +1,29 @@
+"""
+Cliente y utilidades comunes de las pruebas de integración.
+"""
+import io
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from src.config.settings import get_settings
+
+API_HEADERS = {get_settings().API_KEY_HEADER: get_settings().DEFAULT_API_KEY}
+NPY_HEADERS = {**API_HEADERS, "Content-Type": "application/x-npy"}
+JSON_HEADERS = {**API_HEADERS, "Content-Type": "application/json"}
+
+
+def npy_bytes(matrix: np.ndarray) -> bytes:
+    """Serializa la matriz en formato ``.npy``."""
+    buffer = io.BytesIO()
+    np.save(buffer, matrix)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client():
+    from src.api.app import app
+
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,51 @@
+"""
+Pruebas de integración de las animaciones a partir de pilas de fotogramas (/api/v1/convert/animation).
+"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from tests.integration.conftest import NPY_HEADERS, npy_bytes
+
+
+def _frames(content: bytes):
+    image = Image.open(io.BytesIO(content))
+    return image, [np.asarray(frame.convert("RGB")) for frame in ImageSequence.Iterator(image)]
+
+
+@pytest.mark.parametrize("output_format", ["gif", "apng"])
+def test_grayscale_stack_is_lossless(client, output_format):
+    stack = np.arange(6 * 24 * 32, dtype=np.uint16).reshape(6, 24, 32)
+    response = client.post(
+        f"/api/v1/convert/animation?output_format={output_format}&fps=20&normalize=minmax",
+        content=npy_bytes(stack),
+        headers=NPY_HEADERS,
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == f"image/{output_format}"
+
+    image, frames = _frames(response.content)
+    assert len(frames) == 6
+    assert image.info["duration"] == 50
+    # Un único intervalo de normalización para toda la pila
+    low, high = stack.min(), stack.max()
+    expected = np.round((stack - low) * (255.0 / (high - low))).astype(np.uint8)
+    for frame, pixels in zip(frames, expected):
+        np.testing.assert_array_equal(frame[:, :, 0], pixels)
+
+
+def test_rgb_gif_uses_one_palette(client):
+    colors = np.array([[255, 0, 0], [0, 128, 255], [20, 200, 20], [255, 255, 255]], dtype=np.uint8)
+    stack = colors[np.random.default_rng(0).integers(0, 4, (5, 16, 16))]
+    response = client.post("/api/v1/convert/animation?output_format=gif", content=npy_bytes(stack), headers=NPY_HEADERS)
+    image, frames = _frames(response.content)
+    assert len(frames) == 5
+    for frame, pixels in zip(frames, stack):
+        np.testing.assert_array_equal(frame, pixels)
+
+
+def test_rejects_single_image(client):
+    response = client.post("/api/v1/convert/animation", content=npy_bytes(np.zeros((4, 4))), headers=NPY_HEADERS)
+    assert response.status_code == 400
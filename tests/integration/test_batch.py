@@ -0,0 +1,226 @@
+"""
+Pruebas de integración de la conversión por lotes (/api/v1/convert/batch).
+"""
+import asyncio
+import io
+import json
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from starlette.datastructures import UploadFile
+
+from src.config.settings import get_settings
+from src.services import batch_service, execution_engine
+from src.services.execution_engine import ExecutionEngine, PoolSaturatedError
+from tests.integration.conftest import API_HEADERS, JSON_HEADERS, NPY_HEADERS, npy_bytes
+
+_STACK = np.arange(4 * 16 * 16, dtype=np.uint16).reshape(4, 16, 16)
+
+
+def test_zip_matches_convert(client):
+    response = client.post("/api/v1/convert/batch?response_format=zip", content=npy_bytes(_STACK), headers=NPY_HEADERS)
+    assert response.status_code == 200
+    assert response.headers["X-Batch-Size"] == "4"
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+        manifest = json.loads(archive.read("manifest.json"))
+        assert (manifest["succeeded"], manifest["failed"]) == (4, 0)
+        for entry, matrix in zip(manifest["items"], _STACK):
+            expected = client.post("/api/v1/convert", content=npy_bytes(matrix), headers=NPY_HEADERS).content
+            assert archive.read(entry["filename"]) == expected
+
+
+def test_item_errors_do_not_fail_the_batch(client):
+    body = json.dumps({"matrices": [{"id": "ok", "matrix": [[1, 2], [3, 4]]}, {"id": "bad", "matrix": [[1], [2, 3]]}]})
+    response = client.post(
+        "/api/v1/convert/batch?response_format=ndjson",
+        content=body,
+        headers=JSON_HEADERS,
+    )
+    assert response.status_code == 200
+    lines = {line["id"]: line for line in map(json.loads, response.text.splitlines())}
+    assert lines["ok"]["status"] == "ok" and lines["ok"]["content_type"] == "image/png"
+    assert lines["bad"]["status"] == "error"
+
+
+def _multipart(items) -> tuple:
+    body = b"".join(
+        (
+            f'--lote\r\nContent-Disposition: form-data; name="file"; filename="{name}.npy"\r\n'
+            "Content-Type: application/x-npy\r\n\r\n"
+        ).encode() + npy_bytes(matrix) + b"\r\n"
+        for name, matrix in items
+    ) + b"--lote--\r\n"
+    return body, {**API_HEADERS, "Content-Type": "multipart/form-data; boundary=lote"}
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_multipart_upload(client, chunked):
+    body, headers = _multipart([("a", _STACK[0]), ("b", _STACK[1])])
+    response = client.post(
+        "/api/v1/convert/batch?response_format=ndjson",
+        content=iter([body]) if chunked else body,
+        headers=headers,
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted((line["id"], line["status"]) for line in lines) == [("a", "ok"), ("b", "ok")]
+
+
+def test_chunked_multipart_respects_size_limit(client, monkeypatch):
+    monkeypatch.setattr(get_settings(), "MAX_MATRIX_SIZE", 1024)
+    body, headers = _multipart([("a", _STACK[0]), ("b", _STACK[1])])
+    # Sin Content-Length: el límite se aplica mientras se recibe el cuerpo
+    response = client.post("/api/v1/convert/batch", content=iter([body[:700], body[700:]]), headers=headers)
+    assert response.status_code == 413
+
+
+def test_form_files_are_closed_on_error(client, monkeypatch):
+    closed = []
+    original = UploadFile.close
+
+    async def close(self):
+        closed.append(self.filename)
+        await original(self)
+
+    async def broken(self, size=-1):
+        raise ValueError("archivo ilegible")
+
+    monkeypatch.setattr(UploadFile, "close", close)
+    monkeypatch.setattr(UploadFile, "read", broken)
+    body, headers = _multipart([("a", _STACK[0]), ("b", _STACK[1])])
+    response = client.post("/api/v1/convert/batch", content=body, headers=headers)
+    assert response.status_code == 400
+    assert sorted(closed) == ["a.npy", "b.npy"]
+
+
+def test_multipart_parts(client):
+    response = client.post(
+        "/api/v1/convert/batch?response_format=multipart&output_format=jpeg",
+        content=npy_bytes(_STACK.astype(np.uint8)),
+        headers=NPY_HEADERS,
+    )
+    boundary = response.headers["content-type"].split("boundary=")[1]
+    parts = response.content.split(f"--{boundary}".encode())[1:-1]
+    assert len(parts) == 4
+    assert all(b"X-Item-Status: ok" in part and b"Content-Type: image/jpeg" in part for part in parts)
+
+
+def test_alpha_items_are_rejected_in_jpeg(client):
+    response = client.post(
+        "/api/v1/convert/batch?response_format=ndjson&output_format=jpeg",
+        content=npy_bytes(np.zeros((2, 8, 8, 4), dtype=np.uint8)),
+        headers=NPY_HEADERS,
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["status"] for line in lines] == ["error", "error"]
+    assert all("alfa" in line["error"] for line in lines)
+
+
+@pytest.mark.parametrize("body", [b"[]", npy_bytes(np.zeros((4, 4), dtype=np.uint8))])
+def test_rejects_empty_or_unstacked_batch(client, body):
+    content_type = "application/x-npy" if body.startswith(b"\x93NUMPY") else "application/json"
+    response = client.post("/api/v1/convert/batch", content=body, headers={**API_HEADERS, "Content-Type": content_type})
+    assert response.status_code == 400
+
+
+def test_batch_tasks_count_towards_capacity():
+    async def scenario():
+        engine = ExecutionEngine(workers=2, queue_size=1)
+        release = threading.Event()
+        peak = 0
+
+        async def collect(batch):
+            nonlocal peak
+            results = []
+            async for result in batch:
+                peak = max(peak, engine.in_flight)
+                results.append(result)
+            return results
+
+        batches = [
+            asyncio.ensure_future(collect(engine.map_unordered(release.wait, [()] * 5)))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0.05)
+        # Dos tareas del primer lote y una del segundo llenan el motor
+        assert engine.in_flight == engine.capacity
+        with pytest.raises(PoolSaturatedError):
+            await engine.run(sum, [1, 2])
+
+        release.set()
+        results = await asyncio.gather(*batches)
+        engine.shutdown()
+        return results, peak, engine.in_flight
+
+    results, peak, in_flight = asyncio.run(scenario())
+    assert [sorted(index for index, _, _ in batch) for batch in results] == [list(range(5))] * 2
+    assert all(error is None for batch in results for _, _, error in batch)
+    assert peak <= 3 and in_flight == 0
+
+
+def test_abandoned_batch_keeps_running_tasks_admitted():
+    async def scenario():
+        engine = ExecutionEngine(workers=2, queue_size=0)
+        release = threading.Event()
+        batch = engine.map_unordered(release.wait, [()] * 4)
+        first = asyncio.ensure_future(batch.__anext__())
+        await asyncio.sleep(0.05)
+        try:
+            # El cliente se desconecta: el lote se cierra con dos tareas aún en los hilos
+            first.cancel()
+            await asyncio.gather(first, return_exceptions=True)
+            await batch.aclose()
+            assert engine.in_flight == 2
+            with pytest.raises(PoolSaturatedError):
+                await engine.run(sum, [1, 2])
+        finally:
+            release.set()
+
+        for _ in range(100):
+            if engine.in_flight == 0:
+                break
+            await asyncio.sleep(0.01)
+        in_flight = engine.in_flight
+        engine.shutdown()
+        return in_flight
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_saturation_returns_503_while_batch_runs(monkeypatch):
+    from src.api.app import app
+
+    monkeypatch.setattr(get_settings(), "EXECUTION_WORKERS", 2)
+    monkeypatch.setattr(get_settings(), "EXECUTION_QUEUE_SIZE", 0)
+    monkeypatch.setattr(execution_engine, "_engine", None)
+    release = threading.Event()
+    started = threading.Semaphore(0)
+    render = batch_service._render_batch_item
+
+    def blocked_render(*args):
+        started.release()
+        release.wait(10)
+        return render(*args)
+
+    monkeypatch.setattr(batch_service, "_render_batch_item", blocked_render)
+    with TestClient(app) as client, ThreadPoolExecutor(max_workers=1) as pool:
+        batch = pool.submit(
+            client.post, "/api/v1/convert/batch?response_format=ndjson", content=npy_bytes(_STACK), headers=NPY_HEADERS
+        )
+        try:
+            assert started.acquire(timeout=5) and started.acquire(timeout=5)
+            response = client.post("/api/v1/convert", content=npy_bytes(_STACK[0]), headers=NPY_HEADERS)
+        finally:
+            release.set()
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+
+        lines = [json.loads(line) for line in batch.result(timeout=10).text.splitlines()]
+        assert sorted(line["index"] for line in lines) == [0, 1, 2, 3]
+        assert all(line["status"] == "ok" for line in lines)
@@ -0,0 +1,102 @@
+"""
+Pruebas de integración de la entrada binaria de /api/v1/convert (.npy y búfer crudo).
+"""
+import json
+
+import numpy as np
+import pytest
+
+from tests.integration.conftest import API_HEADERS, JSON_HEADERS, NPY_HEADERS, npy_bytes
+
+_MATRIX = np.arange(24 * 32, dtype=np.uint16).reshape(24, 32)
+
+
+def _raw_headers(dtype: str, shape: str) -> dict:
+    return {**API_HEADERS, "Content-Type": "application/octet-stream", "X-Matrix-Dtype": dtype, "X-Matrix-Shape": shape}
+
+
+@pytest.fixture
+def expected(client):
+    response = client.post(
+        "/api/v1/convert",
+        content=json.dumps({"matrix": _MATRIX.tolist()}),
+        headers=JSON_HEADERS,
+    )
+    assert response.status_code == 200
+    return response.content
+
+
+@pytest.mark.parametrize("content_type", ["application/x-npy", "application/octet-stream"])
+def test_npy_matches_json(client, expected, content_type):
+    response = client.post(
+        "/api/v1/convert", content=npy_bytes(_MATRIX), headers={**API_HEADERS, "Content-Type": content_type}
+    )
+    assert response.status_code == 200
+    assert response.content == expected
+
+
+def test_fortran_order_npy_matches_json(client, expected):
+    response = client.post(
+        "/api/v1/convert",
+        content=npy_bytes(np.asfortranarray(_MATRIX)),
+        headers=NPY_HEADERS,
+    )
+    assert response.content == expected
+
+
+@pytest.mark.parametrize("shape", ["24,32", "24x32"])
+def test_raw_buffer_matches_json(client, expected, shape):
+    response = client.post("/api/v1/convert", content=_MATRIX.tobytes(), headers=_raw_headers("uint16", shape))
+    assert response.status_code == 200
+    assert response.content == expected
+
+
+def test_raw_layout_in_query(client, expected):
+    response = client.post(
+        "/api/v1/convert?format=raw&dtype=uint16&shape=24,32",
+        content=_MATRIX.tobytes(),
+        headers={**API_HEADERS, "Content-Type": "application/octet-stream"},
+    )
+    assert response.content == expected
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        b"\x93NUMPY\x01\x00basura",  # Cabecera ilegible
+        npy_bytes(_MATRIX)[:-10],  # Datos truncados
+        npy_bytes(np.array([[{"a": 1}]], dtype=object)),  # Objetos serializados
+        npy_bytes(np.array(["ab", "cd"])),  # Cadenas
+        npy_bytes(np.zeros((2, 2, 5), dtype=np.uint8)),  # Canales no admitidos
+    ],
+    ids=["header", "truncated", "object", "string", "channels"],
+)
+def test_rejects_malformed_npy(client, body):
+    response = client.post("/api/v1/convert", content=body, headers=NPY_HEADERS)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "dtype, shape",
+    [
+        ("uint16", "24,31"),  # El tamaño no coincide con la forma
+        ("float32", "24,32"),  # Ni con el tipo
+        ("object", "24,32"),
+        ("notatype", "24,32"),
+        ("uint16", "24,a"),
+        ("uint16", "0,32"),
+    ],
+)
+def test_rejects_raw_layout_mismatch(client, dtype, shape):
+    response = client.post("/api/v1/convert", content=_MATRIX.tobytes(), headers=_raw_headers(dtype, shape))
+    assert response.status_code == 400
+
+
+def test_raw_requires_layout_headers(client):
+    response = client.post(
+        "/api/v1/convert",
+        content=_MATRIX.tobytes(),
+        headers={**API_HEADERS, "Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == 400
+    assert "X-Matrix-Dtype" in response.json()["detail"]
@@ -0,0 +1,84 @@
+"""
+Pruebas de integración de los mapas de color para matrices de un canal.
+"""
+import io
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from src.services import colormaps
+from src.services.colormaps import colorize, get_colormap_lut
+from tests.integration.conftest import NPY_HEADERS, npy_bytes
+
+_RAMP = np.tile(np.arange(256, dtype=np.uint8), (4, 1))
+
+
+def _convert(client: TestClient, matrix: np.ndarray, query: str):
+    return client.post(f"/api/v1/convert?{query}", content=npy_bytes(matrix), headers=NPY_HEADERS)
+
+
+@pytest.mark.parametrize("name", ["viridis", "jet", "magma"])
+def test_named_colormap_matches_opencv(client, name):
+    response = _convert(client, _RAMP, f"colormap={name}")
+    assert response.status_code == 200
+
+    pixels = np.asarray(Image.open(io.BytesIO(response.content)))
+    expected = cv2.applyColorMap(_RAMP, getattr(cv2, f"COLORMAP_{name.upper()}"))[:, :, ::-1]
+    np.testing.assert_array_equal(pixels, expected)
+
+
+def test_custom_colormap(client):
+    response = _convert(client, _RAMP, "colormap=custom:%23000000,%23ff0000")
+    pixels = np.asarray(Image.open(io.BytesIO(response.content)))
+    assert pixels[0, 0].tolist() == [0, 0, 0]
+    assert pixels[0, 255].tolist() == [255, 0, 0]
+    assert pixels[0, 128, 0] == 128
+    assert not pixels[:, :, 1:].any()
+
+
+def test_custom_colormap_with_positions():
+    lut = get_colormap_lut("custom:0:#000000,0.5:#ffffff,1:#ffffff")
+    assert lut[0].tolist() == [0, 0, 0]
+    assert lut[128:].min() == 255
+    assert not lut.flags.writeable
+
+
+@pytest.mark.parametrize("dtype", [np.uint16, np.int16, np.float32, np.float64])
+def test_wide_types_follow_the_same_map(dtype):
+    # Tabla combinada (enteros) y normalización a 16 bits (flotantes) dan los mismos colores
+    matrix = np.linspace(0, 1000, 2000).astype(dtype).reshape(40, 50)
+    value_range = (0.0, 1000.0)
+    lut = get_colormap_lut("viridis", 65536)
+    positions = np.clip(matrix.astype(np.float64) * 65535 / 1000 + 0.5, 0, 65535).astype(np.uint16)
+    np.testing.assert_array_equal(colorize(matrix, value_range, "viridis"), lut[positions])
+
+
+def test_strips_match_single_pass(monkeypatch):
+    matrix = np.random.default_rng(3).normal(size=(30, 20))
+    whole = colorize(matrix, (-2.0, 2.0), "turbo")
+    monkeypatch.setattr(colormaps, "_STRIP_VALUES", 7)
+    np.testing.assert_array_equal(colorize(matrix, (-2.0, 2.0), "turbo"), whole)
+
+
+def test_single_channel_3d_matrix_is_accepted(client):
+    response = _convert(client, _RAMP[:, :, np.newaxis], "colormap=viridis")
+    assert response.status_code == 200
+    assert np.asarray(Image.open(io.BytesIO(response.content))).shape == (4, 256, 3)
+
+
+@pytest.mark.parametrize(
+    "matrix, query",
+    [
+        (_RAMP, "colormap=nope"),
+        (_RAMP, "colormap=custom:%23000000"),
+        (_RAMP, "colormap=custom:%23zzzzzz,%23ffffff"),
+        (_RAMP, "colormap=custom:0.2:%23000000,1:%23ffffff"),
+        (np.zeros((4, 4, 3), dtype=np.uint8), "colormap=viridis"),
+    ],
+    ids=["unknown", "one-color", "bad-color", "bad-positions", "rgb"],
+)
+def test_rejects_invalid_colormaps(client, matrix, query):
+    assert _convert(client, matrix, query).status_code == 400
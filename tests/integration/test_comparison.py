@@ -0,0 +1,101 @@
+"""
+Pruebas de integración de las comparaciones original/reconstruida (/api/v1/compare).
+"""
+import io
+import json
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from src.services.matrix_service import MatrixService
+from tests.integration.conftest import API_HEADERS
+
+_ORIGINAL = np.tile(np.arange(0, 256, 4, dtype=np.uint8), (48, 1))  # 48x64
+
+
+def _png(pixels: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _compare(client: TestClient, matrix: np.ndarray, mode: str):
+    return client.post(
+        "/api/v1/compare",
+        files={
+            "matrix": ("matrix.json", json.dumps({"matrix": matrix.tolist()}), "application/json"),
+            "original_image": ("original.png", _png(_ORIGINAL), "image/png"),
+        },
+        data={"format": "json", "mode": mode},
+        headers=API_HEADERS,
+    )
+
+
+def test_fast_comparison_panels(client):
+    reconstructed = _ORIGINAL.copy()
+    reconstructed[10:20, 10:20] = 0
+    response = _compare(client, reconstructed, "fast")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert "compare" in response.headers["Server-Timing"]
+
+    canvas = np.asarray(Image.open(io.BytesIO(response.content)).convert("RGB"))
+    height, width = _ORIGINAL.shape
+    gap = max(4, width // 50)
+    label_height = canvas.shape[0] - height
+    assert canvas.shape == (label_height + height, 3 * width + 2 * gap, 3)
+
+    panels = [canvas[label_height:, i * (width + gap):i * (width + gap) + width, 0] for i in range(3)]
+    np.testing.assert_array_equal(panels[0], _ORIGINAL)
+    np.testing.assert_array_equal(panels[1], reconstructed)
+    np.testing.assert_array_equal(panels[2], np.abs(_ORIGINAL.astype(int) - reconstructed).astype(np.uint8))
+
+
+def test_figure_comparison_renders_png(client):
+    pytest.importorskip("matplotlib")
+    response = _compare(client, _ORIGINAL, "figure")
+    assert response.status_code == 200
+    assert response.content.startswith(b"\x89PNG")
+
+
+def test_rejects_unknown_mode(client):
+    assert _compare(client, _ORIGINAL, "slow").status_code == 400
+
+
+def test_metrics_of_identical_images(client):
+    response = _compare(client, _ORIGINAL, "metrics")
+    assert response.status_code == 200
+    metrics = response.json()
+    assert metrics["identical"] is True
+    assert (metrics["mse"], metrics["psnr"], metrics["max_abs_error"]) == (0.0, None, 0)
+    assert metrics["ssim"] == pytest.approx(1.0)
+
+
+def test_metrics_of_known_difference(client):
+    reconstructed = _ORIGINAL.copy()
+    reconstructed[:10, :10] += 10
+    metrics = _compare(client, reconstructed, "metrics").json()
+
+    expected_mse = 100 * 10 ** 2 / _ORIGINAL.size
+    assert (metrics["width"], metrics["height"], metrics["channels"]) == (64, 48, 3)
+    assert metrics["identical"] is False
+    assert metrics["mse"] == pytest.approx(expected_mse)
+    assert metrics["psnr"] == pytest.approx(10 * np.log10(255 ** 2 / expected_mse))
+    assert metrics["max_abs_error"] == 10
+    assert metrics["per_channel"]["G"]["mae"] == pytest.approx(1000 / _ORIGINAL.size)
+    assert metrics["abs_diff_histogram"][10] == 300
+    assert sum(metrics["abs_diff_histogram"]) == _ORIGINAL.size * 3
+    assert 0 < metrics["ssim"] < 1
+
+
+def test_metrics_do_not_depend_on_tile_rows():
+    rng = np.random.default_rng(0)
+    original = rng.integers(0, 256, (100, 80, 3), dtype=np.uint8)
+    reconstructed = np.clip(original.astype(int) + rng.integers(-5, 6, original.shape), 0, 255).astype(np.uint8)
+    whole = MatrixService._compute_metrics(original, reconstructed, tile_rows=1000)
+    tiled = MatrixService._compute_metrics(original, reconstructed, tile_rows=7)
+    assert tiled["abs_diff_histogram"] == whole["abs_diff_histogram"]
+    for name in ("mse", "ssim", "mae"):
+        assert tiled[name] == pytest.approx(whole[name], rel=1e-6)
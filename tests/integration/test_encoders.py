@@ -0,0 +1,133 @@
+"""
+Pruebas de integración de los perfiles de codificación y la elección de backend.
+"""
+import io
+import warnings
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from src.services.conversion_options import ConversionOptions
+from src.services.encoders import encode_pixels, encoder_params, resolve_encoder, streaming_options
+from tests.integration.conftest import NPY_HEADERS, npy_bytes
+
+_MATRIX = np.random.default_rng(7).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+
+
+def _convert(client: TestClient, query: str, matrix: np.ndarray = _MATRIX):
+    return client.post(f"/api/v1/convert?stream=false&{query}", content=npy_bytes(matrix), headers=NPY_HEADERS)
+
+
+@pytest.mark.parametrize(
+    "output_format, options, backend",
+    [
+        ("png", ConversionOptions(), "opencv"),
+        ("jpg", ConversionOptions(), "opencv"),
+        ("webp", ConversionOptions(), "pillow"),
+        ("tif", ConversionOptions(), "pillow"),
+        ("png", ConversionOptions(profile="smallest"), "pillow"),  # OpenCV no admite 'optimize' en PNG
+        ("png", ConversionOptions(encoder="pillow"), "pillow"),
+        ("webp", ConversionOptions(encoder="opencv"), "opencv"),
+    ],
+)
+def test_resolves_backend(output_format, options, backend):
+    assert resolve_encoder(output_format, options)[0] == backend
+
+
+def test_explicit_params_override_profile():
+    options = ConversionOptions(profile="smallest", quality=40, compress_level=3)
+    assert encoder_params("jpeg", options) == {"quality": 40, "optimize": True, "progressive": True}
+    assert encoder_params("png", options) == {"compress_level": 3, "optimize": True}
+    assert encoder_params("webp", ConversionOptions(lossless=True)) == {"quality": 80, "method": 4, "lossless": True}
+
+
+def test_streaming_prefers_pillow():
+    assert streaming_options(ConversionOptions()).encoder == "pillow"
+    assert streaming_options(ConversionOptions(encoder="opencv")).encoder == "opencv"
+
+
+@pytest.mark.parametrize("output_format", ["png", "webp", "tiff", "bmp"])
+@pytest.mark.parametrize("encoder", ["pillow", "opencv"])
+def test_lossless_backends_agree(client, output_format, encoder):
+    query = f"output_format={output_format}&encoder={encoder}"
+    if output_format == "webp":
+        query += "&lossless=true"
+    response = _convert(client, query)
+    assert response.status_code == 200
+    np.testing.assert_array_equal(np.asarray(Image.open(io.BytesIO(response.content)).convert("RGB")), _MATRIX)
+
+
+def test_profiles_trade_size_for_speed(client):
+    y, x = np.mgrid[0:256, 0:256]
+    smooth = ((np.sin(x / 20) + np.cos(y / 13)) * 60 + 128).astype(np.uint8)
+    sizes = {
+        profile: len(_convert(client, f"profile={profile}&encoder=pillow", smooth).content)
+        for profile in ("fastest", "balanced", "smallest")
+    }
+    assert sizes["smallest"] <= sizes["balanced"] <= sizes["fastest"]
+
+
+def test_quality_changes_jpeg(client):
+    low = _convert(client, "output_format=jpeg&quality=10").content
+    high = _convert(client, "output_format=jpeg&quality=95").content
+    assert len(low) < len(high)
+
+
+def test_sixteen_bit_color_uses_opencv():
+    pixels = np.arange(4 * 4 * 3, dtype=np.uint16).reshape(4, 4, 3) * 1000
+    buffer = io.BytesIO()
+    # Pillow no tiene modos de color de 16 bits: se codifica con OpenCV aunque se pida Pillow
+    encode_pixels(pixels, "png", buffer, ConversionOptions(normalize="passthrough", encoder="pillow"))
+    assert buffer.getvalue().startswith(b"\x89PNG")
+
+
+@pytest.mark.parametrize(
+    "pixels",
+    [
+        np.zeros((4, 4), dtype=np.uint8),
+        np.zeros((4, 4, 1), dtype=np.uint8),
+        np.zeros((4, 4, 3), dtype=np.uint8),
+        np.zeros((4, 4, 4), dtype=np.uint8),
+        np.zeros((4, 4), dtype=np.uint16),
+    ],
+    ids=["gray", "gray-channel", "rgb", "rgba", "gray16"],
+)
+def test_pillow_infers_mode_without_deprecated_arguments(pixels):
+    buffer = io.BytesIO()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        encode_pixels(pixels, "png", buffer, ConversionOptions(normalize="passthrough", encoder="pillow"))
+    decoded = np.asarray(Image.open(io.BytesIO(buffer.getvalue())))
+    assert decoded.shape == pixels.shape[:2] + ((pixels.shape[2],) if pixels.ndim == 3 and pixels.shape[2] > 1 else ())
+
+
+@pytest.mark.parametrize("output_format", ["jpeg", "jpg"])
+@pytest.mark.parametrize("encoder", ["auto", "pillow", "opencv"])
+@pytest.mark.parametrize("stream", ["false", "true"])
+def test_rejects_alpha_in_jpeg(client, output_format, encoder, stream):
+    rgba = np.zeros((8, 8, 4), dtype=np.uint8)
+    response = client.post(
+        f"/api/v1/convert?output_format={output_format}&encoder={encoder}&stream={stream}",
+        content=npy_bytes(rgba),
+        headers=NPY_HEADERS,
+    )
+    assert response.status_code == 400
+    assert "alfa" in response.json()["detail"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "profile=tiny",
+        "encoder=magick",
+        "compress_level=10",
+        "quality=0",
+        "encoder=opencv&profile=smallest",
+        "encoder=opencv&output_format=gif",
+    ],
+)
+def test_rejects_invalid_options(client, query):
+    assert _convert(client, query).status_code == 400
+
@@ -0,0 +1,100 @@
+"""
+Pruebas de integración del motor de ejecución y su control de admisión.
+"""
+import asyncio
+import json
+import threading
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from src.config.settings import get_settings
+from src.services.execution_engine import ExecutionEngine, PoolSaturatedError, get_execution_engine
+from tests.integration.conftest import JSON_HEADERS, NPY_HEADERS, npy_bytes
+
+
+def _occupy(client: TestClient, release: threading.Event) -> list:
+    """Llena el motor de la aplicación con tareas que esperan a ``release``."""
+    engine = get_execution_engine()
+
+    async def submit():
+        return [asyncio.ensure_future(engine.run(release.wait)) for _ in range(engine.capacity)]
+
+    tasks = client.portal.call(submit)
+    for _ in range(200):
+        if engine.in_flight == engine.capacity:
+            return tasks
+        time.sleep(0.01)
+    raise AssertionError("El motor no llegó a saturarse")
+
+
+def test_rejects_beyond_capacity():
+    async def scenario():
+        engine = ExecutionEngine(workers=1, queue_size=1, retry_after=7)
+        release = threading.Event()
+        running = [asyncio.ensure_future(engine.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert engine.in_flight == 2
+
+        with pytest.raises(PoolSaturatedError) as saturated:
+            await engine.run(sum, [1, 2])
+        assert saturated.value.retry_after == 7
+
+        release.set()
+        await asyncio.gather(*running)
+        assert engine.in_flight == 0
+        assert await engine.run(sum, [1, 2]) == 3
+        engine.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_run_local_keeps_caller_state_with_process_backend():
+    async def scenario():
+        engine = ExecutionEngine(backend="process", workers=1, queue_size=0)
+        items = []
+        # El objeto del llamador se modifica en un hilo de este proceso, no en una copia
+        await engine.run_local(items.append, 1)
+        engine.shutdown()
+        return items
+
+    assert asyncio.run(scenario()) == [1]
+
+
+def test_streamed_json_is_admitted_by_the_engine(client):
+    release = threading.Event()
+    occupied = _occupy(client, release)
+    try:
+        response = client.post("/api/v1/convert", content=json.dumps({"matrix": [[1, 2], [3, 4]]}), headers=JSON_HEADERS)
+    finally:
+        release.set()
+    client.portal.call(asyncio.wait, occupied)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(get_settings().EXECUTION_RETRY_AFTER)
+
+
+def test_saturated_engine_returns_503(client):
+    release = threading.Event()
+    occupied = _occupy(client, release)
+    try:
+        response = client.post(
+            "/api/v1/convert",
+            content=npy_bytes(np.zeros((8, 8), dtype=np.uint8)),
+            headers=NPY_HEADERS,
+        )
+    finally:
+        release.set()
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(get_settings().EXECUTION_RETRY_AFTER)
+
+    # Al terminar las tareas el motor vuelve a admitir solicitudes
+    client.portal.call(asyncio.wait, occupied)
+    assert get_execution_engine().in_flight == 0
+    response = client.post(
+        "/api/v1/convert",
+        content=npy_bytes(np.zeros((8, 8), dtype=np.uint8)),
+        headers=NPY_HEADERS,
+    )
+    assert response.status_code == 200
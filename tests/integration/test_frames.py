@@ -0,0 +1,70 @@
+"""
+Pruebas de integración de las secuencias de fotogramas por WebSocket (/api/v1/convert/frames).
+"""
+import asyncio
+import json
+
+import numpy as np
+import pytest
+from starlette.testclient import WebSocketDenialResponse
+
+from src.services.frame_stream import HEADER_LENGTH, FrameMailbox, pack_frame
+from tests.integration.conftest import API_HEADERS
+
+
+def _frame(matrix: np.ndarray, seq: int) -> bytes:
+    return pack_frame({"dtype": str(matrix.dtype), "shape": list(matrix.shape), "seq": seq}, matrix.tobytes())
+
+
+def _unpack(message: bytes):
+    (length,) = HEADER_LENGTH.unpack_from(message)
+    start = HEADER_LENGTH.size
+    return json.loads(message[start:start + length]), message[start + length:]
+
+
+def test_frames_match_convert(client):
+    matrix = np.arange(48 * 64, dtype=np.uint16).reshape(48, 64)
+    expected = client.post(
+        "/api/v1/convert",
+        content=matrix.tobytes(),
+        headers={
+            **API_HEADERS,
+            "Content-Type": "application/octet-stream",
+            "X-Matrix-Dtype": "uint16",
+            "X-Matrix-Shape": "48,64",
+        },
+    ).content
+
+    with client.websocket_connect("/api/v1/convert/frames", headers=API_HEADERS) as websocket:
+        for seq in range(3):
+            websocket.send_bytes(_frame(matrix, seq))
+            header, image = _unpack(websocket.receive_bytes())
+            assert (header["seq"], header["content_type"]) == (seq, "image/png")
+            assert image == expected
+
+        # Un fotograma no válido no cierra la conexión
+        websocket.send_bytes(_frame(np.zeros((2, 2, 7), dtype=np.uint8), 3))
+        assert json.loads(websocket.receive_text())["status_code"] == 400
+        websocket.send_bytes(_frame(matrix, 4))
+        assert _unpack(websocket.receive_bytes())[0]["seq"] == 4
+
+
+def test_frames_require_api_key(client):
+    with pytest.raises(WebSocketDenialResponse) as denied:
+        with client.websocket_connect("/api/v1/convert/frames"):
+            pass
+    assert denied.value.status_code == 401
+
+
+def test_mailbox_drops_oldest_frames():
+    async def scenario():
+        mailbox = FrameMailbox(max_pending=2)
+        for message in (b"a", b"b", b"c", b"d"):
+            mailbox.put(message)
+        assert mailbox.dropped == 2
+        assert await mailbox.get() == (2, b"c")
+        assert await mailbox.get() == (3, b"d")
+        mailbox.close()
+        assert await mailbox.get() is None
+
+    asyncio.run(scenario())
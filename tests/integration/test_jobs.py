@@ -0,0 +1,118 @@
+"""
+Pruebas de integración de los trabajos asíncronos (/api/v1/jobs).
+"""
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from src.config.settings import get_settings
+from src.services import job_queue
+from tests.integration.conftest import API_HEADERS, NPY_HEADERS, npy_bytes
+
+
+def _wait(client: TestClient, location: str) -> dict:
+    for _ in range(200):
+        job = client.get(location, headers=API_HEADERS).json()
+        if job["status"] in job_queue.FINISHED_STATUSES:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"El trabajo no terminó: {job}")
+
+
+@pytest.fixture(autouse=True)
+def job_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_settings(), "JOBS_DIR", str(tmp_path))
+    monkeypatch.setattr(get_settings(), "JOBS_CONCURRENCY", 1)
+    monkeypatch.setattr(job_queue, "_queue", None)
+
+
+def test_convert_job_matches_convert(client):
+    body = npy_bytes(np.arange(64 * 64, dtype=np.uint16).reshape(64, 64))
+    response = client.post("/api/v1/jobs/convert?output_format=png", content=body, headers=NPY_HEADERS)
+    assert response.status_code == 202
+    assert response.json()["status"] == "queued"
+
+    job = _wait(client, response.headers["Location"])
+    assert job["status"] == "succeeded"
+    assert job["progress"] == 1.0
+    result = client.get(response.headers["Location"] + "/result", headers=API_HEADERS)
+    assert result.headers["content-type"] == "image/png"
+    assert result.content == client.post("/api/v1/convert", content=body, headers=NPY_HEADERS).content
+
+
+def test_failed_job_keeps_status_code(client):
+    response = client.post("/api/v1/jobs/convert", content=b"no es npy", headers=NPY_HEADERS)
+    job = _wait(client, response.headers["Location"])
+    assert (job["status"], job["status_code"]) == ("failed", 400)
+    assert client.get(response.headers["Location"] + "/result", headers=API_HEADERS).status_code == 409
+
+
+def test_rejects_invalid_priority(client):
+    response = client.post("/api/v1/jobs/convert?priority=10", content=npy_bytes(np.zeros((2, 2))), headers=NPY_HEADERS)
+    assert response.status_code == 400
+
+
+def test_expired_results_are_purged(tmp_path):
+    store = job_queue.JobStore(str(tmp_path))
+    record = store.create("convert", 5)
+    store.finish(record.id, -1.0, (b"imagen", "image/png"))
+    assert store.get(record.id) is None
+    assert store.purge_expired() == 1
+    assert not (tmp_path / "results" / record.id).exists()
+
+
+def test_claim_loses_to_cancel_from_another_worker(tmp_path):
+    store = job_queue.JobStore(str(tmp_path))
+    other_worker = job_queue.JobStore(str(tmp_path))
+    cancelled = store.create("convert", 5)
+    assert other_worker.cancel(cancelled.id, 60.0)
+    assert not store.claim(cancelled.id, 1)
+    assert store.get(cancelled.id).status == "cancelled"
+
+    claimed = store.create("convert", 5)
+    assert store.claim(claimed.id, 1)
+    assert not store.claim(claimed.id, 1)
+    assert not other_worker.cancel(claimed.id, 60.0)
+    assert store.get(claimed.id).status == "running"
+
+
+def test_job_cancelled_elsewhere_does_not_run(tmp_path):
+    calls = []
+
+    async def runner():
+        calls.append(1)
+        return b"imagen", "image/png"
+
+    async def scenario():
+        queue = job_queue.JobQueue(job_queue.JobStore(str(tmp_path)), concurrency=1)
+        record = await queue.submit("convert", runner)
+        # Otro worker atiende el DELETE: la cola de este proceso no se entera
+        job_queue.JobStore(str(tmp_path)).cancel(record.id, 60.0)
+        queue.start()
+        await asyncio.sleep(0.1)
+        await queue.stop()
+        return queue.store.get(record.id)
+
+    record = asyncio.run(scenario())
+    assert record.status == "cancelled"
+    assert calls == []
+
+
+def test_queue_position_follows_priority(tmp_path):
+    async def runner():
+        return b"", "image/png"
+
+    async def scenario():
+        queue = job_queue.JobQueue(job_queue.JobStore(str(tmp_path)))
+        low, high, later = [await queue.submit("convert", runner, priority) for priority in (5, 9, 5)]
+        before = [queue.queue_position(job.id) for job in (low, high, later)]
+        await queue.cancel(high.id)
+        after = [queue.queue_position(job.id) for job in (low, high, later)]
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    assert before == [1, 0, 2]
+    assert after == [0, None, 1]
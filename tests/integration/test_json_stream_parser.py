@@ -0,0 +1,94 @@
+"""
+Pruebas de integración del parser incremental de matrices JSON.
+"""
+import asyncio
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from src.services.json_stream_parser import StreamingMatrixParser, parse_matrix_stream
+from tests.integration.conftest import JSON_HEADERS
+
+
+def _parse(document: str, step: int) -> np.ndarray:
+    parser = StreamingMatrixParser()
+    for start in range(0, len(document), step):
+        parser.feed(document[start:start + step])
+    return parser.close()
+
+
+@pytest.mark.parametrize("step", [1, 7, 4096])
+@pytest.mark.parametrize(
+    "document",
+    [
+        '{"matrix": [[1, 2], [3, 4]]}',
+        '  {"matrix" :\n [[1.5, 2], [3, 4e2]] }  ',
+        '{"meta": {"matrix": 1}, "matrix": [[1, 2], [3, 4]]}',
+        '{"items": [{"matrix": [[9]]}], "matrix": [[1, 2], [3, 4]], "after": {"x": [1]}}',
+        '{"note": "\\"matrix\\": [[0]]", "matrix": [[[1, 2, 3]], [[4, 5, 6]]]}',
+        '{"m\\u0061trix": [[-1, 0], [1, 2]]}',
+    ],
+    ids=["plain", "whitespace", "nested-key", "nested-list", "escaped-string", "escaped-key"],
+)
+def test_matches_json_loads(document, step):
+    matrix = _parse(document, step)
+    expected = np.array(json.loads(document)["matrix"])
+    np.testing.assert_array_equal(matrix, expected)
+    assert matrix.dtype == expected.dtype
+
+
+@pytest.mark.parametrize("step", [1, 4096])
+@pytest.mark.parametrize(
+    "document",
+    [
+        '{"matrix": [[1, 2], [3, 4]]',  # Sin la llave de cierre
+        '{"matrix": [[1, 2], [3, 4]]} basura',
+        '{"matrix": [[1, 2], [3, 4]]}}',
+        '{"matrix": [[1, 2], [3, 4]], }',
+        '{"matrix": [[1, 2], [3, 4]',  # Matriz sin cerrar
+        '{"meta": {"matrix": [[1]]}}',  # La clave solo aparece anidada
+        '[{"matrix": [[1]]}]',
+        '{"matrix": 5}',
+        '{"matrix": [[1, 2], [3]]}',  # Irregular
+        '{"matrix": [[1, "a"], [3, 4]]}',
+        '{"matrix": [1, 2, 3]}',  # Una sola dimensión
+    ],
+)
+def test_rejects_invalid_documents(document, step):
+    with pytest.raises(ValueError):
+        _parse(document, step)
+
+
+def test_stream_parses_off_the_event_loop(monkeypatch):
+    threads = set()
+    original = StreamingMatrixParser.feed
+
+    def feed(self, chunk):
+        threads.add(threading.get_ident())
+        return original(self, chunk)
+
+    async def chunks():
+        yield b'{"matrix": [[1, 2],'
+        yield b' [3, 4]]}'
+
+    async def scenario():
+        return await parse_matrix_stream(chunks()), threading.get_ident()
+
+    monkeypatch.setattr(StreamingMatrixParser, "feed", feed)
+    matrix, loop_thread = asyncio.run(scenario())
+    assert matrix.tolist() == [[1, 2], [3, 4]]
+    assert threads and loop_thread not in threads
+
+
+def test_convert_accepts_nested_matrix_key(client):
+    document = {"meta": {"matrix": "id-7"}, "matrix": np.arange(64, dtype=np.uint8).reshape(8, 8).tolist()}
+    response = client.post("/api/v1/convert", content=json.dumps(document), headers=JSON_HEADERS)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("body", ['{"matrix": [[1, 2], [3, 4]]', '{"matrix": [[1, 2], [3, 4]]} {}'])
+def test_convert_rejects_truncated_or_trailing(client, body):
+    response = client.post("/api/v1/convert", content=body, headers=JSON_HEADERS)
+    assert response.status_code == 400
@@ -0,0 +1,97 @@
+"""
+Pruebas de integración de /api/v1/convert/large (matrices proyectadas desde disco).
+"""
+import io
+import os
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.config.settings import get_settings
+from src.services import large_matrix
+from tests.integration.conftest import NPY_HEADERS, npy_bytes
+
+_MATRIX = np.random.default_rng(4).normal(size=(70, 90)).astype(np.float32)
+
+
+def _pixels(content: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(content)))
+
+
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "LARGE_MATRIX_SPOOL_DIR", str(tmp_path))
+    # Bloques de unos pocos cientos de valores y teselas pequeñas: la matriz se recorre en muchas partes
+    monkeypatch.setattr(settings, "LARGE_MATRIX_MEMORY_LIMIT", large_matrix._FIXED_OVERHEAD + 4096)
+    monkeypatch.setattr(settings, "LARGE_MATRIX_TILE_SIZE", 16)
+    return tmp_path
+
+
+def _convert_both(client, matrix: np.ndarray, query: str):
+    large = client.post(f"/api/v1/convert/large?{query}", content=npy_bytes(matrix), headers=NPY_HEADERS)
+    whole = client.post(f"/api/v1/convert?stream=false&{query}", content=npy_bytes(matrix), headers=NPY_HEADERS)
+    assert (large.status_code, whole.status_code) == (200, 200)
+    return _pixels(large.content), _pixels(whole.content)
+
+
+@pytest.mark.parametrize("output_format", ["png", "tiff"])
+@pytest.mark.parametrize(
+    "options",
+    [
+        "normalize=minmax",
+        "normalize=percentile",
+        "normalize=window&window=2&level=0",
+        "colormap=viridis",
+        "crop=5,7,60,40&stride=3",
+    ],
+)
+def test_matches_in_memory_conversion(client, output_format, options):
+    large, whole = _convert_both(client, _MATRIX, f"output_format={output_format}&{options}")
+    np.testing.assert_array_equal(large, whole)
+
+
+@pytest.mark.parametrize("output_format", ["png", "tiff"])
+def test_sixteen_bit_rgb(client, output_format):
+    matrix = np.arange(50 * 40 * 3, dtype=np.uint16).reshape(50, 40, 3) * 9
+    query = f"output_format={output_format}&normalize=passthrough"
+    large = client.post(f"/api/v1/convert/large?{query}", content=npy_bytes(matrix), headers=NPY_HEADERS)
+    assert large.status_code == 200
+    # Pillow no lee RGB de 16 bits: OpenCV lo devuelve en BGR
+    pixels = cv2.imdecode(np.frombuffer(large.content, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    np.testing.assert_array_equal(pixels[:, :, ::-1], matrix)
+
+
+@pytest.mark.parametrize("output_format", ["png", "tiff"])
+def test_temporary_files_are_removed(client, spool_dir, output_format):
+    response = client.post(
+        f"/api/v1/convert/large?output_format={output_format}", content=npy_bytes(_MATRIX), headers=NPY_HEADERS
+    )
+    assert response.status_code == 200
+    assert os.listdir(spool_dir) == []
+
+
+@pytest.mark.parametrize(
+    "body, query",
+    [
+        (npy_bytes(_MATRIX), "output_format=jpeg"),
+        (npy_bytes(_MATRIX), "max_width=10"),
+        (npy_bytes(_MATRIX), "crop=200,0,10,10"),
+        (npy_bytes(np.zeros((4, 4, 3))), "colormap=viridis"),
+        (npy_bytes(np.zeros((4, 4, 2))), ""),
+        (b'{"matrix": [[1, 2]]}', ""),
+    ],
+    ids=["format", "max-width", "crop", "colormap", "channels", "not-npy"],
+)
+def test_rejects_invalid_requests(client, spool_dir, body, query):
+    response = client.post(f"/api/v1/convert/large?{query}", content=body, headers=NPY_HEADERS)
+    assert response.status_code == 400
+    assert os.listdir(spool_dir) == []
+
+
+def test_rejects_bodies_over_the_limit(client, monkeypatch):
+    monkeypatch.setattr(get_settings(), "LARGE_MATRIX_MAX_SIZE", 1024)
+    response = client.post("/api/v1/convert/large", content=npy_bytes(_MATRIX), headers=NPY_HEADERS)
+    assert response.status_code == 413
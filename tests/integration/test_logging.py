@@ -0,0 +1,72 @@
+"""
+Pruebas de integración del registro de solicitudes (X-Request-ID y líneas JSON).
+"""
+import json
+import logging
+
+import numpy as np
+
+from src.api.middlewares import logging_middleware
+from src.utils.logging_config import JsonFormatter
+from tests.integration.conftest import API_HEADERS, npy_bytes
+
+
+def _request_records(caplog, path: str):
+    return [
+        record for record in caplog.records
+        if record.name == "matrix_to_image" and getattr(record, "fields", {}).get("path") == path
+    ]
+
+
+def test_generates_request_id(client, caplog):
+    caplog.set_level(logging.INFO)
+    response = client.get("/health")
+    request_id = response.headers["X-Request-ID"]
+    assert len(request_id) == 32 and int(request_id, 16) >= 0
+    assert float(response.headers["X-Process-Time"]) >= 0
+
+    (record,) = _request_records(caplog, "/health")
+    assert record.levelno == logging.INFO
+    assert record.fields["request_id"] == request_id
+    assert (record.fields["method"], record.fields["status"]) == ("GET", 200)
+    assert record.fields["response_bytes"] == len(response.content)
+
+
+def test_propagates_client_request_id(client, caplog):
+    caplog.set_level(logging.INFO)
+    response = client.get("/health", headers={"X-Request-ID": "trace-123"})
+    assert response.headers["X-Request-ID"] == "trace-123"
+    assert _request_records(caplog, "/health")[-1].fields["request_id"] == "trace-123"
+
+    long_id = "x" * 500
+    assert client.get("/health", headers={"X-Request-ID": long_id}).headers["X-Request-ID"] == long_id[:128]
+
+
+def test_json_line_contains_request_id(client, caplog):
+    caplog.set_level(logging.INFO)
+    response = client.post(
+        "/api/v1/convert?stream=true",
+        content=npy_bytes(np.zeros((16, 16), dtype=np.uint8)),
+        headers={**API_HEADERS, "Content-Type": "application/x-npy", "X-Request-ID": "abc"},
+    )
+    assert response.status_code == 200
+
+    (record,) = _request_records(caplog, "/api/v1/convert")
+    line = json.loads(JsonFormatter().format(record))
+    assert (line["level"], line["message"], line["request_id"]) == ("INFO", "request", "abc")
+    assert line["status"] == 200
+    # Se cuentan los bytes de todos los fragmentos de la respuesta
+    assert line["response_bytes"] == len(response.content)
+
+
+def test_successful_requests_are_sampled(client, caplog, monkeypatch):
+    caplog.set_level(logging.INFO)
+    monkeypatch.setattr(logging_middleware.random, "random", lambda: 1.0)
+    client.get("/health")
+    missing = client.get("/no/existe")
+
+    assert _request_records(caplog, "/health") == []
+    (record,) = _request_records(caplog, "/no/existe")
+    # Los errores se registran siempre, con su identificador
+    assert record.levelno == logging.WARNING
+    assert record.fields["request_id"] == missing.headers["X-Request-ID"]
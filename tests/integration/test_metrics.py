@@ -0,0 +1,115 @@
+"""
+Pruebas de integración del endpoint /metrics (formato de texto de Prometheus).
+"""
+import re
+from typing import Dict
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from src.services.metrics import Counter, Histogram, MetricsRegistry
+from tests.integration.conftest import API_HEADERS, NPY_HEADERS, npy_bytes
+
+_SAMPLE = re.compile(r"^([a-z_:]+)(\{.*\})? (\S+)$")
+
+
+def _scrape(client: TestClient) -> Dict[str, float]:
+    """Muestras de /metrics por nombre y etiquetas (``nombre{etiquetas}``)."""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    samples = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith("#"):
+            match = _SAMPLE.match(line)
+            assert match is not None, line
+            name, labels, value = match.groups()
+            samples[name + (labels or "")] = float(value)
+    return samples
+
+
+def _delta(before: Dict[str, float], after: Dict[str, float], key: str) -> float:
+    return after.get(key, 0.0) - before.get(key, 0.0)
+
+
+def test_exposition_format(client):
+    response = client.get("/metrics")
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    for name, kind in [
+        ("matrixtoimagen_request_duration_seconds", "histogram"),
+        ("matrixtoimagen_requests_in_flight", "gauge"),
+        ("matrixtoimagen_stage_duration_seconds", "histogram"),
+        ("matrixtoimagen_matrix_bytes", "histogram"),
+        ("matrixtoimagen_execution_in_flight", "gauge"),
+        ("matrixtoimagen_execution_rejected", "counter"),
+        ("matrixtoimagen_upstream_request_duration_seconds", "histogram"),
+        ("matrixtoimagen_upstream_rejected", "counter"),
+    ]:
+        assert f"# TYPE {name} {kind}" in response.text
+        assert f"# HELP {name} " in response.text
+
+
+def test_conversion_is_recorded(client):
+    matrix = np.zeros((32, 48), dtype=np.float32)
+    before = _scrape(client)
+    response = client.post(
+        "/api/v1/convert?output_format=jpeg",
+        content=npy_bytes(matrix),
+        headers=NPY_HEADERS,
+    )
+    assert response.status_code == 200
+    after = _scrape(client)
+
+    request = 'route="/api/v1/convert",status="200",output_format="jpeg"}'
+    assert _delta(before, after, 'matrixtoimagen_request_duration_seconds_count{method="POST",' + request) == 1
+    assert _delta(before, after, 'matrixtoimagen_matrix_bytes_sum{endpoint="convert"}') == matrix.nbytes
+    assert _delta(before, after, 'matrixtoimagen_matrix_bytes_count{endpoint="convert"}') == 1
+    # Una observación por etapa de la cabecera Server-Timing
+    for entry in response.headers["Server-Timing"].split(","):
+        stage = entry.strip().split(";")[0]
+        key = f'matrixtoimagen_stage_duration_seconds_count{{route="/api/v1/convert",stage="{stage}"}}'
+        assert _delta(before, after, key) == 1
+    assert after["matrixtoimagen_requests_in_flight"] == 1  # La propia solicitud a /metrics
+
+
+def test_routes_are_labelled_by_template(client):
+    before = _scrape(client)
+    assert client.get("/api/v1/tiles/desconocida", headers=API_HEADERS).status_code == 404
+    assert client.get("/no/existe").status_code == 404
+    after = _scrape(client)
+
+    tiles = 'matrixtoimagen_request_duration_seconds_count{method="GET",route="/api/v1/tiles/{pyramid_id}",status="404",output_format=""}'
+    unmatched = 'matrixtoimagen_request_duration_seconds_count{method="GET",route="unmatched",status="404",output_format=""}'
+    assert _delta(before, after, tiles) == 1
+    assert _delta(before, after, unmatched) == 1
+    assert not any("desconocida" in key or "/no/existe" in key for key in after)
+
+
+def test_histogram_buckets_are_cumulative(client):
+    samples = _scrape(client)
+    prefix = 'matrixtoimagen_request_duration_seconds_bucket{method="GET",route="/metrics",status="200",output_format="",le="'
+    buckets = [(key[len(prefix):-2], value) for key, value in samples.items() if key.startswith(prefix)]
+    counts = [value for _, value in buckets]
+    assert buckets[-1][0] == "+Inf"
+    assert counts == sorted(counts)
+    count = samples['matrixtoimagen_request_duration_seconds_count{method="GET",route="/metrics",status="200",output_format=""}']
+    assert counts[-1] == count
+
+
+def test_registry_rendering():
+    registry = MetricsRegistry()
+    counter = registry.register(Counter("demo_events", "Eventos", ("kind",)))
+    histogram = registry.register(Histogram("demo_seconds", "Duración", buckets=(0.1, 1.0)))
+    counter.inc(kind='a"b\\c')
+    counter.inc(2, kind='a"b\\c')
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    text = registry.render()
+    assert 'demo_events_total{kind="a\\"b\\\\c"} 3' in text
+    assert 'demo_seconds_bucket{le="0.1"} 0' in text
+    assert 'demo_seconds_bucket{le="1"} 1' in text
+    assert 'demo_seconds_bucket{le="+Inf"} 2' in text
+    assert "demo_seconds_sum 5.5" in text and "demo_seconds_count 2" in text
+    with pytest.raises(ValueError):
+        counter.inc(other="x")
@@ -0,0 +1,125 @@
+"""
+Pruebas de integración del motor de normalización (modos, LUT, franjas y 16 bits).
+"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.services import normalization
+from src.services.conversion_options import ConversionOptions
+from src.services.normalization import normalize_matrix
+from tests.integration.conftest import NPY_HEADERS, npy_bytes
+
+
+def _reference(matrix: np.ndarray, low: float, high: float, out_max: int = 255) -> np.ndarray:
+    """Escalado directo en float64, sin LUT ni franjas."""
+    values = np.nan_to_num(matrix.astype(np.float64), nan=low, posinf=high, neginf=low)
+    scaled = (values - low) * (out_max / (high - low)) + 0.5
+    return np.clip(scaled, 0, out_max).astype(np.uint16 if out_max > 255 else np.uint8)
+
+
+@pytest.mark.parametrize("dtype", [np.int8, np.uint16, np.int16, np.int32, np.float32, np.float64])
+def test_minmax_matches_reference(dtype):
+    rng = np.random.default_rng(1)
+    info = np.iinfo(dtype) if np.dtype(dtype).kind in "iu" else None
+    low, high = (info.min, info.max) if info is not None else (-1000, 1000)
+    matrix = rng.integers(max(low, -100000), min(high, 100000), (40, 30), endpoint=True).astype(dtype)
+
+    result = normalize_matrix(matrix, ConversionOptions(normalize="minmax"))
+    assert result.dtype == np.uint8
+    np.testing.assert_array_equal(result, _reference(matrix, float(matrix.min()), float(matrix.max())))
+
+
+def test_strips_match_single_pass(monkeypatch):
+    rng = np.random.default_rng(2)
+    matrix = rng.normal(size=(50, 20, 3)).astype(np.float32)
+    whole = normalize_matrix(matrix, ConversionOptions(normalize="minmax"))
+    monkeypatch.setattr(normalization, "_STRIP_VALUES", 7)
+    np.testing.assert_array_equal(normalize_matrix(matrix, ConversionOptions(normalize="minmax")), whole)
+
+
+def test_auto_keeps_uint8_without_copy():
+    matrix = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    assert normalize_matrix(matrix) is matrix
+
+
+@pytest.mark.parametrize(
+    "matrix, expected",
+    [
+        (np.array([[0.0, 0.5, 1.0]]), [[0, 128, 255]]),  # Flotantes en [0, 1]
+        (np.array([[0, 100, 255]], dtype=np.int32), [[0, 100, 255]]),  # Ya en [0, 255]
+        (np.array([[-10, 0, 10]], dtype=np.int16), [[0, 128, 255]]),  # Fuera de rango: min-max
+        (np.array([[False, True]]), [[0, 255]]),
+    ],
+)
+def test_auto_mode(matrix, expected):
+    np.testing.assert_array_equal(normalize_matrix(matrix), expected)
+
+
+def test_clip_saturates():
+    matrix = np.array([[-5.0, 0.0, 127.6, 300.0]])
+    np.testing.assert_array_equal(normalize_matrix(matrix, ConversionOptions(normalize="clip")), [[0, 0, 128, 255]])
+
+
+def test_window_mode():
+    matrix = np.array([[-1000, 0, 40, 80, 1000]], dtype=np.int16)
+    options = ConversionOptions(normalize="window", window=80, level=40)
+    np.testing.assert_array_equal(normalize_matrix(matrix, options), [[0, 0, 128, 255, 255]])
+
+
+@pytest.mark.parametrize("dtype", [np.uint16, np.float64])
+def test_percentile_mode(dtype):
+    matrix = np.arange(10000, dtype=dtype).reshape(100, 100)
+    matrix[0, 0] = 60000  # Valor atípico que minmax tendría en cuenta
+    low, high = np.percentile(matrix, [1, 99])
+    result = normalize_matrix(matrix, ConversionOptions(normalize="percentile"))
+    np.testing.assert_allclose(result, _reference(matrix, low, high), atol=1)
+
+
+def test_nan_and_infinity_saturate():
+    matrix = np.array([[np.nan, -np.inf, 2.0, 4.0, np.inf]])
+    # El intervalo se calcula solo con los valores finitos
+    result = normalize_matrix(matrix, ConversionOptions(normalize="minmax"))
+    np.testing.assert_array_equal(result, [[0, 0, 0, 255, 255]])
+
+
+def test_passthrough_keeps_sixteen_bits():
+    matrix = np.arange(0, 65536, 256, dtype=np.uint16).reshape(16, 16)
+    assert normalize_matrix(matrix, ConversionOptions(normalize="passthrough")) is matrix
+
+    floats = np.array([[0.0, 0.5, 1.0]])
+    result = normalize_matrix(floats, ConversionOptions(normalize="passthrough"))
+    assert result.dtype == np.uint16
+    np.testing.assert_array_equal(result, [[0, 32768, 65535]])
+
+
+@pytest.mark.parametrize("output_format", ["png", "tiff"])
+def test_passthrough_conversion_keeps_sixteen_bits(client, output_format):
+    matrix = np.arange(48 * 64, dtype=np.uint16).reshape(48, 64) * 20
+    response = client.post(
+        f"/api/v1/convert?output_format={output_format}&normalize=passthrough",
+        content=npy_bytes(matrix),
+        headers=NPY_HEADERS,
+    )
+    assert response.status_code == 200
+    np.testing.assert_array_equal(np.asarray(Image.open(io.BytesIO(response.content))), matrix)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "normalize=bogus",
+        "normalize=window",  # Sin window ni level
+        "normalize=window&window=0&level=10",
+        "normalize=percentile&percentiles=90,10",
+        "normalize=percentile&percentiles=a,b",
+        "normalize=passthrough&output_format=jpeg",
+        "normalize=passthrough&colormap=viridis",
+    ],
+)
+def test_rejects_invalid_options(client, query):
+    matrix = np.zeros((4, 4), dtype=np.uint16)
+    response = client.post(f"/api/v1/convert?{query}", content=npy_bytes(matrix), headers=NPY_HEADERS)
+    assert response.status_code == 400
@@ -0,0 +1,98 @@
+"""
+Pruebas de integración de las opciones de región de /api/v1/convert (crop, stride, max_width/max_height).
+"""
+import io
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from src.services.conversion_options import ConversionOptions
+from src.services.region import output_shape, select_region
+from tests.integration.conftest import NPY_HEADERS, npy_bytes
+
+_MATRIX = np.random.default_rng(6).integers(0, 256, (60, 80, 3), dtype=np.uint8)
+
+
+def _convert(client: TestClient, query: str, matrix: np.ndarray = _MATRIX):
+    return client.post(f"/api/v1/convert?{query}", content=npy_bytes(matrix), headers=NPY_HEADERS)
+
+
+def _pixels(content: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(content)))
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("crop=10,5,30,20", _MATRIX[5:25, 10:40]),
+        ("crop=70,50,100,100", _MATRIX[50:, 70:]),  # Se ajusta al borde de la matriz
+        ("stride=3", _MATRIX[::3, ::3]),
+        ("crop=10,5,30,20&stride=4", _MATRIX[5:25:4, 10:40:4]),
+    ],
+)
+def test_crop_and_stride(client, query, expected):
+    response = _convert(client, query)
+    assert response.status_code == 200
+    np.testing.assert_array_equal(_pixels(response.content), expected)
+
+
+@pytest.mark.parametrize(
+    "query, size",
+    [
+        ("max_width=40", (40, 30)),
+        ("max_height=15", (20, 15)),
+        ("max_width=40&max_height=10", (13, 10)),
+        ("max_width=1000", (80, 60)),  # Nunca se amplía
+        ("crop=0,0,40,40&max_width=20", (20, 20)),
+    ],
+)
+def test_downscale_keeps_aspect_ratio(client, query, size):
+    response = _convert(client, query)
+    assert response.status_code == 200
+    assert Image.open(io.BytesIO(response.content)).size == size
+
+
+def test_downscale_uses_area_interpolation(client):
+    response = _convert(client, "max_width=20")
+    expected = cv2.resize(_MATRIX, (20, 15), interpolation=cv2.INTER_AREA)
+    np.testing.assert_array_equal(_pixels(response.content), expected)
+
+
+def test_normalization_uses_the_region_only(client):
+    matrix = np.zeros((20, 20), dtype=np.float64)
+    matrix[:10, :10] = np.linspace(100, 200, 100).reshape(10, 10)
+    matrix[15, 15] = 10000  # Fuera del recorte: no cuenta para el intervalo
+    pixels = _pixels(_convert(client, "crop=0,0,10,10&normalize=minmax", matrix).content)
+    assert (pixels.min(), pixels.max()) == (0, 255)
+
+
+@pytest.mark.parametrize("dtype", [np.bool_, np.int8, np.int32, np.uint16, np.float16, np.float64])
+@pytest.mark.parametrize(
+    "options",
+    [
+        ConversionOptions(crop=(3, 4, 50, 20)),
+        ConversionOptions(stride=7),
+        ConversionOptions(crop=(1, 1, 33, 33), stride=2, max_width=9),
+        ConversionOptions(max_height=11),
+    ],
+)
+def test_output_shape_matches_selected_region(dtype, options):
+    matrix = np.ones((45, 61), dtype=dtype)
+    region = select_region(matrix, options)
+    assert region.shape == output_shape(matrix.shape, options)
+
+
+def test_region_without_resize_is_a_view():
+    region = select_region(_MATRIX, ConversionOptions(crop=(10, 10, 20, 20), stride=2))
+    assert np.shares_memory(region, _MATRIX)
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["crop=80,0,10,10", "crop=0,60,10,10", "crop=1,2,3", "crop=a,b,c,d", "crop=0,0,0,10", "stride=0", "max_width=0"],
+)
+def test_rejects_invalid_regions(client, query):
+    assert _convert(client, query).status_code == 400
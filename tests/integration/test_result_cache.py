@@ -0,0 +1,99 @@
+"""
+Pruebas de integración de la caché de resultados y las ETag de /api/v1/convert.
+"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from src.services import result_cache
+from src.services.result_cache import ResultCache
+from tests.integration.conftest import API_HEADERS, NPY_HEADERS, npy_bytes
+
+_BODY = npy_bytes(np.arange(32 * 32, dtype=np.uint16).reshape(32, 32))
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    monkeypatch.setattr(result_cache, "_cache", ResultCache(max_bytes=1024 * 1024))
+
+
+def test_repeated_conversion_is_served_from_cache(client):
+    first = client.post("/api/v1/convert", content=_BODY, headers=NPY_HEADERS)
+    second = client.post("/api/v1/convert", content=_BODY, headers=NPY_HEADERS)
+
+    assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert second.content == first.content
+    assert second.headers["content-type"] == "image/png"
+
+    stats = client.get("/api/v1/cache/stats", headers=API_HEADERS).json()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"otra", {etag}', "*"])
+def test_matching_etag_returns_304(client, if_none_match):
+    etag = client.post("/api/v1/convert", content=_BODY, headers=NPY_HEADERS).headers["ETag"]
+
+    response = client.post(
+        "/api/v1/convert",
+        content=_BODY,
+        headers={**NPY_HEADERS, "If-None-Match": if_none_match.format(etag=etag)},
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_stale_etag_returns_image(client):
+    response = client.post("/api/v1/convert", content=_BODY, headers={**NPY_HEADERS, "If-None-Match": '"antigua"'})
+    assert response.status_code == 200
+    assert response.content.startswith(b"\x89PNG")
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["output_format=jpeg", "normalize=minmax", "colormap=viridis", "crop=0,0,16,16", "profile=smallest"],
+)
+def test_key_depends_on_output_and_options(client, query):
+    base = client.post("/api/v1/convert", content=_BODY, headers=NPY_HEADERS)
+    other = client.post(f"/api/v1/convert?{query}", content=_BODY, headers=NPY_HEADERS)
+    assert other.headers["X-Cache"] == "MISS"
+    assert other.headers["ETag"] != base.headers["ETag"]
+
+
+def test_key_depends_on_dtype_and_shape():
+    matrix = np.arange(16, dtype=np.uint8).reshape(4, 4)
+    keys = {
+        ResultCache.compute_key(matrix, "png"),
+        ResultCache.compute_key(matrix.reshape(2, 8), "png"),
+        ResultCache.compute_key(matrix.view(np.int8), "png"),
+        ResultCache.compute_key(np.asfortranarray(matrix).T.T, "png"),
+    }
+    # El mismo contenido con otra disposición en memoria da la misma clave
+    assert len(keys) == 3
+
+
+def test_memory_budget_evicts_least_recent():
+    async def scenario():
+        cache = ResultCache(max_bytes=10)
+        await cache.put("a", b"12345", "image/png")
+        await cache.put("b", b"12345", "image/png")
+        assert await cache.get("a") is not None  # 'a' pasa a ser el más reciente
+        await cache.put("c", b"12345", "image/png")
+        return cache, await cache.get("b"), await cache.get("a")
+
+    cache, evicted, kept = asyncio.run(scenario())
+    assert evicted is None and kept is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    async def scenario():
+        await ResultCache(max_bytes=1024, disk_dir=str(tmp_path), disk_max_bytes=1024).put("k", b"png", "image/png")
+        restarted = ResultCache(max_bytes=1024, disk_dir=str(tmp_path), disk_max_bytes=1024)
+        return restarted, await restarted.get("k")
+
+    restarted, result = asyncio.run(scenario())
+    assert result == (b"png", "image/png")
+    assert restarted.stats()["disk_hits"] == 1
@@ -0,0 +1,195 @@
+"""
+Pruebas de integración del servidor de producción con fork (src.api.server).
+"""
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from src.api import server
+from src.config.settings import Settings
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Servidor con fork sobre una aplicación mínima: /slow tarda lo indicado y devuelve el pid del worker
+_SLOW_SERVER = """
+import asyncio, os, sys
+import uvicorn
+from fastapi import FastAPI
+from src.api import server
+
+server._KILL_MARGIN = 0.5
+app = FastAPI()
+
+@app.get("/slow")
+async def slow(seconds: float = 0.0):
+    await asyncio.sleep(seconds)
+    return {"pid": os.getpid()}
+
+port, graceful, max_requests = int(sys.argv[1]), float(sys.argv[2]), int(sys.argv[3]) or None
+config = uvicorn.Config(
+    app, host="127.0.0.1", port=port, log_config=None, access_log=False,
+    limit_max_requests=max_requests, timeout_graceful_shutdown=int(graceful),
+)
+server.PreforkServer(config, 2, graceful).run()
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(port: int, path: str, timeout: float = 10.0):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=timeout) as response:
+        return response.status, json.loads(response.read())
+
+
+def _wait_ready(process: subprocess.Popen, port: int, path: str) -> None:
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        assert process.poll() is None, process.stderr.read()
+        try:
+            _get(port, path, timeout=1.0)
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise AssertionError("El servidor no llegó a aceptar conexiones")
+
+
+def _start(args, port: int, path: str, env=None) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, *args],
+        cwd=_ROOT,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        _wait_ready(process, port, path)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    return process
+
+
+@pytest.fixture
+def slow_server():
+    if not hasattr(os, "fork"):
+        pytest.skip("El servidor de producción necesita fork")
+    processes = []
+
+    def start(graceful: float = 5.0, max_requests: int = 0):
+        port = _free_port()
+        process = _start(["-c", _SLOW_SERVER, str(port), str(graceful), str(max_requests)], port, "/slow")
+        processes.append(process)
+        return process, port
+
+    yield start
+    for process in processes:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def _in_flight(port: int, seconds: float):
+    result = {}
+
+    def request():
+        try:
+            result["response"] = _get(port, f"/slow?seconds={seconds}", timeout=seconds + 10)
+        except OSError as exc:
+            result["error"] = exc
+
+    thread = threading.Thread(target=request)
+    thread.start()
+    time.sleep(0.3)  # La solicitud ya está en un worker
+    return thread, result
+
+
+@pytest.mark.parametrize(
+    "settings, cpus, workers, threads",
+    [
+        (Settings(SERVER_WORKERS=0, EXECUTION_WORKERS=2, NATIVE_THREADS=0), 8, 4, 1),
+        (Settings(SERVER_WORKERS=0, EXECUTION_WORKERS=4, NATIVE_THREADS=0), 2, 1, 1),
+        (Settings(SERVER_WORKERS=2, EXECUTION_WORKERS=1, NATIVE_THREADS=0), 8, 2, 4),
+        (Settings(SERVER_WORKERS=3, EXECUTION_WORKERS=2, NATIVE_THREADS=5), 8, 3, 5),
+    ],
+)
+def test_workers_and_native_threads_cover_the_cpus(settings, cpus, workers, threads):
+    assert server.worker_count(settings, cpus) == workers
+    assert server.native_threads(settings, workers, cpus) == threads
+
+
+def test_native_thread_limit_respects_environment(monkeypatch):
+    for name in server._THREAD_ENV_VARS:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("OMP_NUM_THREADS", "7")
+    server.limit_native_threads(2)
+    assert os.environ["OMP_NUM_THREADS"] == "7"
+    assert all(os.environ[name] == "2" for name in server._THREAD_ENV_VARS[1:])
+
+
+def test_sigterm_drains_requests_in_flight(slow_server):
+    process, port = slow_server(graceful=5.0)
+    thread, result = _in_flight(port, 1.5)
+
+    process.send_signal(signal.SIGTERM)
+    thread.join()
+    assert process.wait(timeout=15) == 0
+    assert result["response"][0] == 200
+
+    # Tras el cierre el socket deja de aceptar conexiones
+    with pytest.raises(OSError):
+        _get(port, "/slow", timeout=1.0)
+
+
+def test_workers_past_the_graceful_timeout_are_killed(slow_server):
+    process, port = slow_server(graceful=0.5)
+    thread, result = _in_flight(port, 60)
+
+    started = time.monotonic()
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(timeout=15) == 0
+    assert time.monotonic() - started < 10
+    thread.join()
+    assert "response" not in result
+
+
+def test_recycled_workers_are_replaced(slow_server):
+    process, port = slow_server(max_requests=2)
+    pids = set()
+    for _ in range(12):
+        status, body = _get(port, "/slow")
+        assert status == 200
+        pids.add(body["pid"])
+        time.sleep(0.15)  # uvicorn comprueba el límite en cada tic de 0,1 s
+    # Dos workers no bastan para 12 solicitudes con un límite de 2 cada uno
+    assert len(pids) > 2
+    assert process.poll() is None
+
+
+def test_production_server_serves_and_stops():
+    if not hasattr(os, "fork"):
+        pytest.skip("El servidor de producción necesita fork")
+    port = _free_port()
+    env = {"API_HOST": "127.0.0.1", "API_PORT": str(port), "SERVER_WORKERS": "2"}
+    process = _start(["-m", "src.api.server"], port, "/health", env)
+    try:
+        assert _get(port, "/health") == (200, {"status": "healthy"})
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=40) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
@@ -0,0 +1,101 @@
+"""
+Pruebas de integración de las respuestas por fragmentos de /api/v1/convert.
+"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.config.settings import get_settings
+from tests.integration.conftest import NPY_HEADERS, npy_bytes
+
+_MATRIX = np.arange(96 * 128 * 3, dtype=np.uint32).reshape(96, 128, 3).astype(np.uint8)
+
+
+def _pixels(content: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(content)))
+
+
+@pytest.fixture(autouse=True)
+def stream_settings(monkeypatch):
+    # Cualquier matriz de las pruebas supera el umbral y se transmite en varios fragmentos
+    monkeypatch.setattr(get_settings(), "STREAM_THRESHOLD_BYTES", 1024)
+    monkeypatch.setattr(get_settings(), "STREAM_CHUNK_SIZE", 4096)
+
+
+@pytest.mark.parametrize("output_format", ["png", "jpeg", "bmp"])
+def test_large_image_is_streamed_with_pillow(client, output_format):
+    # Con encoder=auto estos formatos irían con OpenCV, que escribe la imagen de una vez
+    streamed = client.post(
+        f"/api/v1/convert?output_format={output_format}", content=npy_bytes(_MATRIX), headers=NPY_HEADERS
+    )
+    pillow = client.post(
+        f"/api/v1/convert?output_format={output_format}&stream=false&encoder=pillow",
+        content=npy_bytes(_MATRIX),
+        headers=NPY_HEADERS,
+    )
+
+    assert streamed.status_code == 200
+    assert "content-length" not in streamed.headers
+    assert streamed.content == pillow.content
+    assert streamed.headers["ETag"] == pillow.headers["ETag"]
+
+
+def test_streamed_etag_differs_from_buffered_opencv(client):
+    streamed = client.post("/api/v1/convert", content=npy_bytes(_MATRIX), headers=NPY_HEADERS)
+    buffered = client.post("/api/v1/convert?stream=false", content=npy_bytes(_MATRIX), headers=NPY_HEADERS)
+    assert streamed.headers["ETag"] != buffered.headers["ETag"]
+    np.testing.assert_array_equal(_pixels(streamed.content), _pixels(buffered.content))
+
+
+def test_explicit_opencv_is_respected(client):
+    streamed = client.post("/api/v1/convert?encoder=opencv", content=npy_bytes(_MATRIX), headers=NPY_HEADERS)
+    buffered = client.post(
+        "/api/v1/convert?encoder=opencv&stream=false", content=npy_bytes(_MATRIX), headers=NPY_HEADERS
+    )
+    assert "content-length" not in streamed.headers
+    assert streamed.content == buffered.content
+
+
+def test_explicit_stream_of_small_matrix(client, monkeypatch):
+    monkeypatch.setattr(get_settings(), "STREAM_THRESHOLD_BYTES", 1 << 30)
+    response = client.post("/api/v1/convert?stream=true", content=npy_bytes(_MATRIX[:8, :8]), headers=NPY_HEADERS)
+    assert response.status_code == 200
+    assert "content-length" not in response.headers
+    np.testing.assert_array_equal(_pixels(response.content), _MATRIX[:8, :8])
+
+
+@pytest.mark.parametrize("encoder", ["auto", "pillow", "opencv"])
+@pytest.mark.parametrize("output_format", ["tiff", "tif"])
+def test_large_tiff_is_returned_whole(client, output_format, encoder):
+    response = client.post(
+        f"/api/v1/convert?output_format={output_format}&encoder={encoder}",
+        content=npy_bytes(_MATRIX),
+        headers=NPY_HEADERS,
+    )
+    assert response.status_code == 200
+    assert int(response.headers["content-length"]) == len(response.content)
+    np.testing.assert_array_equal(_pixels(response.content), _MATRIX)
+
+
+def test_large_sixteen_bit_tiff_passthrough(client):
+    matrix = np.arange(96 * 128, dtype=np.uint16).reshape(96, 128) * 5
+    response = client.post(
+        "/api/v1/convert?output_format=tiff&normalize=passthrough",
+        content=npy_bytes(matrix),
+        headers=NPY_HEADERS,
+    )
+    assert response.status_code == 200
+    np.testing.assert_array_equal(_pixels(response.content), matrix)
+
+
+@pytest.mark.parametrize("encoder", ["auto", "pillow"])
+def test_explicit_stream_of_tiff_is_rejected(client, encoder):
+    response = client.post(
+        f"/api/v1/convert?output_format=tiff&stream=true&encoder={encoder}",
+        content=npy_bytes(_MATRIX),
+        headers=NPY_HEADERS,
+    )
+    assert response.status_code == 400
+    assert "stream=false" in response.json()["detail"]
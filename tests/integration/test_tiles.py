@@ -0,0 +1,146 @@
+"""
+Pruebas de integración de las pirámides de teselas (/api/v1/tiles).
+"""
+import io
+import json
+import zipfile
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from src.services import tile_pyramid
+from src.services.tile_pyramid import TileStore, downsample_half
+from tests.integration.conftest import API_HEADERS, JSON_HEADERS, NPY_HEADERS, npy_bytes
+
+_MATRIX = np.random.default_rng(5).integers(0, 256, (100, 70), dtype=np.uint8)
+
+
+def _pixels(content: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(content)))
+
+
+def _create(client: TestClient, matrix: np.ndarray = _MATRIX, query: str = "tile_size=32"):
+    return client.post(
+        f"/api/v1/tiles?{query}",
+        content=json.dumps({"matrix": matrix.tolist()}),
+        headers=JSON_HEADERS,
+    )
+
+
+@pytest.fixture(autouse=True)
+def tile_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(tile_pyramid, "_store", TileStore(str(tmp_path), max_pyramids=2))
+
+
+@pytest.fixture
+def pyramid(client):
+    response = _create(client)
+    assert response.status_code == 201
+    return response.json()
+
+
+def _tile(client: TestClient, pyramid: dict, z: int, x: int, y: int, **headers):
+    return client.get(f"/api/v1/tiles/{pyramid['id']}/{z}/{x}/{y}.png", headers={**API_HEADERS, **headers})
+
+
+def _level(client: TestClient, pyramid: dict, z: int) -> np.ndarray:
+    """Recompone un nivel completo a partir de sus teselas."""
+    scale = 2 ** (pyramid["max_level"] - z)
+    width, height = -(-pyramid["width"] // scale), -(-pyramid["height"] // scale)
+    size = pyramid["tile_size"]
+    rows = []
+    for y in range(-(-height // size)):
+        rows.append(np.hstack([_pixels(_tile(client, pyramid, z, x, y).content) for x in range(-(-width // size))]))
+    return np.vstack(rows)
+
+
+def test_creation_metadata(client, pyramid):
+    assert (pyramid["width"], pyramid["height"], pyramid["tile_size"]) == (70, 100, 32)
+    assert (pyramid["min_level"], pyramid["max_level"]) == (5, 7)
+    assert pyramid["tiles"] == f"/api/v1/tiles/{pyramid['id']}/{{z}}/{{x}}/{{y}}.png"
+
+    again = _create(client)
+    assert again.status_code == 200
+    assert again.json()["id"] == pyramid["id"]
+    assert client.get(f"/api/v1/tiles/{pyramid['id']}", headers=API_HEADERS).json()["max_level"] == 7
+
+
+def test_full_resolution_tiles_match_matrix(client, pyramid):
+    np.testing.assert_array_equal(_level(client, pyramid, pyramid["max_level"]), _MATRIX)
+
+
+def test_lower_levels_are_halved(client, pyramid):
+    expected = _MATRIX
+    for z in range(pyramid["max_level"] - 1, -1, -1):
+        expected = downsample_half(expected, np.empty((-(-expected.shape[0] // 2), -(-expected.shape[1] // 2)), np.uint8))
+        np.testing.assert_array_equal(_level(client, pyramid, z), expected)
+    assert expected.shape == (1, 1)
+
+
+def test_downsample_rounds_block_means():
+    source = np.array([[0, 1, 10], [1, 1, 20], [255, 255, 7]], dtype=np.uint8)
+    out = downsample_half(source, np.empty((2, 2), dtype=np.uint8))
+    # Bloques de 2x2; la última fila y columna (impares) se replican
+    np.testing.assert_array_equal(out, [[1, 15], [255, 7]])
+
+
+def test_tiles_are_cacheable(client, pyramid):
+    first = _tile(client, pyramid, 7, 0, 0)
+    assert first.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    assert _tile(client, pyramid, 7, 0, 0).content == first.content
+
+    not_modified = _tile(client, pyramid, 7, 0, 0, **{"If-None-Match": first.headers["ETag"]})
+    assert not_modified.status_code == 304
+    assert _tile(client, pyramid, 7, 1, 0).headers["ETag"] != first.headers["ETag"]
+
+
+def test_deep_zoom_descriptor_and_paths(client, pyramid):
+    dzi = client.get(f"/api/v1/tiles/{pyramid['id']}.dzi", headers=API_HEADERS)
+    assert dzi.headers["content-type"] == "application/xml"
+    assert 'TileSize="32"' in dzi.text and '<Size Width="70" Height="100"/>' in dzi.text
+
+    deep_zoom = client.get(f"/api/v1/tiles/{pyramid['id']}_files/6/1_0.png", headers=API_HEADERS)
+    assert deep_zoom.content == _tile(client, pyramid, 6, 1, 0).content
+
+
+def test_zip_export_contains_every_tile(client, pyramid):
+    response = client.get(f"/api/v1/tiles/{pyramid['id']}.zip", headers=API_HEADERS)
+    assert response.status_code == 200
+    names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+
+    pid = pyramid["id"]
+    assert f"{pid}.dzi" in names
+    assert f"{pid}_files/7/2_3.png" in names and f"{pid}_files/0/0_0.png" in names
+    # Niveles 7..0: 3x4, 2x2, 1x1 y un tile por cada uno de los 5 niveles restantes
+    assert len(names) == 1 + 12 + 4 + 1 + 5
+
+
+def test_npy_body_is_read_from_disk(client):
+    response = client.post(
+        "/api/v1/tiles?tile_size=32&colormap=viridis",
+        content=npy_bytes(_MATRIX),
+        headers=NPY_HEADERS,
+    )
+    assert response.status_code == 201
+    tile = _pixels(_tile(client, response.json(), 7, 0, 0).content)
+    assert tile.shape == (32, 32, 3)
+
+
+@pytest.mark.parametrize("z, x, y", [(8, 0, 0), (7, 3, 0), (7, 0, 4), (0, 1, 0), (-1, 0, 0)])
+def test_tiles_outside_the_pyramid(client, pyramid, z, x, y):
+    assert _tile(client, pyramid, z, x, y).status_code == 404
+
+
+def test_unknown_and_evicted_pyramids(client, pyramid):
+    assert client.get("/api/v1/tiles/desconocida.dzi", headers=API_HEADERS).status_code == 404
+    _create(client, _MATRIX + 1)
+    _create(client, _MATRIX + 2)
+    # max_pyramids=2: la primera se ha eliminado
+    assert client.get(f"/api/v1/tiles/{pyramid['id']}", headers=API_HEADERS).status_code == 404
+
+
+@pytest.mark.parametrize("query", ["tile_size=8", "tile_size=5000", "max_width=10", "crop=500,0,1,1"])
+def test_rejects_invalid_requests(client, query):
+    assert _create(client, query=query).status_code == 400
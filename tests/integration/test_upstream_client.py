@@ -0,0 +1,359 @@
+"""
+Pruebas de integración del cliente de ImageToMatrix contra un servidor local simulado.
+"""
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from src.config.settings import get_settings
+from src.services import upstream_client
+from src.services.upstream_client import CircuitBreaker, UpstreamClient, UpstreamUnavailableError
+
+
+_IMAGE_FILE = {"image": ("image.png", b"\x89PNG", "image/png")}
+
+
+class _StubState:
+    def __init__(self):
+        self.requests = 0
+        self.failures_left = 0
+        self.always_fail = False
+        self.failure_status = 503
+        self.client_ports = set()
+        self.matrix = [[0, 255], [128, 64]]
+        self.binary = None  # True: responde .npy, False: rechaza format=numpy, None: ignora el formato
+        self.binary_status = 422  # Código con el que se rechaza format=numpy
+        self.bad_image = False  # Rechaza la imagen con 422 en cualquier formato
+        self.formats = []
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        state = self.server.state
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        state.requests += 1
+        state.client_ports.add(self.client_address[1])
+        wants_numpy = b'name="format"\r\n\r\nnumpy' in body
+        state.formats.append("numpy" if wants_numpy else "json")
+
+        if state.always_fail or state.failures_left > 0:
+            state.failures_left -= 1
+            self._reply(state.failure_status, b'{"detail": "unavailable"}')
+            return
+        if state.bad_image:
+            self._reply(422, b'{"detail": "image"}')
+            return
+        if wants_numpy and state.binary is False:
+            self._reply(state.binary_status, b'{"detail": "format"}')
+            return
+        if wants_numpy and state.binary:
+            npy = io.BytesIO()
+            np.save(npy, np.array(state.matrix, dtype=np.uint8))
+            self._reply(200, npy.getvalue(), "application/x-npy")
+            return
+        self._reply(200, json.dumps({"matrix": state.matrix}).encode())
+
+    def _reply(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.state = _StubState()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/api/v1/convert", server.state
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _post_many(client, url, count):
+    async def run():
+        try:
+            return [await client.post(url, data={"format": "json"}) for _ in range(count)]
+        finally:
+            await client.aclose()
+    return asyncio.run(run())
+
+
+def test_reuses_connection(stub_server):
+    url, state = stub_server
+    responses = _post_many(UpstreamClient(), url, 5)
+
+    assert [response.status_code for response in responses] == [200] * 5
+    assert state.requests == 5
+    assert len(state.client_ports) == 1
+
+
+def test_retries_with_backoff(stub_server):
+    url, state = stub_server
+    state.failures_left = 2
+    responses = _post_many(UpstreamClient(retries=2, backoff=0.01), url, 1)
+
+    assert responses[0].status_code == 200
+    assert state.requests == 3
+
+
+def test_circuit_breaker_fails_fast(stub_server):
+    url, state = stub_server
+    state.always_fail = True
+    client = UpstreamClient(retries=0, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+
+    async def run():
+        errors = []
+        try:
+            for _ in range(4):
+                with pytest.raises(UpstreamUnavailableError) as info:
+                    await client.post(url)
+                errors.append(info.value)
+        finally:
+            await client.aclose()
+        return errors
+
+    errors = asyncio.run(run())
+    assert state.requests == 2
+    assert client.breaker.state == "open"
+    assert errors[-1].retry_after > 0
+
+
+def test_non_retryable_server_errors_open_the_circuit(stub_server):
+    url, state = stub_server
+    state.always_fail = True
+    state.failure_status = 500
+    client = UpstreamClient(retries=2, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+
+    async def run():
+        try:
+            responses = [await client.post(url) for _ in range(2)]
+            with pytest.raises(UpstreamUnavailableError):
+                await client.post(url)
+            return responses
+        finally:
+            await client.aclose()
+
+    responses = asyncio.run(run())
+    # El 500 no se reintenta, pero cada uno cuenta como fallo
+    assert [response.status_code for response in responses] == [500, 500]
+    assert state.requests == 2
+    assert client.breaker.state == "open"
+
+
+def test_client_errors_do_not_open_the_circuit(stub_server):
+    url, state = stub_server
+    state.always_fail = True
+    state.failure_status = 404
+    client = UpstreamClient(retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+
+    responses = _post_many(client, url, 3)
+    assert [response.status_code for response in responses] == [404] * 3
+    assert client.breaker.state == "closed"
+
+
+def test_circuit_breaker_recovers_after_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def _half_open_client(handler):
+    import httpx
+
+    client = UpstreamClient(retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0))
+    client.breaker.record_failure()
+    assert client.breaker.state == "half-open"
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_cancelled_probe_releases_the_circuit():
+    started = asyncio.Event()
+
+    async def hang(request):
+        started.set()
+        await asyncio.sleep(60)
+
+    client = _half_open_client(hang)
+
+    async def run():
+        try:
+            probe = asyncio.create_task(client.post("http://upstream/api/v1/convert"))
+            await started.wait()
+            probe.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await probe
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    # La siguiente llamada puede volver a probar el servicio
+    assert client.breaker.allow()
+
+
+def test_unexpected_probe_error_reopens_the_circuit():
+    import httpx
+
+    def redirect(request):
+        return httpx.Response(302, headers={"Location": str(request.url)})
+
+    client = _half_open_client(redirect)
+
+    async def run():
+        try:
+            with pytest.raises(httpx.TooManyRedirects):
+                await client.post("http://upstream/api/v1/convert", follow_redirects=True)
+        finally:
+            await client.aclose()
+
+    opened_at = client.breaker._opened_at
+    asyncio.run(run())
+    # Cuenta como fallo: el circuito vuelve a abrirse y admite una nueva prueba después
+    assert client.breaker._opened_at > opened_at
+    assert client.breaker.allow()
+
+
+def test_negotiates_binary_matrix(stub_server):
+    url, state = stub_server
+    state.binary = True
+    client = UpstreamClient()
+
+    async def run():
+        try:
+            return await client.post_matrix_request(url, files=_IMAGE_FILE, data={}, headers={})
+        finally:
+            await client.aclose()
+
+    response, matrix_format = asyncio.run(run())
+    assert matrix_format == "numpy"
+    assert np.load(io.BytesIO(response.content)).tolist() == state.matrix
+    assert client.binary_supported is True
+
+
+@pytest.mark.parametrize("status", [406, 415, 422])
+def test_falls_back_to_json_and_remembers(stub_server, status):
+    url, state = stub_server
+    state.binary = False
+    state.binary_status = status
+    client = UpstreamClient()
+
+    async def run():
+        try:
+            return [await client.post_matrix_request(url, files=_IMAGE_FILE, data={}, headers={}) for _ in range(2)]
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(run())
+    assert [matrix_format for _, matrix_format in results] == ["json", "json"]
+    assert state.formats == ["numpy", "json", "json"]
+    assert client.binary_supported is False
+
+
+def test_rejected_image_does_not_disable_binary(stub_server):
+    url, state = stub_server
+    state.binary = True
+    state.bad_image = True
+    client = UpstreamClient()
+
+    async def run():
+        try:
+            rejected = await client.post_matrix_request(url, files=_IMAGE_FILE, data={}, headers={})
+            state.bad_image = False
+            accepted = await client.post_matrix_request(url, files=_IMAGE_FILE, data={}, headers={})
+            return rejected, accepted
+        finally:
+            await client.aclose()
+
+    (rejected, _), (accepted, matrix_format) = asyncio.run(run())
+    assert rejected.status_code == 422
+    assert (accepted.status_code, matrix_format) == (200, "numpy")
+    assert client.binary_supported is True
+    assert state.formats == ["numpy", "json", "numpy"]
+
+
+@pytest.mark.parametrize("binary", [True, None])
+def test_verify_uses_upstream(stub_server, monkeypatch, binary):
+    url, state = stub_server
+    monkeypatch.setattr(get_settings(), "IMAGE_TO_MATRIX_URL", url)
+    state.binary = binary
+    state.matrix = np.arange(64, dtype=np.uint8).reshape(8, 8).tolist()
+    image = io.BytesIO()
+    Image.fromarray(np.array(state.matrix, dtype=np.uint8)).convert("RGB").save(image, format="PNG")
+
+    from src.api.app import app
+    with TestClient(app) as client:
+        for _ in range(2):
+            response = client.post(
+                "/api/v1/verify",
+                files={"image": ("image.png", image.getvalue(), "image/png")},
+                data={"mode": "metrics"},
+                headers={"X-API-Key": get_settings().DEFAULT_API_KEY},
+            )
+            assert response.status_code == 200
+            assert response.json()["identical"] is True
+
+    assert state.requests == 2
+    assert len(state.client_ports) == 1
+
+
+def test_lifespan_creates_client_without_importing_httpx():
+    # En un intérprete nuevo: TestClient ya importa httpx en este proceso
+    script = (
+        "import asyncio, sys\n"
+        "from src.api.app import app\n"
+        "from src.services import upstream_client\n"
+        "async def main():\n"
+        "    async with app.router.lifespan_context(app):\n"
+        "        assert upstream_client._client is not None\n"
+        "        assert 'httpx' not in sys.modules\n"
+        "    assert upstream_client._client is None\n"
+        "asyncio.run(main())\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = {**os.environ, "WARMUP_ON_STARTUP": "false"}
+    result = subprocess.run([sys.executable, "-c", script], cwd=root, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_pool_is_created_on_first_call(stub_server):
+    url, state = stub_server
+    client = UpstreamClient()
+    assert client._client is None
+    asyncio.run(client.aclose())  # Cerrar sin haberlo usado no falla
+
+    _post_many(client, url, 1)
+    assert state.requests == 1
+    assert client._client is None  # aclose lo libera
+
+
+def test_lifespan_shares_one_client():
+    from src.api.app import app
+
+    with TestClient(app):
+        client = upstream_client._client
+        assert client is not None
+        assert upstream_client.get_upstream_client() is client
@@ -0,0 +1,82 @@
+"""
+Pruebas de integración de la validación única de matrices (MatrixEnvelope).
+"""
+import asyncio
+import json
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from src.services import json_stream_parser, matrix_service
+from src.services.matrix_envelope import MatrixEnvelope
+from src.services.matrix_service import MatrixService
+from src.utils.validation import validate_matrix_data
+from tests.integration.conftest import API_HEADERS, JSON_HEADERS, npy_bytes
+
+
+def test_envelope_is_used_without_reparsing():
+    async def scenario():
+        return await validate_matrix_data({"matrix": [[1, 2], [3, 4]]}, "json")
+
+    envelope = asyncio.run(scenario())
+    assert isinstance(envelope, MatrixEnvelope)
+    assert (envelope.shape, envelope.source_format) == ((2, 2), "json")
+    assert MatrixService._parse_matrix_input(envelope, "json") is envelope.matrix
+
+
+def test_convert_parses_json_once(client, monkeypatch):
+    closes = []
+    original = json_stream_parser.StreamingMatrixParser.close
+
+    def close(self):
+        closes.append(self)
+        return original(self)
+
+    def reparse(*args, **kwargs):
+        raise AssertionError("La matriz se volvió a parsear en el servicio")
+
+    monkeypatch.setattr(json_stream_parser.StreamingMatrixParser, "close", close)
+    monkeypatch.setattr(matrix_service, "parse_matrix_json", reparse)
+    response = client.post(
+        "/api/v1/convert?output_format=png",
+        content=json.dumps({"matrix": np.arange(64).reshape(8, 8).tolist()}),
+        headers=JSON_HEADERS,
+    )
+    assert response.status_code == 200
+    assert len(closes) == 1
+
+
+@pytest.mark.parametrize(
+    "data, format",
+    [
+        ({"matrix": []}, "json"),
+        ({"values": [[1]]}, "json"),
+        ({"matrix": [[[1, 2]]]}, "json"),  # Dos canales
+        ({"matrix": [[[[1]]]]}, "json"),  # 4D
+        (npy_bytes(np.zeros((2, 2, 2, 2), dtype=np.uint8)), "numpy"),
+        (b"{}", "csv"),
+    ],
+)
+def test_rejects_invalid_layout(data, format):
+    async def scenario():
+        await validate_matrix_data(data, format)
+
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(scenario())
+    assert rejected.value.status_code == 400
+
+
+def test_declared_size_is_checked_before_loading(client):
+    # La forma declarada supera MAX_MATRIX_SIZE: 413 sin llegar a comparar el búfer
+    response = client.post(
+        "/api/v1/convert",
+        content=b"\x00" * 16,
+        headers={
+            **API_HEADERS,
+            "Content-Type": "application/octet-stream",
+            "X-Matrix-Dtype": "float64",
+            "X-Matrix-Shape": "100000,100000",
+        },
+    )
+    assert response.status_code == 413